@@ -0,0 +1,134 @@
+import msgpack
+from rest_framework.utils.encoders import JSONEncoder
+import voluptuous as V
+
+from chiton.wintour import pipeline
+
+
+# Keys used by API responses outside of the recommendation data shapes
+RESPONSE_KEYS = ('errors', 'recommendation_id', 'recommendations')
+
+
+def get_shape_keys(*shapes):
+    """Get every key defined by a set of data shapes, including nested keys.
+
+    Args:
+        shapes (list[function]): Data-shape functions created by `define_data_shape`
+
+    Returns:
+        list[str]: The keys, in alphabetical order
+    """
+    keys = set()
+    for shape in shapes:
+        _collect_schema_keys(shape.schema, keys)
+
+    return sorted(keys)
+
+
+def pack_compact(data):
+    """Encode API data in a compact MessagePack layout.
+
+    Each dict key is replaced by its index in a key table, which starts with
+    the keys of the recommendation data shapes and is extended with any other
+    keys in the data.  The result is a two-item array of the key table and the
+    indexed data, which is decoded by `unpack_compact`.  Keys and values are
+    normalized in the same way as when encoding JSON, so a decoded payload is
+    equivalent to the decoded JSON for the same data.
+
+    Args:
+        data (*): API response data
+
+    Returns:
+        bytes: The encoded data
+    """
+    keys = list(KEY_TABLE)
+    key_indexes = dict((key, index) for index, key in enumerate(keys))
+    encoder = JSONEncoder()
+
+    def index_value(value):
+        if isinstance(value, dict):
+            indexed = {}
+            for key, item in value.items():
+                key = _normalize_key(key)
+                try:
+                    key_index = key_indexes[key]
+                except KeyError:
+                    key_index = key_indexes[key] = len(keys)
+                    keys.append(key)
+                indexed[key_index] = index_value(item)
+            return indexed
+        elif isinstance(value, (list, tuple)):
+            return [index_value(item) for item in value]
+        elif value is None or isinstance(value, (bool, float, int, str)):
+            return value
+        else:
+            return index_value(encoder.default(value))
+
+    body = index_value(data)
+    return msgpack.packb([keys, body], use_bin_type=True)
+
+
+def unpack_compact(payload):
+    """Decode data encoded by `pack_compact`.
+
+    Args:
+        payload (bytes): The encoded data
+
+    Returns:
+        *: The decoded data, with its original keys
+    """
+    keys, body = msgpack.unpackb(payload, encoding='utf-8')
+
+    def expand_value(value):
+        if isinstance(value, dict):
+            return dict((keys[key], expand_value(item)) for key, item in value.items())
+        elif isinstance(value, list):
+            return [expand_value(item) for item in value]
+        else:
+            return value
+
+    return expand_value(body)
+
+
+def _collect_schema_keys(schema, keys):
+    """Add the keys of a Voluptuous schema and its nested schemas to a set.
+
+    Args:
+        schema (*): A Voluptuous schema, or a data-shape function
+        keys (set): The set of keys to update
+    """
+    schema = getattr(schema, 'schema', schema)
+
+    if isinstance(schema, dict):
+        for key, value in schema.items():
+            if isinstance(key, V.Marker):
+                key = key.schema
+            if isinstance(key, str):
+                keys.add(key)
+            _collect_schema_keys(value, keys)
+    elif isinstance(schema, (list, tuple)):
+        for value in schema:
+            _collect_schema_keys(value, keys)
+
+
+def _normalize_key(key):
+    """Convert a dict key to the form that it takes when encoded as JSON.
+
+    Args:
+        key (*): A dict key
+
+    Returns:
+        str: The normalized key
+    """
+    if isinstance(key, str):
+        return key
+    elif key is None:
+        return 'null'
+    elif isinstance(key, bool):
+        return 'true' if key else 'false'
+    else:
+        return str(key)
+
+
+# The base key table, derived from the recommendation data shapes
+KEY_TABLE = tuple(sorted(set(get_shape_keys(pipeline.GarmentsPage, pipeline.Recommendations)) | set(RESPONSE_KEYS)))
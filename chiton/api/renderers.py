@@ -0,0 +1,183 @@
+import re
+from threading import Lock
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.response import Response
+
+from chiton.api.compact import pack_compact
+
+
+# The parts of a garment recommendation that only depend on the catalog
+GARMENT_FRAGMENT_PARTS = ('garment', 'purchase_options')
+
+# The placeholder used for a garment fragment before it is spliced in, which
+# starts with a control character that never occurs in catalog data
+FRAGMENT_PLACEHOLDER = '\x00fragment:%d:%s'
+
+# A pattern matching an encoded fragment placeholder
+ENCODED_PLACEHOLDER_MATCH = re.compile(rb'"\\u0000fragment:(\d+):(%s)"' % b'|'.join(p.encode('ascii') for p in GARMENT_FRAGMENT_PARTS))
+
+# The encoded garment fragments for the current catalog generation
+_fragments = {
+    'generation': None,
+    'garments': {}
+}
+_fragments_lock = Lock()
+
+
+class CatalogResponse(Response):
+    """A response whose garments were computed against a known catalog generation."""
+
+    def __init__(self, data=None, catalog_generation=None, **kwargs):
+        """Create a new response.
+
+        Keyword Args:
+            catalog_generation (str): The catalog generation of the garment data
+        """
+        super().__init__(data, **kwargs)
+        self.catalog_generation = catalog_generation
+
+
+class FragmentJSONRenderer(JSONRenderer):
+    """A JSON renderer that reuses the encoded catalog data of garments.
+
+    When a response is known to contain garments from a particular catalog
+    generation, the static parts of each garment recommendation are encoded
+    once per generation and spliced into the encoded response, leaving only
+    per-request data such as weights to be encoded.  Any other response is
+    rendered as standard JSON.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Render data as JSON, splicing in pre-encoded garment fragments."""
+        renderer_context = renderer_context or {}
+        response = renderer_context.get('response', None)
+        generation = getattr(response, 'catalog_generation', None)
+
+        if data is None or generation is None or self.get_indent(accepted_media_type, renderer_context) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        fragments = {}
+        skeleton = _extract_garment_fragments(data, fragments, _get_garment_fragments(generation), self._encode)
+        encoded = super().render(skeleton, accepted_media_type, renderer_context)
+
+        _store_garment_fragments(generation, fragments)
+
+        return ENCODED_PLACEHOLDER_MATCH.sub(
+            lambda match: fragments[int(match.group(1))][match.group(2).decode('ascii')],
+            encoded
+        )
+
+    def _encode(self, value):
+        """Encode a value as compact JSON.
+
+        Args:
+            value (*): A JSON-serializable value
+
+        Returns:
+            bytes: The encoded value
+        """
+        return super().render(value)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """A renderer for the compact MessagePack layout used by internal API clients.
+
+    The payloads produced by this renderer can be decoded with
+    `chiton.api.compact.unpack_compact`.
+    """
+
+    media_type = 'application/x-msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Render data in the compact MessagePack layout."""
+        if data is None:
+            return bytes()
+
+        return pack_compact(data)
+
+
+def _extract_garment_fragments(value, fragments, stored, encode):
+    """Replace the static parts of each garment recommendation with placeholders.
+
+    Args:
+        value (*): Response data
+        fragments (dict): The encoded fragments of each garment in the response, keyed by ID
+        stored (dict): The stored fragments for the response's catalog generation, keyed by ID
+        encode (function): A function that encodes a value as JSON
+
+    Returns:
+        *: A copy of the data with fragment placeholders
+    """
+    if isinstance(value, list):
+        return [_extract_garment_fragments(v, fragments, stored, encode) for v in value]
+    elif not isinstance(value, dict):
+        return value
+
+    if not _is_garment_recommendation(value):
+        return dict((k, _extract_garment_fragments(v, fragments, stored, encode)) for k, v in value.items())
+
+    garment_id = value['garment']['id']
+    if garment_id not in fragments:
+        fragments[garment_id] = stored.get(garment_id, None) or dict(
+            (part, encode(value[part])) for part in GARMENT_FRAGMENT_PARTS
+        )
+
+    skeleton = dict(value)
+    for part in GARMENT_FRAGMENT_PARTS:
+        skeleton[part] = FRAGMENT_PLACEHOLDER % (garment_id, part)
+
+    return skeleton
+
+
+def _is_garment_recommendation(value):
+    """Determine whether a dict is a complete garment recommendation.
+
+    Args:
+        value (dict): A dict of response data
+
+    Returns:
+        bool: Whether the dict is a garment recommendation
+    """
+    return (
+        all(part in value for part in GARMENT_FRAGMENT_PARTS) and
+        isinstance(value['garment'], dict) and
+        'id' in value['garment']
+    )
+
+
+def _get_garment_fragments(generation):
+    """Get the stored fragments of garments for a catalog generation.
+
+    Args:
+        generation (str): A catalog generation
+
+    Returns:
+        dict: The encoded parts of each stored garment, keyed by ID
+    """
+    with _fragments_lock:
+        if _fragments['generation'] == generation:
+            return _fragments['garments']
+        else:
+            return {}
+
+
+def _store_garment_fragments(generation, fragments):
+    """Store the fragments of garments for a catalog generation.
+
+    Fragments from any other generation are discarded, since a new generation
+    indicates that the catalog data of any garment may have changed.
+
+    Args:
+        generation (str): The catalog generation of the fragments
+        fragments (dict): The encoded fragments of garments, keyed by ID
+    """
+    with _fragments_lock:
+        if _fragments['generation'] != generation:
+            _fragments['generation'] = generation
+            _fragments['garments'] = {}
+
+        _fragments['garments'].update(fragments)
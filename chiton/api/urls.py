@@ -7,6 +7,9 @@ from chiton.api import views
 
 patterns = [
     url(r'^recommendations/$', views.Recommendations.as_view()),
+    url(r'^recommendations/batch/$', views.BatchRecommendations.as_view()),
+    url(r'^recommendations/(?P<pk>\d+)/$', views.RecommendationDetail.as_view()),
+    url(r'^recommendations/(?P<pk>\d+)/basics/(?P<basic_slug>[\w-]+)/garments/$', views.RecommendationGarments.as_view()),
     url(r'^wardrobe-profiles/$', views.WardrobeProfiles.as_view())
 ]
 
@@ -1,15 +1,29 @@
 from django.conf import settings
+from django.db import transaction
+from django.utils.http import parse_etags, quote_etag
 from ipware.ip import get_ip
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from chiton.api.permissions import IsRecommender
+from chiton.api.renderers import CatalogResponse
 from chiton.core.schema import DataShapeError
-from chiton.wintour.matching import convert_recommendation_to_wardrobe_profile, make_recommendations, PersonRecommendation
-from chiton.wintour.models import Person, Recommendation
+from chiton.rack.affiliates.scheduling import record_recommendation_exposure, record_recommendations_exposure
+from chiton.wintour.buffers import recommendation_buffer
+from chiton.wintour.coalescing import recommendation_coalescer
+from chiton.wintour.exceptions import CursorError, GroupNotFoundError, ProjectionError
+from chiton.wintour.matching import convert_recommendation_to_wardrobe_profile, make_recommendations_many, PersonRecommendation
+from chiton.wintour.models import Person, Recommendation, RecommendationProfile
+from chiton.wintour.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, page_group_garments, preview_recommendations
 from chiton.wintour.pipelines.core import CorePipeline
 from chiton.wintour.profiles import PipelineProfile
+from chiton.wintour.projections import FieldProjection
+from chiton.wintour.snapshots import get_catalog_generation, get_current_snapshot, get_snapshot_etag, save_recommendation_snapshot
+
+
+# The maximum number of profiles accepted by a single batch request
+MAX_BATCH_SIZE = 1000
 
 
 class Recommendations(APIView):
@@ -22,17 +36,168 @@ class Recommendations(APIView):
         custom_ip = request.data.pop('client_ip_address', None)
         max_garments_per_group = request.data.pop('max_garments_per_group', None)
 
+        try:
+            projection = _get_projection(request.data.pop('fields', None), request.data.pop('max_images', None))
+        except ProjectionError as e:
+            return Response({'errors': {'projection': str(e)}}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
             profile = PipelineProfile(request.data, validate=True)
         except DataShapeError as e:
             return Response({'errors': {'fields': e.fields}}, status=status.HTTP_400_BAD_REQUEST)
 
         ip_address = get_ip(request) if settings.CHITON_API_IS_PUBLIC else custom_ip
-        recommendation = Recommendation.objects.create(profile=profile, ip_address=ip_address)
+        recommendation_id = recommendation_buffer.add(profile, ip_address=ip_address)
+
+        generation = get_catalog_generation()
+        recommendations = recommendation_coalescer.make_recommendations(profile, CorePipeline(), projection=projection)
+        recommendations['recommendation_id'] = recommendation_id
+        snapshot = _snapshot_recommendations(recommendation_id, recommendations, generation, projection)
+
+        recommendations = preview_recommendations(snapshot, max_garments_per_group=max_garments_per_group)
+        record_recommendation_exposure(recommendations)
+        return CatalogResponse(recommendations, catalog_generation=_get_response_generation([snapshot], projection))
+
+
+class RecommendationDetail(APIView):
+    """Retrieve previously generated outfit recommendations."""
+
+    permission_classes = (IsRecommender,)
+
+    def get(self, request, pk, format=None):
+        """Get the current recommendations for a recommendation record."""
+        try:
+            max_garments_per_group = _get_int_param(request, 'max_garments_per_group')
+        except ValueError as e:
+            return Response({'errors': {'max_garments_per_group': str(e)}}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            recommendation = _get_recommendation(pk)
+        except Recommendation.DoesNotExist as e:
+            return Response({'errors': {'recommendation': str(e)}}, status=status.HTTP_404_NOT_FOUND)
+
+        variants = [request.accepted_renderer.format, max_garments_per_group]
+        etag = get_snapshot_etag(recommendation, get_catalog_generation(), *variants)
+        if _is_not_modified(request, etag):
+            return _not_modified(etag)
+
+        snapshot = get_current_snapshot(recommendation)
+        recommendations = preview_recommendations(snapshot, max_garments_per_group=max_garments_per_group)
+
+        response = CatalogResponse(recommendations, catalog_generation=snapshot['generation'])
+        response['ETag'] = quote_etag(get_snapshot_etag(recommendation, snapshot['generation'], *variants))
+        return response
+
+
+class RecommendationGarments(APIView):
+    """Page through the garments recommended for a basic."""
+
+    permission_classes = (IsRecommender,)
+
+    def get(self, request, pk, basic_slug, format=None):
+        """Get a page of the garments in one of a basic's facet groups."""
+        facet_slug = request.query_params.get('facet', None)
+        group_slug = request.query_params.get('group', None)
+        if not facet_slug or not group_slug:
+            return Response({'errors': {'group': 'A facet and group are required'}}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = _get_int_param(request, 'limit') or DEFAULT_PAGE_SIZE
+        except ValueError as e:
+            return Response({'errors': {'limit': str(e)}}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            recommendation = _get_recommendation(pk)
+        except Recommendation.DoesNotExist as e:
+            return Response({'errors': {'recommendation': str(e)}}, status=status.HTTP_404_NOT_FOUND)
+
+        cursor = request.query_params.get('cursor', None)
+        limit = min(limit, MAX_PAGE_SIZE)
+
+        variants = [request.accepted_renderer.format, basic_slug, facet_slug, group_slug, cursor, limit]
+        etag = get_snapshot_etag(recommendation, get_catalog_generation(), *variants)
+        if _is_not_modified(request, etag):
+            return _not_modified(etag)
+
+        snapshot = get_current_snapshot(recommendation)
+
+        try:
+            page = page_group_garments(snapshot, basic_slug, facet_slug, group_slug, cursor=cursor, limit=limit)
+        except CursorError as e:
+            return Response({'errors': {'cursor': str(e)}}, status=status.HTTP_400_BAD_REQUEST)
+        except GroupNotFoundError as e:
+            return Response({'errors': {'group': str(e)}}, status=status.HTTP_404_NOT_FOUND)
+
+        record_recommendation_exposure({'basics': [page]})
+
+        response = CatalogResponse(page, catalog_generation=snapshot['generation'])
+        response['ETag'] = quote_etag(get_snapshot_etag(recommendation, snapshot['generation'], *variants))
+        return response
+
+
+class BatchRecommendations(APIView):
+    """Manage outfit recommendations for many users at once."""
+
+    permission_classes = (IsRecommender,)
+
+    def post(self, request, format=None):
+        """Generate recommendations for a batch of users."""
+        max_garments_per_group = request.data.get('max_garments_per_group', None)
+
+        try:
+            projection = _get_projection(request.data.get('fields', None), request.data.get('max_images', None))
+        except ProjectionError as e:
+            return Response({'errors': {'projection': str(e)}}, status=status.HTTP_400_BAD_REQUEST)
+
+        profiles_data = request.data.get('profiles', None)
+        if not isinstance(profiles_data, list) or not profiles_data:
+            return Response({'errors': {'profiles': 'A non-empty list of profiles is required'}}, status=status.HTTP_400_BAD_REQUEST)
+        elif len(profiles_data) > MAX_BATCH_SIZE:
+            return Response({'errors': {'profiles': 'At most %d profiles can be requested at once' % MAX_BATCH_SIZE}}, status=status.HTTP_400_BAD_REQUEST)
+
+        profiles = []
+        ip_addresses = []
+        profile_errors = {}
+
+        for index, profile_data in enumerate(profiles_data):
+            if not isinstance(profile_data, dict):
+                profile_errors[str(index)] = 'A profile must be an object'
+                continue
+
+            profile_data = dict(profile_data)
+            custom_ip = profile_data.pop('client_ip_address', None)
 
-        recommendations = make_recommendations(profile, CorePipeline(), max_garments_per_group=max_garments_per_group)
-        recommendations['recommendation_id'] = recommendation.pk
-        return Response(recommendations)
+            try:
+                profiles.append(PipelineProfile(profile_data, validate=True))
+            except DataShapeError as e:
+                profile_errors[str(index)] = e.fields
+            else:
+                ip_addresses.append(get_ip(request) if settings.CHITON_API_IS_PUBLIC else custom_ip)
+
+        if profile_errors:
+            return Response({'errors': {'profiles': profile_errors}}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            digests = RecommendationProfile.objects.ensure_exist(profiles)
+            recommendations = Recommendation.objects.bulk_create([
+                Recommendation(profile_id=digest, ip_address=ip_address)
+                for digest, ip_address in zip(digests, ip_addresses)
+            ])
+
+        generation = get_catalog_generation()
+        all_recommendations = make_recommendations_many(profiles, CorePipeline(), projection=projection)
+
+        snapshots = []
+        for index, recommendation in enumerate(recommendations):
+            all_recommendations[index]['recommendation_id'] = recommendation.pk
+            snapshots.append(_snapshot_recommendations(recommendation.pk, all_recommendations[index], generation, projection))
+            all_recommendations[index] = preview_recommendations(snapshots[index], max_garments_per_group=max_garments_per_group)
+        record_recommendations_exposure(all_recommendations)
+
+        return CatalogResponse(
+            {'recommendations': all_recommendations},
+            catalog_generation=_get_response_generation(snapshots, projection)
+        )
 
 
 class WardrobeProfiles(APIView):
@@ -45,6 +210,9 @@ class WardrobeProfiles(APIView):
         except DataShapeError as e:
             return Response({'errors': {'fields': e.fields}}, status=status.HTTP_400_BAD_REQUEST)
 
+        # Ensure that a recommendation buffered by any process has been saved
+        recommendation_buffer.flush_if_pending(data['recommendation_id'])
+
         try:
             recommendation = Recommendation.objects.get(pk=data['recommendation_id'])
         except Recommendation.DoesNotExist as e:
@@ -56,3 +224,149 @@ class WardrobeProfiles(APIView):
         return Response({
             'wardrobe_profile_id': wardrobe_profile.pk
         })
+
+
+def _get_recommendation(recommendation_id):
+    """Get a recommendation record, including one that is still buffered.
+
+    Args:
+        recommendation_id (str): The ID of a recommendation
+
+    Returns:
+        chiton.wintour.models.Recommendation: The recommendation
+
+    Raises:
+        chiton.wintour.models.Recommendation.DoesNotExist: If the recommendation does not exist
+    """
+    recommendation_id = int(recommendation_id)
+    recommendation_buffer.flush_if_pending(recommendation_id)
+
+    return Recommendation.objects.select_related('profile').get(pk=recommendation_id)
+
+
+def _get_int_param(request, name):
+    """Get the value of an optional integer query parameter.
+
+    Args:
+        request (rest_framework.request.Request): The current request
+        name (str): The name of the parameter
+
+    Returns:
+        int: The parameter's value, or None if it was not provided
+
+    Raises:
+        ValueError: If the parameter is not a positive integer
+    """
+    value = request.query_params.get(name, None)
+    if value is None:
+        return None
+
+    if not value.isdigit() or not int(value):
+        raise ValueError('A positive integer is required')
+
+    return int(value)
+
+
+def _is_not_modified(request, etag):
+    """Determine whether a request's cached copy of a resource is current.
+
+    Args:
+        request (rest_framework.request.Request): The current request
+        etag (str): The current entity tag of the requested resource
+
+    Returns:
+        bool: Whether the request's If-None-Match header matches the entity tag
+    """
+    header = request.META.get('HTTP_IF_NONE_MATCH', None)
+    if not header:
+        return False
+    elif header.strip() == '*':
+        return True
+
+    return etag in parse_etags(header)
+
+
+def _not_modified(etag):
+    """Build a response indicating that a client's cached copy is current.
+
+    Args:
+        etag (str): The current entity tag of the requested resource
+
+    Returns:
+        rest_framework.response.Response: The response
+    """
+    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    response['ETag'] = quote_etag(etag)
+    return response
+
+
+def _get_projection(fields, max_images):
+    """Get the field projection requested for recommendations.
+
+    Args:
+        fields (list[str]): The requested fields, either as a list or a comma-separated string
+        max_images (int): The requested maximum number of images per purchase option
+
+    Returns:
+        chiton.wintour.projections.FieldProjection: The projection, or None if all fields were requested
+
+    Raises:
+        chiton.wintour.exceptions.ProjectionError: If the requested projection is invalid
+    """
+    if fields is None and max_images is None:
+        return None
+
+    if isinstance(fields, str):
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+    elif fields is not None and (not isinstance(fields, list) or not all(isinstance(f, str) for f in fields)):
+        raise ProjectionError('The fields must be a list of field names')
+
+    if max_images is not None and (not isinstance(max_images, int) or isinstance(max_images, bool) or max_images < 0):
+        raise ProjectionError('The maximum number of images must be a non-negative integer')
+
+    return FieldProjection(fields, max_images=max_images)
+
+
+def _snapshot_recommendations(recommendation_id, recommendations, generation, projection):
+    """Build the snapshot used to respond with newly computed recommendations.
+
+    Only full recommendations are stored, since projected recommendations lack
+    the data needed to serve the recommendations again.  Projected
+    recommendations are instead stored in full when they are first retrieved.
+
+    Args:
+        recommendation_id (int): The ID of a recommendation
+        recommendations (chiton.wintour.pipeline.Recommendations): The computed recommendations
+        generation (str): The catalog generation read before computing the recommendations
+        projection (chiton.wintour.projections.FieldProjection): The projection applied to the recommendations
+
+    Returns:
+        dict: The snapshot's generation and recommendations
+    """
+    if projection is None:
+        return save_recommendation_snapshot(recommendation_id, recommendations, generation)
+
+    return {
+        'generation': generation,
+        'recommendations': recommendations
+    }
+
+
+def _get_response_generation(snapshots, projection):
+    """Get the catalog generation shared by all recommendations in a response.
+
+    Args:
+        snapshots (list[dict]): The snapshots of the recommendations in the response
+        projection (chiton.wintour.projections.FieldProjection): The projection applied to the recommendations
+
+    Returns:
+        str: The shared generation, or None if the recommendations have no single generation or are projected
+    """
+    if projection is not None:
+        return None
+
+    generations = set(snapshot['generation'] for snapshot in snapshots)
+    if len(generations) == 1:
+        return generations.pop()
+    else:
+        return None
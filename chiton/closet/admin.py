@@ -14,8 +14,8 @@ from chiton.closet.apps import Config as ClosetConfig
 from chiton.core.admin import site
 from chiton.rack.admin import AffiliateItemInline
 from chiton.rack.apps import Config as RackConfig
-from chiton.rack.models import AffiliateItem, StockRecord
-from chiton.rack.affiliates.data import update_affiliate_item_details
+from chiton.rack.models import AffiliateItem
+from chiton.rack.affiliates.jobs import enqueue_item_refresh
 from chiton.runway.models import Basic
 
 
@@ -93,8 +93,14 @@ class GarmentAdmin(admin.ModelAdmin):
 
     def save_related(self, request, form, formset, change):
         super().save_related(request, form, formset, change)
-        for affiliate_item in form.instance.affiliate_items.all():
-            update_affiliate_item_details(affiliate_item)
+
+        affiliate_items = form.instance.affiliate_items.all()
+        for affiliate_item in affiliate_items:
+            enqueue_item_refresh(affiliate_item)
+
+        if len(affiliate_items):
+            message = _('The details of %d affiliate items will be refreshed in the background') % len(affiliate_items)
+            messages.add_message(request, messages.INFO, message)
 
     def get_urls(self):
         core = super().get_urls()
@@ -104,39 +110,36 @@ class GarmentAdmin(admin.ModelAdmin):
         return custom + core
 
     def availability(self, request):
-        item_records = {}
-        for record in StockRecord.objects.all().select_related('size'):
-            item_records.setdefault(record.item_id, {
-                'regular': 0,
-                'tall': 0,
-                'petite': 0,
-                'plus': 0
-            })
-            if not record.is_available:
-                continue
-
-            item_record = item_records[record.item_id]
-            if record.size.is_regular:
-                item_record['regular'] += 1
-            if record.size.is_tall:
-                item_record['tall'] += 1
-            if record.size.is_petite:
-                item_record['petite'] += 1
-            if record.size.is_plus_sized:
-                item_record['plus'] += 1
+        variant_masks = {
+            'regular': 0,
+            'tall': 0,
+            'petite': 0,
+            'plus': 0
+        }
+        for size in models.StandardSize.objects.all():
+            size_bit = 1 << size.ordinal
+            if size.is_regular:
+                variant_masks['regular'] |= size_bit
+            if size.is_tall:
+                variant_masks['tall'] |= size_bit
+            if size.is_petite:
+                variant_masks['petite'] |= size_bit
+            if size.is_plus_sized:
+                variant_masks['plus'] |= size_bit
 
         items = []
         retailers = []
         for item in AffiliateItem.objects.all().select_related('garment', 'garment__basic', 'network'):
-            if not item_records[item.pk]:
-                continue
+            item_record = dict(
+                (variant, bin(item.availability_mask & variant_mask).count('1'))
+                for variant, variant_mask in variant_masks.items()
+            )
 
             retailers.append(item.retailer)
 
             change_url = reverse('admin:%s_affiliateitem_change' % RackConfig.label, args=[item.pk])
             garment_change_url = reverse('admin:%s_garment_change' % ClosetConfig.label, args=[item.garment.pk])
 
-            item_record = item_records[item.pk]
             items.append(dict(item_record,
                 affiliate_url=item.affiliate_url,
                 basic=item.garment.basic.name,
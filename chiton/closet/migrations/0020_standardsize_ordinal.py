@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-19 15:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def assign_ordinals(apps, schema_editor):
+    """Give each standard size a stable ordinal based on its current position."""
+    StandardSize = apps.get_model('chiton_closet', 'StandardSize')
+
+    for ordinal, size in enumerate(StandardSize.objects.all().order_by('position', 'pk')):
+        size.ordinal = ordinal
+        size.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chiton_closet', '0019_auto_20160529_0019'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='standardsize',
+            name='ordinal',
+            field=models.PositiveSmallIntegerField(null=True, verbose_name='ordinal'),
+        ),
+        migrations.RunPython(assign_ordinals, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='standardsize',
+            name='ordinal',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, unique=True, verbose_name='ordinal'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Lookup
 from django.utils.translation import ugettext_lazy as _
 
 from chiton.closet.data import EMPHASES, EMPHASIS_CHOICES
@@ -28,3 +29,36 @@ class PriceField(models.DecimalField):
         options.update(kwargs)
 
         super().__init__(*args, **options)
+
+
+class AvailabilityMaskField(models.BigIntegerField):
+    """A field for storing the available sizes of an item as a bitmask.
+
+    Each bit in the mask corresponds to the ordinal of a standard size, and the
+    field supports a `has_any` lookup that matches masks sharing any set bits
+    with a given mask.
+    """
+
+    description = _('A bitmask of available sizes')
+
+    # The number of bits available in the mask, excluding the sign bit
+    MAX_BITS = 63
+
+    def __init__(self, *args, **kwargs):
+        if 'default' not in kwargs:
+            kwargs['default'] = 0
+
+        super().__init__(*args, **kwargs)
+
+
+@AvailabilityMaskField.register_lookup
+class HasAnyBits(Lookup):
+    """A lookup that matches masks that share any set bits with a given mask."""
+
+    lookup_name = 'has_any'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+
+        return '(%s & %s) <> 0' % (lhs, rhs), lhs_params + rhs_params
@@ -2,11 +2,11 @@ import re
 
 from autoslug import AutoSlugField
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connection, models, transaction
 from django.utils.translation import ugettext_lazy as _
 
 from chiton.closet import data
-from chiton.closet.model_fields import EmphasisField
+from chiton.closet.model_fields import AvailabilityMaskField, EmphasisField
 from chiton.core.queries import cache_query
 from chiton.core.validators import validate_range
 from chiton.runway.models import Basic, Formality, Style
@@ -208,6 +208,34 @@ def _make_slug_for_standard_size(size):
     return '-'.join(parts)
 
 
+def _get_next_standard_size_ordinal():
+    """Get the ordinal to assign to a new standard size.
+
+    The lowest ordinal not held by an existing size is used, so that the
+    ordinals of deleted sizes are reclaimed and stay within the bits of an
+    availability mask.  Deleting a size clears its bit from every mask, so a
+    reclaimed ordinal never matches items stocked in the deleted size.
+
+    This locks the standard-size table against writes until the end of the
+    current transaction, so that concurrently created sizes are never given
+    the same ordinal, and must be called within the transaction that saves
+    the new size.
+
+    Returns:
+        int: The next unused ordinal
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('LOCK TABLE %s IN SHARE ROW EXCLUSIVE MODE' % connection.ops.quote_name(StandardSize._meta.db_table))
+
+    taken = set(StandardSize.objects.values_list('ordinal', flat=True))
+
+    ordinal = 0
+    while ordinal in taken:
+        ordinal += 1
+
+    return ordinal
+
+
 class StandardSizeManager(models.Manager):
     """A custom manager for standard sizes."""
 
@@ -222,6 +250,24 @@ class StandardSizeManager(models.Manager):
         """
         return _get_standard_size_slugs()
 
+    def get_mask(self, slugs):
+        """Return the availability mask matching any of the given sizes.
+
+        Args:
+            slugs (list[str]): The slugs of standard sizes
+
+        Returns:
+            int: A bitmask with the bit of each size's ordinal set
+        """
+        ordinals = _get_standard_size_ordinals()
+
+        mask = 0
+        for slug in slugs:
+            if slug in ordinals:
+                mask |= 1 << ordinals[slug]
+
+        return mask
+
 
 class StandardSize(models.Model):
     """A standard size for an item."""
@@ -237,6 +283,7 @@ class StandardSize(models.Model):
     is_petite = models.BooleanField(verbose_name=_('petite'), default=False)
     is_plus_sized = models.BooleanField(verbose_name=_('plus-sized'), default=False)
     position = models.PositiveSmallIntegerField(verbose_name=_('position'), default=0)
+    ordinal = models.PositiveSmallIntegerField(verbose_name=_('ordinal'), unique=True, editable=False, blank=True)
 
     class Meta:
         ordering = ('position',)
@@ -251,7 +298,7 @@ class StandardSize(models.Model):
         return (self.slug,)
 
     def clean(self):
-        """Ensure that only one variant is selected."""
+        """Ensure that only one variant is selected and that the size fits in an availability mask."""
         variants = [getattr(self, field) for field in self.VARIANT_FIELDS]
         variant_count = len([v for v in variants if v])
 
@@ -260,6 +307,31 @@ class StandardSize(models.Model):
         elif variant_count > 1:
             raise ValidationError('Only one variant type may be selected')
 
+        if self.ordinal is not None:
+            self._validate_ordinal()
+
+    def save(self, *args, **kwargs):
+        """Save the size, giving a new size the lowest unused ordinal.
+
+        Raises:
+            django.core.exceptions.ValidationError: If the size's ordinal does not fit in an availability mask
+        """
+        with transaction.atomic():
+            if self.ordinal is None:
+                self.ordinal = _get_next_standard_size_ordinal()
+            self._validate_ordinal()
+
+            super().save(*args, **kwargs)
+
+    def _validate_ordinal(self):
+        """Ensure that the size's ordinal fits in an availability mask.
+
+        Raises:
+            django.core.exceptions.ValidationError: If the ordinal is too large
+        """
+        if self.ordinal >= AvailabilityMaskField.MAX_BITS:
+            raise ValidationError('No more than %d standard sizes can be tracked' % AvailabilityMaskField.MAX_BITS)
+
     @property
     def display_name(self):
         """Get the formatted name of the size for display.
@@ -292,6 +364,12 @@ class StandardSize(models.Model):
         )
 
 
+@cache_query(StandardSize)
+def _get_standard_size_ordinals():
+    """Return the ordinals of all standard sizes keyed by their slugs."""
+    return dict(StandardSize.objects.all().values_list('slug', 'ordinal'))
+
+
 @cache_query(StandardSize)
 def _get_standard_size_slugs():
     """Return all StandardSize slugs."""
@@ -57,6 +57,7 @@ def _default_config():
         'media_url': '/media/',
         'previous_encryption_key': None,
         'public_api': False,
+        'recommendation_spool': None,
         'redis': {},
         'secret_key': None,
         'sentry_dsn': None,
@@ -97,6 +98,7 @@ def _validate_config(config):
         'media_url': All(str, Length(min=1), _MediaUrl()),
         'public_api': bool,
         'previous_encryption_key': All(str, Length(min=1)),
+        'recommendation_spool': All(str, Length(min=1), _AbsolutePath()),
         'redis': Schema({
             'db': int,
             'host': All(str, Length(min=1)),
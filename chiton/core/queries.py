@@ -1,3 +1,7 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import local, Lock
+
 from django.core.cache import cache
 from django.db.models.signals import m2m_changed, post_delete, post_save
 
@@ -11,6 +15,16 @@ MODEL_SIGNALS = (post_delete, post_save)
 # The separator used for namespaces
 NAMESPACE_SEPARATOR = ':'
 
+# The state of deferred refreshes, shared by all threads
+_deferred = {
+    'depth': 0,
+    'pending': OrderedDict()
+}
+_deferred_lock = Lock()
+
+# The values of cached queries pinned by the current thread
+_pinned = local()
+
 
 def cache_query(*model_classes, namespace='default'):
     """Cache a function that returns a query's value.
@@ -29,17 +43,28 @@ def cache_query(*model_classes, namespace='default'):
         other_queries = len([q for q in CACHED_QUERIES if q['id'] == query_id])
         query_guid = '%s--%d' % (query_id, other_queries)
 
-        # Wrap the query in a get-or-set cache call
+        # Wrap the query in a get-or-set cache call, reusing any value pinned
+        # by the current thread
         def run_query():
+            pinned = getattr(_pinned, 'values', None)
+            if pinned is not None and query_guid in pinned:
+                return pinned[query_guid]
+
             result = cache.get(query_guid)
             if result is None:
                 result = query_fn()
                 cache.set(query_guid, result, None)
 
+            if pinned is not None:
+                pinned[query_guid] = result
+
             return result
 
-        # Define a signal handler that refreshes the cached value
+        # Define a signal handler that refreshes the cached value, unless
+        # refreshes are being deferred
         def refresh_query(*args, **kwargs):
+            if _defer_refresh(query_guid, refresh_query):
+                return
             cache.delete(query_guid)
             cache.set(query_guid, query_fn(), None)
 
@@ -81,12 +106,77 @@ def bind_signal_handlers(namespace=''):
                         m2m_changed.connect(query['refresh_fn'], sender=field.remote_field.through, dispatch_uid=query['guid'])
 
 
+@contextmanager
+def defer_cached_query_refreshes():
+    """Defer all cached-query refreshes until the end of a block.
+
+    Any refresh requested while the block is active, whether by a model signal
+    or by an explicit call to `refresh_cached_queries`, is queued instead of
+    being performed, and each queued query is refreshed exactly once when the
+    outermost block exits.  This applies to all threads, which allows bulk
+    operations that save many models to coalesce their cache invalidation.
+    """
+    with _deferred_lock:
+        _deferred['depth'] += 1
+
+    try:
+        yield
+    finally:
+        with _deferred_lock:
+            _deferred['depth'] -= 1
+            if _deferred['depth']:
+                pending = []
+            else:
+                pending = list(_deferred['pending'].values())
+                _deferred['pending'].clear()
+
+        for refresh_fn in pending:
+            refresh_fn()
+
+
+@contextmanager
+def pin_cached_queries():
+    """Read each cached query at most once within a block.
+
+    The first value returned by a cached query within the block is reused by
+    every later call made on the same thread, which spares batch operations
+    from repeatedly reading and deserializing the same lookups from the cache.
+    Values are not shared with other threads, and are released when the
+    outermost block exits.
+    """
+    is_outermost = getattr(_pinned, 'values', None) is None
+    if is_outermost:
+        _pinned.values = {}
+
+    try:
+        yield
+    finally:
+        if is_outermost:
+            _pinned.values = None
+
+
 def prime_cached_queries():
     """Prime all cached queries."""
     for query in CACHED_QUERIES:
         query['refresh_fn']()
 
 
+def refresh_cached_queries(*model_classes):
+    """Refresh all cached queries that involve any of the given models.
+
+    This should be called after writes that bypass model signals, such as bulk
+    creates, to bring the affected cached queries up to date.
+
+    Args:
+        model_classes (list[django.db.models.Model]): The models whose data changed
+    """
+    changed = set(model_classes)
+
+    for query in CACHED_QUERIES:
+        if changed.intersection(query['model_classes']):
+            query['refresh_fn']()
+
+
 def unbind_signal_handlers(namespace=''):
     """Unbind all connected signal handlers.
 
@@ -102,3 +192,21 @@ def unbind_signal_handlers(namespace=''):
             for signal in MODEL_SIGNALS:
                 if query['guid'].startswith(namespace_prefix):
                     signal.disconnect(None, sender=model_class, dispatch_uid=query['guid'])
+
+
+def _defer_refresh(query_guid, refresh_fn):
+    """Queue a query's refresh if refreshes are being deferred.
+
+    Args:
+        query_guid (str): The unique ID of a cached query
+        refresh_fn (function): The function that refreshes the query
+
+    Returns:
+        bool: Whether the refresh was deferred
+    """
+    with _deferred_lock:
+        if not _deferred['depth']:
+            return False
+
+        _deferred['pending'][query_guid] = refresh_fn
+        return True
@@ -27,7 +27,7 @@ def define_data_shape(schema, defaults=None, validated=True):
         validated (bool): Whether the data should be validated by default
 
     Returns:
-        function: A function that creates and validates a dict according to the schema
+        function: A function that creates and validates a dict according to the schema, exposing the schema as its `schema` attribute
     """
     def validate_data(data={}, validate=validated):
         if not validate:
@@ -48,6 +48,8 @@ def define_data_shape(schema, defaults=None, validated=True):
         else:
             return data
 
+    validate_data.schema = schema
+
     return validate_data
 
 
@@ -1,7 +1,10 @@
 from django.conf.urls import url
 from django.contrib import admin
+from django.contrib import messages
 from django.core.urlresolvers import reverse
+from django.http import HttpResponseRedirect
 from django.template.response import TemplateResponse
+from django.utils import timezone
 from django.utils.html import format_html
 from django.utils.translation import ugettext_lazy as _
 import json
@@ -12,7 +15,8 @@ from pygments.formatters import HtmlFormatter
 from chiton.core.admin import site
 from chiton.rack import models
 from chiton.rack.affiliates import create_affiliate
-from chiton.rack.affiliates.data import update_affiliate_item_details
+from chiton.rack.affiliates.jobs import enqueue_item_refresh, get_latest_refresh_jobs, LATEST_REFRESH_JOBS_ATTR, prefetch_latest_refresh_jobs
+from chiton.rack.data import REFRESH_JOB_STATUSES
 from chiton.rack.forms import AffiliateItemURLForm
 
 
@@ -25,7 +29,7 @@ class AffiliateItemAdmin(admin.ModelAdmin):
 
     form = AffiliateItemURLForm
     inlines = [StockRecordInline]
-    list_display = ('name', 'network', 'item_link', 'api_link', 'price', 'has_detailed_stock', 'garment', 'retailer', 'has_multiple_colors')
+    list_display = ('name', 'network', 'item_link', 'api_link', 'price', 'has_detailed_stock', 'garment', 'retailer', 'has_multiple_colors', 'refresh_status')
     list_filter = ('network', 'has_detailed_stock', 'retailer')
     ordering = ('name',)
     search_fields = ['name']
@@ -61,8 +65,9 @@ class AffiliateItemAdmin(admin.ModelAdmin):
         affiliate = create_affiliate(slug=item.network.slug)
 
         if request.POST:
-            update_affiliate_item_details(item, images=request.POST.getlist('images'))
-            item.refresh_from_db()
+            enqueue_item_refresh(item, images=request.POST.getlist('images'))
+            messages.add_message(request, messages.INFO, _('The custom images for "%s" will be saved in the background') % item.name)
+            return HttpResponseRedirect(request.path)
 
         images = affiliate.request_images(item.guid)
         current_urls = item.images.all().values_list('source_url', flat=True)
@@ -72,6 +77,7 @@ class AffiliateItemAdmin(admin.ModelAdmin):
             current_images=current_urls,
             images=images,
             item=item,
+            refresh_status=_format_refresh_status(get_latest_refresh_jobs([item.pk]).get(item.pk)),
             title=item.name
         ))
 
@@ -84,11 +90,28 @@ class AffiliateItemAdmin(admin.ModelAdmin):
         return format_html('<a href="%s" target="_blank">Query API</a>' % url)
     api_link.short_description = _('API details')
 
+    def get_queryset(self, request):
+        return prefetch_latest_refresh_jobs(super().get_queryset(request))
+
+    def refresh_status(self, item):
+        return _format_prefetched_refresh_status(item)
+    refresh_status.short_description = _('refresh status')
+
 
 class AffiliateItemInline(admin.TabularInline):
-    fields = ('network', 'url', 'guid', 'name')
+    fields = ('network', 'url', 'guid', 'name', 'refresh_status')
     form = AffiliateItemURLForm
     model = models.AffiliateItem
+    readonly_fields = ('refresh_status',)
+
+    def get_queryset(self, request):
+        return prefetch_latest_refresh_jobs(super().get_queryset(request))
+
+    def refresh_status(self, item):
+        if not item.pk:
+            return ''
+        return _format_prefetched_refresh_status(item)
+    refresh_status.short_description = _('refresh status')
 
 
 @admin.register(models.AffiliateNetwork, site=site)
@@ -96,3 +119,50 @@ class AffiliateNetworkAdmin(admin.ModelAdmin):
 
     list_display = ('name',)
     ordering = ('name',)
+
+
+@admin.register(models.RefreshJob, site=site)
+class RefreshJobAdmin(admin.ModelAdmin):
+
+    list_display = ('item', 'status', 'created_at', 'started_at', 'finished_at', 'details')
+    list_filter = ('status',)
+    list_select_related = ('item',)
+    ordering = ('-created_at',)
+    readonly_fields = ('item', 'status', 'images', 'details', 'created_at', 'started_at', 'finished_at')
+    search_fields = ['item__name']
+
+
+def _format_refresh_status(job):
+    """Describe the state of an affiliate item's most recent refresh job.
+
+    Args:
+        job (chiton.rack.models.RefreshJob): A refresh job, or None if the item was never queued
+
+    Returns:
+        str: An HTML description of the job's status
+    """
+    if not job:
+        return '-'
+
+    if job.status == REFRESH_JOB_STATUSES['DONE']:
+        return format_html('{} ({})', job.get_status_display(), timezone.localtime(job.finished_at).strftime('%Y-%m-%d %H:%M:%S'))
+    elif job.status == REFRESH_JOB_STATUSES['ERROR']:
+        return format_html('<span title="{}">{}</span>', job.details, job.get_status_display())
+    else:
+        return job.get_status_display()
+
+
+def _format_prefetched_refresh_status(item):
+    """Describe the state of an affiliate item's prefetched most recent refresh job.
+
+    Args:
+        item (chiton.rack.models.AffiliateItem): An affiliate item with its latest refresh job prefetched
+
+    Returns:
+        str: An HTML description of the job's status
+    """
+    jobs = getattr(item, LATEST_REFRESH_JOBS_ATTR, None)
+    if jobs is None:
+        jobs = list(get_latest_refresh_jobs([item.pk]).values())
+
+    return _format_refresh_status(jobs[0] if jobs else None)
@@ -1,4 +1,3 @@
-from collections import OrderedDict
 from contextlib import contextmanager
 import urllib
 from urllib.error import HTTPError
@@ -9,14 +8,19 @@ from django.conf import settings
 import xmltodict
 
 from chiton.core.uris import extract_query_param
+from chiton.rack.affiliates.amazon.parsing import parse_item_lookup
 from chiton.rack.affiliates.amazon.urls import extract_asin_from_url
 from chiton.rack.affiliates.base import Affiliate as BaseAffiliate
 from chiton.rack.affiliates.exceptions import LookupError, ThrottlingError
+from chiton.rack.affiliates.metrics import record_download
 
 
 # The desired image sizes to use from a response
 IMAGE_SIZES = ('MediumImage', 'LargeImage')
 
+# The timeout for a single API request, in seconds
+REQUEST_TIMEOUT = 15
+
 
 @contextmanager
 def raise_throttling_exception():
@@ -43,29 +47,36 @@ class Affiliate(BaseAffiliate):
             raise LookupError('No ASIN could be extracted from the URL: %s' % url)
 
         with raise_throttling_exception():
-            response = self.connect().ItemLookup(ItemId=asin, ResponseGroup='Small')
+            response = self.connect(parser=parse_item_lookup).ItemLookup(ItemId=asin, ResponseGroup='Small')
 
-        validated = self._validate_response(response, asin)
-        item = validated['Items']['Item']
-        name = item.get('ItemAttributes', {}).get('Title', None)
+        item = self._validate_lookup(response, asin)
 
-        asin = item['ASIN']
-        parent_asin = item.get('ParentASIN', None)
+        asin = item['asin']
+        parent_asin = item['parent_asin']
         if parent_asin != asin:
             asin = parent_asin
 
         return {
             'guid': asin,
-            'name': name
+            'name': item['title']
         }
 
-    def provide_details(self, asin, colors):
-        item = self._request_combined_data(asin)['Items']['Item']
+    def provide_details_payload(self, asin):
+        with raise_throttling_exception():
+            xml = self.connect(parser=None).ItemLookup(ItemId=asin, ResponseGroup='ItemAttributes,Variations')
+
+        return {
+            'asin': asin,
+            'xml': xml
+        }
 
-        if 'Variations' not in item:
+    def provide_details_from_payload(self, payload, colors):
+        item = self._validate_lookup(parse_item_lookup(payload['xml']), payload['asin'])
+
+        if not item['has_variations']:
             raise LookupError('Details may not be provided for a child ASIN')
 
-        variations = self._extract_variations(item)
+        variations = item['variations']
         price = self._calculate_price(variations)
         images = [self._find_color_image(variations, size, colors) for size in IMAGE_SIZES]
 
@@ -73,19 +84,21 @@ class Affiliate(BaseAffiliate):
             'availability': True,
             'colors': self._find_colors(variations),
             'images': images,
-            'name': item['ItemAttributes']['Title'],
+            'name': item['title'],
             'price': price,
             'retailer': 'Amazon',
-            'url': urllib.parse.unquote(item['DetailPageURL'])
+            'url': urllib.parse.unquote(item['url'])
         }
 
     def provide_images(self, asin):
-        data = self._request_combined_data(asin)['Items']['Item']
-        return sorted(set(self._find_images(data, IMAGE_SIZES)))
+        item = self._request_item(asin)
+        return sorted(set(self._find_images(item['variations'], IMAGE_SIZES)))
 
     def provide_raw(self, asin):
-        data = self._request_combined_data(asin)
-        return data['Items']
+        with raise_throttling_exception():
+            response = self.connect().ItemLookup(ItemId=asin, ResponseGroup='ItemAttributes,Variations')
+
+        return self._validate_response(response, asin)['Items']
 
     def provide_url_validity(self, url):
         if not url:
@@ -93,51 +106,46 @@ class Affiliate(BaseAffiliate):
         else:
             return extract_query_param(url, 'tag') == [settings.AMAZON_ASSOCIATES_TRACKING_ID]
 
-    def connect(self):
+    def connect(self, parser=xmltodict.parse):
         """Return a connection to the Amazon Associates API.
 
+        Keyword Args:
+            parser (function): The function used to parse the raw XML of responses
+
         Returns:
             bottlenose.Amazon: A connection to the API
         """
+        def parse_response(xml):
+            record_download(len(xml))
+            return parser(xml) if parser else xml
+
         return bottlenose.Amazon(
             settings.AMAZON_ASSOCIATES_AWS_ACCESS_KEY_ID,
             settings.AMAZON_ASSOCIATES_AWS_SECRET_ACCESS_KEY,
             settings.AMAZON_ASSOCIATES_TRACKING_ID,
-            Parser=xmltodict.parse
+            Parser=parse_response,
+            Timeout=REQUEST_TIMEOUT
         )
 
-    def _request_combined_data(self, asin):
+    def _request_item(self, asin):
         """Request combined attributes and listing information for an item.
 
+        The response is parsed with the streaming extractor, which only exposes
+        the values needed to describe the item and its variations.
+
         Args:
             asin (str): An item's ASIN
 
         Returns:
-            dict: The API response
+            dict: The extracted item data
 
         Raises:
             chiton.rack.affiliates.exceptions.LookupError: If the request errored out
         """
         with raise_throttling_exception():
-            response = self.connect().ItemLookup(ItemId=asin, ResponseGroup='ItemAttributes,Variations')
-
-        return self._validate_response(response, asin)
-
-    def _extract_variations(self, item):
-        """Extract a list of item variations from an item's details.
-
-        Args:
-            item (dict): An item's details from a parsed API response
-
-        Returns:
-            list: All item variations
-        """
-        variations = item['Variations']['Item']
-
-        if isinstance(variations, OrderedDict):
-            variations = [variations]
+            response = self.connect(parser=parse_item_lookup).ItemLookup(ItemId=asin, ResponseGroup='ItemAttributes,Variations')
 
-        return variations
+        return self._validate_lookup(response, asin)
 
     def _calculate_price(self, variations):
         """Calculate the average price for the item based on all offers.
@@ -151,9 +159,8 @@ class Affiliate(BaseAffiliate):
         total_price = 0
 
         for variation in variations:
-            if 'Offers' in variation:
-                price = variation['Offers']['Offer']['OfferListing']['Price']['Amount']
-                total_price += int(price)
+            if variation['price'] is not None:
+                total_price += variation['price']
 
         avg_price = total_price / len(variations)
         return Decimal('%.02f' % (avg_price / 100))
@@ -170,18 +177,16 @@ class Affiliate(BaseAffiliate):
         colors = set()
 
         for variation in variations:
-            if 'ItemAttributes' in variation:
-                color = variation['ItemAttributes'].get('Color', None)
-                if color:
-                    colors.add(color)
+            if variation['color']:
+                colors.add(variation['color'])
 
         return sorted(colors)
 
-    def _find_images(self, item, size_names):
+    def _find_images(self, variations, size_names):
         """Find all images for an item matching a list of sizes.
 
         Args:
-            item (dict): An item's details
+            variations (list): A list of all item variations
             size_names (list): A list of all valid size names
 
         Returns:
@@ -189,12 +194,12 @@ class Affiliate(BaseAffiliate):
         """
         images = []
 
-        for variation in item['Variations']['Item']:
+        for variation in variations:
             for size_name in size_names:
-                if size_name in variation:
-                    images.append(variation[size_name])
+                if size_name in variation['images']:
+                    images.append(variation['images'][size_name])
 
-        return [image['URL'] for image in images]
+        return images
 
     def _find_color_image(self, variations, size_name, color_names):
         """Find an image of a given size for an item of a given color.
@@ -217,11 +222,11 @@ class Affiliate(BaseAffiliate):
 
         if color_matches:
             for variation in variations:
-                if size_name not in variation:
+                if size_name not in variation['images'] or not variation['color']:
                     continue
-                color_name = variation['ItemAttributes']['Color'].lower()
+                color_name = variation['color'].lower()
                 if color_name in color_matches:
-                    color_images[color_name] = variation[size_name]
+                    color_images[color_name] = variation['images'][size_name]
 
         for color_match in color_matches:
             image = color_images.get(color_match, None)
@@ -230,11 +235,34 @@ class Affiliate(BaseAffiliate):
 
         if image is None:
             for variation in variations:
-                if size_name in variation:
-                    image = variation[size_name]
+                if size_name in variation['images']:
+                    image = variation['images'][size_name]
                     break
 
-        return image['URL']
+        return image
+
+    def _validate_lookup(self, lookup, asin):
+        """Raise a lookup error if a streamed lookup response is invalid.
+
+        Args:
+            lookup (dict): A lookup response parsed by the streaming extractor
+            asin (str): The ASIN of the requested item
+
+        Returns:
+            dict: The data for the looked-up item
+
+        Raises:
+            chiton.rack.affiliates.exceptions.LookupError: If the request errored out
+        """
+        if lookup['errors']:
+            error = lookup['errors'][0]
+            raise LookupError('Invalid lookup for ASIN %s: %s (%s)' % (
+                asin, error['code'], error['message']))
+
+        if lookup['item'] is None:
+            raise LookupError('No item was returned for ASIN %s' % asin)
+
+        return lookup['item']
 
     def _validate_response(self, response, asin):
         """Raise a lookup error if a response is invalid.
@@ -0,0 +1,163 @@
+from io import BytesIO
+from xml.etree.ElementTree import iterparse
+
+
+# The path to the looked-up item, and to each of its variations
+ITEM_PATH = ('Items', 'Item')
+VARIATIONS_PATH = ITEM_PATH + ('Variations',)
+VARIATION_PATH = VARIATIONS_PATH + ('Item',)
+
+# The path to each error reported for the request
+ERROR_PATH = ('Items', 'Request', 'Errors', 'Error')
+
+# The fields extracted from the item, keyed by their path relative to it
+ITEM_FIELDS = {
+    ('ASIN',): 'asin',
+    ('DetailPageURL',): 'url',
+    ('ItemAttributes', 'Title'): 'title',
+    ('ParentASIN',): 'parent_asin'
+}
+
+# The fields extracted from each variation, keyed by their path relative to it
+VARIATION_FIELDS = {
+    ('ASIN',): 'asin',
+    ('ItemAttributes', 'Color'): 'color',
+    ('Offers', 'Offer', 'OfferListing', 'Price', 'Amount'): 'price'
+}
+
+# The fields extracted from each error, keyed by their path relative to it
+ERROR_FIELDS = {
+    ('Code',): 'code',
+    ('Message',): 'message'
+}
+
+
+def parse_item_lookup(xml):
+    """Extract item data from an ItemLookup response in a single streaming pass.
+
+    Rather than building a tree of the full response, this only records the
+    values used by the affiliate, discarding each element once it has been
+    read.  Only the first item in the response is extracted.  Images are keyed
+    by their size name, and include only those directly attached to the item
+    or variation, ignoring any image sets.
+
+    Args:
+        xml (bytes): The raw XML of the response
+
+    Returns:
+        dict: The errors reported by the API and the data for the looked-up item
+    """
+    lookup = {
+        'errors': [],
+        'item': None
+    }
+
+    path = []
+    item = None
+    variation = None
+    error = None
+    item_done = False
+
+    for event, element in iterparse(BytesIO(xml), events=('start', 'end')):
+        if event == 'start':
+            path.append(_local_name(element.tag))
+            location = tuple(path[1:])
+
+            if location == ITEM_PATH and not item_done:
+                item = _create_item()
+                lookup['item'] = item
+            elif item is not None and location == VARIATIONS_PATH:
+                item['has_variations'] = True
+            elif item is not None and location == VARIATION_PATH:
+                variation = _create_variation()
+                item['variations'].append(variation)
+            elif location == ERROR_PATH:
+                error = {'code': None, 'message': None}
+                lookup['errors'].append(error)
+
+            continue
+
+        location = tuple(path[1:])
+        text = (element.text or '').strip()
+
+        if text:
+            if variation is not None and location[:len(VARIATION_PATH)] == VARIATION_PATH:
+                _record_field(variation, location[len(VARIATION_PATH):], VARIATION_FIELDS, text)
+            elif item is not None and location[:len(ITEM_PATH)] == ITEM_PATH:
+                _record_field(item, location[len(ITEM_PATH):], ITEM_FIELDS, text)
+            elif error is not None and location[:len(ERROR_PATH)] == ERROR_PATH:
+                _record_field(error, location[len(ERROR_PATH):], ERROR_FIELDS, text)
+
+        if location == VARIATION_PATH:
+            variation = None
+        elif location == ITEM_PATH and item is not None:
+            item = None
+            item_done = True
+        elif location == ERROR_PATH:
+            error = None
+
+        path.pop()
+        element.clear()
+
+    return lookup
+
+
+def _create_item():
+    """Create an empty record for a looked-up item.
+
+    Returns:
+        dict: The item record
+    """
+    return {
+        'asin': None,
+        'has_variations': False,
+        'images': {},
+        'parent_asin': None,
+        'title': None,
+        'url': None,
+        'variations': []
+    }
+
+
+def _create_variation():
+    """Create an empty record for an item variation.
+
+    Returns:
+        dict: The variation record
+    """
+    return {
+        'asin': None,
+        'color': None,
+        'images': {},
+        'price': None
+    }
+
+
+def _record_field(record, relative_path, fields, text):
+    """Record the value of an element if its path maps to a field.
+
+    Args:
+        record (dict): The record being populated
+        relative_path (tuple): The element's path relative to the record's element
+        fields (dict): A mapping of relative paths to field names
+        text (str): The element's text
+    """
+    if len(relative_path) == 2 and relative_path[0].endswith('Image') and relative_path[1] == 'URL':
+        record['images'].setdefault(relative_path[0], text)
+        return
+
+    field = fields.get(relative_path)
+    if field and record[field] is None:
+        record[field] = int(text) if field == 'price' else text
+
+
+def _local_name(tag):
+    """Remove any namespace from an element's tag.
+
+    Args:
+        tag (str): The element's tag
+
+    Returns:
+        str: The tag without a namespace
+    """
+    return tag.rsplit('}', 1)[-1]
@@ -49,16 +49,43 @@ class Affiliate:
             chiton.rack.affiliates.exceptions.LookupError: If details could not be returned
         """
         data = self.provide_details(guid, colors)
+        return self._validate_details(data)
 
-        try:
-            details = ItemDetails(data)
-        except FormatError as e:
-            raise LookupError('Incorrect details format: %s' % e)
+    def request_details_payload(self, guid):
+        """Request the raw API payload from which an item's details are parsed.
 
-        if not isinstance(details['availability'], bool) and details['availability']:
-            details['availability'] = [ItemAvailability(a) for a in details['availability']]
+        This allows the I/O-bound work of fetching details to be separated from
+        the CPU-bound work of parsing them, which is done by passing the payload
+        to `parse_details_payload`.
 
-        return details
+        Args:
+            guid (str): The item's unique ID
+
+        Returns:
+            object: A picklable payload
+
+        Raises:
+            chiton.rack.affiliates.exceptions.LookupError: If the payload could not be returned
+        """
+        return self.provide_details_payload(guid)
+
+    def parse_details_payload(self, payload, colors=[]):
+        """Parse detailed information on an item from a raw API payload.
+
+        Args:
+            payload (object): A payload returned by `request_details_payload`
+
+        Keyword Args:
+            colors (list): The names of all colors for the item
+
+        Returns:
+            chiton.rack.affiliates.responses.ItemDetails: Details on the item
+
+        Raises:
+            chiton.rack.affiliates.exceptions.LookupError: If details could not be parsed
+        """
+        data = self.provide_details_from_payload(payload, colors)
+        return self._validate_details(data)
 
     def request_images(self, guid):
         """Request all full-size images for an item.
@@ -118,8 +145,34 @@ class Affiliate:
     def provide_details(self, guid, colors):
         """Allow a child affiliate to return an item's details.
 
+        By default, this parses the details from the item's raw payload.
+
+        Args:
+            guid (str): The item's GUID
+            colors (list): The names of the item's colors
+
+        Returns:
+            chiton.rack.affiliates.responses.ItemDetails: Information on the item's overview
+        """
+        payload = self.provide_details_payload(guid)
+        return self.provide_details_from_payload(payload, colors)
+
+    def provide_details_payload(self, guid):
+        """Allow a child affiliate to return the raw payload for an item's details.
+
         Args:
             guid (str): The item's GUID
+
+        Returns:
+            object: A picklable payload
+        """
+        raise NotImplementedError()
+
+    def provide_details_from_payload(self, payload, colors):
+        """Allow a child affiliate to parse an item's details from a raw payload.
+
+        Args:
+            payload (object): A payload returned by `provide_details_payload`
             colors (list): The names of the item's colors
 
         Returns:
@@ -159,3 +212,25 @@ class Affiliate:
             bool: Whether the url is valid
         """
         return True
+
+    def _validate_details(self, data):
+        """Validate the details provided by a child affiliate.
+
+        Args:
+            data (dict): The item's details
+
+        Returns:
+            chiton.rack.affiliates.responses.ItemDetails: The validated details
+
+        Raises:
+            chiton.rack.affiliates.exceptions.LookupError: If the details have an invalid format
+        """
+        try:
+            details = ItemDetails(data)
+        except FormatError as e:
+            raise LookupError('Incorrect details format: %s' % e)
+
+        if not isinstance(details['availability'], bool) and details['availability']:
+            details['availability'] = [ItemAvailability(a) for a in details['availability']]
+
+        return details
@@ -1,67 +1,204 @@
+from functools import partial
 from io import StringIO
+from itertools import islice
+from multiprocessing import Pool as ProcessPool, TimeoutError as ProcessTimeout
 from multiprocessing.dummy import Pool as ThreadPool
 from queue import Queue, Empty as QueueEmpty
 import random
-from time import sleep
+from threading import BoundedSemaphore, Lock
+from time import monotonic, sleep
 from traceback import print_exc
 
+from django.db import connection, DatabaseError, models, transaction
+
+from chiton.core.queries import refresh_cached_queries
 from chiton.rack.affiliates import create_affiliate
-from chiton.rack.affiliates.data import update_affiliate_item_details, update_affiliate_item_metadata
-from chiton.rack.affiliates.exceptions import BatchError, LookupError, ThrottlingError
+from chiton.rack.affiliates.circuits import CircuitBreakers
+from chiton.rack.affiliates.data import apply_affiliate_item_details, apply_stock_record_changes, get_affiliate_item_color_names, parse_affiliate_item_details, request_affiliate_item_details_payload, update_affiliate_item_details, update_affiliate_item_metadata
+from chiton.rack.affiliates.exceptions import BatchError, CircuitOpenError, DeadlineError, LookupError, ThrottlingError
+from chiton.rack.affiliates.metrics import JobMetrics, track_item_activity
+from chiton.rack.models import AffiliateItem, ItemImage, ItemImageDerivative, StockRecord
 
 
 # Default values for tuning batch jobs
 DEFAULT_MAX_RETRIES = 10
 DEFAULT_WORKERS = 2
 
+# Default values for tuning the parse and write stages of staged batch jobs
+DEFAULT_PARSE_QUEUE_SIZE = 32
+DEFAULT_WRITE_QUEUE_SIZE = 32
+
+# The default number of refreshed items whose stock-record changes are written together
+DEFAULT_STOCK_BATCH_SIZE = 50
+
 # The initial timeout when handling a throttled API request, in seconds
 API_TIMEOUT = 1.5
 
 # The maximum API sleep time, in seconds
 MAX_API_SLEEP = 15
 
-# The timeout for fetching an item from the queue
-QUEUE_TIMEOUT = MAX_API_SLEEP * 2
+# The default number of invalid items deleted in a single transaction when pruning
+DEFAULT_PRUNE_CHUNK_SIZE = 500
+
+# The default time allowed for processing a single item, in seconds
+DEFAULT_ITEM_DEADLINE = 60
+
+# The time beyond a job's item deadline after which a job with no processed or
+# cancelled items is aborted, which lets slow items be cancelled rather than
+# ending the job
+QUEUE_TIMEOUT_MARGIN = MAX_API_SLEEP * 2
+
+# The interval at which a job checks for items that have exceeded their deadline
+DEADLINE_POLL_INTERVAL = 0.5
 
 
 class BatchJobResult:
     """The result of processing a single task in a batch job."""
 
-    def __init__(self, item_id=None, details=None, is_error=False):
+    def __init__(self, item_id=None, details=None, is_error=False, is_skipped=False, stock_changes=None):
         """Create a new job result.
 
         Keyword Args:
             details (str): A detailed message describing the result
             is_error (bool): Whether the job failed
+            is_skipped (bool): Whether the item was unchanged and not written
             item_id (int): The ID of the processed item
+            stock_changes (list[dict]): The stock-record changes for the item that have yet to be written
         """
         self.details = details
         self.is_error = is_error
+        self.is_skipped = is_skipped
         self.item_id = item_id
+        self.stock_changes = stock_changes
+
+
+class InFlightItems:
+    """A thread-safe record of the items being processed by a job and their deadlines."""
+
+    def __init__(self, deadline, clock=monotonic):
+        """Create a new record of in-flight items.
+
+        Args:
+            deadline (float): The time allowed for processing a single item, in seconds
+
+        Keyword Args:
+            clock (function): A function that returns the current time in seconds
+        """
+        self.clock = clock
+        self.deadline = deadline
+
+        self._items = {}
+        self._lock = Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def start(self, item_id, breaker=None):
+        """Start tracking an item.
+
+        Args:
+            item_id (int): The ID of an affiliate item
+
+        Keyword Args:
+            breaker (chiton.rack.affiliates.circuits.CircuitBreaker): The circuit breaker for the item's network
+        """
+        with self._lock:
+            self._items[item_id] = (self.clock() + self.deadline, breaker)
+
+    def finish(self, item_id):
+        """Stop tracking an item that has been processed.
+
+        Args:
+            item_id (int): The ID of an affiliate item
+
+        Returns:
+            bool: Whether the item was finished before being cancelled
+        """
+        with self._lock:
+            return self._items.pop(item_id, None) is not None
+
+    def remaining(self, item_id):
+        """Get the time remaining before an item's deadline.
+
+        Args:
+            item_id (int): The ID of an affiliate item
+
+        Returns:
+            float: The remaining time in seconds, which is zero for cancelled items
+        """
+        with self._lock:
+            tracked = self._items.get(item_id)
+
+        if tracked is None:
+            return 0
+        else:
+            return max(tracked[0] - self.clock(), 0)
+
+    def cancel_expired(self):
+        """Cancel every item whose deadline has passed.
+
+        The failure of each cancelled item is recorded by the circuit breaker of
+        its network.
+
+        Returns:
+            list[int]: The IDs of the cancelled items
+        """
+        now = self.clock()
+
+        with self._lock:
+            expired = [item_id for item_id, tracked in self._items.items() if tracked[0] <= now]
+            breakers = [self._items.pop(item_id)[1] for item_id in expired]
+
+        for breaker in breakers:
+            if breaker:
+                breaker.record_failure()
+
+        return expired
 
 
 class BatchJob:
     """A batch-upate job performed on a site of affiliate items."""
 
-    def __init__(self, items, item_updater, workers=DEFAULT_WORKERS, max_retries=DEFAULT_MAX_RETRIES):
+    def __init__(self, items, item_updater, workers=DEFAULT_WORKERS, max_retries=DEFAULT_MAX_RETRIES, deadline=DEFAULT_ITEM_DEADLINE, circuit_breakers=None, stock_batch_size=None):
         """Create a new batch job.
 
+        The item updater may return a false value to indicate that the item was
+        unchanged, which will cause its result to be marked as skipped.  If a
+        stock batch size is given, the updater is passed a `stock_changes` list
+        to which it adds the item's stock-record changes, which the job writes
+        for many items at once.
+
         Args:
             items (django.db.models.query.QuerySet): A queryset of affiliate items
             item_updater (function): A function to update a single item
 
         Keyword Args:
+            circuit_breakers (chiton.rack.affiliates.circuits.CircuitBreakers): The circuit breakers for each network
+            deadline (float): The time allowed for processing a single item, in seconds
             max_retries (int): The maximum number of retries when handling throttled API requests
+            stock_batch_size (int): The number of items whose stock-record changes are written together
             workers (int): The number of workers to use
         """
         self.items = items
         self.item_updater = item_updater
         self.workers = workers
         self.max_retries = max_retries
+        self.deadline = deadline
+        self.circuit_breakers = circuit_breakers or CircuitBreakers()
+        self.metrics = JobMetrics()
+        self.stock_batch_size = stock_batch_size
 
     def run(self):
         """Run the batch job on the items.
 
+        Each item must be processed within the job's deadline, and an item that
+        exceeds it is reported as an error while the job moves on.  Any late
+        result for the item is discarded.  Each network has a circuit breaker,
+        and items whose network's circuit is open are failed without making any
+        requests.  Metrics on the job's throughput are collected in its
+        `metrics` attribute, which is reset on each run.
+
         Yields:
             chiton.rack.affiliates.bulk.BatchJobResult: The result of processing an item
         """
@@ -70,90 +207,358 @@ class BatchJob:
 
         retry_range = range(0, max_retries + 1)
         queue = Queue()
+        in_flight = InFlightItems(self.deadline)
+
+        metrics = JobMetrics()
+        network_ids = {}
+        self.metrics = metrics
 
         def refresh_item(item):
+            network_ids[item.pk] = item.network_id
+
+            breaker = self.circuit_breakers[item.network_id]
+            if not breaker.allow_request():
+                return queue.put((item.pk, _create_circuit_open_result(item)))
+
+            in_flight.start(item.pk, breaker=breaker)
+            with track_item_activity() as activity:
+                result = process_item(item, breaker)
+            metrics.record_activity(item.network_id, activity)
+
+            if result and in_flight.finish(item.pk):
+                queue.put((item.pk, result))
+
+            # Write the stock changes of an item whose result was discarded, so
+            # that its stock records match the details that were saved
+            elif result and result.stock_changes:
+                _write_stock_changes([result])
+
+        def process_item(item, breaker):
             for retry_index in retry_range:
                 try:
-                    item_updater(item)
+                    if self.stock_batch_size:
+                        stock_changes = []
+                        was_changed = item_updater(item, stock_changes=stock_changes)
+                    else:
+                        stock_changes = None
+                        was_changed = item_updater(item)
 
                 # If we receive a throttling error from the API, and we have yet
                 # to exceed the maximum retries, randomly calculate a delay
-                # using an exponential backoff algorithm.  If the maximum
+                # using an exponential backoff algorithm, giving up on the item
+                # if the delay would extend past its deadline.  If the maximum
                 # retries have been exceeded, add an error message to the queue.
                 except ThrottlingError:
                     if retry_index < max_retries:
                         delay = random.uniform(1, min(MAX_API_SLEEP, API_TIMEOUT * 2 ** retry_index))
+                        if delay >= in_flight.remaining(item.pk):
+                            metrics.record_throttle(item.network_id, is_retried=False)
+                            breaker.record_failure()
+                            return _create_deadline_result(item.pk, self.deadline)
+                        metrics.record_throttle(item.network_id, is_retried=True)
                         sleep(delay)
                     else:
-                        return queue.put(BatchJobResult(
+                        metrics.record_throttle(item.network_id, is_retried=False)
+                        breaker.record_failure()
+                        return BatchJobResult(
                             details='Exceeded max throttling retries of %d' % max_retries,
                             is_error=True,
                             item_id=item.pk
-                        ))
+                        )
 
                 # If a lookup error occurred, which indicates that the item has
                 # since become invalid in its provider's API, remove it from
                 # inventory and add a removal error message to the queue
                 except LookupError:
+                    breaker.record_success()
                     item_name = item.name
                     item_id = item.pk
                     item.delete()
 
-                    return queue.put(BatchJobResult(
+                    return BatchJobResult(
                         details='Removed invalid item: %s' % item_name,
                         is_error=True,
                         item_id=item_id
-                    ))
+                    )
 
                 # If the API call resulted in an error of any kind, capture the
                 # error's traceback and add it as the message to the queue
                 except Exception:
+                    breaker.record_failure()
                     error_buffer = StringIO()
                     print_exc(file=error_buffer)
-                    return queue.put(BatchJobResult(
+                    return BatchJobResult(
                         details=error_buffer.getvalue().strip(),
                         is_error=True,
                         item_id=item.pk
-                    ))
+                    )
 
                 # If the API call succeeded, add a success message to the queue
+                # that notes whether the item was left unchanged
                 else:
-                    return queue.put(BatchJobResult(
+                    breaker.record_success()
+                    return BatchJobResult(
                         is_error=False,
-                        item_id=item.pk
-                    ))
+                        is_skipped=was_changed is False,
+                        item_id=item.pk,
+                        stock_changes=stock_changes or None
+                    )
+
+        def drain_results():
+            total_count = self.items.count()
+            for item_id, result in _drain_queue(queue, in_flight, total_count):
+                yield result or _create_deadline_result(item_id, self.deadline)
 
         pool = ThreadPool(self.workers)
-        pool.map_async(refresh_item, self.items)
-        pool.close()
 
-        total_count = self.items.count()
-        processed_count = 0
+        try:
+            pool.map_async(refresh_item, self.items)
+            pool.close()
 
-        while True:
-            try:
-                yield queue.get(timeout=QUEUE_TIMEOUT)
-            except QueueEmpty:
-                pool.terminate()
-                raise BatchError('Job timed out after %d seconds' % QUEUE_TIMEOUT)
+            for result in _write_stock_changes_in_batches(drain_results(), self.stock_batch_size):
+                metrics.record_result(network_ids.get(result.item_id), result)
+                yield result
 
-            queue.task_done()
+        # Worker threads cannot be stopped, so any worker stuck on an item whose
+        # deadline passed is abandoned rather than joined
+        finally:
+            pool.terminate()
 
-            processed_count += 1
-            if processed_count == total_count:
-                break
 
-        pool.join()
-        queue.join()
+class StagedDetailsJob:
+    """A batch job that refreshes item details in separate fetch, parse and write stages.
+
+    Raw API payloads are fetched by a pool of threads, then parsed and validated
+    by a pool of processes, which keeps CPU-bound parsing from contending with
+    the fetch threads for the GIL.  The parsed details are applied to each item
+    by the thread consuming the job's results, which performs all writes.
+    """
+
+    def __init__(self, items, workers=DEFAULT_WORKERS, processes=None, max_retries=DEFAULT_MAX_RETRIES, parse_queue_size=DEFAULT_PARSE_QUEUE_SIZE, write_queue_size=DEFAULT_WRITE_QUEUE_SIZE, force=False, deadline=DEFAULT_ITEM_DEADLINE, circuit_breakers=None, stock_batch_size=DEFAULT_STOCK_BATCH_SIZE):
+        """Create a new staged job.
+
+        Args:
+            items (django.db.models.query.QuerySet): A queryset of affiliate items
+
+        Keyword Args:
+            circuit_breakers (chiton.rack.affiliates.circuits.CircuitBreakers): The circuit breakers for each network
+            deadline (float): The time allowed for fetching or parsing a single item, in seconds
+            force (bool): Whether to update items whose details are unchanged
+            max_retries (int): The maximum number of retries when handling throttled API requests
+            parse_queue_size (int): The maximum number of payloads awaiting parsing
+            processes (int): The number of parser processes to use
+            stock_batch_size (int): The number of items whose stock-record changes are written together
+            workers (int): The number of fetch threads to use
+            write_queue_size (int): The maximum number of items awaiting a write
+        """
+        self.items = items
+        self.circuit_breakers = circuit_breakers or CircuitBreakers()
+        self.deadline = deadline
+        self.force = force
+        self.max_retries = max_retries
+        self.metrics = JobMetrics()
+        self.parse_queue_size = parse_queue_size
+        self.processes = processes
+        self.stock_batch_size = stock_batch_size
+        self.workers = workers
+        self.write_queue_size = write_queue_size
+
+    def run(self):
+        """Run the staged job on the items.
+
+        Fetching an item's payload is subject to the same deadline and circuit
+        breakers as a batch job, and parsing the payload must also finish
+        within the deadline.  Metrics are collected in the same way as for a
+        batch job, and the stock-record changes of the items are written in
+        batches.
+
+        Yields:
+            chiton.rack.affiliates.bulk.BatchJobResult: The result of processing an item
+        """
+        max_retries = self.max_retries
+        retry_range = range(0, max_retries + 1)
+
+        write_queue = Queue(maxsize=self.write_queue_size)
+        parse_slots = BoundedSemaphore(self.parse_queue_size)
+        in_flight = InFlightItems(self.deadline)
+
+        metrics = JobMetrics()
+        network_ids = {}
+        self.metrics = metrics
+
+        def release_parse_slot(*args):
+            parse_slots.release()
+
+        def fetch_item(item):
+            network_ids[item.pk] = item.network_id
+
+            breaker = self.circuit_breakers[item.network_id]
+            if not breaker.allow_request():
+                return write_queue.put((item.pk, (item, None, CircuitOpenError())))
+
+            in_flight.start(item.pk, breaker=breaker)
+            with track_item_activity() as activity:
+                entry = fetch_payload(item, breaker)
+            metrics.record_activity(item.network_id, activity)
+
+            if entry and in_flight.finish(item.pk):
+                write_queue.put((item.pk, entry))
+
+        def fetch_payload(item, breaker):
+            for retry_index in retry_range:
+                try:
+                    color_names = get_affiliate_item_color_names(item)
+                    payload = request_affiliate_item_details_payload(item)
+
+                # Retry throttled requests using the same backoff as a batch
+                # job, passing the error on to the writer once the retries are
+                # exhausted or the item's deadline would be exceeded
+                except ThrottlingError as e:
+                    if retry_index < max_retries:
+                        delay = random.uniform(1, min(MAX_API_SLEEP, API_TIMEOUT * 2 ** retry_index))
+                        if delay >= in_flight.remaining(item.pk):
+                            metrics.record_throttle(item.network_id, is_retried=False)
+                            breaker.record_failure()
+                            return (item, None, DeadlineError())
+                        metrics.record_throttle(item.network_id, is_retried=True)
+                        sleep(delay)
+                    else:
+                        metrics.record_throttle(item.network_id, is_retried=False)
+                        breaker.record_failure()
+                        return (item, None, e)
+
+                # Lookup errors show that the API is responding, while any other
+                # error is treated as a failure of the API, with both passed on
+                # to the writer
+                except LookupError as e:
+                    breaker.record_success()
+                    return (item, None, e)
+
+                except Exception as e:
+                    breaker.record_failure()
+                    return (item, None, e)
+
+                # Hand the payload off to a parser process, waiting for a free
+                # slot so that the parse backlog stays bounded
+                else:
+                    breaker.record_success()
+                    parse_slots.acquire()
+                    parsed = parse_pool.apply_async(
+                        parse_affiliate_item_details,
+                        (item.network.slug, payload, color_names),
+                        callback=release_parse_slot,
+                        error_callback=release_parse_slot
+                    )
+                    return (item, parsed, None)
+
+        # Start the parser processes before any fetch threads exist, closing
+        # the database connection first so that no process inherits its socket
+        connection.close()
+        parse_pool = ProcessPool(self.processes)
+        fetch_pool = ThreadPool(self.workers)
+
+        def write_results():
+            total_count = self.items.count()
+            for item_id, entry in _drain_queue(write_queue, in_flight, total_count):
+                if entry is None:
+                    yield _create_deadline_result(item_id, self.deadline)
+                else:
+                    with track_item_activity() as activity:
+                        result = self._write_item(*entry)
+                    metrics.record_activity(network_ids.get(item_id), activity)
+                    yield result
+
+        try:
+            fetch_pool.map_async(fetch_item, self.items)
+            fetch_pool.close()
+
+            for result in _write_stock_changes_in_batches(write_results(), self.stock_batch_size):
+                metrics.record_result(network_ids.get(result.item_id), result)
+                yield result
+
+            parse_pool.close()
+        finally:
+            fetch_pool.terminate()
+            parse_pool.terminate()
+            parse_pool.join()
 
+    def _write_item(self, item, parsed, error):
+        """Apply an item's parsed details to the item.
 
-def bulk_update_affiliate_item_metadata(items, workers=DEFAULT_WORKERS, max_retries=DEFAULT_MAX_RETRIES):
+        Args:
+            item (chiton.rack.models.AffiliateItem): An affiliate item
+            parsed (multiprocessing.pool.AsyncResult): The pending result of parsing the item's payload
+            error (Exception): An error raised while fetching the item's payload
+
+        Returns:
+            chiton.rack.affiliates.bulk.BatchJobResult: The result of processing the item
+        """
+        stock_changes = [] if self.stock_batch_size else None
+
+        try:
+            if error:
+                raise error
+            details = parsed.get(timeout=self.deadline)
+            was_changed = apply_affiliate_item_details(item, details, force=self.force, stock_changes=stock_changes)
+
+        except CircuitOpenError:
+            return _create_circuit_open_result(item)
+
+        except DeadlineError:
+            return _create_deadline_result(item.pk, self.deadline)
+
+        except ThrottlingError:
+            return BatchJobResult(
+                details='Exceeded max throttling retries of %d' % self.max_retries,
+                is_error=True,
+                item_id=item.pk
+            )
+
+        except ProcessTimeout:
+            return BatchJobResult(
+                details='Parsing timed out after %g seconds' % self.deadline,
+                is_error=True,
+                item_id=item.pk
+            )
+
+        # Remove items that are no longer valid in their provider's API
+        except LookupError:
+            item_name = item.name
+            item_id = item.pk
+            item.delete()
+
+            return BatchJobResult(
+                details='Removed invalid item: %s' % item_name,
+                is_error=True,
+                item_id=item_id
+            )
+
+        except Exception:
+            error_buffer = StringIO()
+            print_exc(file=error_buffer)
+            return BatchJobResult(
+                details=error_buffer.getvalue().strip(),
+                is_error=True,
+                item_id=item.pk
+            )
+
+        else:
+            return BatchJobResult(
+                is_error=False,
+                is_skipped=not was_changed,
+                item_id=item.pk,
+                stock_changes=stock_changes or None
+            )
+
+
+def bulk_update_affiliate_item_metadata(items, workers=DEFAULT_WORKERS, max_retries=DEFAULT_MAX_RETRIES, deadline=DEFAULT_ITEM_DEADLINE):
     """Refresh the metadata for a batch of affiliate items.
 
     Args:
         items (django.db.models.query.QuerySet): A queryset of affiliate items
 
     Keyword Args:
+        deadline (float): The time allowed for processing a single item, in seconds
         max_retries (int): The maximum number of retries when handling throttled API requests
         workers (int): The number of workers to use to process the items
 
@@ -161,48 +566,329 @@ def bulk_update_affiliate_item_metadata(items, workers=DEFAULT_WORKERS, max_retr
         chiton.rack.affiliates.bulk.BatchJob: A batch job describing the updates
     """
     items = items.select_related('network')
-    return BatchJob(items, update_affiliate_item_metadata, workers=workers, max_retries=max_retries)
+    return BatchJob(items, update_affiliate_item_metadata, workers=workers, max_retries=max_retries, deadline=deadline)
 
 
-def bulk_update_affiliate_item_details(items, workers=DEFAULT_WORKERS, max_retries=DEFAULT_MAX_RETRIES):
+def bulk_update_affiliate_item_details(items, workers=DEFAULT_WORKERS, max_retries=DEFAULT_MAX_RETRIES, force=False, processes=None, parse_queue_size=DEFAULT_PARSE_QUEUE_SIZE, write_queue_size=DEFAULT_WRITE_QUEUE_SIZE, deadline=DEFAULT_ITEM_DEADLINE, stock_batch_size=DEFAULT_STOCK_BATCH_SIZE):
     """Refresh the details for a batch of affiliate items.
 
+    If a number of processes is given, the refresh is performed as a staged job,
+    with payloads fetched by the workers and parsed by the processes.  In either
+    case, the stock-record changes of the items are written in batches.
+
     Args:
         items (django.db.models.query.QuerySet): A queryset of affiliate items
 
     Keyword Args:
+        deadline (float): The time allowed for processing a single item, in seconds
+        force (bool): Whether to update items whose details are unchanged
         max_retries (int): The maximum number of retries when handling throttled API requests
+        parse_queue_size (int): The maximum number of payloads awaiting parsing in a staged job
+        processes (int): The number of parser processes to use for a staged job
+        stock_batch_size (int): The number of items whose stock-record changes are written together
         workers (int): The number of workers to use to process the items
+        write_queue_size (int): The maximum number of items awaiting a write in a staged job
 
     Returns:
         chiton.rack.affiliates.bulk.BatchJob: A batch job describing the updates
     """
     items = items.select_related('garment__basic', 'network')
-    return BatchJob(items, update_affiliate_item_details, workers=workers, max_retries=max_retries)
 
+    if processes:
+        return StagedDetailsJob(
+            items,
+            deadline=deadline,
+            force=force,
+            max_retries=max_retries,
+            parse_queue_size=parse_queue_size,
+            processes=processes,
+            stock_batch_size=stock_batch_size,
+            workers=workers,
+            write_queue_size=write_queue_size
+        )
 
-def prune_affiliate_items(items):
+    item_updater = update_affiliate_item_details
+    if force:
+        item_updater = partial(update_affiliate_item_details, force=True)
+
+    return BatchJob(items, item_updater, workers=workers, max_retries=max_retries, deadline=deadline, stock_batch_size=stock_batch_size)
+
+
+def prune_affiliate_items(items, workers=1, chunk_size=DEFAULT_PRUNE_CHUNK_SIZE):
     """Prune any affiliate items that report themselves as invalid.
 
+    The items are streamed from the database and checked in order, with the
+    checks optionally spread across multiple workers for affiliates whose
+    checks require network access.  Invalid items are deleted in bulk once
+    enough of them have been collected, and all cached queries involving
+    affiliate items are refreshed once after the last deletion.
+
     Args:
         items (django.db.models.query.QuerySet): A queryset of affiliate items
 
+    Keyword Args:
+        chunk_size (int): The number of invalid items to delete in a single transaction
+        workers (int): The number of workers to use to check the items
+
     Yields:
         list: The name of the item, its network name, and whether or not it was pruned
     """
     affiliates = {}
-    items = items.select_related('network')
+    affiliates_lock = Lock()
 
-    for item in items:
-        item_name = item.name
-        network_name = item.network.name
-        was_pruned = False
+    def check_item(item):
+        item_id, item_name, affiliate_url, network_name, network_slug = item
 
-        network_slug = item.network.slug
-        affiliate = affiliates.setdefault(network_slug, create_affiliate(slug=network_slug))
+        with affiliates_lock:
+            if network_slug not in affiliates:
+                affiliates[network_slug] = create_affiliate(slug=network_slug)
+            affiliate = affiliates[network_slug]
 
-        if not affiliate.is_url_valid(item.affiliate_url):
-            item.delete()
-            was_pruned = True
+        return item_id, item_name, network_name, not affiliate.is_url_valid(affiliate_url)
+
+    # Read the items on the current thread, which owns the database connection,
+    # and only hand their checks off to the workers
+    def check_items(pool):
+        rows = items.values_list('pk', 'name', 'affiliate_url', 'network__name', 'network__slug').iterator()
+        while True:
+            batch = list(islice(rows, chunk_size))
+            if not batch:
+                break
+            if pool:
+                yield from pool.imap(check_item, batch)
+            else:
+                yield from map(check_item, batch)
+
+    pool = ThreadPool(workers) if workers > 1 else None
+    checked = check_items(pool)
+
+    pruned_ids = []
+    deleted_count = 0
+
+    try:
+        for item_id, item_name, network_name, is_invalid in checked:
+            if is_invalid:
+                pruned_ids.append(item_id)
+
+            if len(pruned_ids) >= chunk_size:
+                deleted_count += _delete_affiliate_items(pruned_ids)
+                pruned_ids = []
+
+            yield item_name, network_name, is_invalid
+
+        if pruned_ids:
+            deleted_count += _delete_affiliate_items(pruned_ids)
+
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+        if deleted_count:
+            refresh_cached_queries(AffiliateItem, ItemImage, ItemImageDerivative, StockRecord)
+
+
+def _drain_queue(queue, in_flight, total_count):
+    """Consume the entries that a job's workers add to a queue.
+
+    While waiting on the queue, any items whose deadlines have passed are
+    cancelled.  The job is only aborted if no item is processed or cancelled
+    within the item deadline plus a margin.
+
+    Args:
+        queue (queue.Queue): A queue of item IDs and their entries
+        in_flight (chiton.rack.affiliates.bulk.InFlightItems): The items being processed
+        total_count (int): The total number of items in the job
+
+    Yields:
+        tuple: The ID of an item and its queued entry, or None if the item was cancelled
+
+    Raises:
+        chiton.rack.affiliates.exceptions.BatchError: If the job timed out
+    """
+    queue_timeout = in_flight.deadline + QUEUE_TIMEOUT_MARGIN
+    processed_count = 0
+    last_processed_at = monotonic()
+
+    while processed_count < total_count:
+        for item_id in in_flight.cancel_expired():
+            processed_count += 1
+            last_processed_at = monotonic()
+            yield item_id, None
+
+        if processed_count == total_count:
+            break
+
+        try:
+            item_id, entry = queue.get(timeout=DEADLINE_POLL_INTERVAL)
+        except QueueEmpty:
+            if monotonic() - last_processed_at >= queue_timeout:
+                raise BatchError('Job timed out after %g seconds' % queue_timeout)
+            continue
+
+        processed_count += 1
+        last_processed_at = monotonic()
+        yield item_id, entry
+
+
+def _create_circuit_open_result(item):
+    """Create the result for an item rejected by its network's circuit breaker.
+
+    Args:
+        item (chiton.rack.models.AffiliateItem): An affiliate item
+
+    Returns:
+        chiton.rack.affiliates.bulk.BatchJobResult: An error result for the item
+    """
+    return BatchJobResult(
+        details='Skipped while the API for network %d is failing' % item.network_id,
+        is_error=True,
+        item_id=item.pk
+    )
+
+
+def _create_deadline_result(item_id, deadline):
+    """Create the result for an item that exceeded its deadline.
 
-        yield item_name, network_name, was_pruned
+    Args:
+        item_id (int): The ID of an affiliate item
+        deadline (float): The time allowed for processing the item, in seconds
+
+    Returns:
+        chiton.rack.affiliates.bulk.BatchJobResult: An error result for the item
+    """
+    return BatchJobResult(
+        details='Cancelled after exceeding the deadline of %g seconds' % deadline,
+        is_error=True,
+        item_id=item_id
+    )
+
+
+def _write_stock_changes_in_batches(results, batch_size):
+    """Write the pending stock-record changes of job results in batches.
+
+    Results without pending stock changes are passed through immediately,
+    while the others are held until enough have accumulated, and are only
+    yielded once their stock changes have been written.  The changes of any
+    held results are still written if the job stops early.
+
+    Args:
+        results (iterator): An iterator of job results
+        batch_size (int): The number of results whose stock changes are written together
+
+    Yields:
+        chiton.rack.affiliates.bulk.BatchJobResult: The result of processing an item
+    """
+    pending = []
+
+    try:
+        for result in results:
+            if result.stock_changes is None:
+                yield result
+                continue
+
+            pending.append(result)
+            if len(pending) >= batch_size:
+                batch, pending = pending, []
+                yield from _write_stock_changes(batch)
+
+        batch, pending = pending, []
+        yield from _write_stock_changes(batch)
+
+    finally:
+        if pending:
+            _write_stock_changes(pending)
+
+
+def _write_stock_changes(results):
+    """Write the pending stock-record changes of a batch of job results.
+
+    The stock changes carry the deferred fingerprint of each item, which is
+    saved with its stock records.  If the changes cannot be written, each
+    result is replaced by an error and the details fingerprint of its item is
+    cleared, which ensures that the next refresh of the item writes its stock
+    records again.
+
+    Args:
+        results (list[chiton.rack.affiliates.bulk.BatchJobResult]): Results with pending stock changes
+
+    Returns:
+        list[chiton.rack.affiliates.bulk.BatchJobResult]: The final results
+    """
+    if not results:
+        return []
+
+    try:
+        apply_stock_record_changes([changes for result in results for changes in result.stock_changes])
+    except DatabaseError:
+        error_buffer = StringIO()
+        print_exc(file=error_buffer)
+        details = error_buffer.getvalue().strip()
+
+        item_ids = [result.item_id for result in results]
+        AffiliateItem.objects.filter(pk__in=item_ids).update(details_fingerprint='')
+
+        return [BatchJobResult(details=details, is_error=True, item_id=item_id) for item_id in item_ids]
+
+    for result in results:
+        result.stock_changes = None
+
+    return results
+
+
+def _delete_affiliate_items(item_ids):
+    """Delete affiliate items and their related records in a single transaction.
+
+    The deletions are performed directly in the database, which avoids loading
+    each item and sending model signals that would refresh cached queries once
+    per deleted record.  Since the database does not cascade these deletions,
+    the records of every model that cascades from an affiliate item are
+    deleted first.
+
+    Args:
+        item_ids (list[int]): The IDs of the affiliate items to delete
+
+    Returns:
+        int: The number of deleted affiliate items
+    """
+    placeholders = ', '.join(['%s'] * len(item_ids))
+    quote_name = connection.ops.quote_name
+
+    condition = '%s IN (%s)' % (quote_name(AffiliateItem._meta.pk.column), placeholders)
+    statements = _build_cascading_deletes(AffiliateItem, condition, quote_name)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement, item_ids)
+
+        return cursor.rowcount
+
+
+def _build_cascading_deletes(model, condition, quote_name):
+    """Build the statements that delete a model's records and their cascading relations.
+
+    Args:
+        model (django.db.models.Model): A model class
+        condition (str): The SQL condition selecting the records to delete
+        quote_name (function): A function that quotes a table or column name
+
+    Returns:
+        list[str]: The delete statements, with those for related records first
+    """
+    table = quote_name(model._meta.db_table)
+    statements = []
+
+    for relation in model._meta.related_objects:
+        if relation.on_delete is not models.CASCADE or relation.many_to_many:
+            continue
+
+        related_condition = '%s IN (SELECT %s FROM %s WHERE %s)' % (
+            quote_name(relation.field.column),
+            quote_name(relation.field.target_field.column),
+            table,
+            condition
+        )
+        statements += _build_cascading_deletes(relation.related_model, related_condition, quote_name)
+
+    statements.append('DELETE FROM %s WHERE %s' % (table, condition))
+    return statements
@@ -0,0 +1,109 @@
+from django.utils import timezone
+
+from chiton.rack.data import REFRESH_STATUSES
+from chiton.rack.models import RefreshCheckpoint, RefreshRun
+
+
+def start_refresh_run(kind):
+    """Start a new refresh run.
+
+    Args:
+        kind (str): The kind of refresh being performed
+
+    Returns:
+        chiton.rack.models.RefreshRun: The new run
+    """
+    return RefreshRun.objects.create(kind=kind)
+
+
+def find_resumable_refresh_run(kind):
+    """Find the most recent unfinished refresh run of a given kind.
+
+    Args:
+        kind (str): The kind of refresh being performed
+
+    Returns:
+        chiton.rack.models.RefreshRun: The unfinished run, or None if every run finished
+    """
+    return RefreshRun.objects.filter(kind=kind, finished_at__isnull=True).order_by('-started_at', '-pk').first()
+
+
+def finish_refresh_run(run):
+    """Mark a refresh run as finished, preventing it from being resumed.
+
+    Args:
+        run (chiton.rack.models.RefreshRun): A refresh run
+    """
+    run.finished_at = timezone.now()
+    run.save(update_fields=['finished_at'])
+
+
+def exclude_completed_items(items, run):
+    """Exclude any items that a refresh run has already processed.
+
+    Items whose refresh errored out are not considered complete, and will be
+    retried when the run is resumed.
+
+    Args:
+        items (django.db.models.query.QuerySet): A queryset of affiliate items
+        run (chiton.rack.models.RefreshRun): A refresh run
+
+    Returns:
+        django.db.models.query.QuerySet: The items that still need to be refreshed
+    """
+    completed = run.checkpoints.exclude(status=REFRESH_STATUSES['ERROR']).values('item_id')
+    return items.exclude(pk__in=completed)
+
+
+def exclude_recently_refreshed_items(items, kind, since):
+    """Exclude any items that a refresh of a given kind processed recently.
+
+    An item counts as refreshed when its latest successful checkpoint for the
+    kind was recorded at or after the cutoff, while items whose refreshes
+    errored out are not excluded.
+
+    Args:
+        items (django.db.models.query.QuerySet): A queryset of affiliate items
+        kind (str): The kind of refresh being performed
+        since (datetime.datetime): The earliest refresh that excludes an item
+
+    Returns:
+        django.db.models.query.QuerySet: The items that still need to be refreshed
+    """
+    refreshed = RefreshCheckpoint.objects.filter(
+        recorded_at__gte=since,
+        run__kind=kind
+    ).exclude(
+        status=REFRESH_STATUSES['ERROR']
+    ).values('item_id')
+
+    return items.exclude(pk__in=refreshed)
+
+
+def record_refresh_result(run, result):
+    """Durably record the result of refreshing a single item.
+
+    Args:
+        run (chiton.rack.models.RefreshRun): A refresh run
+        result (chiton.rack.affiliates.bulk.BatchJobResult): The result of refreshing an item
+
+    Returns:
+        chiton.rack.models.RefreshCheckpoint: The checkpoint for the item
+    """
+    if result.is_error:
+        status = REFRESH_STATUSES['ERROR']
+    elif result.is_skipped:
+        status = REFRESH_STATUSES['UNCHANGED']
+    else:
+        status = REFRESH_STATUSES['CHANGED']
+
+    checkpoint, created = RefreshCheckpoint.objects.update_or_create(
+        run=run,
+        item_id=result.item_id,
+        defaults={
+            'details': result.details or '',
+            'status': status
+        }
+    )
+
+    return checkpoint
@@ -0,0 +1,132 @@
+from threading import Lock
+from time import monotonic
+
+
+# The states of a circuit breaker
+CLOSED = 'closed'
+HALF_OPEN = 'half-open'
+OPEN = 'open'
+
+# The default number of consecutive failures after which a circuit opens
+DEFAULT_FAILURE_THRESHOLD = 5
+
+# The default time after which an open circuit allows a probe request, in seconds
+DEFAULT_RESET_TIMEOUT = 30
+
+
+class CircuitBreaker:
+    """A thread-safe circuit breaker for requests made to a single API.
+
+    The circuit starts out closed, allowing all requests.  Once a number of
+    consecutive requests fail, the circuit opens and rejects requests until its
+    reset timeout elapses, at which point it becomes half-open and allows a
+    single probe request.  A successful probe closes the circuit, while a failed
+    probe opens it again.
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT, clock=monotonic):
+        """Create a new circuit breaker.
+
+        Keyword Args:
+            clock (function): A function that returns the current time in seconds
+            failure_threshold (int): The number of consecutive failures that opens the circuit
+            reset_timeout (float): The time after which an open circuit allows a probe, in seconds
+        """
+        self.clock = clock
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._failures = 0
+        self._lock = Lock()
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        """The current state of the circuit.
+
+        Returns:
+            str: The name of the state
+        """
+        with self._lock:
+            return self._get_state()
+
+    def allow_request(self):
+        """Determine whether a request may be made.
+
+        When the circuit is half-open, only the first caller is allowed to make
+        a request, which acts as a probe of the API's recovery.
+
+        Returns:
+            bool: Whether the request may be made
+        """
+        with self._lock:
+            state = self._get_state()
+
+            if state == CLOSED:
+                return True
+            elif state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            else:
+                return False
+
+    def record_success(self):
+        """Record a successful request, closing the circuit."""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        """Record a failed request, opening the circuit if needed."""
+        with self._lock:
+            self._failures += 1
+
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = self.clock()
+
+            self._probing = False
+
+    def _get_state(self):
+        """Determine the current state of the circuit.
+
+        This must be called while holding the lock.
+
+        Returns:
+            str: The name of the state
+        """
+        if self._opened_at is None:
+            return CLOSED
+        elif self.clock() - self._opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        else:
+            return OPEN
+
+
+class CircuitBreakers:
+    """A thread-safe collection of circuit breakers keyed by affiliate network."""
+
+    def __init__(self, **kwargs):
+        """Create a new collection of circuit breakers.
+
+        Keyword Args:
+            **kwargs: Keyword args used to create each circuit breaker
+        """
+        self._breakers = {}
+        self._kwargs = kwargs
+        self._lock = Lock()
+
+    def __getitem__(self, network_id):
+        """Get the circuit breaker for a network, creating it if needed.
+
+        Args:
+            network_id (int): The ID of an affiliate network
+
+        Returns:
+            chiton.rack.affiliates.circuits.CircuitBreaker: The network's circuit breaker
+        """
+        with self._lock:
+            if network_id not in self._breakers:
+                self._breakers[network_id] = CircuitBreaker(**self._kwargs)
+            return self._breakers[network_id]
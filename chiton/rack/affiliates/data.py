@@ -1,11 +1,19 @@
+import hashlib
+import json
 import os
 
-from django.core.files.base import ContentFile
-import requests
+from django.db import transaction
 
-from chiton.closet.models import StandardSize
+from chiton.closet.models import CanonicalSize, StandardSize
+from chiton.core.queries import cache_query
 from chiton.rack.affiliates import create_affiliate
-from chiton.rack.models import ItemImage, StockRecord
+from chiton.rack.affiliates.images import find_known_images, ingest_images
+from chiton.rack.affiliates.metrics import measure_request, measure_write
+from chiton.rack.models import AffiliateItem, ItemImage, StockRecord
+
+
+# The fields of an affiliate item that are only saved with its stock records
+STOCK_STATE_FIELDS = ('availability_mask', 'details_fingerprint', 'has_detailed_stock')
 
 
 def update_affiliate_item_metadata(item):
@@ -15,109 +23,268 @@ def update_affiliate_item_metadata(item):
         item (chiton.rack.models.AffiliateItem): An affiliate item
 
     Returns:
-        chiton.rack.models.AffiliateItem: The updated affiliate item
+        bool: Whether the item's metadata changed
 
     Raises:
         chiton.rack.exceptions.LookupError: If the item's information cannot be updated
     """
     affiliate = create_affiliate(slug=item.network.slug)
 
-    overview = affiliate.request_overview(item.url)
+    with measure_request():
+        overview = affiliate.request_overview(item.url)
+
+    if overview['guid'] == item.guid and overview['name'] == item.name:
+        return False
+
     item.guid = overview['guid']
     item.name = overview['name']
 
-    item.save()
-    return item
+    with measure_write():
+        item.save()
+    return True
 
 
-def update_affiliate_item_details(item, images=[]):
+def update_affiliate_item_details(item, images=[], force=False, stock_changes=None):
     """Update the details for an affiliate item from its network's API.
 
     This sends a details query to the API of the item's affiliate network, and
-    updates the item record with the response data.  If the `full` keyword arg
-    is true, this will first re-fetch the item's GUID from its URL, and then
-    issue the details query.
+    updates the item record with the response data.
 
     Args:
         item (chiton.rack.models.AffiliateItem): An affiliate item
 
     Keyword Args:
+        force (bool): Whether to update the item even if its details are unchanged
         images (list): Custom image URLs to use
+        stock_changes (list): A list to which the item's stock-record changes are added instead of being written
 
     Returns:
-        chiton.rack.models.AffiliateItem: The updated affiliate item
+        bool: Whether the item's details changed
 
     Raises:
         chiton.rack.exceptions.LookupError: If the item's information cannot be updated
     """
     affiliate = create_affiliate(slug=item.network.slug)
+    color_names = get_affiliate_item_color_names(item)
+
+    with measure_request():
+        details = affiliate.request_details(item.guid, colors=color_names)
+
+    return apply_affiliate_item_details(item, details, images=images, force=force, stock_changes=stock_changes)
+
+
+def request_affiliate_item_details_payload(item):
+    """Request the raw details payload for an affiliate item from its network's API.
+
+    Args:
+        item (chiton.rack.models.AffiliateItem): An affiliate item
+
+    Returns:
+        object: A picklable payload that can be given to `parse_affiliate_item_details`
+
+    Raises:
+        chiton.rack.exceptions.LookupError: If the item's payload cannot be fetched
+    """
+    affiliate = create_affiliate(slug=item.network.slug)
+
+    with measure_request():
+        return affiliate.request_details_payload(item.guid)
+
+
+def parse_affiliate_item_details(network_slug, payload, color_names):
+    """Parse and validate the details for an affiliate item from a raw payload.
+
+    This does not access the database, and only deals in plain, picklable
+    values, which allows it to be run in a separate process.
+
+    Args:
+        network_slug (str): The slug of the item's affiliate network
+        payload (object): The item's raw details payload
+        color_names (list[str]): The names of the item's colors, in order of preference
+
+    Returns:
+        chiton.rack.affiliates.responses.ItemDetails: The item's details
+
+    Raises:
+        chiton.rack.exceptions.LookupError: If the item's details are invalid
+    """
+    affiliate = create_affiliate(slug=network_slug)
+    return affiliate.parse_details_payload(payload, colors=color_names)
+
+
+def get_affiliate_item_color_names(item):
+    """Get the names of the colors to use when requesting an item's details.
+
+    The primary color of the item's basic is placed at the head of the list,
+    followed by the basic's secondary colors.
+
+    Args:
+        item (chiton.rack.models.AffiliateItem): An affiliate item
+
+    Returns:
+        list[str]: The names of the item's colors
+    """
     basic = item.garment.basic
 
-    # Place the primary color at the head of the colors list for fetching
-    # details, followed by the secondary colors
     color_names = []
     primary_color_name = getattr(basic.primary_color, 'name', None)
     if primary_color_name:
         color_names.append(primary_color_name)
     color_names += basic.secondary_colors.values_list('name', flat=True)
 
-    details = affiliate.request_details(item.guid, colors=color_names)
+    return color_names
 
-    item.name = details['name']
-    item.price = details['price']
-    item.retailer = details['retailer']
-    item.affiliate_url = details['url']
-    item.has_multiple_colors = len(details['colors']) > 1
-    _update_item_images(item, images or details['images'])
-    _update_stock_records(item, details['availability'])
 
-    item.save()
-    return item
+def apply_affiliate_item_details(item, details, images=[], force=False, stock_changes=None):
+    """Update an affiliate item using details returned by its network's API.
 
+    A fingerprint of the normalized details is stored on the item, and if a
+    later set of details produces the same fingerprint, all writes are skipped
+    unless the `force` keyword arg is true.
 
-def _update_item_images(item, image_urls):
-    """Update the image associated with an affiliate item.
+    If a list of stock changes is given, the item's stock-record changes are
+    added to it so that the caller can write them with those of other items.
+    The item's fingerprint and availability are then only saved when those
+    changes are written, and its stored fingerprint is cleared until then, so
+    that an item whose stock records were never written is always refreshed.
 
     Args:
         item (chiton.rack.models.AffiliateItem): An affiliate item
-        image_urls (list[str]): The URLs of all item images
+        details (chiton.rack.affiliates.responses.ItemDetails): The item's details
+
+    Keyword Args:
+        force (bool): Whether to update the item even if its details are unchanged
+        images (list): Custom image URLs to use
+        stock_changes (list): A list to which the item's stock-record changes are added instead of being written
+
+    Returns:
+        bool: Whether the item's details changed
     """
-    all_images = [image for image in item.images.all()]
-    missing_images = [image for image in all_images if not os.path.isfile(image.file.path)]
-    existing_images = [image for image in all_images if image not in missing_images]
+    image_urls = images or details['images']
 
-    for image_url in image_urls:
-        existing_matches = [ei for ei in existing_images if ei.source_url == image_url]
-        if not existing_matches:
-            item_image = ItemImage(item=item, source_url=image_url)
+    fingerprint = fingerprint_item_details(item, details, image_urls)
+    if fingerprint == item.details_fingerprint and not force:
+        return False
 
-            image_path = os.path.join(str(item.pk), image_url.split('/')[-1])
-            item_image.file.save(image_path, _download_image(image_url))
+    item.name = details['name']
+    item.price = details['price']
+    item.retailer = details['retailer']
+    item.affiliate_url = details['url']
+    item.has_multiple_colors = len(details['colors']) > 1
+    _update_item_images(item, image_urls)
 
-            item_image.save()
+    with measure_write():
+        _update_stock_records(item, details['availability'], stock_changes=stock_changes)
+        if stock_changes is None:
+            item.details_fingerprint = fingerprint
+            item.save()
+        else:
+            stock_changes[-1]['item_state'] = {
+                'availability_mask': item.availability_mask,
+                'details_fingerprint': fingerprint,
+                'has_detailed_stock': item.has_detailed_stock,
+                'pk': item.pk
+            }
+            item.details_fingerprint = ''
+            item.save(update_fields=_get_item_fields_without_stock_state())
+            item.details_fingerprint = fingerprint
 
-    prune_images = [image for image in existing_images if image.source_url not in image_urls]
-    for image in prune_images + missing_images:
-        image.delete()
+    return True
 
 
-def _download_image(url):
-    """Download an item image.
+def fingerprint_item_details(item, details, image_urls):
+    """Create a fingerprint of the details used to update an affiliate item.
 
-    This saves to the image to the media directory, then returns a file
-    reference to it that can be associated with an ItemImage model.
+    The fingerprint covers the normalized API details as well as the local
+    data that determines how those details are applied to the item, so that a
+    change to the item's garment size types or to the known standard sizes
+    will also produce a new fingerprint.
 
     Args:
-        url (str): The URL of the image
+        item (chiton.rack.models.AffiliateItem): An affiliate item
+        details (chiton.rack.affiliates.responses.ItemDetails): The item's details
+        image_urls (list[str]): The URLs of the images to use for the item
 
     Returns:
-        django.core.files.ContentFile: The image's contents
+        str: A hex digest of the details
     """
-    request = requests.get(url)
-    return ContentFile(request.content)
+    garment = item.garment
+    availability = details['availability']
+
+    if not isinstance(availability, bool):
+        availability = sorted([
+            [a['size'], a['is_regular'], a['is_petite'], a['is_tall'], a['is_plus_sized']]
+            for a in availability
+        ])
+
+    normalized = {
+        'availability': availability,
+        'colors': sorted(details['colors']),
+        'garment_sizes': [
+            garment.is_regular_sized,
+            garment.is_petite_sized,
+            garment.is_tall_sized,
+            garment.is_plus_sized
+        ],
+        'images': list(image_urls),
+        'name': details['name'],
+        'price': str(details['price']),
+        'retailer': details['retailer'],
+        'sizes': _get_standard_size_index()['pks'],
+        'url': details['url']
+    }
+
+    encoded = json.dumps(normalized, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def _update_item_images(item, image_urls):
+    """Update the image associated with an affiliate item.
 
+    Images are ingested as a separate stage that downloads any new images
+    concurrently, and stores their files by content hash, allowing a single
+    file to be shared by the images of many items.
+
+    Args:
+        item (chiton.rack.models.AffiliateItem): An affiliate item
+        image_urls (list[str]): The URLs of all item images
+    """
+    current_images = {}
+    stale_images = []
 
-def _update_stock_records(item, availability):
+    for image in item.images.all():
+        if image.source_url in current_images or not os.path.isfile(image.file.path):
+            stale_images.append(image)
+        else:
+            current_images[image.source_url] = image
+
+    new_urls = []
+    for image_url in image_urls:
+        if image_url not in current_images and image_url not in new_urls:
+            new_urls.append(image_url)
+
+    ingested = ingest_images(new_urls, known_images=find_known_images(new_urls))
+    stale_images += [image for url, image in current_images.items() if url not in image_urls]
+
+    with measure_write():
+        for image_url in new_urls:
+            image = ingested[image_url]
+            ItemImage.objects.create(
+                content_hash=image['content_hash'],
+                file=image['file'],
+                height=image['height'],
+                item=item,
+                source_etag=image['etag'],
+                source_last_modified=image['last_modified'],
+                source_url=image_url,
+                width=image['width']
+            )
+
+        if stale_images:
+            ItemImage.objects.filter(pk__in=[image.pk for image in stale_images]).delete()
+
+
+def _update_stock_records(item, availability, stock_changes=None):
     """Update an item's stock records.
 
     This looks at the sizes of the given stock records and maps them to known
@@ -137,18 +304,47 @@ def _update_stock_records(item, availability):
     information is returned, any reported availability not in a regular size
     will be ignored.
 
+    The item's detailed-stock flag and availability mask are updated in place,
+    but the item itself is not saved.
+
     Args:
         item (chiton.rack.models.AffiliateItem): An affiliate item
         availability (bool,list): Information on the item's availability
+
+    Keyword Args:
+        stock_changes (list): A list to which the stock-record changes are added instead of being written
     """
-    all_sizes = StandardSize.objects.all()
-    existing_records = item.stock_records.all().select_related('size__canonical')
+    changes = calculate_stock_record_changes(item, availability)
+    if stock_changes is None:
+        apply_stock_record_changes([changes])
+    else:
+        stock_changes.append(changes)
+
+    item.availability_mask = changes['availability_mask']
+    item.has_detailed_stock = changes['has_details']
+
+
+def calculate_stock_record_changes(item, availability):
+    """Determine the stock-record writes needed to reflect an item's availability.
+
+    This compares the availability computed for every standard size against the
+    item's existing stock records, and only schedules writes for records that
+    are missing or whose availability differs from the stored value.
+
+    Args:
+        item (chiton.rack.models.AffiliateItem): An affiliate item
+        availability (bool,list): Information on the item's availability
+
+    Returns:
+        dict: The records to create, the IDs of records to mark as available or
+              unavailable, the availability mask of the item, and whether the
+              availability was detailed
+    """
+    size_index = _get_standard_size_index()
     has_details = False
 
     # Default to marking all known sizes as out of stock
-    available_sizes = {}
-    for size in all_sizes:
-        available_sizes[size] = False
+    available_sizes = dict.fromkeys(size_index['pks'], False)
 
     # If global or specific availability was provided, mark in-stock items
     if availability:
@@ -160,31 +356,27 @@ def _update_stock_records(item, availability):
             has_details = len(availability) > 0
 
         # Get a subset of sizes that map to the size types of the garments by
-        # comparing the type signatures
-        garment_signature = {
-            'is_regular': garment.is_regular_sized,
-            'is_petite': garment.is_petite_sized,
-            'is_tall': garment.is_tall_sized,
-            'is_plus_sized': garment.is_plus_sized
-        }
-        type_sizes = []
-        for size in all_sizes:
-            for availability_field, garment_value in garment_signature.items():
-                if garment_value and getattr(size, availability_field):
-                    type_sizes.append(size)
-                    break
+        # comparing the variant signatures of each size and the garment
+        garment_signature = (
+            garment.is_regular_sized,
+            garment.is_petite_sized,
+            garment.is_tall_sized,
+            garment.is_plus_sized
+        )
+        type_sizes = set()
+        for variant, sizes in size_index['by_variant'].items():
+            if any(g and v for g, v in zip(garment_signature, variant)):
+                type_sizes.update(size['pk'] for size in sizes)
 
         # Map reported availability to unambiguous standard sizes
         reported_sizes = set()
         if has_records:
             for record in availability:
+                variant = (record['is_regular'], record['is_petite'], record['is_tall'], record['is_plus_sized'])
                 matches = [
-                    size for size in type_sizes
-                    if record['is_regular'] == size.is_regular
-                    and record['is_petite'] == size.is_petite
-                    and record['is_tall'] == size.is_tall
-                    and record['is_plus_sized'] == size.is_plus_sized
-                    and size.canonical.range_lower <= record['size'] <= size.canonical.range_upper
+                    size['pk'] for size in size_index['by_variant'].get(variant, [])
+                    if size['pk'] in type_sizes
+                    and size['range_lower'] <= record['size'] <= size['range_upper']
                 ]
                 if len(matches) == 1:
                     reported_sizes.add(matches[0])
@@ -195,31 +387,118 @@ def _update_stock_records(item, availability):
             has_records = False
 
         # Update the availability map with the computed values
-        for size in type_sizes:
+        for size_pk in type_sizes:
             if has_records:
-                available_sizes[size] = size in reported_sizes
+                available_sizes[size_pk] = size_pk in reported_sizes
             else:
-                available_sizes[size] = True
-
-    # Create a new stock record for the item or update an existing record
-    for size in all_sizes:
-        current_record = None
-        for existing_record in existing_records:
-            if existing_record.size == size:
-                current_record = existing_record
-                break
-
-        if current_record:
-            current_record.is_available = available_sizes[size]
-            current_record.save()
+                available_sizes[size_pk] = True
+
+    # Diff the computed availability against the stored records, scheduling
+    # writes only for missing records or records whose availability changed
+    existing_records = {}
+    for record_pk, size_pk, is_available in item.stock_records.values_list('pk', 'size_id', 'is_available'):
+        existing_records[size_pk] = (record_pk, is_available)
+
+    changes = {
+        'availability_mask': 0,
+        'available': [],
+        'create': [],
+        'has_details': has_details,
+        'unavailable': []
+    }
+
+    for size_pk, is_available in available_sizes.items():
+        if is_available:
+            changes['availability_mask'] |= 1 << size_index['ordinals'][size_pk]
+
+        try:
+            record_pk, was_available = existing_records[size_pk]
+        except KeyError:
+            changes['create'].append(StockRecord(item=item, size_id=size_pk, is_available=is_available))
         else:
-            StockRecord.objects.create(
-                item=item,
-                size=size,
-                is_available=available_sizes[size]
-            )
+            if is_available is not was_available:
+                changes['available' if is_available else 'unavailable'].append(record_pk)
 
-    # If the item's stock-detail state has changed, update it
-    if has_details is not item.has_detailed_stock:
-        item.has_detailed_stock = has_details
-        item.save()
+    return changes
+
+
+def apply_stock_record_changes(all_changes):
+    """Persist a batch of stock-record changes.
+
+    The changes for any number of items are merged, and are then written using
+    at most one insert and two updates.  Any deferred fingerprint and
+    availability of an item are saved in the same transaction.
+
+    Args:
+        all_changes (list[dict]): Stock-record changes for one or more items
+    """
+    to_create = []
+    to_mark_available = []
+    to_mark_unavailable = []
+
+    for changes in all_changes:
+        to_create += changes['create']
+        to_mark_available += changes['available']
+        to_mark_unavailable += changes['unavailable']
+
+    with transaction.atomic():
+        if to_mark_available:
+            StockRecord.objects.filter(pk__in=to_mark_available).update(is_available=True)
+        if to_mark_unavailable:
+            StockRecord.objects.filter(pk__in=to_mark_unavailable).update(is_available=False)
+        if to_create:
+            StockRecord.objects.bulk_create(to_create)
+
+        for changes in all_changes:
+            item_state = changes.get('item_state')
+            if item_state:
+                AffiliateItem.objects.filter(pk=item_state['pk']).update(**{
+                    field: item_state[field]
+                    for field in STOCK_STATE_FIELDS
+                })
+
+
+def _get_item_fields_without_stock_state():
+    """Get the names of the affiliate-item fields that are saved before its stock records.
+
+    Returns:
+        list[str]: The names of all non-key item fields outside of its stock state
+    """
+    return [
+        field.name for field in AffiliateItem._meta.concrete_fields
+        if not field.primary_key and field.name not in STOCK_STATE_FIELDS
+    ]
+
+
+@cache_query(CanonicalSize, StandardSize)
+def _get_standard_size_index():
+    """Return a lookup of standard-size data keyed by variant flags.
+
+    Returns:
+        dict: The primary keys of all sizes, the ordinal of each size keyed by
+              its primary key, and each size's primary key and numeric range
+              grouped by a tuple of its variant flags
+    """
+    index = {
+        'by_variant': {},
+        'ordinals': {},
+        'pks': []
+    }
+
+    sizes = StandardSize.objects.all().values(
+        'pk', 'ordinal', 'is_regular', 'is_petite', 'is_tall', 'is_plus_sized',
+        'canonical__range_lower', 'canonical__range_upper'
+    )
+
+    for size in sizes:
+        variant = (size['is_regular'], size['is_petite'], size['is_tall'], size['is_plus_sized'])
+        index['ordinals'][size['pk']] = size['ordinal']
+        index['pks'].append(size['pk'])
+        index['by_variant'].setdefault(variant, [])
+        index['by_variant'][variant].append({
+            'pk': size['pk'],
+            'range_lower': size['canonical__range_lower'],
+            'range_upper': size['canonical__range_upper']
+        })
+
+    return index
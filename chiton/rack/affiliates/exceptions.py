@@ -12,3 +12,11 @@ class ThrottlingError(Exception):
 
 class BatchError(Exception):
     """An error raised when a batch of jobs fails."""
+
+
+class CircuitOpenError(Exception):
+    """An internal error raised when a network's circuit breaker rejects a request."""
+
+
+class DeadlineError(Exception):
+    """An internal error raised when an item cannot be processed within its deadline."""
@@ -0,0 +1,235 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import mimetypes
+import os
+import tempfile
+from threading import Lock
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from PIL import Image
+import requests
+
+from chiton.rack.affiliates.metrics import bind_item_activity, record_download
+from chiton.rack.models import ItemImage
+
+
+# The number of concurrent image downloads
+DOWNLOAD_WORKERS = 4
+
+# The size of each chunk streamed to disk, in bytes
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# The timeout for a single image request, in seconds
+DOWNLOAD_TIMEOUT = 30
+
+# The directory in which content-addressed images are stored
+IMAGES_DIR = 'products'
+
+# The fallback extension for images without a recognizable type
+DEFAULT_EXTENSION = '.jpg'
+
+# The shared pool used for downloads, and a record of in-flight downloads by URL
+_download_pool = None
+_downloads = {}
+_downloads_lock = Lock()
+
+# A lock that serializes writes of content-addressed files
+_storage_lock = Lock()
+
+
+def ingest_images(image_urls, known_images={}):
+    """Download images concurrently and store them by their content hash.
+
+    Each URL is downloaded by a shared pool of workers, with concurrent requests
+    for the same URL coalesced into a single download.  If a known image is
+    provided for a URL and its file still exists, a conditional request is made
+    using the stored validators, and the known file is reused if the remote
+    image is unchanged.  Images with identical content are stored only once.
+
+    Args:
+        image_urls (list[str]): The URLs of the images to ingest
+
+    Keyword Args:
+        known_images (dict[str, dict]): Previously ingested images keyed by URL
+
+    Returns:
+        dict[str, dict]: Information on each ingested image, keyed by URL
+
+    Raises:
+        requests.exceptions.RequestException: If an image could not be downloaded
+    """
+    futures = {}
+    for image_url in image_urls:
+        futures[image_url] = _submit_download(image_url, known_images.get(image_url))
+
+    return dict([(image_url, future.result()) for image_url, future in futures.items()])
+
+
+def find_known_images(image_urls):
+    """Find the most recent ingested image for each of a list of URLs.
+
+    Args:
+        image_urls (list[str]): The URLs of images
+
+    Returns:
+        dict[str, dict]: Information on each known image, keyed by URL
+    """
+    known = {}
+    images = (
+        ItemImage.objects
+        .filter(source_url__in=image_urls)
+        .exclude(content_hash='')
+        .order_by('pk')
+        .values('content_hash', 'file', 'height', 'source_etag', 'source_last_modified', 'source_url', 'width')
+    )
+
+    for image in images:
+        known[image['source_url']] = {
+            'content_hash': image['content_hash'],
+            'etag': image['source_etag'],
+            'file': image['file'],
+            'height': image['height'],
+            'last_modified': image['source_last_modified'],
+            'width': image['width']
+        }
+
+    return known
+
+
+def _submit_download(image_url, known_image):
+    """Submit an image download to the shared pool.
+
+    Args:
+        image_url (str): The URL of an image
+        known_image (dict): Information on a previous ingestion of the image
+
+    Returns:
+        concurrent.futures.Future: A future that resolves to the ingested image
+    """
+    global _download_pool
+
+    with _downloads_lock:
+        if _download_pool is None:
+            _download_pool = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS)
+
+        future = _downloads.get(image_url)
+        is_new = future is None
+        if is_new:
+            future = _download_pool.submit(bind_item_activity(_download_image), image_url, known_image)
+            _downloads[image_url] = future
+
+    # Register the cleanup outside of the lock, since the callback runs on this
+    # thread if the download has already finished
+    if is_new:
+        future.add_done_callback(lambda f: _forget_download(image_url, f))
+
+    return future
+
+
+def _forget_download(image_url, future):
+    """Remove a completed download from the in-flight record."""
+    with _downloads_lock:
+        if _downloads.get(image_url) is future:
+            del _downloads[image_url]
+
+
+def _download_image(image_url, known_image=None):
+    """Download an image and store it using its content hash.
+
+    The response is streamed to a temporary file while being hashed, and is
+    then moved into storage unless a file with the same hash already exists.
+
+    Args:
+        image_url (str): The URL of an image
+
+    Keyword Args:
+        known_image (dict): Information on a previous ingestion of the image
+
+    Returns:
+        dict: Information on the ingested image
+    """
+    headers = {}
+    if known_image and default_storage.exists(known_image['file']):
+        if known_image['etag']:
+            headers['If-None-Match'] = known_image['etag']
+        if known_image['last_modified']:
+            headers['If-Modified-Since'] = known_image['last_modified']
+
+    response = requests.get(image_url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT)
+    temp_path = None
+
+    # Remove any temporary file whether or not the image is stored, which
+    # covers a stream that fails partway through or a file that is not an image
+    try:
+        if response.status_code == 304 and headers:
+            return dict(known_image)
+        response.raise_for_status()
+
+        hasher = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+            temp_path = temp_file.name
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                hasher.update(chunk)
+                temp_file.write(chunk)
+                record_download(len(chunk))
+
+        with open(temp_path, 'rb') as image_file:
+            width, height = Image.open(image_file).size
+
+        content_hash = hasher.hexdigest()
+        extension = _guess_extension(image_url, response.headers.get('Content-Type'))
+        file_name = _store_image(temp_path, content_hash, extension)
+    finally:
+        response.close()
+        if temp_path:
+            os.remove(temp_path)
+
+    return {
+        'content_hash': content_hash,
+        'etag': response.headers.get('ETag', ''),
+        'file': file_name,
+        'height': height,
+        'last_modified': response.headers.get('Last-Modified', ''),
+        'width': width
+    }
+
+
+def _store_image(path, content_hash, extension):
+    """Move a downloaded image into content-addressed storage.
+
+    Args:
+        path (str): The path to the downloaded file
+        content_hash (str): The hex digest of the file's content
+        extension (str): The file extension to use
+
+    Returns:
+        str: The name of the stored file
+    """
+    file_name = os.path.join(IMAGES_DIR, content_hash[0:2], content_hash[2:4], '%s%s' % (content_hash, extension))
+
+    with _storage_lock:
+        if not default_storage.exists(file_name):
+            with open(path, 'rb') as image_file:
+                file_name = default_storage.save(file_name, File(image_file))
+
+    return file_name
+
+
+def _guess_extension(image_url, content_type):
+    """Guess the extension to use for an image.
+
+    Args:
+        image_url (str): The URL of the image
+        content_type (str): The image's reported content type
+
+    Returns:
+        str: A file extension, including the leading period
+    """
+    url_path = image_url.split('?')[0].split('#')[0]
+    extension = os.path.splitext(url_path)[1].lower()
+
+    if not extension and content_type:
+        extension = mimetypes.guess_extension(content_type.split(';')[0].strip()) or ''
+
+    return extension or DEFAULT_EXTENSION
@@ -0,0 +1,203 @@
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from chiton.rack.affiliates.data import update_affiliate_item_details
+from chiton.rack.affiliates.exceptions import LookupError
+from chiton.rack.data import REFRESH_JOB_STATUSES
+from chiton.rack.models import RefreshJob
+
+
+# The number of seconds after which a running job is assumed to be abandoned
+DEFAULT_STALE_AFTER = 60 * 15
+
+# The attribute of an affiliate item that holds its prefetched latest refresh job
+LATEST_REFRESH_JOBS_ATTR = 'latest_refresh_jobs'
+
+
+def enqueue_item_refresh(item, images=[]):
+    """Queue a refresh of an affiliate item's details.
+
+    If the item already has a pending job that would perform the same refresh,
+    that job is returned instead of queueing a duplicate.  Duplicates are
+    prevented by a unique index on the pending jobs of each item, so a job
+    queued by a concurrent request is returned instead of a new one.
+
+    Args:
+        item (chiton.rack.models.AffiliateItem): An affiliate item
+
+    Keyword Args:
+        images (list): Custom image URLs to use
+
+    Returns:
+        chiton.rack.models.RefreshJob: The pending job for the item
+    """
+    encoded_images = '\n'.join(images)
+
+    pending = RefreshJob.objects.filter(
+        item=item,
+        images=encoded_images,
+        status=REFRESH_JOB_STATUSES['PENDING']
+    )
+
+    while True:
+        job = pending.first()
+        if job:
+            return job
+
+        try:
+            with transaction.atomic():
+                return RefreshJob.objects.create(item=item, images=encoded_images)
+        except IntegrityError:
+            pass
+
+
+def claim_refresh_job():
+    """Claim the oldest pending refresh job for processing.
+
+    A job is claimed by conditionally marking it as running, which ensures
+    that no two workers can claim the same job.
+
+    Returns:
+        chiton.rack.models.RefreshJob: The claimed job, or None if no jobs are pending
+    """
+    pending = RefreshJob.objects.filter(status=REFRESH_JOB_STATUSES['PENDING'])
+
+    while True:
+        job = pending.order_by('created_at', 'pk').first()
+        if not job:
+            return None
+
+        started_at = timezone.now()
+        claimed = pending.filter(pk=job.pk).update(status=REFRESH_JOB_STATUSES['RUNNING'], started_at=started_at)
+
+        if claimed:
+            job.status = REFRESH_JOB_STATUSES['RUNNING']
+            job.started_at = started_at
+            return job
+
+
+def run_refresh_job(job):
+    """Refresh an affiliate item's details using a claimed job.
+
+    Args:
+        job (chiton.rack.models.RefreshJob): A claimed refresh job
+
+    Returns:
+        chiton.rack.models.RefreshJob: The finished job
+    """
+    try:
+        update_affiliate_item_details(job.item, images=job.image_urls)
+    except LookupError as e:
+        job.status = REFRESH_JOB_STATUSES['ERROR']
+        job.details = str(e)
+    except Exception as e:
+        job.status = REFRESH_JOB_STATUSES['ERROR']
+        job.details = 'Unexpected error: %s' % e
+    else:
+        job.status = REFRESH_JOB_STATUSES['DONE']
+        job.details = ''
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['details', 'finished_at', 'status'])
+
+    return job
+
+
+def process_refresh_jobs(limit=None):
+    """Process pending refresh jobs until the queue is empty.
+
+    Keyword Args:
+        limit (int): The maximum number of jobs to process
+
+    Yields:
+        chiton.rack.models.RefreshJob: Each finished job
+    """
+    processed = 0
+
+    while limit is None or processed < limit:
+        job = claim_refresh_job()
+        if not job:
+            break
+
+        yield run_refresh_job(job)
+        processed += 1
+
+
+def requeue_stale_refresh_jobs(stale_after=DEFAULT_STALE_AFTER):
+    """Return any jobs abandoned by a stopped worker to the queue.
+
+    Keyword Args:
+        stale_after (int): The number of seconds after which a running job is considered abandoned
+
+    A stale job whose refresh has been queued again since it was claimed is
+    marked as failed instead, since only one such job can be pending.
+
+    Returns:
+        int: The number of requeued jobs
+    """
+    now = timezone.now()
+    stale_jobs = RefreshJob.objects.filter(
+        status=REFRESH_JOB_STATUSES['RUNNING'],
+        started_at__lt=now - timedelta(seconds=stale_after)
+    )
+
+    requeued_count = 0
+
+    for job_id in stale_jobs.values_list('pk', flat=True):
+        job = stale_jobs.filter(pk=job_id)
+        try:
+            with transaction.atomic():
+                requeued_count += job.update(status=REFRESH_JOB_STATUSES['PENDING'], started_at=None)
+        except IntegrityError:
+            job.update(
+                details='Abandoned after the same refresh was queued again',
+                finished_at=now,
+                status=REFRESH_JOB_STATUSES['ERROR']
+            )
+
+    return requeued_count
+
+
+def get_latest_refresh_jobs(item_ids):
+    """Get the most recent refresh job of each of a set of affiliate items.
+
+    Args:
+        item_ids (list[int]): The IDs of affiliate items
+
+    Returns:
+        dict: A mapping of item IDs to their most recent refresh jobs
+    """
+    jobs = _get_latest_refresh_jobs_queryset().filter(item_id__in=item_ids)
+    return dict((job.item_id, job) for job in jobs)
+
+
+def prefetch_latest_refresh_jobs(items):
+    """Prefetch the most recent refresh job of each affiliate item in a queryset.
+
+    The jobs of all items are fetched with a single query that only returns
+    one job per item, and each item's job is stored as the only member of the
+    list in its `latest_refresh_jobs` attribute.
+
+    Args:
+        items (django.db.models.query.QuerySet): A queryset of affiliate items
+
+    Returns:
+        django.db.models.query.QuerySet: The queryset with its items' latest jobs prefetched
+    """
+    return items.prefetch_related(Prefetch(
+        'refresh_jobs',
+        queryset=_get_latest_refresh_jobs_queryset(),
+        to_attr=LATEST_REFRESH_JOBS_ATTR
+    ))
+
+
+def _get_latest_refresh_jobs_queryset():
+    """Get a queryset that returns only the most recent refresh job of each item.
+
+    Returns:
+        django.db.models.query.QuerySet: A queryset of refresh jobs
+    """
+    return RefreshJob.objects.order_by('item_id', '-created_at', '-pk').distinct('item_id')
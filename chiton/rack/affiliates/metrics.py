@@ -0,0 +1,290 @@
+from contextlib import contextmanager
+from functools import wraps
+from threading import local, Lock
+from time import monotonic
+
+
+# The upper bounds of the buckets of the request-latency histograms, in seconds
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# The activity of the item being processed by each thread
+_local = local()
+
+
+class ItemActivity:
+    """The measured activity involved in processing a single affiliate item."""
+
+    def __init__(self):
+        """Create an empty record of activity."""
+        self.byte_count = 0
+        self.request_times = []
+        self.write_time = 0
+
+        self._lock = Lock()
+
+    def add_bytes(self, byte_count):
+        """Record the download of a number of bytes.
+
+        Args:
+            byte_count (int): The number of bytes downloaded
+        """
+        with self._lock:
+            self.byte_count += byte_count
+
+    def add_request_time(self, seconds):
+        """Record the duration of an API request.
+
+        Args:
+            seconds (float): The duration of the request
+        """
+        with self._lock:
+            self.request_times.append(seconds)
+
+    def add_write_time(self, seconds):
+        """Record time spent writing to the database.
+
+        Args:
+            seconds (float): The duration of the writes
+        """
+        with self._lock:
+            self.write_time += seconds
+
+
+class NetworkMetrics:
+    """Aggregated metrics for the items of a single affiliate network."""
+
+    def __init__(self):
+        """Create empty metrics."""
+        self.byte_count = 0
+        self.changed_count = 0
+        self.error_count = 0
+        self.item_count = 0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_max = 0
+        self.latency_total = 0
+        self.request_count = 0
+        self.retry_count = 0
+        self.skipped_count = 0
+        self.throttle_count = 0
+        self.write_time = 0
+
+    def add_request_time(self, seconds):
+        """Add the duration of a request to the latency histogram.
+
+        Args:
+            seconds (float): The duration of the request
+        """
+        bucket_index = len(LATENCY_BUCKETS)
+        for index, upper_bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= upper_bound:
+                bucket_index = index
+                break
+
+        self.latency_buckets[bucket_index] += 1
+        self.latency_max = max(self.latency_max, seconds)
+        self.latency_total += seconds
+        self.request_count += 1
+
+    def to_dict(self):
+        """Serialize the metrics.
+
+        Returns:
+            dict: The metrics as JSON-compatible data
+        """
+        bounds = list(LATENCY_BUCKETS) + [None]
+
+        return {
+            'bytes_downloaded': self.byte_count,
+            'changed': self.changed_count,
+            'errors': self.error_count,
+            'items': self.item_count,
+            'requests': {
+                'buckets': [{'le': bound, 'count': count} for bound, count in zip(bounds, self.latency_buckets)],
+                'count': self.request_count,
+                'max_seconds': self.latency_max,
+                'mean_seconds': self.latency_total / self.request_count if self.request_count else 0
+            },
+            'retries': self.retry_count,
+            'skipped': self.skipped_count,
+            'throttles': self.throttle_count,
+            'write_seconds': self.write_time
+        }
+
+
+class JobMetrics:
+    """Thread-safe throughput and latency metrics for a batch job, grouped by network."""
+
+    def __init__(self, clock=monotonic):
+        """Create empty metrics and start the job's clock.
+
+        Keyword Args:
+            clock (function): A function that returns the current time in seconds
+        """
+        self.clock = clock
+        self.started_at = clock()
+
+        self._lock = Lock()
+        self._networks = {}
+
+    def record_activity(self, network_id, activity):
+        """Record the activity involved in processing an item.
+
+        Args:
+            network_id (int): The ID of the item's affiliate network
+            activity (chiton.rack.affiliates.metrics.ItemActivity): The item's activity
+        """
+        with self._lock:
+            network = self._get_network(network_id)
+            network.byte_count += activity.byte_count
+            network.write_time += activity.write_time
+            for request_time in activity.request_times:
+                network.add_request_time(request_time)
+
+    def record_result(self, network_id, result):
+        """Record the outcome of processing an item.
+
+        Args:
+            network_id (int): The ID of the item's affiliate network
+            result (chiton.rack.affiliates.bulk.BatchJobResult): The result of processing the item
+        """
+        with self._lock:
+            network = self._get_network(network_id)
+            network.item_count += 1
+            if result.is_error:
+                network.error_count += 1
+            elif result.is_skipped:
+                network.skipped_count += 1
+            else:
+                network.changed_count += 1
+
+    def record_throttle(self, network_id, is_retried):
+        """Record a throttled request.
+
+        Args:
+            network_id (int): The ID of the item's affiliate network
+            is_retried (bool): Whether the request will be retried
+        """
+        with self._lock:
+            network = self._get_network(network_id)
+            network.throttle_count += 1
+            if is_retried:
+                network.retry_count += 1
+
+    def report(self, network_names={}):
+        """Create a report of the metrics collected so far.
+
+        Args:
+            network_names (dict): A mapping of network IDs to the names used in the report
+
+        Returns:
+            dict: The report as JSON-compatible data
+        """
+        elapsed = self.clock() - self.started_at
+
+        with self._lock:
+            networks = dict(
+                (network_names.get(network_id, str(network_id)), network.to_dict())
+                for network_id, network in self._networks.items()
+            )
+
+        item_count = sum([network['items'] for network in networks.values()])
+
+        return {
+            'elapsed_seconds': elapsed,
+            'items': item_count,
+            'items_per_second': item_count / elapsed if elapsed else 0,
+            'networks': networks
+        }
+
+    def _get_network(self, network_id):
+        """Get the metrics for a network, creating them if needed.
+
+        This must be called while holding the lock.
+
+        Args:
+            network_id (int): The ID of an affiliate network
+
+        Returns:
+            chiton.rack.affiliates.metrics.NetworkMetrics: The network's metrics
+        """
+        if network_id not in self._networks:
+            self._networks[network_id] = NetworkMetrics()
+        return self._networks[network_id]
+
+
+@contextmanager
+def track_item_activity(activity=None):
+    """Track the activity of the current thread while processing an item.
+
+    Args:
+        activity (chiton.rack.affiliates.metrics.ItemActivity): An existing record of activity to add to
+
+    Yields:
+        chiton.rack.affiliates.metrics.ItemActivity: The record of the item's activity
+    """
+    previous = getattr(_local, 'activity', None)
+    _local.activity = activity or ItemActivity()
+
+    try:
+        yield _local.activity
+    finally:
+        _local.activity = previous
+
+
+def bind_item_activity(function):
+    """Bind a function to the activity being tracked by the current thread.
+
+    This allows work handed off to another thread to be attributed to the item
+    that requested it.
+
+    Args:
+        function (function): The function to bind
+
+    Returns:
+        function: A function that tracks its activity with the current item
+    """
+    activity = getattr(_local, 'activity', None)
+    if activity is None:
+        return function
+
+    @wraps(function)
+    def bound(*args, **kwargs):
+        with track_item_activity(activity):
+            return function(*args, **kwargs)
+
+    return bound
+
+
+@contextmanager
+def measure_request():
+    """Measure the duration of an API request made for the current item."""
+    started_at = monotonic()
+    try:
+        yield
+    finally:
+        activity = getattr(_local, 'activity', None)
+        if activity:
+            activity.add_request_time(monotonic() - started_at)
+
+
+@contextmanager
+def measure_write():
+    """Measure time spent writing the current item to the database."""
+    started_at = monotonic()
+    try:
+        yield
+    finally:
+        activity = getattr(_local, 'activity', None)
+        if activity:
+            activity.add_write_time(monotonic() - started_at)
+
+
+def record_download(byte_count):
+    """Record the download of a number of bytes for the current item.
+
+    Args:
+        byte_count (int): The number of bytes downloaded
+    """
+    activity = getattr(_local, 'activity', None)
+    if activity:
+        activity.add_bytes(byte_count)
@@ -0,0 +1,151 @@
+from datetime import timedelta
+import math
+
+from django.db.models import Case, Count, F, IntegerField, Max, When
+from django.utils import timezone
+
+from chiton.rack.data import REFRESH_KINDS, REFRESH_STATUSES
+from chiton.rack.models import AffiliateItem, RefreshCheckpoint
+
+
+# The period of refresh history used to estimate the volatility of an item
+VOLATILITY_WINDOW = timedelta(days=30)
+
+
+def schedule_affiliate_items(items, budget, now=None):
+    """Select the affiliate items that should be refreshed within a budget.
+
+    Args:
+        items (django.db.models.query.QuerySet): A queryset of affiliate items
+        budget (int): The maximum number of items to refresh
+
+    Keyword Args:
+        now (datetime.datetime): The time at which the refresh is scheduled
+
+    Returns:
+        list[int]: The IDs of the selected items, from highest to lowest priority
+    """
+    priorities = prioritize_affiliate_items(items, now=now)
+    ranked = sorted(priorities.items(), key=lambda p: (-p[1], p[0]))
+
+    return [item_id for item_id, priority in ranked[:budget]]
+
+
+def prioritize_affiliate_items(items, now=None):
+    """Calculate the refresh priority of each affiliate item.
+
+    The priority of an item is the product of three factors: its exposure,
+    which is the logarithmically damped number of times that it was shown in
+    recommendations; its volatility, which is the smoothed fraction of recent
+    refreshes that changed its details; and its staleness, which is the number
+    of hours since it was last checked.  An item that has never been refreshed
+    is treated as having a volatility of one half.
+
+    Args:
+        items (django.db.models.query.QuerySet): A queryset of affiliate items
+
+    Keyword Args:
+        now (datetime.datetime): The time at which the refresh is scheduled
+
+    Returns:
+        dict: A mapping of item IDs to their priorities
+    """
+    now = now or timezone.now()
+    history = _get_refresh_history(items, now - VOLATILITY_WINDOW)
+
+    priorities = {}
+    for item_id, exposure_count, last_modified in items.values_list('pk', 'exposure_count', 'last_modified'):
+        observed, changed, last_checked = history.get(item_id, (0, 0, None))
+
+        if last_checked is None or last_checked < last_modified:
+            last_checked = last_modified
+
+        exposure = 1 + math.log1p(exposure_count)
+        volatility = (changed + 1) / (observed + 2)
+        staleness = max((now - last_checked).total_seconds(), 0) / 3600
+
+        priorities[item_id] = exposure * volatility * staleness
+
+    return priorities
+
+
+def record_recommendation_exposure(recommendations):
+    """Increment the exposure count of each item offered in recommendations.
+
+    Args:
+        recommendations (chiton.wintour.pipeline.Recommendations): The returned recommendations
+
+    Returns:
+        int: The number of items whose exposure was recorded
+    """
+    return record_recommendations_exposure([recommendations])
+
+
+def record_recommendations_exposure(all_recommendations):
+    """Increment the exposure count of each item offered in a batch of recommendations.
+
+    Each item's count is incremented once for every set of recommendations
+    that offers it, using one update per distinct increment.
+
+    Args:
+        all_recommendations (list[chiton.wintour.pipeline.Recommendations]): The returned recommendations
+
+    Returns:
+        int: The number of items whose exposure was recorded
+    """
+    exposures = {}
+    for recommendations in all_recommendations:
+        item_ids = set()
+        for basic in recommendations['basics']:
+            for garment in basic['garments']:
+                for purchase_option in garment['purchase_options']:
+                    item_ids.add(purchase_option['id'])
+
+        for item_id in item_ids:
+            exposures[item_id] = exposures.get(item_id, 0) + 1
+
+    items_by_increment = {}
+    for item_id, increment in exposures.items():
+        items_by_increment.setdefault(increment, []).append(item_id)
+
+    for increment, item_ids in items_by_increment.items():
+        AffiliateItem.objects.filter(pk__in=item_ids).update(exposure_count=F('exposure_count') + increment)
+
+    return len(exposures)
+
+
+def decay_item_exposure():
+    """Halve the exposure count of every item.
+
+    This is performed after each scheduled refresh, so that the exposure of an
+    item favors its recent appearances in recommendations.
+    """
+    AffiliateItem.objects.filter(exposure_count__gt=0).update(exposure_count=F('exposure_count') / 2)
+
+
+def _get_refresh_history(items, since):
+    """Summarize the recent details refreshes of affiliate items.
+
+    Args:
+        items (django.db.models.query.QuerySet): A queryset of affiliate items
+        since (datetime.datetime): The earliest refresh to consider
+
+    Returns:
+        dict: A mapping of item IDs to the number of successful refreshes, the number of changing refreshes, and the time of the latest refresh
+    """
+    checkpoints = RefreshCheckpoint.objects.filter(
+        item_id__in=items.values('pk'),
+        recorded_at__gte=since,
+        run__kind=REFRESH_KINDS['DETAILS']
+    ).exclude(
+        status=REFRESH_STATUSES['ERROR']
+    ).values('item_id').annotate(
+        changed=Count(Case(When(status=REFRESH_STATUSES['CHANGED'], then=1), output_field=IntegerField())),
+        last_checked=Max('recorded_at'),
+        observed=Count('pk')
+    ).order_by()
+
+    return dict(
+        (c['item_id'], (c['observed'], c['changed'], c['last_checked']))
+        for c in checkpoints
+    )
@@ -10,6 +10,7 @@ from chiton.core.uris import extract_query_param
 from chiton.rack.affiliates.shopstyle.urls import extract_product_id_from_api_url
 from chiton.rack.affiliates.base import Affiliate as BaseAffiliate
 from chiton.rack.affiliates.exceptions import LookupError
+from chiton.rack.affiliates.metrics import record_download
 
 
 # Matches for extracting numeric sizes from canonical-size names
@@ -24,6 +25,9 @@ SIZE_PLUS = 'Plus'
 # Desired image sizes
 IMAGE_SIZES = ('Medium', 'XLarge')
 
+# The timeout for a single API request, in seconds
+REQUEST_TIMEOUT = 15
+
 
 class Affiliate(BaseAffiliate):
     """An affiliate for Shopstyle."""
@@ -43,9 +47,14 @@ class Affiliate(BaseAffiliate):
             'name': parsed['brandedName']
         }
 
-    def provide_details(self, product_id, color_names):
+    def provide_details_payload(self, product_id):
         response = self._request_product(product_id)
-        parsed = self._validate_response(response, product_id)
+        self._check_response(response, product_id)
+
+        return response.text
+
+    def provide_details_from_payload(self, payload, color_names):
+        parsed = json.loads(payload)
 
         price = Money(str(parsed.get('salePrice', parsed['price'])), USD)
         images = [self._find_color_image(parsed, size, color_names) for size in IMAGE_SIZES]
@@ -247,11 +256,27 @@ class Affiliate(BaseAffiliate):
             requests.Response: The API response
         """
         endpoint = '%s/products/%s' % (self._API_URL, product_id)
-        return requests.get(endpoint, params={
+        response = requests.get(endpoint, timeout=REQUEST_TIMEOUT, params={
             'format': 'json',
             'pid': settings.SHOPSTYLE_UID
         })
 
+        record_download(len(response.content))
+        return response
+
+    def _check_response(self, response, product_id):
+        """Raise a lookup error if an API response was unsuccessful.
+
+        Args:
+            response (requests.Response): An HTTP response
+            product_id (str): The product ID associated with the response
+
+        Raises:
+            chiton.rack.affiliates.exceptions.LookupError: If the request failed
+        """
+        if response.status_code != 200:
+            raise LookupError('Invalid lookup for product %s: %s' % (product_id, response.text))
+
     def _validate_response(self, response, product_id):
         """Validate an API response.
 
@@ -262,7 +287,5 @@ class Affiliate(BaseAffiliate):
         Returns:
             dict: The parsed, valid response
         """
-        if response.status_code != 200:
-            raise LookupError('Invalid lookup for product %s: %s' % (product_id, response.text))
-
+        self._check_response(response, product_id)
         return json.loads(response.text)
@@ -0,0 +1,485 @@
+from collections import OrderedDict
+import csv
+import json
+from multiprocessing.dummy import Pool as ThreadPool
+import os
+from threading import Lock
+
+from django.db import transaction
+from django.utils import timezone
+import voluptuous as V
+
+from chiton.closet.data import BOTTOM_LENGTHS, CARE_TYPES, EMPHASES, PANT_RISES, SLEEVE_LENGTHS
+from chiton.closet.models import Brand, Garment
+from chiton.core.exceptions import FormatError
+from chiton.core.queries import refresh_cached_queries
+from chiton.core.schema import define_data_shape, OneOf
+from chiton.rack.affiliates import create_affiliate
+from chiton.rack.affiliates.bulk import DEFAULT_WORKERS
+from chiton.rack.models import AffiliateItem, AffiliateNetwork
+from chiton.runway.models import Basic, Formality, Style
+
+
+# The formats in which a catalog manifest can be written
+CATALOG_FORMATS = {
+    'CSV': 'csv',
+    'JSONL': 'jsonl'
+}
+
+# The separator used for list values in CSV manifests
+CSV_LIST_SEPARATOR = '|'
+
+# The manifest fields that are copied directly to a garment
+GARMENT_FIELDS = (
+    'bottom_length',
+    'care',
+    'description',
+    'hip_emphasis',
+    'is_busty',
+    'is_featured',
+    'is_petite_sized',
+    'is_plus_sized',
+    'is_regular_sized',
+    'is_tall_sized',
+    'notes',
+    'pant_rise',
+    'shoulder_emphasis',
+    'sleeve_length',
+    'waist_emphasis'
+)
+
+# The manifest fields whose CSV values are booleans, integers or lists
+_CSV_BOOLEAN_FIELDS = ('is_busty', 'is_featured', 'is_petite_sized', 'is_plus_sized', 'is_regular_sized', 'is_tall_sized')
+_CSV_INTEGER_FIELDS = ('hip_emphasis', 'shoulder_emphasis', 'waist_emphasis')
+_CSV_LIST_FIELDS = ('formalities', 'styles')
+
+
+# A single entry in a catalog manifest, describing a garment and optionally
+# one of its affiliate items
+CatalogEntry = define_data_shape({
+    V.Required('brand'): V.All(str, V.Length(min=1)),
+    V.Required('garment'): V.All(str, V.Length(min=1)),
+    'basic': V.All(str, V.Length(min=1)),
+    'bottom_length': OneOf(BOTTOM_LENGTHS.values()),
+    'care': OneOf(CARE_TYPES.values()),
+    'description': str,
+    'formalities': [str],
+    'hip_emphasis': OneOf(EMPHASES.values()),
+    'is_busty': bool,
+    'is_featured': bool,
+    'is_petite_sized': bool,
+    'is_plus_sized': bool,
+    'is_regular_sized': bool,
+    'is_tall_sized': bool,
+    'network': V.All(str, V.Length(min=1)),
+    'notes': str,
+    'pant_rise': OneOf(PANT_RISES.values()),
+    'shoulder_emphasis': OneOf(EMPHASES.values()),
+    'sleeve_length': OneOf(SLEEVE_LENGTHS.values()),
+    'styles': [str],
+    'url': V.All(str, V.Length(min=1)),
+    'waist_emphasis': OneOf(EMPHASES.values())
+})
+
+
+class CatalogImport:
+    """The outcome of importing a catalog manifest."""
+
+    def __init__(self):
+        """Create an empty import record."""
+        self.created_garments = 0
+        self.created_items = 0
+        self.errors = []
+        self.item_ids = []
+        self.updated_garments = 0
+        self.updated_items = 0
+
+    def add_error(self, entry_number, message):
+        """Record an entry that could not be imported.
+
+        Args:
+            entry_number (int): The one-based position of the entry in the manifest
+            message (str): A description of the error
+        """
+        self.errors.append((entry_number, message))
+
+
+def read_catalog_manifest(path, format=None):
+    """Read and validate the entries in a catalog manifest.
+
+    A manifest can be either a JSON Lines file, with one JSON object per line,
+    or a CSV file with a header row.  In CSV files, list fields separate their
+    values with a pipe character, and boolean fields accept values such as
+    "true" or "false".
+
+    Args:
+        path (str): The path to the manifest file
+
+    Keyword Args:
+        format (str): The format of the manifest, which is inferred from the file extension by default
+
+    Returns:
+        list[dict]: The validated entries in the manifest
+
+    Raises:
+        chiton.core.exceptions.FormatError: If the manifest or any of its entries are invalid
+    """
+    format = format or os.path.splitext(path)[1].lstrip('.').lower()
+    if format not in CATALOG_FORMATS.values():
+        raise FormatError('Unknown manifest format "%s": use one of %s' % (format, ', '.join(sorted(CATALOG_FORMATS.values()))))
+
+    with open(path, newline='') as manifest:
+        if format == CATALOG_FORMATS['CSV']:
+            rows = [_normalize_csv_row(row) for row in csv.DictReader(manifest)]
+        else:
+            rows = []
+            for line_number, line in enumerate(manifest, 1):
+                if not line.strip():
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except ValueError as e:
+                    raise FormatError('Invalid JSON on line %d: %s' % (line_number, e))
+
+    entries = []
+    for entry_number, row in enumerate(rows, 1):
+        try:
+            entry = CatalogEntry(row)
+        except FormatError as e:
+            raise FormatError('Invalid manifest entry %d: %s' % (entry_number, e))
+
+        if ('network' in entry) != ('url' in entry):
+            raise FormatError('Invalid manifest entry %d: an affiliate item needs both a network and a URL' % entry_number)
+
+        entries.append(entry)
+
+    return entries
+
+
+def import_catalog(entries, workers=DEFAULT_WORKERS):
+    """Create or update the garments and affiliate items in a catalog.
+
+    Garments are matched to existing ones by their brand and name, and affiliate
+    items by their network and GUID.  The GUID and name of each new affiliate
+    item are requested from its network, with the requests spread across a pool
+    of workers, and all writes are performed using bulk operations.
+
+    This does not request the full details of the affiliate items, which should
+    be done in bulk using the IDs of the imported items.  Any entry that cannot
+    be imported is recorded as an error without affecting the other entries.
+    Since the bulk writes bypass model signals, the cached queries involving
+    garments and affiliate items are refreshed once at the end of the import.
+
+    Args:
+        entries (list[dict]): Validated catalog-manifest entries
+
+    Keyword Args:
+        workers (int): The number of workers to use to request item overviews
+
+    Returns:
+        chiton.rack.catalog.CatalogImport: A record of the import
+    """
+    result = CatalogImport()
+    references = _get_references(entries)
+
+    valid_entries = []
+    for entry_number, entry in enumerate(entries, 1):
+        missing = _find_missing_references(entry, references)
+        if missing:
+            result.add_error(entry_number, 'Unknown %s' % ', '.join(missing))
+        else:
+            valid_entries.append((entry_number, entry))
+
+    with transaction.atomic():
+        garment_ids = _upsert_garments(valid_entries, references, result)
+
+    item_entries = [
+        (entry_number, entry) for entry_number, entry in valid_entries
+        if 'url' in entry and (references['brands'][entry['brand']], entry['garment']) in garment_ids
+    ]
+    overviews = _request_overviews(item_entries, workers, result)
+
+    with transaction.atomic():
+        _upsert_affiliate_items(overviews, garment_ids, references, result)
+
+    if garment_ids:
+        refresh_cached_queries(AffiliateItem, Formality, Garment, Style)
+
+    return result
+
+
+def _normalize_csv_row(row):
+    """Convert the string values of a CSV manifest row to their native types.
+
+    Args:
+        row (dict): A row read from a CSV manifest
+
+    Returns:
+        dict: The row's non-empty values, converted to their native types
+    """
+    normalized = {}
+
+    for field, value in row.items():
+        value = (value or '').strip()
+        if not value:
+            continue
+
+        if field in _CSV_BOOLEAN_FIELDS:
+            value = value.lower() in ('1', 'true', 'yes')
+        elif field in _CSV_INTEGER_FIELDS:
+            try:
+                value = int(value)
+            except ValueError:
+                pass
+        elif field in _CSV_LIST_FIELDS:
+            value = [v.strip() for v in value.split(CSV_LIST_SEPARATOR) if v.strip()]
+
+        normalized[field] = value
+
+    return normalized
+
+
+def _get_references(entries):
+    """Look up the IDs of all models referenced by slug in catalog entries.
+
+    Args:
+        entries (list[dict]): Catalog-manifest entries
+
+    Returns:
+        dict: Mappings of slugs to IDs for brands, basics, networks, formalities and styles
+    """
+    slugs = {
+        'basics': set(),
+        'brands': set(),
+        'formalities': set(),
+        'networks': set(),
+        'styles': set()
+    }
+
+    for entry in entries:
+        slugs['brands'].add(entry['brand'])
+        if 'basic' in entry:
+            slugs['basics'].add(entry['basic'])
+        if 'network' in entry:
+            slugs['networks'].add(entry['network'])
+        slugs['formalities'].update(entry.get('formalities', []))
+        slugs['styles'].update(entry.get('styles', []))
+
+    models = {
+        'basics': Basic,
+        'brands': Brand,
+        'formalities': Formality,
+        'networks': AffiliateNetwork,
+        'styles': Style
+    }
+
+    return dict(
+        (name, dict(models[name].objects.filter(slug__in=slugs[name]).values_list('slug', 'pk')))
+        for name in models
+    )
+
+
+def _find_missing_references(entry, references):
+    """Find the slugs in a catalog entry that do not refer to existing models.
+
+    Args:
+        entry (dict): A catalog-manifest entry
+        references (dict): Mappings of slugs to IDs for all referenced models
+
+    Returns:
+        list[str]: Descriptions of the missing references
+    """
+    missing = []
+
+    for field, name, label in [('brand', 'brands', 'brand'), ('basic', 'basics', 'basic'), ('network', 'networks', 'network')]:
+        if field in entry and entry[field] not in references[name]:
+            missing.append('%s "%s"' % (label, entry[field]))
+
+    for field, label in [('formalities', 'formality'), ('styles', 'style')]:
+        for slug in entry.get(field, []):
+            if slug not in references[field]:
+                missing.append('%s "%s"' % (label, slug))
+
+    return missing
+
+
+def _upsert_garments(entries, references, result):
+    """Create or update the garments described by catalog entries.
+
+    The fields of a garment described by multiple entries are merged in the
+    order of the entries.  New garments are created individually so that their
+    slugs are unique, while existing garments and all garment relations are
+    written without triggering model signals.
+
+    Args:
+        entries (list[tuple]): The number of each valid entry and the entry itself
+        references (dict): Mappings of slugs to IDs for all referenced models
+        result (chiton.rack.catalog.CatalogImport): The record of the import
+
+    Returns:
+        dict: A mapping of brand IDs and garment names to garment IDs
+    """
+    garments = OrderedDict()
+    for entry_number, entry in entries:
+        key = (references['brands'][entry['brand']], entry['garment'])
+        garments.setdefault(key, (entry_number, {}))[1].update(entry)
+
+    existing = {}
+    if garments:
+        brand_ids = set(brand_id for brand_id, name in garments.keys())
+        names = set(name for brand_id, name in garments.keys())
+        for pk, brand_id, name in Garment.objects.filter(brand_id__in=brand_ids, name__in=names).values_list('pk', 'brand_id', 'name'):
+            existing[(brand_id, name)] = pk
+
+    garment_ids = {}
+    relations = {
+        'formalities': {},
+        'styles': {}
+    }
+
+    for key, (entry_number, entry) in garments.items():
+        brand_id, name = key
+        fields = dict((field, entry[field]) for field in GARMENT_FIELDS if field in entry)
+        if 'basic' in entry:
+            fields['basic_id'] = references['basics'][entry['basic']]
+
+        if key in existing:
+            garment_id = existing[key]
+            Garment.objects.filter(pk=garment_id).update(updated_at=timezone.now(), **fields)
+            result.updated_garments += 1
+        elif 'basic_id' not in fields:
+            result.add_error(entry_number, 'A basic is required for the new garment "%s"' % name)
+            continue
+        else:
+            garment_id = Garment.objects.create(brand_id=brand_id, name=name, **fields).pk
+            result.created_garments += 1
+
+        garment_ids[key] = garment_id
+        for field in relations.keys():
+            if field in entry:
+                relations[field][garment_id] = [references[field][slug] for slug in entry[field]]
+
+    _replace_garment_relations(Garment.formalities.through, 'formality_id', relations['formalities'])
+    _replace_garment_relations(Garment.styles.through, 'style_id', relations['styles'])
+
+    return garment_ids
+
+
+def _replace_garment_relations(through_model, related_field, relations):
+    """Replace the many-to-many relations of garments in bulk.
+
+    Args:
+        through_model (django.db.models.Model): The model of the relation's intermediate table
+        related_field (str): The name of the intermediate model's field for the related model
+        relations (dict): A mapping of garment IDs to the IDs of their related models
+    """
+    if not relations:
+        return
+
+    through_model.objects.filter(garment_id__in=relations.keys()).delete()
+    through_model.objects.bulk_create([
+        through_model(**{'garment_id': garment_id, related_field: related_id})
+        for garment_id, related_ids in relations.items()
+        for related_id in set(related_ids)
+    ])
+
+
+def _request_overviews(entries, workers, result):
+    """Request the overviews of the affiliate items in catalog entries.
+
+    Args:
+        entries (list[tuple]): The number of each entry describing an affiliate item and the entry itself
+        workers (int): The number of workers to use to make the requests
+        result (chiton.rack.catalog.CatalogImport): The record of the import
+
+    Returns:
+        list[tuple]: The number, entry and overview of each item whose overview was found
+    """
+    affiliates = {}
+    affiliates_lock = Lock()
+
+    def request_overview(numbered_entry):
+        entry_number, entry = numbered_entry
+
+        try:
+            with affiliates_lock:
+                if entry['network'] not in affiliates:
+                    affiliates[entry['network']] = create_affiliate(slug=entry['network'])
+                affiliate = affiliates[entry['network']]
+
+            return entry_number, entry, affiliate.request_overview(entry['url']), None
+        except Exception as e:
+            return entry_number, entry, None, str(e) or e.__class__.__name__
+
+    if not entries:
+        return []
+
+    pool = ThreadPool(max(min(workers, len(entries)), 1))
+    try:
+        responses = pool.map(request_overview, entries)
+    finally:
+        pool.terminate()
+        pool.join()
+
+    overviews = []
+    for entry_number, entry, overview, error in responses:
+        if error:
+            result.add_error(entry_number, 'Could not look up %s: %s' % (entry['url'], error))
+        else:
+            overviews.append((entry_number, entry, overview))
+
+    return overviews
+
+
+def _upsert_affiliate_items(overviews, garment_ids, references, result):
+    """Create or update the affiliate items described by catalog entries.
+
+    Existing items are moved to their entry's garment using one update per
+    garment, and new items are created using a single bulk insert.
+
+    Args:
+        overviews (list[tuple]): The number, entry and overview of each item
+        garment_ids (dict): A mapping of brand IDs and garment names to garment IDs
+        references (dict): Mappings of slugs to IDs for all referenced models
+        result (chiton.rack.catalog.CatalogImport): The record of the import
+    """
+    items = OrderedDict()
+    for entry_number, entry, overview in overviews:
+        key = (references['networks'][entry['network']], overview['guid'])
+        garment_id = garment_ids[(references['brands'][entry['brand']], entry['garment'])]
+        items[key] = (entry, overview, garment_id)
+
+    if not items:
+        return
+
+    existing = {}
+    guids = set(guid for network_id, guid in items.keys())
+    for pk, network_id, guid in AffiliateItem.objects.filter(guid__in=guids).values_list('pk', 'network_id', 'guid'):
+        existing[(network_id, guid)] = pk
+
+    to_create = []
+    to_move = {}
+
+    for key, (entry, overview, garment_id) in items.items():
+        network_id, guid = key
+        if key in existing:
+            to_move.setdefault(garment_id, []).append(existing[key])
+        else:
+            to_create.append(AffiliateItem(
+                affiliate_url='',
+                garment_id=garment_id,
+                guid=guid,
+                name=overview['name'],
+                network_id=network_id,
+                retailer='',
+                url=entry['url']
+            ))
+
+    for garment_id, item_ids in to_move.items():
+        AffiliateItem.objects.filter(pk__in=item_ids).update(garment_id=garment_id)
+        result.item_ids += item_ids
+        result.updated_items += len(item_ids)
+
+    created = AffiliateItem.objects.bulk_create(to_create)
+    result.item_ids += [item.pk for item in created]
+    result.created_items += len(created)
@@ -0,0 +1,48 @@
+from django.utils.translation import ugettext_lazy as _
+
+
+IMAGE_FORMATS = {
+    'JPEG': 'jpeg',
+    'WEBP': 'webp'
+}
+
+IMAGE_FORMAT_CHOICES = (
+    (IMAGE_FORMATS['WEBP'], _('WebP')),
+    (IMAGE_FORMATS['JPEG'], _('JPEG'))
+)
+
+REFRESH_JOB_STATUSES = {
+    'DONE': 'done',
+    'ERROR': 'error',
+    'PENDING': 'pending',
+    'RUNNING': 'running'
+}
+
+REFRESH_JOB_STATUS_CHOICES = (
+    (REFRESH_JOB_STATUSES['PENDING'], _('Pending')),
+    (REFRESH_JOB_STATUSES['RUNNING'], _('Running')),
+    (REFRESH_JOB_STATUSES['DONE'], _('Done')),
+    (REFRESH_JOB_STATUSES['ERROR'], _('Error'))
+)
+
+REFRESH_KINDS = {
+    'DETAILS': 'details',
+    'METADATA': 'metadata'
+}
+
+REFRESH_KIND_CHOICES = (
+    (REFRESH_KINDS['DETAILS'], _('Details')),
+    (REFRESH_KINDS['METADATA'], _('Metadata'))
+)
+
+REFRESH_STATUSES = {
+    'CHANGED': 'changed',
+    'ERROR': 'error',
+    'UNCHANGED': 'unchanged'
+}
+
+REFRESH_STATUS_CHOICES = (
+    (REFRESH_STATUSES['CHANGED'], _('Changed')),
+    (REFRESH_STATUSES['UNCHANGED'], _('Unchanged')),
+    (REFRESH_STATUSES['ERROR'], _('Error'))
+)
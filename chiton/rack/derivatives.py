@@ -0,0 +1,190 @@
+from concurrent.futures import as_completed, ProcessPoolExecutor
+import hashlib
+from io import BytesIO
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image
+
+from chiton.core.queries import refresh_cached_queries
+from chiton.rack.data import IMAGE_FORMATS
+from chiton.rack.models import ItemImageDerivative
+
+
+# The widths of the derivatives generated for each image, in pixels
+DERIVATIVE_WIDTHS = (160, 320, 640)
+
+# The formats in which each derivative is generated
+DERIVATIVE_FORMATS = (IMAGE_FORMATS['WEBP'], IMAGE_FORMATS['JPEG'])
+
+# The quality setting used when encoding derivatives
+DERIVATIVE_QUALITY = 80
+
+# The directory in which derivatives are stored
+DERIVATIVES_DIR = 'derivatives'
+
+# The Pillow encoder and file extension for each derivative format
+FORMAT_ENCODERS = {
+    IMAGE_FORMATS['JPEG']: ('JPEG', '.jpg'),
+    IMAGE_FORMATS['WEBP']: ('WEBP', '.webp')
+}
+
+
+def generate_image_derivatives(images, processes=None):
+    """Generate resized derivatives of item images using a pool of processes.
+
+    The resizing and encoding of each image is performed in a separate process,
+    while the derivative records are written by the calling process as each
+    image completes.  Any existing derivatives for an image are replaced.
+
+    Args:
+        images (django.db.models.query.QuerySet): The item images to process
+
+    Keyword Args:
+        processes (int): The number of processes to use
+
+    Yields:
+        tuple: The item image, a list of its derivatives, and any error raised while generating them
+    """
+    images = list(images)
+
+    # The worker processes are started as the images are submitted, so close
+    # the database connection first so that no process inherits its socket
+    connection.close()
+    pool = ProcessPoolExecutor(max_workers=processes)
+    futures = {}
+
+    try:
+        for image in images:
+            futures[pool.submit(render_image_derivatives, image.file.name)] = image
+
+        for future in as_completed(futures):
+            image = futures[future]
+
+            try:
+                renders = future.result()
+            except Exception as e:
+                yield image, [], e
+                continue
+
+            with transaction.atomic():
+                ItemImageDerivative.objects.filter(image=image).delete()
+                derivatives = ItemImageDerivative.objects.bulk_create([
+                    ItemImageDerivative(
+                        file=render['file'],
+                        format=render['format'],
+                        height=render['height'],
+                        image=image,
+                        width=render['width']
+                    )
+                    for render in renders
+                ])
+
+            yield image, derivatives, None
+    finally:
+        pool.shutdown(wait=True)
+        refresh_cached_queries(ItemImageDerivative)
+
+
+def render_image_derivatives(file_name, widths=DERIVATIVE_WIDTHS, formats=DERIVATIVE_FORMATS):
+    """Render and store the resized derivatives of a single image file.
+
+    Derivatives are stored by the content hash of their source, so the
+    derivatives of an image that is shared by multiple items are only rendered
+    once.  Only widths smaller than the source image are rendered, and an image
+    narrower than every width is rendered once at its own width.
+
+    Args:
+        file_name (str): The name of the source image in storage
+
+    Keyword Args:
+        widths (tuple[int]): The widths of the derivatives to render
+        formats (tuple[str]): The formats of the derivatives to render
+
+    Returns:
+        list[dict]: The file name, format, height, and width of each derivative
+    """
+    with default_storage.open(file_name, 'rb') as source_file:
+        content = source_file.read()
+
+    content_hash = hashlib.sha256(content).hexdigest()
+    source = Image.open(BytesIO(content))
+    source_width, source_height = source.size
+
+    target_widths = [width for width in sorted(widths) if width < source_width] or [source_width]
+    targets = [
+        (width, max(int(round(source_height * width / source_width)), 1))
+        for width in target_widths
+    ]
+
+    # Allow the JPEG decoder to downscale while loading when every target is
+    # much smaller than the source
+    source.draft('RGB', targets[-1])
+
+    renders = []
+    for width, height in targets:
+        resized = None
+
+        for image_format in formats:
+            encoder, extension = FORMAT_ENCODERS[image_format]
+            derivative_name = os.path.join(
+                DERIVATIVES_DIR,
+                content_hash[0:2],
+                content_hash[2:4],
+                '%s-%dw%s' % (content_hash, width, extension)
+            )
+
+            if not default_storage.exists(derivative_name):
+                if resized is None:
+                    resized = _resize_image(source, width, height)
+
+                encoded = BytesIO()
+                _prepare_for_encoder(resized, encoder).save(encoded, encoder, quality=DERIVATIVE_QUALITY)
+                derivative_name = default_storage.save(derivative_name, ContentFile(encoded.getvalue()))
+
+            renders.append({
+                'file': derivative_name,
+                'format': image_format,
+                'height': height,
+                'width': width
+            })
+
+    return renders
+
+
+def _resize_image(image, width, height):
+    """Resize an image to exact dimensions.
+
+    Args:
+        image (PIL.Image.Image): The source image
+        width (int): The target width
+        height (int): The target height
+
+    Returns:
+        PIL.Image.Image: The resized image
+    """
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+    if image.size == (width, height):
+        return image
+
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def _prepare_for_encoder(image, encoder):
+    """Convert an image to a mode supported by an encoder.
+
+    Args:
+        image (PIL.Image.Image): A resized image
+        encoder (str): The name of a Pillow encoder
+
+    Returns:
+        PIL.Image.Image: The image in a compatible mode
+    """
+    if encoder == 'JPEG' and image.mode != 'RGB':
+        return image.convert('RGB')
+
+    return image
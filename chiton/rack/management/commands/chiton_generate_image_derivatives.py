@@ -0,0 +1,56 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from chiton.rack.derivatives import generate_image_derivatives
+from chiton.rack.models import ItemImage
+
+
+class Command(BaseCommand):
+    help = 'Generate resized derivatives of item images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            dest='all',
+            default=False,
+            help='Regenerate the derivatives of images that already have them'
+        )
+
+        parser.add_argument(
+            '--processes',
+            action='store',
+            dest='processes',
+            default=None,
+            type=int,
+            help='The number of processes to use'
+        )
+
+    def handle(self, *arg, **options):
+        images = ItemImage.objects.all().order_by('pk').select_related('item')
+        if not options['all']:
+            images = images.filter(derivatives__isnull=True)
+
+        total_count = images.count()
+        if total_count == 0:
+            self.stdout.write('No item images need derivatives')
+            return
+        else:
+            self.stdout.write('Generating derivatives for %d images\n--' % total_count)
+
+        error_count = 0
+        for index, (image, derivatives, error) in enumerate(generate_image_derivatives(images, processes=options['processes'])):
+            label = '%s: %s' % (image.item.name, image.file.name)
+            if error:
+                error_count += 1
+                self.stderr.write(self.style.ERROR('[!] %d/%d (%s)' % (index + 1, total_count, label)))
+                self.stderr.write(self.style.ERROR('--\n%s\n--\n' % error))
+            else:
+                self.stdout.write('%d/%d (%s) [%d]' % (index + 1, total_count, label, len(derivatives)))
+
+        if error_count:
+            self.stderr.write(self.style.ERROR('\n%d images could not be processed' % error_count))
+            sys.exit(1)
+        else:
+            self.stdout.write(self.style.SUCCESS('\nGenerated derivatives for all %d images' % total_count))
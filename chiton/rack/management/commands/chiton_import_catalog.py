@@ -0,0 +1,108 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chiton.core.exceptions import FormatError
+from chiton.core.queries import defer_cached_query_refreshes
+from chiton.rack.affiliates.bulk import bulk_update_affiliate_item_details, DEFAULT_WORKERS
+from chiton.rack.affiliates.exceptions import BatchError
+from chiton.rack.catalog import CATALOG_FORMATS, import_catalog, read_catalog_manifest
+from chiton.rack.models import AffiliateItem
+
+
+class Command(BaseCommand):
+    help = 'Import garments and affiliate items from a JSONL or CSV catalog manifest'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'manifest',
+            help='The path to the catalog manifest'
+        )
+
+        parser.add_argument(
+            '--format',
+            action='store',
+            dest='format',
+            default=None,
+            choices=sorted(CATALOG_FORMATS.values()),
+            help='The format of the manifest, which is inferred from its extension by default'
+        )
+
+        parser.add_argument(
+            '--workers',
+            action='store',
+            dest='workers',
+            default=DEFAULT_WORKERS,
+            type=int,
+            help='The number of workers to use for affiliate API requests'
+        )
+
+        parser.add_argument(
+            '--skip-details',
+            action='store_true',
+            dest='skip_details',
+            default=False,
+            help='Do not request the full details of the imported affiliate items'
+        )
+
+    def handle(self, *arg, **options):
+        try:
+            entries = read_catalog_manifest(options['manifest'], format=options['format'])
+        except (FormatError, OSError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write('Importing %d catalog entries with %d workers\n--' % (len(entries), options['workers']))
+
+        # Refresh the cached queries for garments and items once all of the
+        # catalog's data has been written
+        with defer_cached_query_refreshes():
+            result = import_catalog(entries, workers=options['workers'])
+
+            self.stdout.write('Garments: %d created, %d updated' % (result.created_garments, result.updated_garments))
+            self.stdout.write('Affiliate items: %d created, %d updated' % (result.created_items, result.updated_items))
+
+            detail_errors = []
+            if result.item_ids and not options['skip_details']:
+                detail_errors = self._update_details(result.item_ids, options['workers'])
+
+        if result.errors or detail_errors:
+            self.stderr.write(self.style.ERROR('\nThe following entries could not be imported:'))
+            for entry_number, message in result.errors:
+                self.stderr.write(self.style.ERROR('* Entry %d: %s' % (entry_number, message)))
+            for label, message in detail_errors:
+                self.stderr.write(self.style.ERROR('* %s: %s' % (label, message)))
+            sys.exit(1)
+        else:
+            self.stdout.write(self.style.SUCCESS('\nImported all %d catalog entries' % len(entries)))
+
+    def _update_details(self, item_ids, workers):
+        """Request the details of imported affiliate items as a batch job.
+
+        Args:
+            item_ids (list[int]): The IDs of the imported affiliate items
+            workers (int): The number of workers to use
+
+        Returns:
+            list[tuple]: The label and error message of each item that could not be updated
+        """
+        items = AffiliateItem.objects.filter(pk__in=item_ids).order_by('pk').select_related('network')
+        item_labels = dict((item.pk, '%s: %s' % (item.network.name, item.name)) for item in items)
+        total_count = len(item_labels)
+
+        self.stdout.write('\nUpdating details for %d affiliate items\n--' % total_count)
+
+        errors = []
+        batch_job = bulk_update_affiliate_item_details(items, workers=workers, force=True)
+
+        try:
+            for index, result in enumerate(batch_job.run()):
+                label = item_labels[result.item_id]
+                if result.is_error:
+                    errors.append((label, result.details))
+                    self.stderr.write(self.style.ERROR('%d/%d (%s) [ERROR]' % (index + 1, total_count, label)))
+                else:
+                    self.stdout.write('%d/%d (%s)' % (index + 1, total_count, label))
+        except BatchError:
+            errors.append(('Details', 'Update aborted due to timeout'))
+
+        return errors
@@ -0,0 +1,55 @@
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from chiton.rack.affiliates.jobs import DEFAULT_STALE_AFTER, process_refresh_jobs, requeue_stale_refresh_jobs
+from chiton.rack.data import REFRESH_JOB_STATUSES
+
+
+class Command(BaseCommand):
+    help = 'Process the affiliate item refreshes queued from the admin'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            dest='once',
+            default=False,
+            help='Exit once the queue is empty instead of waiting for new jobs'
+        )
+
+        parser.add_argument(
+            '--interval',
+            action='store',
+            dest='interval',
+            default=5,
+            type=float,
+            help='The number of seconds to wait before checking an empty queue again'
+        )
+
+        parser.add_argument(
+            '--stale-after',
+            action='store',
+            dest='stale_after',
+            default=DEFAULT_STALE_AFTER,
+            type=int,
+            help='The number of seconds after which a running job is requeued'
+        )
+
+    def handle(self, *arg, **options):
+        while True:
+            requeued = requeue_stale_refresh_jobs(options['stale_after'])
+            if requeued:
+                self.stdout.write('Requeued %d abandoned jobs' % requeued)
+
+            for job in process_refresh_jobs():
+                label = '%s: %s' % (job.item.network.name, job.item.name)
+                if job.status == REFRESH_JOB_STATUSES['ERROR']:
+                    self.stderr.write(self.style.ERROR('%s [ERROR] %s' % (label, job.details)))
+                else:
+                    self.stdout.write(label)
+
+            if options['once']:
+                break
+
+            sleep(options['interval'])
@@ -1,20 +1,39 @@
 from django.core.management.base import BaseCommand
 
-from chiton.rack.affiliates.bulk import prune_affiliate_items
+from chiton.rack.affiliates.bulk import DEFAULT_PRUNE_CHUNK_SIZE, prune_affiliate_items
 from chiton.rack.models import AffiliateItem
 
 
 class Command(BaseCommand):
     help = 'Prune invalid affiliate items'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            action='store',
+            dest='workers',
+            default=1,
+            type=int,
+            help='The number of workers to use to check the items'
+        )
+
+        parser.add_argument(
+            '--chunk-size',
+            action='store',
+            dest='chunk_size',
+            default=DEFAULT_PRUNE_CHUNK_SIZE,
+            type=int,
+            help='The number of invalid items to delete in a single transaction'
+        )
+
     def handle(self, *arg, **options):
-        items = AffiliateItem.objects.all().order_by('pk').select_related('network')
+        items = AffiliateItem.objects.all().order_by('pk')
 
         total_items = items.count()
         current_item = 0
         pruned_items = []
 
-        for item_name, network_name, was_pruned in prune_affiliate_items(items):
+        for item_name, network_name, was_pruned in prune_affiliate_items(items, workers=options['workers'], chunk_size=options['chunk_size']):
             current_item += 1
             progress = '%d/%d' % (current_item, total_items)
             display_name = '%s (%s)' % (item_name, network_name)
@@ -1,10 +1,51 @@
+from argparse import ArgumentTypeError
+from datetime import timedelta
+import json
+import re
 import sys
+from time import monotonic
 
 from django.core.management.base import BaseCommand
+from django.utils import timezone
 
-from chiton.rack.affiliates.bulk import bulk_update_affiliate_item_details, bulk_update_affiliate_item_metadata
+from chiton.rack.affiliates.bulk import bulk_update_affiliate_item_details, bulk_update_affiliate_item_metadata, DEFAULT_ITEM_DEADLINE, DEFAULT_PARSE_QUEUE_SIZE, DEFAULT_WRITE_QUEUE_SIZE
+from chiton.rack.affiliates.checkpoints import exclude_completed_items, exclude_recently_refreshed_items, find_resumable_refresh_run, finish_refresh_run, record_refresh_result, start_refresh_run
 from chiton.rack.affiliates.exceptions import BatchError
-from chiton.rack.models import AffiliateItem
+from chiton.rack.affiliates.scheduling import decay_item_exposure, schedule_affiliate_items
+from chiton.rack.data import REFRESH_KINDS
+from chiton.rack.models import AffiliateItem, AffiliateNetwork
+
+
+# A match for an age expressed as a number and a unit
+AGE_MATCH = re.compile(r'^(\d+)([smhd])$')
+
+# The number of seconds in each unit of an age
+AGE_UNITS = {
+    's': 1,
+    'm': 60,
+    'h': 60 * 60,
+    'd': 60 * 60 * 24
+}
+
+
+def parse_age(value):
+    """Parse an age such as "12h" or "3d" into a time delta.
+
+    Args:
+        value (str): A number followed by a unit of s, m, h or d
+
+    Returns:
+        datetime.timedelta: The age
+
+    Raises:
+        argparse.ArgumentTypeError: If the age is not valid
+    """
+    match = AGE_MATCH.match(value.strip())
+    if not match:
+        raise ArgumentTypeError('Invalid age "%s": use a number followed by s, m, h or d' % value)
+
+    amount, unit = match.groups()
+    return timedelta(seconds=int(amount) * AGE_UNITS[unit])
 
 
 class Command(BaseCommand):
@@ -19,6 +60,14 @@ class Command(BaseCommand):
             help='Update the GUID and name of each item'
         )
 
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            dest='force',
+            default=False,
+            help='Update the details of items whose API data is unchanged'
+        )
+
         parser.add_argument(
             '--workers',
             action='store',
@@ -28,41 +77,168 @@ class Command(BaseCommand):
             help='The number of workers to use'
         )
 
+        parser.add_argument(
+            '--processes',
+            action='store',
+            dest='processes',
+            default=0,
+            type=int,
+            help='The number of processes to use for parsing details, or 0 to parse in the workers'
+        )
+
+        parser.add_argument(
+            '--parse-queue',
+            action='store',
+            dest='parse_queue_size',
+            default=DEFAULT_PARSE_QUEUE_SIZE,
+            type=int,
+            help='The maximum number of fetched details awaiting parsing'
+        )
+
+        parser.add_argument(
+            '--write-queue',
+            action='store',
+            dest='write_queue_size',
+            default=DEFAULT_WRITE_QUEUE_SIZE,
+            type=int,
+            help='The maximum number of parsed details awaiting a write'
+        )
+
+        parser.add_argument(
+            '--deadline',
+            action='store',
+            dest='deadline',
+            default=DEFAULT_ITEM_DEADLINE,
+            type=float,
+            help='The number of seconds allowed for refreshing a single item'
+        )
+
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            dest='resume',
+            default=False,
+            help='Resume the last unfinished run, skipping items that it already refreshed'
+        )
+
+        parser.add_argument(
+            '--since',
+            action='store',
+            dest='since',
+            default=None,
+            type=parse_age,
+            help='Only refresh items not successfully refreshed within an age such as 12h or 3d'
+        )
+
+        parser.add_argument(
+            '--budget',
+            action='store',
+            dest='budget',
+            default=None,
+            type=int,
+            help='Only refresh this many items, choosing those with the highest priority'
+        )
+
+        parser.add_argument(
+            '--report',
+            action='store',
+            dest='report',
+            default=None,
+            help='The path of a file to which a JSON report of throughput and latency is written'
+        )
+
+        parser.add_argument(
+            '--progress-log',
+            action='store',
+            dest='progress_log',
+            default=None,
+            help='The path of a file to which periodic JSON progress snapshots are appended'
+        )
+
+        parser.add_argument(
+            '--progress-interval',
+            action='store',
+            dest='progress_interval',
+            default=30,
+            type=float,
+            help='The number of seconds between progress snapshots'
+        )
+
     def handle(self, *arg, **options):
         items = AffiliateItem.objects.all().order_by('pk').select_related('network')
+        kind = REFRESH_KINDS['METADATA'] if options['meta'] else REFRESH_KINDS['DETAILS']
+
+        if options['since']:
+            items = exclude_recently_refreshed_items(items, kind, timezone.now() - options['since'])
+
+        run = None
+        if options['resume']:
+            run = find_resumable_refresh_run(kind)
+            if run:
+                items = exclude_completed_items(items, run)
+                self.stdout.write('Resuming the run started at %s' % run.started_at)
+            else:
+                self.stdout.write('No unfinished run exists, so starting a new run')
+
+        if options['budget'] is not None:
+            items = items.filter(pk__in=schedule_affiliate_items(items, options['budget']))
+
         total_count = items.count()
 
         if total_count == 0:
-            self.stdout.write('No affiliate items exist')
+            self.stdout.write('No affiliate items need refreshing')
+            if run:
+                finish_refresh_run(run)
             return
         else:
+            if run is None:
+                run = start_refresh_run(kind)
             target_noun = 'metadata' if options['meta'] else 'details'
             self.stdout.write('Updating %s for %d items with %d workers\n--' % (target_noun, total_count, options['workers']))
 
         if options['meta']:
-            create_batch_job = bulk_update_affiliate_item_metadata
+            batch_job = bulk_update_affiliate_item_metadata(items, deadline=options['deadline'], workers=options['workers'])
         else:
-            create_batch_job = bulk_update_affiliate_item_details
-
-        batch_job = create_batch_job(items, workers=options['workers'])
+            batch_job = bulk_update_affiliate_item_details(
+                items,
+                deadline=options['deadline'],
+                force=options['force'],
+                parse_queue_size=options['parse_queue_size'],
+                processes=options['processes'],
+                workers=options['workers'],
+                write_queue_size=options['write_queue_size']
+            )
 
         error_count = 0
         processed_count = 0
+        skipped_count = 0
         failed_updates = []
 
         item_labels = {}
         for item in items:
             item_labels[item.pk] = '%s: %s' % (item.network.name, item.name)
 
+        network_slugs = dict(AffiliateNetwork.objects.values_list('pk', 'slug'))
+        snapshot_at = monotonic() + options['progress_interval']
+
         try:
             for index, result in enumerate(batch_job.run()):
                 label = item_labels[result.item_id]
                 processed_count += 1
+                record_refresh_result(run, result)
+
+                if options['progress_log'] and monotonic() >= snapshot_at:
+                    snapshot_at = monotonic() + options['progress_interval']
+                    self._log_progress(options['progress_log'], batch_job.metrics.report(network_slugs), processed_count, total_count)
+
                 if result.is_error:
                     error_count += 1
                     self.stderr.write(self.style.ERROR('\n[!] %d/%d (%s)' % (index + 1, total_count, label)))
                     self.stderr.write(self.style.ERROR('--\n%s\n--\n' % result.details))
                     failed_updates.append(label)
+                elif result.is_skipped:
+                    skipped_count += 1
+                    self.stdout.write('%d/%d (%s) [UNCHANGED]' % (index + 1, total_count, label))
                 else:
                     self.stdout.write('%d/%d (%s)' % (index + 1, total_count, label))
         except BatchError:
@@ -71,8 +247,22 @@ class Command(BaseCommand):
         else:
             aborted = False
 
+        if not aborted:
+            finish_refresh_run(run)
+            if options['budget'] is not None:
+                decay_item_exposure()
+
+        if options['report']:
+            report = batch_job.metrics.report(network_slugs)
+            report['aborted'] = aborted
+            report['kind'] = kind
+            report['workers'] = options['workers']
+            with open(options['report'], 'w') as report_file:
+                json.dump(report, report_file, indent=2, sort_keys=True)
+
         if aborted:
             self.stderr.write(self.style.ERROR('Update aborted due to timeout'))
+            self.stderr.write(self.style.ERROR('Run again with --resume to skip the items already refreshed'))
             self.stderr.write(self.style.ERROR('\nUpdated %d/%d items' % (total_count - error_count, total_count)))
             self.stderr.write(self.style.ERROR('%d items could not be updated' % error_count))
         elif error_count:
@@ -83,5 +273,24 @@ class Command(BaseCommand):
         else:
             self.stdout.write(self.style.SUCCESS('\nUpdated all %d items' % (total_count)))
 
+        if not aborted:
+            changed_count = processed_count - error_count - skipped_count
+            self.stdout.write('%d items changed, %d items unchanged' % (changed_count, skipped_count))
+
         if error_count:
             sys.exit(1)
+
+    def _log_progress(self, path, report, processed_count, total_count):
+        """Append a snapshot of a job's progress to a log file.
+
+        Args:
+            path (str): The path to the log file
+            report (dict): A report of the job's metrics
+            processed_count (int): The number of items processed so far
+            total_count (int): The total number of items in the job
+        """
+        report['processed'] = processed_count
+        report['total'] = total_count
+
+        with open(path, 'a') as log_file:
+            log_file.write('%s\n' % json.dumps(report, sort_keys=True))
@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
 
-from chiton.rack.pricing import update_basic_price_points
+from chiton.rack.pricing import update_all_basic_price_points
 from chiton.runway.models import Basic
 
 
@@ -8,17 +8,15 @@ class Command(BaseCommand):
     help = 'Update the price points for all basics'
 
     def handle(self, *arg, **options):
-        basics = Basic.objects.all().order_by('name')
+        basics = list(Basic.objects.all().order_by('name'))
+        price_points = update_all_basic_price_points()
 
         for basic in basics:
-            previous_budget = basic.budget_end
-            previous_luxury = basic.luxury_start
-            budget_end, luxury_start = update_basic_price_points(basic)
-
-            if budget_end is not None and luxury_start is not None:
+            if basic.pk in price_points:
+                budget_end, luxury_start = price_points[basic.pk]
                 self.stdout.write(basic.name.upper())
-                self.stdout.write('Budget End: $%.02f => $%.02f' % (previous_budget, budget_end))
-                self.stdout.write('Luxury Start: $%.02f => $%.02f\n\n' % (previous_luxury, luxury_start))
+                self.stdout.write('Budget End: $%.02f => $%.02f' % (basic.budget_end, budget_end))
+                self.stdout.write('Luxury Start: $%.02f => $%.02f\n\n' % (basic.luxury_start, luxury_start))
             else:
                 self.stdout.write('%s [!]' % basic.name.upper())
                 self.stdout.write('No pricing information available\n\n')
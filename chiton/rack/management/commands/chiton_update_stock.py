@@ -15,6 +15,16 @@ class Command(BaseCommand):
             help='The number of workers to use'
         )
 
+        parser.add_argument(
+            '--budget',
+            action='store',
+            dest='budget',
+            default=None,
+            type=int,
+            help='The maximum number of items to refresh, prioritized by exposure, volatility and staleness'
+        )
+
     def handle(self, *arg, **options):
-        call_command('chiton_refresh_affiliate_items', workers=options['workers'])
+        call_command('chiton_refresh_affiliate_items', budget=options['budget'], workers=options['workers'])
         call_command('chiton_update_basic_price_points')
+        call_command('chiton_generate_image_derivatives')
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-19 09:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chiton_rack', '0021_affiliateitem_has_multiple_colors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='affiliateitem',
+            name='details_fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='details fingerprint'),
+        ),
+    ]
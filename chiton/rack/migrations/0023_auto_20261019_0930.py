@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-19 09:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chiton_rack', '0022_affiliateitem_details_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemimage',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64, verbose_name='content hash'),
+        ),
+        migrations.AddField(
+            model_name='itemimage',
+            name='source_etag',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='source ETag'),
+        ),
+        migrations.AddField(
+            model_name='itemimage',
+            name='source_last_modified',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='source last-modified date'),
+        ),
+    ]
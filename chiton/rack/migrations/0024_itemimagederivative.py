@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-19 11:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chiton_rack', '0023_auto_20261019_0930'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemImageDerivative',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.ImageField(height_field='height', max_length=255, upload_to='', verbose_name='file', width_field='width')),
+                ('format', models.CharField(choices=[('webp', 'WebP'), ('jpeg', 'JPEG')], max_length=10, verbose_name='format')),
+                ('height', models.PositiveIntegerField(verbose_name='height')),
+                ('width', models.PositiveIntegerField(verbose_name='width')),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='derivatives', to='chiton_rack.ItemImage', verbose_name='item image')),
+            ],
+            options={
+                'ordering': ('image', 'format', 'width'),
+                'verbose_name': 'item image derivative',
+                'verbose_name_plural': 'item image derivatives',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='itemimagederivative',
+            unique_together=set([('image', 'format', 'width')]),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-19 13:41
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chiton_rack', '0024_itemimagederivative'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RefreshRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('details', 'Details'), ('metadata', 'Metadata')], db_index=True, max_length=10, verbose_name='kind')),
+                ('started_at', models.DateTimeField(auto_now_add=True, verbose_name='started at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finished at')),
+            ],
+            options={
+                'ordering': ('-started_at',),
+                'verbose_name': 'refresh run',
+                'verbose_name_plural': 'refresh runs',
+            },
+        ),
+        migrations.CreateModel(
+            name='RefreshCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_id', models.PositiveIntegerField(verbose_name='affiliate item ID')),
+                ('status', models.CharField(choices=[('changed', 'Changed'), ('unchanged', 'Unchanged'), ('error', 'Error')], max_length=10, verbose_name='status')),
+                ('details', models.TextField(blank=True, default='', verbose_name='details')),
+                ('recorded_at', models.DateTimeField(auto_now=True, verbose_name='recorded at')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='chiton_rack.RefreshRun', verbose_name='refresh run')),
+            ],
+            options={
+                'verbose_name': 'refresh checkpoint',
+                'verbose_name_plural': 'refresh checkpoints',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='refreshcheckpoint',
+            unique_together=set([('run', 'item_id')]),
+        ),
+    ]
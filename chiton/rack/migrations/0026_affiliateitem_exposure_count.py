@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-19 14:18
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chiton_rack', '0025_refreshrun_refreshcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='affiliateitem',
+            name='exposure_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='exposure count'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-19 15:04
+from __future__ import unicode_literals
+
+import chiton.closet.model_fields
+from django.db import migrations
+
+
+def build_availability_masks(apps, schema_editor):
+    """Build each affiliate item's availability mask from its stock records."""
+    AffiliateItem = apps.get_model('chiton_rack', 'AffiliateItem')
+    StandardSize = apps.get_model('chiton_closet', 'StandardSize')
+    StockRecord = apps.get_model('chiton_rack', 'StockRecord')
+
+    quote_name = schema_editor.connection.ops.quote_name
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE %(items)s AS items
+            SET availability_mask = masks.availability_mask
+            FROM (
+                SELECT records.item_id, BIT_OR(1::bigint << sizes.ordinal) AS availability_mask
+                FROM %(records)s AS records
+                INNER JOIN %(sizes)s AS sizes ON sizes.id = records.size_id
+                WHERE records.is_available
+                GROUP BY records.item_id
+            ) AS masks
+            WHERE items.id = masks.item_id
+        """ % {
+            'items': quote_name(AffiliateItem._meta.db_table),
+            'records': quote_name(StockRecord._meta.db_table),
+            'sizes': quote_name(StandardSize._meta.db_table)
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chiton_closet', '0020_standardsize_ordinal'),
+        ('chiton_rack', '0026_affiliateitem_exposure_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='affiliateitem',
+            name='availability_mask',
+            field=chiton.closet.model_fields.AvailabilityMaskField(default=0, verbose_name='availability mask'),
+        ),
+        migrations.RunPython(build_availability_masks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-19 17:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chiton_rack', '0027_affiliateitem_availability_mask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RefreshJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('error', 'Error')], db_index=True, default='pending', max_length=10, verbose_name='status')),
+                ('images', models.TextField(blank=True, default='', verbose_name='custom image URLs')),
+                ('details', models.TextField(blank=True, default='', verbose_name='details')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='started at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finished at')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='refresh_jobs', to='chiton_rack.AffiliateItem', verbose_name='affiliate item')),
+            ],
+            options={
+                'ordering': ('-created_at',),
+                'verbose_name': 'refresh job',
+                'verbose_name_plural': 'refresh jobs',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-19 18:40
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chiton_rack', '0028_refreshjob'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            DELETE FROM chiton_rack_refreshjob duplicate
+            USING chiton_rack_refreshjob original
+            WHERE duplicate.status = 'pending'
+              AND original.status = 'pending'
+              AND duplicate.item_id = original.item_id
+              AND duplicate.images = original.images
+              AND duplicate.id > original.id;
+
+            CREATE UNIQUE INDEX chiton_rack_refreshjob_pending_uniq
+            ON chiton_rack_refreshjob (item_id, md5(images))
+            WHERE status = 'pending';
+            """,
+            'DROP INDEX chiton_rack_refreshjob_pending_uniq;'
+        ),
+    ]
@@ -1,10 +1,14 @@
 import os
 
 from django.db import models
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 
 from chiton.closet.models import Garment, StandardSize
-from chiton.closet.model_fields import PriceField
+from chiton.closet.model_fields import AvailabilityMaskField, PriceField
+from chiton.rack import data
 
 
 class AffiliateNetworkManager(models.Manager):
@@ -48,6 +52,9 @@ class AffiliateItem(models.Model):
     retailer = models.CharField(max_length=255, verbose_name=_('retailer'), db_index=True)
     affiliate_url = models.TextField(verbose_name=_('affiliate URL'))
     has_multiple_colors = models.BooleanField(verbose_name=_('has multiple colors'), default=False)
+    details_fingerprint = models.CharField(max_length=64, verbose_name=_('details fingerprint'), blank=True, default='')
+    exposure_count = models.PositiveIntegerField(verbose_name=_('exposure count'), default=0)
+    availability_mask = AvailabilityMaskField(verbose_name=_('availability mask'))
 
     class Meta:
         unique_together = ('guid', 'network')
@@ -83,6 +90,9 @@ class ItemImage(models.Model):
     height = models.PositiveIntegerField(verbose_name=_('height'))
     width = models.PositiveIntegerField(verbose_name=_('width'))
     source_url = models.URLField(verbose_name=_('source URL'))
+    content_hash = models.CharField(max_length=64, verbose_name=_('content hash'), blank=True, default='', db_index=True)
+    source_etag = models.CharField(max_length=255, verbose_name=_('source ETag'), blank=True, default='')
+    source_last_modified = models.CharField(max_length=255, verbose_name=_('source last-modified date'), blank=True, default='')
 
     class Meta:
         verbose_name = _('item image')
@@ -90,3 +100,96 @@ class ItemImage(models.Model):
 
     def __str__(self):
         return '%dx%d' % (self.width, self.height)
+
+
+class ItemImageDerivative(models.Model):
+    """A resized copy of an item image."""
+
+    image = models.ForeignKey(ItemImage, on_delete=models.CASCADE, verbose_name=_('item image'), related_name='derivatives')
+    file = models.ImageField(max_length=255, verbose_name=_('file'), height_field='height', width_field='width')
+    format = models.CharField(max_length=10, choices=data.IMAGE_FORMAT_CHOICES, verbose_name=_('format'))
+    height = models.PositiveIntegerField(verbose_name=_('height'))
+    width = models.PositiveIntegerField(verbose_name=_('width'))
+
+    class Meta:
+        ordering = ('image', 'format', 'width')
+        unique_together = ('image', 'format', 'width')
+        verbose_name = _('item image derivative')
+        verbose_name_plural = _('item image derivatives')
+
+    def __str__(self):
+        return '%dx%d %s' % (self.width, self.height, self.format)
+
+
+class RefreshRun(models.Model):
+    """A single run of a bulk refresh of affiliate items."""
+
+    kind = models.CharField(max_length=10, choices=data.REFRESH_KIND_CHOICES, verbose_name=_('kind'), db_index=True)
+    started_at = models.DateTimeField(verbose_name=_('started at'), auto_now_add=True)
+    finished_at = models.DateTimeField(verbose_name=_('finished at'), null=True, blank=True)
+
+    class Meta:
+        ordering = ('-started_at',)
+        verbose_name = _('refresh run')
+        verbose_name_plural = _('refresh runs')
+
+    def __str__(self):
+        return '%s: %s' % (self.get_kind_display(), self.started_at)
+
+
+class RefreshCheckpoint(models.Model):
+    """A record of the outcome of refreshing a single item during a run."""
+
+    run = models.ForeignKey(RefreshRun, on_delete=models.CASCADE, verbose_name=_('refresh run'), related_name='checkpoints')
+    item_id = models.PositiveIntegerField(verbose_name=_('affiliate item ID'))
+    status = models.CharField(max_length=10, choices=data.REFRESH_STATUS_CHOICES, verbose_name=_('status'))
+    details = models.TextField(verbose_name=_('details'), blank=True, default='')
+    recorded_at = models.DateTimeField(verbose_name=_('recorded at'), auto_now=True)
+
+    class Meta:
+        unique_together = ('run', 'item_id')
+        verbose_name = _('refresh checkpoint')
+        verbose_name_plural = _('refresh checkpoints')
+
+    def __str__(self):
+        return '%d: %s' % (self.item_id, self.get_status_display())
+
+
+class RefreshJob(models.Model):
+    """A queued request to refresh the details of a single affiliate item."""
+
+    item = models.ForeignKey(AffiliateItem, on_delete=models.CASCADE, verbose_name=_('affiliate item'), related_name='refresh_jobs')
+    status = models.CharField(max_length=10, choices=data.REFRESH_JOB_STATUS_CHOICES, default=data.REFRESH_JOB_STATUSES['PENDING'], verbose_name=_('status'), db_index=True)
+    images = models.TextField(verbose_name=_('custom image URLs'), blank=True, default='')
+    details = models.TextField(verbose_name=_('details'), blank=True, default='')
+    created_at = models.DateTimeField(verbose_name=_('created at'), auto_now_add=True)
+    started_at = models.DateTimeField(verbose_name=_('started at'), null=True, blank=True)
+    finished_at = models.DateTimeField(verbose_name=_('finished at'), null=True, blank=True)
+
+    class Meta:
+        ordering = ('-created_at',)
+        verbose_name = _('refresh job')
+        verbose_name_plural = _('refresh jobs')
+
+    def __str__(self):
+        return '%s: %s' % (self.item, self.get_status_display())
+
+    @property
+    def image_urls(self):
+        """The custom image URLs to use for the item.
+
+        Returns:
+            list[str]: The image URLs, which are empty when the network's images should be used
+        """
+        return [url for url in self.images.split('\n') if url]
+
+
+@receiver(post_delete, sender=StandardSize)
+def _clear_deleted_size_from_masks(sender, instance, **kwargs):
+    """Clear the bit of a deleted standard size from all availability masks.
+
+    This allows the ordinal of the deleted size to be given to a new size
+    without the new size matching items that stocked the deleted one.
+    """
+    bit = 1 << instance.ordinal
+    AffiliateItem.objects.filter(availability_mask__has_any=bit).update(availability_mask=F('availability_mask').bitand(~bit))
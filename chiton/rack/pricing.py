@@ -1,7 +1,95 @@
+from django.db import connection, transaction
+
+from chiton.closet.models import Garment
+from chiton.core.queries import refresh_cached_queries
 from chiton.rack.models import AffiliateItem
+from chiton.runway.models import Basic
+
+
+# The default fraction of prices that fall into the budget and luxury groups
+DEFAULT_CUTOFF = 0.33
+
+
+def calculate_basic_price_points(cutoff=DEFAULT_CUTOFF, basic_ids=None):
+    """Calculate the price points of basics using the prices of their offerings.
+
+    The price points of every basic are calculated in a single query, which
+    ranks the prices of each basic's affiliate items and picks the prices at the
+    lower and upper cutoffs.
+
+    Keyword Args:
+        basic_ids (list[int]): The IDs of the basics to limit the calculation to
+        cutoff (float): The cutoff for the lower and upper price groups
 
+    Returns:
+        dict: A mapping of basic IDs to two-tuples of their budget end and luxury start prices
+    """
+    basic_filter = ''
+    params = [cutoff]
+    if basic_ids is not None:
+        if not basic_ids:
+            return {}
+        basic_filter = 'AND garments.basic_id IN (%s)' % ', '.join(['%s'] * len(basic_ids))
+        params += list(basic_ids)
+
+    query = """
+        SELECT basic_id,
+            MAX(CASE WHEN position = cutoff_position THEN price END),
+            MAX(CASE WHEN position = total - cutoff_position + 1 THEN price END)
+        FROM (
+            SELECT garments.basic_id AS basic_id,
+                items.price AS price,
+                ROW_NUMBER() OVER (PARTITION BY garments.basic_id ORDER BY items.price) AS position,
+                COUNT(*) OVER (PARTITION BY garments.basic_id) AS total,
+                GREATEST(FLOOR(COUNT(*) OVER (PARTITION BY garments.basic_id) * %%s)::integer, 1) AS cutoff_position
+            FROM %(items)s AS items
+            INNER JOIN %(garments)s AS garments ON garments.id = items.garment_id
+            WHERE items.price IS NOT NULL %(basic_filter)s
+        ) AS ranked
+        GROUP BY basic_id
+    """ % {
+        'basic_filter': basic_filter,
+        'garments': connection.ops.quote_name(Garment._meta.db_table),
+        'items': connection.ops.quote_name(AffiliateItem._meta.db_table)
+    }
+
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+
+    return dict((basic_id, (budget_end, luxury_start)) for basic_id, budget_end, luxury_start in rows)
 
-def update_basic_price_points(basic, cutoff=0.33):
+
+def update_all_basic_price_points(cutoff=DEFAULT_CUTOFF):
+    """Update the price points of all basics using the prices of their offerings.
+
+    Only basics whose price points have changed are written, using a single
+    update statement, after which any cached queries involving basics are
+    refreshed once.
+
+    Keyword Args:
+        cutoff (float): The cutoff for the lower and upper price groups
+
+    Returns:
+        dict: A mapping of the IDs of all priced basics to two-tuples of their budget end and luxury start prices
+    """
+    price_points = calculate_basic_price_points(cutoff)
+    current = Basic.objects.filter(pk__in=price_points.keys()).values_list('pk', 'budget_end', 'luxury_start')
+
+    changed = []
+    for basic_id, budget_end, luxury_start in current:
+        if price_points[basic_id] != (budget_end, luxury_start):
+            changed.append((basic_id,) + price_points[basic_id])
+
+    if changed:
+        with transaction.atomic():
+            _bulk_update_price_points(changed)
+        refresh_cached_queries(Basic)
+
+    return price_points
+
+
+def update_basic_price_points(basic, cutoff=DEFAULT_CUTOFF):
     """Update the price points for a basic using the price of its offerings.
 
     This sets the budget and luxury points by examining the lower and upper
@@ -16,21 +104,38 @@ def update_basic_price_points(basic, cutoff=0.33):
     Returns:
         tuple: A two-tuple defining the budget start point and the luxury end point
     """
-    prices = (AffiliateItem.objects
-        .filter(garment__basic=basic)
-        .order_by('price')
-        .values_list('price', flat=True))
-    price_count = len(prices)
-
-    if not price_count:
+    price_points = calculate_basic_price_points(cutoff, basic_ids=[basic.pk])
+    if basic.pk not in price_points:
         return (None, None)
 
-    cutoff_index = max(int(price_count * cutoff) - 1, 0)
-    budget_end = prices[max(cutoff_index, 0)]
-    luxury_start = prices[max(price_count - 1 - cutoff_index, 0)]
+    budget_end, luxury_start = price_points[basic.pk]
 
-    basic.budget_end = budget_end
-    basic.luxury_start = luxury_start
-    basic.save()
+    if (basic.budget_end, basic.luxury_start) != (budget_end, luxury_start):
+        basic.budget_end = budget_end
+        basic.luxury_start = luxury_start
+        basic.save()
 
     return (budget_end, luxury_start)
+
+
+def _bulk_update_price_points(price_points):
+    """Write the price points of multiple basics in a single statement.
+
+    Args:
+        price_points (list[tuple]): Three-tuples of a basic's ID, budget end and luxury start prices
+    """
+    values = ', '.join(['(%s::integer, %s::numeric, %s::numeric)'] * len(price_points))
+    params = [value for row in price_points for value in row]
+
+    query = """
+        UPDATE %(basics)s AS basics
+        SET budget_end = points.budget_end, luxury_start = points.luxury_start
+        FROM (VALUES %(values)s) AS points (id, budget_end, luxury_start)
+        WHERE basics.id = points.id
+    """ % {
+        'basics': connection.ops.quote_name(Basic._meta.db_table),
+        'values': values
+    }
+
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
@@ -1,6 +1,7 @@
 from base64 import b64decode
 import json
 import os
+import tempfile
 
 from chiton.core.environment import use_config
 
@@ -185,6 +186,8 @@ SHOPSTYLE_UID = config['shopstyle_uid']
 
 CHITON_ALLOW_API_BROWSING = config['allow_api_browsing']
 CHITON_API_IS_PUBLIC = config['public_api']
+CHITON_BUFFER_RECOMMENDATIONS = True
+CHITON_RECOMMENDATION_SPOOL = config['recommendation_spool'] or os.path.join(tempfile.gettempdir(), 'chiton-recommendations')
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -192,6 +195,10 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'chiton.api.renderers.FragmentJSONRenderer',
+        'chiton.api.renderers.MessagePackRenderer',
     )
 }
 
@@ -199,9 +206,8 @@ if CHITON_ALLOW_API_BROWSING:
     REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'] += (
         'rest_framework.authentication.SessionAuthentication',
     )
-else:
-    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = (
-        'rest_framework.renderers.JSONRenderer',
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] += (
+        'rest_framework.renderers.BrowsableAPIRenderer',
     )
 
 # Encryption
@@ -10,4 +10,10 @@ class Config(AppConfig):
 
     def ready(self):
         """Import all code that uses cached queries."""
+        from chiton.core.queries import bind_signal_handlers
         from chiton.wintour.pipelines.core import CorePipeline # noqa
+        from chiton.wintour.snapshots import GENERATION_NAMESPACE
+
+        # Bind the catalog generation's handlers, since the core app binds its
+        # handlers before this app is ready
+        bind_signal_handlers(GENERATION_NAMESPACE)
@@ -0,0 +1,466 @@
+import atexit
+from collections import deque
+import fcntl
+import json
+import os
+from threading import Event, Lock, Thread
+from time import monotonic
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, DatabaseError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from chiton.wintour.models import Recommendation, RecommendationProfile
+
+
+# The number of buffered recommendations that triggers a flush
+DEFAULT_FLUSH_SIZE = 100
+
+# The maximum number of seconds that a recommendation remains buffered
+DEFAULT_FLUSH_INTERVAL = 5
+
+# The number of recommendation IDs reserved from the database at once
+DEFAULT_RESERVE_SIZE = 100
+
+# The number of seconds for which any process can save a buffered recommendation
+DEFAULT_PENDING_TTL = 60 * 60
+
+# The prefix for the cache keys of buffered recommendations
+PENDING_KEY_PREFIX = 'pending-recommendation'
+
+# The number of seconds between attempts to save recommendations left on disk
+DEFAULT_RECOVERY_INTERVAL = 60
+
+# The extension of spooled recommendation files
+SPOOL_EXTENSION = '.jsonl'
+
+# The extension of the journals of buffered recommendations
+JOURNAL_EXTENSION = '.journal'
+
+
+class RecommendationBuffer:
+    """A write-behind buffer for recommendation records.
+
+    Recommendations added to the buffer are assigned an ID immediately, drawn
+    from a block of IDs reserved from the database sequence, and are written
+    with a single bulk insert once enough of them have been buffered or the
+    oldest has waited for the flush interval.  Each buffered recommendation is
+    also shared through the cache, so that any process can save it when it is
+    requested before it has been written.  Any recommendations that cannot be
+    written are spooled to disk, and the buffer is flushed when the process
+    exits.
+
+    Each buffered recommendation is appended to a journal in the spool
+    directory before its ID is returned, and the journal only ever holds the
+    recommendations that have yet to be written or spooled.  A buffer holds a
+    lock on its journal, so the journal of a process that was killed can be
+    told apart from a live one, and is loaded along with the spool files.
+    """
+
+    def __init__(self, flush_size=DEFAULT_FLUSH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL, reserve_size=DEFAULT_RESERVE_SIZE, pending_ttl=DEFAULT_PENDING_TTL, recovery_interval=DEFAULT_RECOVERY_INTERVAL, spool_dir=None, background=True, clock=monotonic):
+        """Create a new buffer.
+
+        Keyword Args:
+            background (bool): Whether to enforce the flush interval, recover orphaned recommendations and flush on exit from a background thread
+            clock (function): A function returning the current time in seconds
+            flush_interval (float): The maximum number of seconds a recommendation remains buffered
+            flush_size (int): The number of buffered recommendations that triggers a flush
+            pending_ttl (int): The number of seconds for which any process can save a buffered recommendation
+            recovery_interval (float): The number of seconds between attempts to save recommendations left on disk
+            reserve_size (int): The number of IDs to reserve at once
+            spool_dir (str): The directory in which to spool and journal unwritten recommendations
+        """
+        self.background = background
+        self.clock = clock
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.pending_ttl = pending_ttl
+        self.recovery_interval = recovery_interval
+        self.reserve_size = reserve_size
+        self.spool_dir = spool_dir
+
+        self._flush_lock = Lock()
+        self._flusher = None
+        self._journal = None
+        self._journal_path = None
+        self._journal_pid = None
+        self._lock = Lock()
+        self._oldest = None
+        self._pending = []
+        self._reserved_ids = deque()
+        self._stopped = Event()
+
+    def add(self, profile, ip_address=None):
+        """Buffer a new recommendation.
+
+        Args:
+            profile (chiton.wintour.profiles.PipelineProfile): The profile data
+
+        Keyword Args:
+            ip_address (str): The IP address of the requester
+
+        Returns:
+            int: The ID of the recommendation
+        """
+        with self._lock:
+            if not self._reserved_ids:
+                self._reserved_ids.extend(_reserve_recommendation_ids(self.reserve_size))
+
+            record = {
+                'created_at': timezone.now(),
+                'id': self._reserved_ids.popleft(),
+                'ip_address': ip_address,
+                'profile': dict(profile)
+            }
+            self._journal_record(record)
+            cache.set(_get_pending_key(record['id']), record, self.pending_ttl)
+
+            if not self._pending:
+                self._oldest = self.clock()
+            self._pending.append(record)
+
+            should_flush = len(self._pending) >= self.flush_size
+            if self.background:
+                self._start_flusher()
+
+        if should_flush:
+            self.flush()
+
+        return record['id']
+
+    def flush(self):
+        """Write all buffered recommendations.
+
+        Returns:
+            int: The number of recommendations written or spooled
+        """
+        with self._flush_lock:
+            return self._write_pending()
+
+    def flush_if_pending(self, recommendation_id):
+        """Ensure that a recommendation is saved if it is still buffered.
+
+        A recommendation buffered by this process causes the buffer to be
+        flushed, and if it is already being written by another thread, this
+        waits for that write to finish.  A recommendation buffered by another
+        process is saved from the copy shared through the cache.
+
+        Args:
+            recommendation_id (int): The ID of a recommendation
+
+        Returns:
+            bool: Whether the recommendation was still buffered
+        """
+        with self._flush_lock:
+            with self._lock:
+                is_pending = any(r['id'] == recommendation_id for r in self._pending)
+
+            if is_pending:
+                self._write_pending()
+                return True
+
+        pending_key = _get_pending_key(recommendation_id)
+        record = cache.get(pending_key)
+        if record is None:
+            return False
+
+        with transaction.atomic():
+            _save_recommendation_records([record])
+        cache.delete(pending_key)
+
+        return True
+
+    def flush_if_stale(self):
+        """Write the buffered recommendations if the oldest has exceeded the flush interval.
+
+        Returns:
+            bool: Whether the buffer was flushed
+        """
+        with self._lock:
+            is_stale = self._oldest is not None and self.clock() - self._oldest >= self.flush_interval
+
+        if is_stale:
+            self.flush()
+
+        return is_stale
+
+    def stop(self):
+        """Stop the background flusher and write any buffered recommendations."""
+        self._stopped.set()
+        self.flush()
+
+    def _write_pending(self):
+        """Write all buffered recommendations, spooling them if the write fails.
+
+        Returns:
+            int: The number of recommendations written or spooled
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = []
+            self._oldest = None
+
+        if not pending:
+            return 0
+
+        try:
+            with transaction.atomic():
+                _save_recommendation_records(pending)
+        except DatabaseError:
+            self._spool(pending)
+        else:
+            cache.delete_many([_get_pending_key(record['id']) for record in pending])
+
+        with self._lock:
+            self._compact_journal()
+
+        return len(pending)
+
+    def _journal_record(self, record):
+        """Append a buffered recommendation to the journal of this process.
+
+        The journal is flushed after each record, so that the record survives
+        the process being killed.  This must be called while holding the
+        buffer's lock.
+
+        Args:
+            record (dict): The record of a buffered recommendation
+        """
+        if self._journal is None or self._journal_pid != os.getpid():
+            spool_dir = self.spool_dir or settings.CHITON_RECOMMENDATION_SPOOL
+            os.makedirs(spool_dir, exist_ok=True)
+
+            file_name = '%d-%s%s' % (os.getpid(), uuid.uuid4().hex, JOURNAL_EXTENSION)
+            journal_path = os.path.join(spool_dir, file_name)
+            partial_path = '%s.partial' % journal_path
+
+            # Lock the journal before giving it a name that a loader reads, so
+            # that a loader never mistakes a new journal for an orphaned one
+            self._journal = open(partial_path, 'w')
+            self._journal_pid = os.getpid()
+            fcntl.flock(self._journal, fcntl.LOCK_EX)
+            os.rename(partial_path, journal_path)
+            self._journal_path = journal_path
+
+        self._journal.write(_encode_record(record))
+        self._journal.flush()
+
+    def _compact_journal(self):
+        """Replace the journal with one holding only the still-buffered recommendations.
+
+        The remaining recommendations are written to a new journal before the
+        current one is removed, so that a process killed while compacting its
+        journal leaves every recommendation in at least one journal.  This must
+        be called while holding the buffer's lock.
+        """
+        journal = self._journal
+        journal_path = self._journal_path
+        if journal is None or self._journal_pid != os.getpid():
+            return
+
+        self._journal = None
+        for record in self._pending:
+            self._journal_record(record)
+
+        os.remove(journal_path)
+        journal.close()
+
+    def _start_flusher(self):
+        """Start the thread that enforces the flush interval, if it is not running."""
+        if self._flusher:
+            return
+
+        self._flusher = Thread(target=self._run_flusher, daemon=True)
+        self._flusher.start()
+        atexit.register(self.stop)
+
+    def _run_flusher(self):
+        """Periodically flush stale recommendations until the buffer is stopped.
+
+        The flusher also periodically saves the recommendations left on disk,
+        which includes those spooled by any process and those in the journals
+        of processes that exited without flushing their buffers.
+        """
+        recovered_at = None
+
+        try:
+            while True:
+                if recovered_at is None or self.clock() - recovered_at >= self.recovery_interval:
+                    recovered_at = self.clock()
+
+                    # A failed recovery leaves the files in place for the next attempt
+                    try:
+                        load_spooled_recommendations(self.spool_dir)
+                    except (DatabaseError, OSError):
+                        pass
+
+                if self._stopped.wait(self.flush_interval / 2):
+                    break
+                self.flush_if_stale()
+        finally:
+            connection.close()
+
+    def _spool(self, records):
+        """Durably write recommendations that could not be saved to a spool file.
+
+        Args:
+            records (list[dict]): The records of unsaved recommendations
+        """
+        spool_dir = self.spool_dir or settings.CHITON_RECOMMENDATION_SPOOL
+        os.makedirs(spool_dir, exist_ok=True)
+
+        file_name = '%d-%s%s' % (os.getpid(), uuid.uuid4().hex, SPOOL_EXTENSION)
+        spool_path = os.path.join(spool_dir, file_name)
+        partial_path = '%s.partial' % spool_path
+
+        # Write to a partial file that is only renamed once complete, so that
+        # a loader never reads a partially spooled batch
+        with open(partial_path, 'w') as spool_file:
+            for record in records:
+                spool_file.write(_encode_record(record))
+            spool_file.flush()
+            os.fsync(spool_file.fileno())
+
+        os.rename(partial_path, spool_path)
+
+
+def load_spooled_recommendations(spool_dir=None):
+    """Save all spooled recommendations and remove their spool files.
+
+    This also saves the recommendations in the journals of any processes that
+    exited without flushing their buffers, while the journals of running
+    processes, which remain locked, are skipped.  Recommendations whose IDs
+    already exist are skipped, which allows a spool file to be loaded again if
+    loading it was interrupted.
+
+    Keyword Args:
+        spool_dir (str): The directory containing spooled recommendations
+
+    Returns:
+        int: The number of recommendations saved
+    """
+    spool_dir = spool_dir or settings.CHITON_RECOMMENDATION_SPOOL
+    if not os.path.isdir(spool_dir):
+        return 0
+
+    saved_count = 0
+
+    for file_name in sorted(os.listdir(spool_dir)):
+        if not file_name.endswith((SPOOL_EXTENSION, JOURNAL_EXTENSION)):
+            continue
+
+        spool_path = os.path.join(spool_dir, file_name)
+        try:
+            spool_file = open(spool_path)
+        except FileNotFoundError:
+            continue
+
+        with spool_file:
+            try:
+                fcntl.flock(spool_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+
+            # Ignore a final line that was only partially written, which can
+            # only belong to a recommendation whose ID was never returned
+            records = [json.loads(line) for line in spool_file if line.strip() and line.endswith('\n')]
+
+            for record in records:
+                record['created_at'] = parse_datetime(record['created_at'])
+
+            with transaction.atomic():
+                saved_count += _save_recommendation_records(records)
+
+            try:
+                os.remove(spool_path)
+            except FileNotFoundError:
+                pass
+
+    return saved_count
+
+
+def _save_recommendation_records(records):
+    """Save recommendations from their records, skipping any that already exist.
+
+    Each record is a dict with the recommendation's `id`, `profile` data,
+    `ip_address` and the `created_at` time at which it was requested.
+
+    Args:
+        records (list[dict]): The records of recommendations
+
+    Returns:
+        int: The number of recommendations saved
+    """
+    if not records:
+        return 0
+
+    digests = RecommendationProfile.objects.ensure_exist([record['profile'] for record in records])
+
+    values = ', '.join(['(%s, %s, %s, %s)'] * len(records))
+    params = []
+    for record, digest in zip(records, digests):
+        params += [record['id'], digest, record['ip_address'], record['created_at']]
+
+    query = """
+        INSERT INTO %(recommendations)s (id, profile_id, ip_address, created_at)
+        VALUES %(values)s
+        ON CONFLICT (id) DO NOTHING
+    """ % {
+        'recommendations': connection.ops.quote_name(Recommendation._meta.db_table),
+        'values': values
+    }
+
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        return cursor.rowcount
+
+
+def _encode_record(record):
+    """Encode the record of a recommendation as a line of JSON.
+
+    Args:
+        record (dict): The record of a recommendation
+
+    Returns:
+        str: The encoded record, including a trailing newline
+    """
+    return '%s\n' % json.dumps(dict(record, created_at=record['created_at'].isoformat()))
+
+
+def _get_pending_key(recommendation_id):
+    """Get the cache key of a buffered recommendation.
+
+    Args:
+        recommendation_id (int): The ID of a recommendation
+
+    Returns:
+        str: The cache key
+    """
+    return '%s:%d' % (PENDING_KEY_PREFIX, recommendation_id)
+
+
+def _reserve_recommendation_ids(count):
+    """Reserve IDs for new recommendations from the database sequence.
+
+    Args:
+        count (int): The number of IDs to reserve
+
+    Returns:
+        list[int]: The reserved IDs, which are unique but may not be contiguous
+    """
+    query = "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)"
+
+    with connection.cursor() as cursor:
+        cursor.execute(query, [Recommendation._meta.db_table, count])
+        return [row[0] for row in cursor.fetchall()]
+
+
+# The buffer used by the API, which writes each recommendation immediately
+# when buffering is disabled
+recommendation_buffer = RecommendationBuffer(
+    background=settings.CHITON_BUFFER_RECOMMENDATIONS,
+    flush_size=DEFAULT_FLUSH_SIZE if settings.CHITON_BUFFER_RECOMMENDATIONS else 1
+)
@@ -0,0 +1,217 @@
+from concurrent.futures import Future
+import hashlib
+import json
+from threading import Lock
+from time import monotonic, sleep
+import zlib
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+from chiton.wintour.matching import make_recommendations
+from chiton.wintour.profiles import hash_pipeline_profile
+from chiton.wintour.snapshots import get_catalog_generation
+
+
+# The maximum number of seconds for which a process holds the lock for computing shared recommendations
+DEFAULT_LOCK_TTL = 30
+
+# The maximum number of seconds that a process waits for another process's recommendations
+DEFAULT_WAIT_TIMEOUT = 5
+
+# The number of seconds between checks for another process's recommendations
+DEFAULT_POLL_INTERVAL = 0.05
+
+# The number of seconds for which shared recommendations are retained
+DEFAULT_RESULT_TTL = 30
+
+# The prefix for the cache keys of shared recommendation results
+RESULT_KEY_PREFIX = 'coalesced-recommendations'
+
+# The prefix for the cache keys of locks on shared recommendation results
+LOCK_KEY_PREFIX = 'coalesced-recommendations-lock'
+
+
+class RecommendationCoalescer:
+    """A single-flight wrapper for computing recommendations.
+
+    Concurrent requests for the recommendations of the same normalized profile
+    share a single computation.  Within a process, duplicate requests wait for
+    the result of the request already in flight.  Across processes, the first
+    process to claim a short-lived cache lock computes the recommendations and
+    stores them in the cache, while other processes wait briefly for the
+    stored result before falling back to computing it themselves.
+    """
+
+    def __init__(self, lock_ttl=DEFAULT_LOCK_TTL, wait_timeout=DEFAULT_WAIT_TIMEOUT, poll_interval=DEFAULT_POLL_INTERVAL, result_ttl=DEFAULT_RESULT_TTL, clock=monotonic):
+        """Create a new coalescer.
+
+        Keyword Args:
+            clock (function): A function returning the current time in seconds
+            lock_ttl (int): The maximum number of seconds for which a process holds a lock
+            poll_interval (float): The number of seconds between checks for another process's result
+            result_ttl (int): The number of seconds for which shared results are retained
+            wait_timeout (float): The maximum number of seconds to wait for another process's result
+        """
+        self.clock = clock
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self.wait_timeout = wait_timeout
+
+        self._in_flight = {}
+        self._lock = Lock()
+
+    def make_recommendations(self, profile, pipeline, projection=None):
+        """Make recommendations for a profile, sharing any identical computation in flight.
+
+        The returned recommendations are a shallow copy of the shared result,
+        so callers may add top-level keys but must not modify nested data.
+
+        Args:
+            profile (chiton.wintour.profiles.PipelineProfile): A profile for which to make recommendations
+            pipeline (chiton.wintour.pipelines.BasePipeline): An instance of a pipeline class
+
+        Keyword Args:
+            projection (chiton.wintour.projections.FieldProjection): The fields to build for each garment
+
+        Returns:
+            chiton.wintour.pipeline.Recommendations: The recommendations data
+        """
+        key = _get_coalescing_key(profile, pipeline, projection)
+
+        with self._lock:
+            future = self._in_flight.get(key, None)
+            is_leader = future is None
+            if is_leader:
+                future = self._in_flight[key] = Future()
+
+        if not is_leader:
+            return dict(future.result())
+
+        try:
+            recommendations = self._make_shared_recommendations(key, profile, pipeline, projection)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(recommendations)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+        return dict(recommendations)
+
+    def _make_shared_recommendations(self, key, profile, pipeline, projection):
+        """Make recommendations, reusing the result of another process if possible.
+
+        Args:
+            key (str): The coalescing key for the recommendations
+            profile (chiton.wintour.profiles.PipelineProfile): A profile for which to make recommendations
+            pipeline (chiton.wintour.pipelines.BasePipeline): An instance of a pipeline class
+            projection (chiton.wintour.projections.FieldProjection): The fields to build for each garment
+
+        Returns:
+            chiton.wintour.pipeline.Recommendations: The recommendations data
+        """
+        result_key = '%s:%s' % (RESULT_KEY_PREFIX, key)
+        lock_key = '%s:%s' % (LOCK_KEY_PREFIX, key)
+
+        recommendations = _load_result(result_key)
+        if recommendations is not None:
+            return recommendations
+
+        has_lock = cache.add(lock_key, True, self.lock_ttl)
+        if not has_lock:
+            recommendations = self._wait_for_result(result_key, lock_key)
+            if recommendations is not None:
+                return recommendations
+
+        try:
+            recommendations = make_recommendations(profile, pipeline, projection=projection)
+            _store_result(result_key, recommendations, self.result_ttl)
+        finally:
+            if has_lock:
+                cache.delete(lock_key)
+
+        return recommendations
+
+    def _wait_for_result(self, result_key, lock_key):
+        """Wait for another process to store the result of its computation.
+
+        Waiting stops early if the other process releases its lock without
+        storing a result, or if the lock cannot be read from the cache.
+
+        Args:
+            result_key (str): The cache key of the shared result
+            lock_key (str): The cache key of the lock held by the computing process
+
+        Returns:
+            chiton.wintour.pipeline.Recommendations: The stored recommendations, or None if none were stored in time
+        """
+        deadline = self.clock() + self.wait_timeout
+
+        while self.clock() < deadline:
+            sleep(self.poll_interval)
+
+            recommendations = _load_result(result_key)
+            if recommendations is not None:
+                return recommendations
+            elif cache.get(lock_key) is None:
+                return None
+
+        return None
+
+
+def _get_coalescing_key(profile, pipeline, projection):
+    """Get the key identifying identical recommendation requests.
+
+    Args:
+        profile (chiton.wintour.profiles.PipelineProfile): A profile for which to make recommendations
+        pipeline (chiton.wintour.pipelines.BasePipeline): An instance of a pipeline class
+        projection (chiton.wintour.projections.FieldProjection): The fields to build for each garment
+
+    Returns:
+        str: The coalescing key
+    """
+    parts = [
+        type(pipeline).__name__,
+        get_catalog_generation(),
+        hash_pipeline_profile(profile),
+        projection.get_key() if projection else None
+    ]
+    encoded = json.dumps(parts, separators=(',', ':'))
+
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def _load_result(result_key):
+    """Load a shared recommendations result from the cache.
+
+    Args:
+        result_key (str): The cache key of the result
+
+    Returns:
+        chiton.wintour.pipeline.Recommendations: The recommendations, or None if no result is stored
+    """
+    encoded = cache.get(result_key)
+    if encoded is None:
+        return None
+
+    return json.loads(zlib.decompress(encoded).decode('utf-8'))
+
+
+def _store_result(result_key, recommendations, ttl):
+    """Store a shared recommendations result in the cache.
+
+    Args:
+        result_key (str): The cache key of the result
+        recommendations (chiton.wintour.pipeline.Recommendations): The computed recommendations
+        ttl (int): The number of seconds for which to retain the result
+    """
+    encoded = json.dumps(recommendations, cls=DjangoJSONEncoder, separators=(',', ':'))
+    cache.set(result_key, zlib.compress(encoded.encode('utf-8')), ttl)
+
+
+# The coalescer used by the API
+recommendation_coalescer = RecommendationCoalescer()
@@ -0,0 +1,10 @@
+class CursorError(Exception):
+    """An error indicating an invalid or outdated pagination cursor."""
+
+
+class GroupNotFoundError(Exception):
+    """An error indicating that recommendations lack a requested facet group."""
+
+
+class ProjectionError(Exception):
+    """An error indicating an unknown field in a projection."""
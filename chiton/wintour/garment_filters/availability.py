@@ -1,4 +1,5 @@
-from chiton.rack.models import StockRecord
+from chiton.closet.models import StandardSize
+from chiton.rack.models import AffiliateItem
 from chiton.wintour.garment_filters import BaseGarmentFilter
 
 
@@ -13,12 +14,14 @@ class AvailabilityGarmentFilter(BaseGarmentFilter):
 
         # Build a lookup table that maps garment primary keys to arbitrary
         # booleans, with the presence of garments determined by their having at
-        # least one available size that matches the user's sizes
+        # least one affiliate item whose availability mask includes one of the
+        # user's sizes
+        size_mask = StandardSize.objects.get_mask(profile['sizes'])
         available_garment_ids = (
-            StockRecord.objects
-            .filter(size__slug__in=profile['sizes'], is_available=True)
-            .select_related('item')
-            .values_list('item__garment_id', flat=True)
+            AffiliateItem.objects
+            .filter(availability_mask__has_any=size_mask)
+            .values_list('garment_id', flat=True)
+            .distinct()
         )
         for garment_id in available_garment_ids:
             available_garments[garment_id] = True
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from chiton.wintour.buffers import load_spooled_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Save any recommendations that were spooled to disk or left buffered by a process that exited'
+
+    def handle(self, *arg, **options):
+        saved_count = load_spooled_recommendations()
+        self.stdout.write(self.style.SUCCESS('Saved %d spooled recommendations' % saved_count))
@@ -16,7 +16,7 @@ PersonRecommendation = define_data_shape({
 })
 
 
-def make_recommendations(pipeline_profile, pipeline, debug=False, max_garments_per_group=None):
+def make_recommendations(pipeline_profile, pipeline, debug=False, max_garments_per_group=None, projection=None):
     """Return garment recommendations for a wardrobe profile.
 
     Args:
@@ -26,6 +26,7 @@ def make_recommendations(pipeline_profile, pipeline, debug=False, max_garments_p
     Keyword Args:
         debug (bool): Whether to generate debug statistics
         max_garments_per_group (int): The maximum number of garments to return per facet group
+        projection (chiton.wintour.projections.FieldProjection): The fields to build for each garment
 
     Returns:
         chiton.wintour.pipeline.Recommendations: The recommendations data
@@ -34,7 +35,7 @@ def make_recommendations(pipeline_profile, pipeline, debug=False, max_garments_p
         previous_queries = set([q['sql'] for q in connection.queries])
         start_time = default_timer()
 
-    recs = pipeline.make_recommendations(pipeline_profile, debug=debug, max_garments_per_group=max_garments_per_group)
+    recs = pipeline.make_recommendations(pipeline_profile, debug=debug, max_garments_per_group=max_garments_per_group, projection=projection)
 
     if debug:
         elapsed_time = default_timer() - start_time
@@ -46,6 +47,25 @@ def make_recommendations(pipeline_profile, pipeline, debug=False, max_garments_p
     return recs
 
 
+def make_recommendations_many(pipeline_profiles, pipeline, max_garments_per_group=None, projection=None):
+    """Return garment recommendations for many wardrobe profiles.
+
+    The pipeline loads its garments and lookups once for the batch.
+
+    Args:
+        pipeline_profiles (list[chiton.wintour.profiles.PipelineProfile]): The profiles for which to make recommendations
+        pipeline (chiton.wintour.pipelines.BasePipeline): An instance of a pipeline class
+
+    Keyword Args:
+        max_garments_per_group (int): The maximum number of garments to return per facet group
+        projection (chiton.wintour.projections.FieldProjection): The fields to build for each garment
+
+    Returns:
+        list[chiton.wintour.pipeline.Recommendations]: The recommendations for each profile, in input order
+    """
+    return pipeline.make_recommendations_many(pipeline_profiles, max_garments_per_group=max_garments_per_group, projection=projection)
+
+
 def convert_recommendation_to_wardrobe_profile(recommendation, person=None):
     """Convert a recommendation to a wardrobe profile.
 
@@ -65,7 +85,7 @@ def convert_recommendation_to_wardrobe_profile(recommendation, person=None):
     else:
         return existing_profile
 
-    data = recommendation.profile
+    data = recommendation.profile.data
 
     formality_lookup = _get_formality_pks_by_slug()
     size_lookup = _get_size_pks_by_slug()
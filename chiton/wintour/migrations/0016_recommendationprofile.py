@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-19 17:58
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chiton_wintour', '0015_wardrobeprofile_recommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationProfile',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='digest')),
+                ('data', django.contrib.postgres.fields.jsonb.JSONField(verbose_name='The profile data')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+            ],
+            options={
+                'verbose_name': 'recommendation profile',
+                'verbose_name_plural': 'recommendation profiles',
+            },
+        ),
+        migrations.AddField(
+            model_name='recommendation',
+            name='stored_profile',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='recommendations', to='chiton_wintour.RecommendationProfile', verbose_name='profile'),
+        ),
+        migrations.AlterField(
+            model_name='recommendation',
+            name='profile',
+            field=django.contrib.postgres.fields.jsonb.JSONField(null=True, verbose_name='The profile data'),
+        ),
+    ]
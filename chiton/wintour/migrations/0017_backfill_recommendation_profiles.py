@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-19 17:59
+from __future__ import unicode_literals
+
+from hashlib import sha256
+import json
+
+from django.db import migrations, transaction
+
+
+# The number of recommendations whose profiles are moved in each transaction
+CHUNK_SIZE = 1000
+
+# The profile fields whose values are lists in which order has no meaning
+UNORDERED_PROFILE_FIELDS = ('avoid_care', 'expectations', 'sizes', 'styles')
+
+
+def serialize_profile_data(data):
+    return json.dumps(data, separators=(',', ':'), sort_keys=True)
+
+
+def normalize_pipeline_profile(profile):
+    """Normalize a profile as chiton.wintour.profiles did when this migration was written."""
+    normalized = dict(profile)
+
+    for field in UNORDERED_PROFILE_FIELDS:
+        values = normalized.get(field, None)
+        if isinstance(values, list):
+            normalized[field] = sorted(values, key=serialize_profile_data)
+
+    return normalized
+
+
+def hash_pipeline_profile(profile):
+    """Hash a profile as chiton.wintour.profiles did when this migration was written."""
+    serialized = serialize_profile_data(normalize_pipeline_profile(profile))
+    return sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def store_recommendation_profiles(apps, schema_editor):
+    Recommendation = apps.get_model('chiton_wintour', 'Recommendation')
+    RecommendationProfile = apps.get_model('chiton_wintour', 'RecommendationProfile')
+
+    connection = schema_editor.connection
+    quote_name = connection.ops.quote_name
+    pending = Recommendation.objects.filter(stored_profile__isnull=True, profile__isnull=False).order_by('pk')
+
+    while True:
+        chunk = list(pending.values_list('pk', 'profile')[:CHUNK_SIZE])
+        if not chunk:
+            break
+
+        profiles = {}
+        links = []
+        for recommendation_id, profile in chunk:
+            digest = hash_pipeline_profile(profile)
+            profiles.setdefault(digest, normalize_pipeline_profile(profile))
+            links.append((recommendation_id, digest))
+
+        profile_params = []
+        for digest, profile in profiles.items():
+            profile_params += [digest, json.dumps(profile)]
+
+        link_params = []
+        for link in links:
+            link_params += list(link)
+
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO %s (digest, data, created_at) VALUES %s ON CONFLICT (digest) DO NOTHING' % (
+                    quote_name(RecommendationProfile._meta.db_table),
+                    ', '.join(['(%s, %s::jsonb, NOW())'] * len(profiles))
+                ),
+                profile_params
+            )
+            cursor.execute(
+                'UPDATE %s AS recommendations SET stored_profile_id = links.digest FROM (VALUES %s) AS links (id, digest) WHERE recommendations.id = links.id' % (
+                    quote_name(Recommendation._meta.db_table),
+                    ', '.join(['(%s::integer, %s)'] * len(links))
+                ),
+                link_params
+            )
+
+
+def restore_recommendation_profiles(apps, schema_editor):
+    Recommendation = apps.get_model('chiton_wintour', 'Recommendation')
+    RecommendationProfile = apps.get_model('chiton_wintour', 'RecommendationProfile')
+
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'UPDATE %(recommendations)s AS recommendations SET profile = profiles.data FROM %(profiles)s AS profiles WHERE profiles.digest = recommendations.stored_profile_id' % {
+                'profiles': connection.ops.quote_name(RecommendationProfile._meta.db_table),
+                'recommendations': connection.ops.quote_name(Recommendation._meta.db_table)
+            }
+        )
+
+
+class Migration(migrations.Migration):
+
+    # Commit each chunk of the backfill separately
+    atomic = False
+
+    dependencies = [
+        ('chiton_wintour', '0016_recommendationprofile'),
+    ]
+
+    operations = [
+        migrations.RunPython(store_recommendation_profiles, restore_recommendation_profiles),
+    ]
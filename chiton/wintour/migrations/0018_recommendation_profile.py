@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-19 18:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chiton_wintour', '0017_backfill_recommendation_profiles'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='recommendation',
+            name='profile',
+        ),
+        migrations.RenameField(
+            model_name='recommendation',
+            old_name='stored_profile',
+            new_name='profile',
+        ),
+        migrations.AlterField(
+            model_name='recommendation',
+            name='profile',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='recommendations', to='chiton_wintour.RecommendationProfile', verbose_name='profile'),
+        ),
+    ]
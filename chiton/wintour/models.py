@@ -1,3 +1,5 @@
+import json
+
 from django.contrib.postgres.fields import JSONField
 from django.db import connection, models
 from django.utils.translation import ugettext_lazy as _
@@ -9,6 +11,7 @@ from chiton.closet.data import CARE_CHOICES
 from chiton.closet.models import StandardSize
 from chiton.runway.models import Formality, Style
 from chiton.wintour import data
+from chiton.wintour.profiles import hash_pipeline_profile, normalize_pipeline_profile
 
 
 class PersonManager(models.Manager):
@@ -158,10 +161,73 @@ class WardrobeProfile(models.Model):
         verbose_name_plural = _('wardrobe profiles')
 
 
+class RecommendationProfileManager(models.Manager):
+    """A custom manager for recommendation profiles."""
+
+    def ensure_exist(self, profiles):
+        """Ensure that a stored profile exists for each of a list of profiles.
+
+        Each profile is stored once under the hash of its normalized form, and
+        profiles that are already stored are left untouched.
+
+        Args:
+            profiles (list[dict]): The data for pipeline profiles
+
+        Returns:
+            list[str]: The digest of each profile, in input order
+        """
+        digests = []
+        unique = {}
+
+        for profile in profiles:
+            digest = hash_pipeline_profile(profile)
+            digests.append(digest)
+            unique.setdefault(digest, normalize_pipeline_profile(profile))
+
+        if not unique:
+            return digests
+
+        values = ', '.join(['(%s, %s::jsonb, NOW())'] * len(unique))
+        params = []
+        for digest, profile in unique.items():
+            params += [digest, json.dumps(profile)]
+
+        query = """
+            INSERT INTO %(profiles)s (digest, data, created_at)
+            VALUES %(values)s
+            ON CONFLICT (digest) DO NOTHING
+        """ % {
+            'profiles': connection.ops.quote_name(self.model._meta.db_table),
+            'values': values
+        }
+
+        with connection.cursor() as cursor:
+            cursor.execute(query, params)
+
+        return digests
+
+
+class RecommendationProfile(models.Model):
+    """A normalized profile shared by all recommendations made for it."""
+
+    digest = models.CharField(max_length=64, primary_key=True, verbose_name=_('digest'))
+    data = JSONField(verbose_name=_('The profile data'))
+    created_at = models.DateTimeField(verbose_name=_('created at'), auto_now_add=True)
+
+    objects = RecommendationProfileManager()
+
+    class Meta:
+        verbose_name = _('recommendation profile')
+        verbose_name_plural = _('recommendation profiles')
+
+    def __str__(self):
+        return self.digest
+
+
 class Recommendation(models.Model):
     """A set of wardrobe recommendations generated from a profile."""
 
-    profile = JSONField(verbose_name=_('The profile data'))
+    profile = models.ForeignKey(RecommendationProfile, on_delete=models.PROTECT, verbose_name=_('profile'), related_name='recommendations')
     ip_address = models.GenericIPAddressField(verbose_name=_('IP address'), null=True, blank=True)
     created_at = models.DateTimeField(verbose_name=_('created at'), auto_now_add=True)
 
@@ -0,0 +1,162 @@
+import base64
+import binascii
+
+from chiton.wintour.exceptions import CursorError, GroupNotFoundError
+from chiton.wintour.pipeline import GarmentsPage
+from chiton.wintour.pipelines import prune_basic_recommendations
+
+
+# The default number of garments in a page of a facet group
+DEFAULT_PAGE_SIZE = 10
+
+# The maximum number of garments in a page of a facet group
+MAX_PAGE_SIZE = 100
+
+# The separator between the parts of an encoded cursor
+CURSOR_SEPARATOR = ':'
+
+
+def preview_recommendations(snapshot, max_garments_per_group=None):
+    """Build the recommendations for a snapshot, limiting the garments per facet group.
+
+    The snapshot itself is not modified.  Each facet group that had garments
+    removed is given a cursor that can be used to page through the remaining
+    garments in the group.
+
+    Args:
+        snapshot (dict): A snapshot's generation and full recommendations
+
+    Keyword Args:
+        max_garments_per_group (int): The maximum number of garments to return per facet group
+
+    Returns:
+        chiton.wintour.pipeline.Recommendations: The recommendations data
+    """
+    recommendations = snapshot['recommendations']
+    if max_garments_per_group is None:
+        return recommendations
+
+    # Copy each level of the recommendations that pruning replaces, leaving
+    # the snapshot's own data intact
+    basics = [
+        dict(basic, facets=[
+            dict(facet, groups=[dict(group) for group in facet['groups']])
+            for facet in basic['facets']
+        ])
+        for basic in recommendations['basics']
+    ]
+    prune_basic_recommendations(basics, max_garments_per_group)
+
+    for basic, original_basic in zip(basics, recommendations['basics']):
+        for facet, original_facet in zip(basic['facets'], original_basic['facets']):
+            for group, original_group in zip(facet['groups'], original_facet['groups']):
+                if len(group['garment_ids']) < len(original_group['garment_ids']):
+                    group['next_cursor'] = _encode_cursor(snapshot['generation'], len(group['garment_ids']))
+
+    return dict(recommendations, basics=basics)
+
+
+def page_group_garments(snapshot, basic_slug, facet_slug, group_slug, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Get a page of the garments in one of a snapshot's facet groups.
+
+    Args:
+        snapshot (dict): A snapshot's generation and full recommendations
+        basic_slug (str): The slug of a recommended basic
+        facet_slug (str): The slug of one of the basic's facets
+        group_slug (str): The slug of one of the facet's groups
+
+    Keyword Args:
+        cursor (str): The cursor marking the start of the page
+        limit (int): The maximum number of garments in the page
+
+    Returns:
+        chiton.wintour.pipeline.GarmentsPage: The page of garments
+
+    Raises:
+        chiton.wintour.exceptions.CursorError: If the cursor is invalid or refers to other recommendations
+        chiton.wintour.exceptions.GroupNotFoundError: If the facet group does not exist
+    """
+    offset = 0
+    if cursor:
+        generation, offset = _decode_cursor(cursor)
+        if generation != snapshot['generation']:
+            raise CursorError('The cursor refers to recommendations that are no longer current')
+
+    basics = snapshot['recommendations']['basics']
+    basic = basics[_find_by_slug([b['basic'] for b in basics], basic_slug, 'basic')]
+    facet = basic['facets'][_find_by_slug(basic['facets'], facet_slug, 'facet')]
+    group = facet['groups'][_find_by_slug(facet['groups'], group_slug, 'group')]
+
+    garments_by_id = dict((g['garment']['id'], g) for g in basic['garments'])
+    next_offset = offset + limit
+
+    if next_offset < len(group['garment_ids']):
+        next_cursor = _encode_cursor(snapshot['generation'], next_offset)
+    else:
+        next_cursor = None
+
+    return GarmentsPage({
+        'garments': [garments_by_id[garment_id] for garment_id in group['garment_ids'][offset:next_offset]],
+        'next_cursor': next_cursor,
+        'total': len(group['garment_ids'])
+    })
+
+
+def _encode_cursor(generation, offset):
+    """Encode the position of a page as an opaque cursor.
+
+    Args:
+        generation (str): The catalog generation of the paged recommendations
+        offset (int): The index of the first garment in the page
+
+    Returns:
+        str: The encoded cursor
+    """
+    position = '%s%s%d' % (generation, CURSOR_SEPARATOR, offset)
+    return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor):
+    """Decode the position of a page from a cursor.
+
+    Args:
+        cursor (str): An encoded cursor
+
+    Returns:
+        tuple: The catalog generation and offset of the page
+
+    Raises:
+        chiton.wintour.exceptions.CursorError: If the cursor is invalid
+    """
+    try:
+        position = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        generation, offset = position.rsplit(CURSOR_SEPARATOR, 1)
+        offset = int(offset)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise CursorError('The cursor is invalid')
+
+    if offset < 0:
+        raise CursorError('The cursor is invalid')
+
+    return generation, offset
+
+
+def _find_by_slug(entries, slug, label):
+    """Find the index of the entry with a given slug.
+
+    Args:
+        entries (list[dict]): Entries with a slug
+        slug (str): The slug to find
+        label (str): A label for the type of entry
+
+    Returns:
+        int: The index of the matching entry
+
+    Raises:
+        chiton.wintour.exceptions.GroupNotFoundError: If no entry has the slug
+    """
+    for index, entry in enumerate(entries):
+        if entry['slug'] == slug:
+            return index
+
+    raise GroupNotFoundError('No %s has the slug %s' % (label, slug))
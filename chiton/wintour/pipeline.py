@@ -22,9 +22,18 @@ DebugExplanations = define_data_shape({
 }, validated=False)
 
 
+ImageVariant = define_data_shape({
+    V.Required('format'): str,
+    V.Required('height'): int,
+    V.Required('url'): str,
+    V.Required('width'): int
+}, validated=False)
+
+
 ProductImage = define_data_shape({
     V.Required('height'): int,
-    V.Required('relative_url'): str,
+    V.Required('url'): str,
+    V.Required('variants'): [ImageVariant],
     V.Required('width'): int
 }, validated=False)
 
@@ -67,6 +76,7 @@ BasicOverview = define_data_shape({
 
 
 FacetGroup = define_data_shape({
+    'next_cursor': str,
     V.Required('garment_ids'): [int],
     V.Required('slug'): str
 }, validated=False)
@@ -86,6 +96,13 @@ BasicRecommendations = define_data_shape({
 }, validated=False)
 
 
+GarmentsPage = define_data_shape({
+    V.Required('garments'): [GarmentRecommendation],
+    V.Required('next_cursor'): V.Any(None, str),
+    V.Required('total'): int
+}, validated=False)
+
+
 Recommendations = define_data_shape({
     V.Required('basics'): [BasicRecommendations],
     V.Required('categories'): [str],
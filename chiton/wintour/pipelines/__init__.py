@@ -4,12 +4,24 @@ from django.conf import settings
 
 from chiton.closet.data import CARE_CHOICES
 from chiton.closet.models import Basic, Brand, Garment, make_branded_garment_name
-from chiton.core.queries import cache_query
+from chiton.core.queries import cache_query, pin_cached_queries
 from chiton.core.numbers import price_to_integer
 from chiton.core.uris import file_path_to_relative_url, join_url
-from chiton.rack.models import AffiliateItem, AffiliateNetwork, ItemImage
+from chiton.rack.models import AffiliateItem, AffiliateNetwork, ItemImage, ItemImageDerivative
 from chiton.runway.models import Category
-from chiton.wintour.pipeline import BasicRecommendations, BasicOverview, Facet, FacetGroup, GarmentOverview, GarmentRecommendation, ProductImage, PurchaseOption, Recommendations
+from chiton.wintour.pipeline import BasicRecommendations, BasicOverview, Facet, FacetGroup, GarmentOverview, GarmentRecommendation, ImageVariant, ProductImage, PurchaseOption, Recommendations
+from chiton.wintour.projections import FieldProjection, GARMENT_RECOMMENDATION_FIELDS
+
+
+# The purchase-option fields copied from affiliate-item data, mapped to the
+# keys of their values
+PURCHASE_OPTION_FIELDS = (
+    ('has_multiple_colors', 'has_multiple_colors'),
+    ('id', 'id'),
+    ('network_name', 'network__name'),
+    ('retailer', 'retailer'),
+    ('url', 'affiliate_url')
+)
 
 
 class BasePipeline:
@@ -70,7 +82,7 @@ class BasePipeline:
         """
         return []
 
-    def make_recommendations(self, profile, debug=False, max_garments_per_group=None):
+    def make_recommendations(self, profile, debug=False, max_garments_per_group=None, projection=None):
         """Make recommendations for a wardrobe profile.
 
         Args:
@@ -79,6 +91,7 @@ class BasePipeline:
         Keyword Args:
             debug (bool): Whether to generate debug statistics
             max_garments_per_group (int): The maximum number of garments to return per facet group
+            projection (chiton.wintour.projections.FieldProjection): The fields to build for each garment
 
         Returns:
             dict[chiton.runway.models.Basic, chiton.wintour.pipeline.BasicRecommendations]: The per-basic garment recommendations
@@ -95,21 +108,80 @@ class BasePipeline:
             for step in facets + garment_filters + query_filters + weights:
                 step.debug = debug
 
-        # Generate the master list of weighted garments as a dict keyed by a
-        # basic instance with garment core data and metadata
         self._current_profile = profile
+        self._projection = projection or FieldProjection()
         garments_qs = self._filter_garments_queryset(garments_qs, query_filters)
         garments = self._filter_garments(garments_qs, garment_filters)
+        recommendations = self._recommend_garments(garments, weights, facets, max_garments_per_group)
+        self._current_profile = None
+        self._projection = None
+
+        return recommendations
+
+    def make_recommendations_many(self, profiles, max_garments_per_group=None, projection=None):
+        """Make recommendations for many wardrobe profiles at once.
+
+        The garments are loaded once for the entire batch, and each cached
+        lookup used by the pipeline steps is read once, rather than once per
+        profile.  Query filters are still applied per profile, but they only
+        select the IDs of the matching garments.
+
+        Args:
+            profiles (list[chiton.wintour.profiles.PipelineProfile]): Wardrobe profiles
+
+        Keyword Args:
+            max_garments_per_group (int): The maximum number of garments to return per facet group
+            projection (chiton.wintour.projections.FieldProjection): The fields to build for each garment
+
+        Returns:
+            list[chiton.wintour.pipeline.Recommendations]: The recommendations for each profile, in input order
+        """
+        self._projection = projection or FieldProjection()
+
+        with pin_cached_queries():
+            garments_qs = self.load_garments().select_related('basic')
+            catalog = list(garments_qs)
+
+            facets = self.provide_facets()
+            garment_filters = self.provide_garment_filters()
+            query_filters = self.provide_query_filters()
+            weights = self.provide_weights()
+
+            recommendations = []
+            for profile in profiles:
+                self._current_profile = profile
+                garments = self._filter_garments_catalog(catalog, garments_qs, query_filters)
+                garments = self._filter_garments(garments, garment_filters)
+                recommendations.append(self._recommend_garments(garments, weights, facets, max_garments_per_group))
+            self._current_profile = None
+
+        self._projection = None
+
+        return recommendations
+
+    def _recommend_garments(self, garments, weights, facets, max_garments_per_group):
+        """Weight and package filtered garments as recommendations for the current profile.
+
+        Args:
+            garments (list[chiton.closet.models.Garment]): The garments that passed all filters
+            weights (list[chiton.wintour.weights.BaseWeight]): Instances of weights
+            facets (list[chiton.wintour.facets.BaseFacet]): Instances of facets
+            max_garments_per_group (int): The maximum number of garments to return per facet group
+
+        Returns:
+            chiton.wintour.pipeline.Recommendations: The recommendations data
+        """
+        # Generate the master list of weighted garments as a dict keyed by a
+        # basic instance with garment core data and metadata
         weightings = self._weight_garments(garments, weights)
         weighted_garments = self._coalesce_garment_weights(weightings)
         garments_by_basic = self._convert_weighted_garments_to_recommendations(weighted_garments)
         basic_recommendations = self._package_garment_recommendations_as_basic_recommendations(garments_by_basic, facets)
         pruned_recommendations = self._prune_basic_recommendations(basic_recommendations, max_garments_per_group)
-        self._current_profile = None
 
         return Recommendations({
             'basics': pruned_recommendations,
-            'categories': _get_ordered_categories()
+            'categories': list(_get_ordered_categories())
         })
 
     def _get_all_steps(self):
@@ -145,6 +217,27 @@ class BasePipeline:
 
         return garments
 
+    def _filter_garments_catalog(self, catalog, garments, query_filters):
+        """Apply a series of query filters to a pre-loaded list of garments.
+
+        The filters are applied to the queryset from which the catalog was
+        loaded, and only the IDs of the garments that remain are selected.
+
+        Args:
+            catalog (list[chiton.closet.models.Garment]): The evaluated queryset of garments
+            garments (django.db.models.query.QuerySet): The queryset from which the catalog was loaded
+            query_filters (list[chiton.wintour.query_filters.BaseQueryFilter]): Instances of query filters
+
+        Returns:
+            list[chiton.closet.models.Garment]: The catalog garments that match the filters
+        """
+        filtered = self._filter_garments_queryset(garments, query_filters)
+        if filtered is garments:
+            return catalog
+
+        garment_ids = set(filtered.values_list('pk', flat=True))
+        return [garment for garment in catalog if garment.pk in garment_ids]
+
     def _filter_garments(self, garments, garment_filters):
         """Apply a series of filters to a individual garments.
 
@@ -255,7 +348,8 @@ class BasePipeline:
 
         This transforms per-garment weight information into a mapping between
         basic slugs and a further mapping between garment slugs and
-        recommendations for the garment.
+        recommendations for the garment.  Only the fields selected by the
+        current projection are built.
 
         Args:
             weighted_garments (dict[str, dict]): Per-garment weighting information keyed by slug
@@ -263,10 +357,22 @@ class BasePipeline:
         Returns:
             dict[str, dict]: Per-basic garment recommendations
         """
-        images_lookup = _build_item_image_lookup_table()
+        projection = self._projection
+        include_images = projection.includes('purchase_options.images')
+        images_lookup = _build_item_image_lookup_table() if include_images else {}
         by_basic = {}
         max_weight = 0
 
+        # Determine the fields to build for each purchase option and garment
+        option_fields = [
+            (field, key) for field, key in PURCHASE_OPTION_FIELDS
+            if projection.includes('purchase_options.%s' % field)
+        ]
+        garment_fields = set(
+            field for field in GARMENT_RECOMMENDATION_FIELDS['garment']
+            if projection.includes('garment.%s' % field)
+        )
+
         # Group garments by their basic type, exposing information on each
         # garment's associated affiliate items
         for affiliate_item in _get_deep_affiliate_items():
@@ -280,49 +386,59 @@ class BasePipeline:
             max_weight = max(max_weight, garment_data['weight'])
 
             # Serialize affiliate items as purchase options
-            purchase_option = PurchaseOption({
-                'has_multiple_colors': affiliate_item['has_multiple_colors'],
-                'id': affiliate_item['id'],
-                'images': [],
-                'network_name': affiliate_item['network__name'],
-                'price': price_to_integer(affiliate_item['price']),
-                'retailer': affiliate_item['retailer'],
-                'url': affiliate_item['affiliate_url']
-            })
+            purchase_option = PurchaseOption(dict(
+                (field, affiliate_item[key]) for field, key in option_fields
+            ))
+            purchase_option['price'] = price_to_integer(affiliate_item['price'])
 
             # Serialize the purchase option's images
-            for image in images_lookup.get(affiliate_item['id'], []):
-                purchase_option['images'].append(ProductImage({
-                    'height': image['height'],
-                    'url': join_url(settings.MEDIA_URL, image['relative_url']),
-                    'width': image['width']
-                }))
+            if include_images:
+                purchase_option['images'] = []
+                for image in images_lookup.get(affiliate_item['id'], [])[0:projection.max_images]:
+                    purchase_option['images'].append(ProductImage({
+                        'height': image['height'],
+                        'url': join_url(settings.MEDIA_URL, image['relative_url']),
+                        'variants': [
+                            ImageVariant({
+                                'format': variant['format'],
+                                'height': variant['height'],
+                                'url': join_url(settings.MEDIA_URL, variant['relative_url']),
+                                'width': variant['width']
+                            })
+                            for variant in image['variants']
+                        ],
+                        'width': image['width']
+                    }))
 
             # Add each garment recommendation to its basic
             by_basic.setdefault(basic_slug, {})
             try:
                 by_basic[basic_slug][garment_slug]['purchase_options'].append(purchase_option)
             except KeyError:
-                garment_care = affiliate_item['garment__care']
-                if garment_care:
-                    care_type = [str(c[1]) for c in CARE_CHOICES if c[0] == garment_care][0]
-                else:
-                    care_type = None
+                garment = GarmentOverview({
+                    'branded_name': make_branded_garment_name(affiliate_item['garment__name'], affiliate_item['garment__brand__name']),
+                    'id': affiliate_item['garment_id']
+                })
+
+                if 'brand' in garment_fields:
+                    garment['brand'] = affiliate_item['garment__brand__name']
+                if 'name' in garment_fields:
+                    garment['name'] = affiliate_item['garment__name']
+                if 'care' in garment_fields:
+                    garment_care = affiliate_item['garment__care']
+                    if garment_care:
+                        garment['care'] = [str(c[1]) for c in CARE_CHOICES if c[0] == garment_care][0]
+                    else:
+                        garment['care'] = None
 
                 by_basic[basic_slug][garment_slug] = GarmentRecommendation({
-                    'garment': GarmentOverview({
-                        'brand': affiliate_item['garment__brand__name'],
-                        'branded_name': make_branded_garment_name(affiliate_item['garment__name'], affiliate_item['garment__brand__name']),
-                        'care': care_type,
-                        'id': affiliate_item['garment_id'],
-                        'name': affiliate_item['garment__name']
-                    }),
+                    'garment': garment,
                     'purchase_options': [purchase_option],
                     'weight': garment_data['weight']
                 })
 
                 explanations = garment_data.get('explanations', None)
-                if explanations:
+                if explanations and projection.includes('explanations'):
                     by_basic[basic_slug][garment_slug]['explanations'] = explanations
 
         # Update all weights to use floating-point percentages calibrated
@@ -360,7 +476,7 @@ class BasePipeline:
             sorted_garments.sort(key=lambda g: g['weight'], reverse=True)
 
             recommendations.append(BasicRecommendations({
-                'basic': BasicOverview(basic_data[basic_slug]),
+                'basic': BasicOverview(dict(basic_data[basic_slug])),
                 'facets': [],
                 'garments': sorted_garments
             }))
@@ -381,9 +497,6 @@ class BasePipeline:
     def _prune_basic_recommendations(self, basic_recommendations, max_garments_per_group):
         """Remove garments that exceed the maximum number per facet group.
 
-        This ensure that each facet group has at most the given number of
-        garments, then removes all garment entries that are not in those groups.
-
         Args:
             basic_recommendations (list[chiton.wintour.pipeline.BasicRecommendations]): Basic recommendations
             max_garments_per_group (int): The maximum number of garments per facet group
@@ -391,26 +504,43 @@ class BasePipeline:
         Returns:
             list[chiton.wintour.pipeline.BasicRecommendations]: The pruned basic recommendations
         """
-        if max_garments_per_group is None:
-            return basic_recommendations
+        return prune_basic_recommendations(basic_recommendations, max_garments_per_group)
 
-        for basic_recommendation in basic_recommendations:
-            include_ids = []
 
-            for facet in basic_recommendation['facets']:
-                for i, group in enumerate(facet['groups']):
-                    subset_ids = group['garment_ids'][0:max_garments_per_group]
-                    facet['groups'][i]['garment_ids'] = subset_ids
-                    include_ids += subset_ids
+def prune_basic_recommendations(basic_recommendations, max_garments_per_group):
+    """Remove garments that exceed the maximum number per facet group.
 
-            include_ids = set(include_ids)
-            basic_recommendation['garments'] = [
-                garment for garment in basic_recommendation['garments']
-                if garment['garment']['id'] in include_ids
-            ]
+    This ensure that each facet group has at most the given number of
+    garments, then removes all garment entries that are not in those groups.
+    The recommendations are modified in place.
 
+    Args:
+        basic_recommendations (list[chiton.wintour.pipeline.BasicRecommendations]): Basic recommendations
+        max_garments_per_group (int): The maximum number of garments per facet group
+
+    Returns:
+        list[chiton.wintour.pipeline.BasicRecommendations]: The pruned basic recommendations
+    """
+    if max_garments_per_group is None:
         return basic_recommendations
 
+    for basic_recommendation in basic_recommendations:
+        include_ids = []
+
+        for facet in basic_recommendation['facets']:
+            for i, group in enumerate(facet['groups']):
+                subset_ids = group['garment_ids'][0:max_garments_per_group]
+                facet['groups'][i]['garment_ids'] = subset_ids
+                include_ids += subset_ids
+
+        include_ids = set(include_ids)
+        basic_recommendation['garments'] = [
+            garment for garment in basic_recommendation['garments']
+            if garment['garment']['id'] in include_ids
+        ]
+
+    return basic_recommendations
+
 
 @cache_query(Category)
 def _get_ordered_categories():
@@ -447,20 +577,40 @@ def _get_deep_affiliate_items():
     )
 
 
-@cache_query(ItemImage)
+@cache_query(ItemImage, ItemImageDerivative)
 def _build_item_image_lookup_table():
     """Create a lookup table that maps affiliate-item IDs to their images.
 
+    Each image exposes its resized derivatives as variants, ordered by format
+    and then ascending by width.
+
     Returns:
         dict[int, dict]: A lookup for item images
     """
+    variants = {}
+    derivatives = (
+        ItemImageDerivative.objects.all()
+        .order_by('image_id', 'format', 'width')
+        .values('file', 'format', 'height', 'image_id', 'width')
+    )
+
+    for derivative in derivatives:
+        variants.setdefault(derivative['image_id'], [])
+        variants[derivative['image_id']].append({
+            'format': derivative['format'],
+            'height': derivative['height'],
+            'relative_url': file_path_to_relative_url(derivative['file']),
+            'width': derivative['width']
+        })
+
     lookup = {}
 
-    for image in ItemImage.objects.all().values('file', 'height', 'item_id', 'width'):
+    for image in ItemImage.objects.all().values('file', 'height', 'id', 'item_id', 'width'):
         lookup.setdefault(image['item_id'], [])
         lookup[image['item_id']].append({
             'height': image['height'],
             'relative_url': file_path_to_relative_url(image['file']),
+            'variants': variants.get(image['id'], []),
             'width': image['width']
         })
 
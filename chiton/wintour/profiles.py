@@ -1,3 +1,6 @@
+from hashlib import sha256
+import json
+
 import voluptuous as V
 
 from chiton.closet.data import CARE_TYPES
@@ -7,6 +10,10 @@ from chiton.runway.models import Formality, Style
 from chiton.wintour.data import BIRTH_YEAR_MAX, BIRTH_YEAR_MIN, BODY_SHAPES, EXPECTATION_FREQUENCIES
 
 
+# The profile fields whose values are lists in which order has no meaning
+UNORDERED_PROFILE_FIELDS = ('avoid_care', 'expectations', 'sizes', 'styles')
+
+
 PipelineProfile = define_data_shape({
     V.Required('avoid_care'): list(CARE_TYPES.values()),
     V.Required('birth_year'): NumberInRange(BIRTH_YEAR_MIN, BIRTH_YEAR_MAX),
@@ -45,3 +52,50 @@ def package_wardrobe_profile(profile):
         })
 
     return PipelineProfile(data)
+
+
+def normalize_pipeline_profile(profile):
+    """Convert a pipeline profile to a canonical form.
+
+    Profiles that differ only in the order of their keys or of the values of
+    their unordered fields have the same normalized form.
+
+    Args:
+        profile (dict): The data for a pipeline profile
+
+    Returns:
+        dict: The normalized profile data
+    """
+    normalized = dict(profile)
+
+    for field in UNORDERED_PROFILE_FIELDS:
+        values = normalized.get(field, None)
+        if isinstance(values, list):
+            normalized[field] = sorted(values, key=_serialize_profile_data)
+
+    return normalized
+
+
+def hash_pipeline_profile(profile):
+    """Calculate the content hash of a pipeline profile.
+
+    Args:
+        profile (dict): The data for a pipeline profile
+
+    Returns:
+        str: The hex digest of the normalized profile
+    """
+    serialized = _serialize_profile_data(normalize_pipeline_profile(profile))
+    return sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def _serialize_profile_data(data):
+    """Serialize profile data as compact JSON with sorted keys.
+
+    Args:
+        data (object): Any JSON-serializable profile data
+
+    Returns:
+        str: The serialized data
+    """
+    return json.dumps(data, separators=(',', ':'), sort_keys=True)
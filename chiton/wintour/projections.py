@@ -0,0 +1,84 @@
+from chiton.wintour.exceptions import ProjectionError
+
+
+# The fields of a garment recommendation that can be selected, mapped to their
+# selectable sub-fields
+GARMENT_RECOMMENDATION_FIELDS = {
+    'explanations': (),
+    'garment': ('brand', 'branded_name', 'care', 'id', 'name'),
+    'purchase_options': ('has_multiple_colors', 'id', 'images', 'network_name', 'price', 'retailer', 'url'),
+    'weight': ()
+}
+
+# The fields that are always included, since the pipeline relies on them to
+# sort, facet and prune garments and to record item exposure
+REQUIRED_FIELDS = (
+    'garment',
+    'garment.branded_name',
+    'garment.id',
+    'purchase_options',
+    'purchase_options.id',
+    'purchase_options.price',
+    'weight'
+)
+
+# The separator between a field and its sub-field
+FIELD_SEPARATOR = '.'
+
+
+class FieldProjection:
+    """A selection of the fields to build for each garment recommendation."""
+
+    def __init__(self, fields=None, max_images=None):
+        """Create a new projection.
+
+        Fields are given as either a top-level field of a garment
+        recommendation, which selects all of its sub-fields, or as a sub-field
+        joined to its field by a period, such as `garment.name`.
+
+        Keyword Args:
+            fields (list[str]): The fields to include, or None to include all fields
+            max_images (int): The maximum number of images to include per purchase option
+
+        Raises:
+            chiton.wintour.exceptions.ProjectionError: If a field cannot be selected
+        """
+        self.max_images = max_images
+
+        if fields is None:
+            self._fields = None
+            return
+
+        self._fields = set(REQUIRED_FIELDS)
+        for field in fields:
+            parent, separator, child = field.partition(FIELD_SEPARATOR)
+            sub_fields = GARMENT_RECOMMENDATION_FIELDS.get(parent, None)
+
+            if sub_fields is None or (separator and child not in sub_fields):
+                raise ProjectionError('%s is not a valid field' % field)
+
+            self._fields.add(parent)
+            if separator:
+                self._fields.add(field)
+            else:
+                self._fields.update(['%s%s%s' % (parent, FIELD_SEPARATOR, sub_field) for sub_field in sub_fields])
+
+    def includes(self, field):
+        """Determine whether a field is included in the projection.
+
+        Args:
+            field (str): A field or sub-field of a garment recommendation
+
+        Returns:
+            bool: Whether the field should be built
+        """
+        return self._fields is None or field in self._fields
+
+    def get_key(self):
+        """Get a JSON-serializable value that identifies the projection.
+
+        Returns:
+            list: The sorted selected fields, or None for all fields, and the maximum number of images
+        """
+        fields = sorted(self._fields) if self._fields is not None else None
+        return [fields, self.max_images]
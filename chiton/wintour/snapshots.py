@@ -0,0 +1,159 @@
+import hashlib
+import json
+import uuid
+import zlib
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+from chiton.closet.models import Brand, Garment, StandardSize
+from chiton.core.queries import cache_query
+from chiton.rack.models import AffiliateItem, AffiliateNetwork, ItemImage, ItemImageDerivative
+from chiton.runway.models import Basic, Category, Formality, Propriety, Style
+from chiton.wintour.matching import make_recommendations
+from chiton.wintour.pipelines.core import CorePipeline
+from chiton.wintour.profiles import PipelineProfile
+
+
+# The namespace used for the catalog generation's cached query
+GENERATION_NAMESPACE = 'snapshots'
+
+# The number of seconds for which a recommendation snapshot is retained
+DEFAULT_SNAPSHOT_TTL = 60 * 60 * 24 * 7
+
+# The prefix for the cache keys of recommendation snapshots
+SNAPSHOT_KEY_PREFIX = 'recommendation-snapshot'
+
+# The version of the entity tags for snapshots, which must be changed whenever
+# the layout of the data served from a snapshot changes
+ETAG_VERSION = 1
+
+
+@cache_query(AffiliateItem, AffiliateNetwork, Basic, Brand, Category, Formality, Garment, ItemImage, ItemImageDerivative, Propriety, StandardSize, Style, namespace=GENERATION_NAMESPACE)
+def get_catalog_generation():
+    """Get an identifier for the current state of the garment catalog.
+
+    A new identifier is generated whenever any model that can affect a
+    recommendation changes, so two snapshots with the same generation were
+    computed against the same catalog.
+
+    Returns:
+        str: The catalog generation
+    """
+    return uuid.uuid4().hex
+
+
+def save_recommendation_snapshot(recommendation_id, recommendations, generation, ttl=DEFAULT_SNAPSHOT_TTL):
+    """Store the full scored recommendations for a recommendation record.
+
+    The recommendations are stored as compressed JSON along with the catalog
+    generation against which they were computed.  They should not be pruned,
+    so that any page of garments can later be served from the snapshot.
+
+    The generation must be read before the recommendations are computed, so
+    that recommendations computed while the catalog changed are treated as
+    outdated rather than being stored under the new generation.
+
+    Args:
+        recommendation_id (int): The ID of a recommendation
+        recommendations (chiton.wintour.pipeline.Recommendations): The computed recommendations
+        generation (str): The catalog generation read before computing the recommendations
+
+    Keyword Args:
+        ttl (int): The number of seconds for which to retain the snapshot
+
+    Returns:
+        dict: The snapshot's generation and recommendations
+    """
+    encoded = json.dumps(recommendations, cls=DjangoJSONEncoder, separators=(',', ':'), sort_keys=True)
+
+    cache.set(_get_snapshot_key(recommendation_id), {
+        'generation': generation,
+        'recommendations': zlib.compress(encoded.encode('utf-8'))
+    }, ttl)
+
+    return {
+        'generation': generation,
+        'recommendations': recommendations
+    }
+
+
+def load_recommendation_snapshot(recommendation_id):
+    """Load the stored snapshot of a recommendation record.
+
+    Args:
+        recommendation_id (int): The ID of a recommendation
+
+    Returns:
+        dict: The snapshot's generation and decoded recommendations, or None if no snapshot exists
+    """
+    snapshot = cache.get(_get_snapshot_key(recommendation_id))
+    if snapshot is None:
+        return None
+
+    return {
+        'generation': snapshot['generation'],
+        'recommendations': json.loads(zlib.decompress(snapshot['recommendations']).decode('utf-8'))
+    }
+
+
+def get_current_snapshot(recommendation, ttl=DEFAULT_SNAPSHOT_TTL):
+    """Get an up-to-date snapshot of a recommendation record.
+
+    The stored snapshot is returned as-is if it was computed against the
+    current catalog.  Otherwise, the recommendations are recomputed from the
+    record's profile and stored as a new snapshot.
+
+    Args:
+        recommendation (chiton.wintour.models.Recommendation): A recommendation record
+
+    Keyword Args:
+        ttl (int): The number of seconds for which to retain a new snapshot
+
+    Returns:
+        dict: The snapshot's generation and recommendations, which include the recommendation's ID
+    """
+    generation = get_catalog_generation()
+
+    snapshot = load_recommendation_snapshot(recommendation.pk)
+    if snapshot and snapshot['generation'] == generation:
+        return snapshot
+
+    profile = PipelineProfile(recommendation.profile.data)
+    recommendations = make_recommendations(profile, CorePipeline())
+    recommendations['recommendation_id'] = recommendation.pk
+
+    return save_recommendation_snapshot(recommendation.pk, recommendations, generation, ttl=ttl)
+
+
+def get_snapshot_etag(recommendation, generation, *variants):
+    """Get an entity tag for data served from a recommendation's snapshot.
+
+    The tag is derived from the recommendation's normalized profile and the
+    catalog generation, which together determine the snapshot's content, so
+    it can be computed without loading or recomputing the snapshot.
+
+    Args:
+        recommendation (chiton.wintour.models.Recommendation): A recommendation record
+        generation (str): The catalog generation of the snapshot
+        variants (list): JSON-serializable values that select the data served from the snapshot
+
+    Returns:
+        str: The entity tag
+    """
+    parts = [ETAG_VERSION, recommendation.pk, recommendation.profile_id, generation, list(variants)]
+    encoded = json.dumps(parts, separators=(',', ':'))
+
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def _get_snapshot_key(recommendation_id):
+    """Get the cache key for a recommendation's snapshot.
+
+    Args:
+        recommendation_id (int): The ID of a recommendation
+
+    Returns:
+        str: The cache key
+    """
+    return '%s:%d' % (SNAPSHOT_KEY_PREFIX, recommendation_id)
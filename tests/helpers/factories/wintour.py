@@ -5,7 +5,7 @@ from faker import Faker
 
 from chiton.closet.data import CARE_TYPES
 from chiton.wintour.data import BODY_SHAPES, EXPECTATION_FREQUENCIES
-from chiton.wintour.models import Person, Recommendation, WardrobeProfile
+from chiton.wintour.models import Person, Recommendation, RecommendationProfile, WardrobeProfile
 from chiton.wintour.profiles import PipelineProfile
 
 
@@ -59,7 +59,8 @@ def pipeline_profile_factory(formality_factory, standard_size_factory, style_fac
 
 def recommendation_factory(pipeline_profile_factory):
     def create_recommendation(profile=None):
-        return Recommendation.objects.create(profile=profile or pipeline_profile_factory())
+        digest = RecommendationProfile.objects.ensure_exist([profile or pipeline_profile_factory()])[0]
+        return Recommendation.objects.create(profile_id=digest)
 
     return create_recommendation
 
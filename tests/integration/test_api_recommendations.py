@@ -2,12 +2,15 @@ from django.apps import apps
 from django.contrib.auth.management import create_permissions
 from django.contrib.auth.models import Permission, User
 from django.contrib.contenttypes.models import ContentType
+import mock
 import pytest
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 
+from chiton.api.compact import unpack_compact
 from chiton.wintour.apps import Config as Wintour
+from chiton.wintour.buffers import RecommendationBuffer
 from chiton.wintour.models import Recommendation, WardrobeProfile
 
 
@@ -16,6 +19,9 @@ from chiton.wintour.models import Recommendation, WardrobeProfile
 class TestRecommendations:
 
     ENDPOINT = '/api/recommendations/'
+    BATCH_ENDPOINT = '/api/recommendations/batch/'
+    DETAIL_ENDPOINT = '/api/recommendations/%d/'
+    GARMENTS_ENDPOINT = '/api/recommendations/%d/basics/%s/garments/'
 
     @pytest.fixture(autouse=True)
     def permissions(self):
@@ -106,6 +112,37 @@ class TestRecommendations:
         assert response.status_code == status.HTTP_200_OK
         assert 'basics' in response.data
 
+    def test_recommendations_fields(self, api_client, formality_factory, standard_size_factory, style_factory):
+        """It allows the garment fields in the recommendations to be selected."""
+        formality_factory(slug='casual')
+        standard_size_factory(slug='m')
+        style_factory(slug='bold-powerful')
+
+        response = api_client.post(self.ENDPOINT, {
+            'avoid_care': ['dry_clean'],
+            'birth_year': 1950,
+            'body_shape': 'apple',
+            'expectations': [
+                {'formality': 'casual', 'frequency': 'always'}
+            ],
+            'fields': ['garment.name', 'purchase_options.images'],
+            'max_images': 1,
+            'sizes': ['m'],
+            'styles': ['bold-powerful']
+        }, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert 'basics' in response.data
+
+    def test_recommendations_fields_errors(self, api_client):
+        """It returns errors when given unknown fields."""
+        response = api_client.post(self.ENDPOINT, {
+            'fields': ['garment.sizes']
+        }, format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'projection' in response.data['errors']
+
     def test_recommendations_errors(self, api_client):
         """It returns errors when given an invalid request."""
         response = api_client.post(self.ENDPOINT, {
@@ -140,3 +177,201 @@ class TestRecommendations:
         assert response.status_code == status.HTTP_400_BAD_REQUEST
         assert 'errors' in response.data
         assert 'fields' in response.data['errors']
+
+    def test_batch_recommendations(self, api_client, formality_factory, standard_size_factory, style_factory):
+        """It returns recommendations for each profile in a batch, in order."""
+        formality_factory(slug='casual')
+        standard_size_factory(slug='m')
+        style_factory(slug='bold-powerful')
+
+        profile = {
+            'avoid_care': ['dry_clean'],
+            'birth_year': 1950,
+            'body_shape': 'apple',
+            'expectations': [
+                {'formality': 'casual', 'frequency': 'always'}
+            ],
+            'sizes': ['m'],
+            'styles': ['bold-powerful']
+        }
+
+        response = api_client.post(self.BATCH_ENDPOINT, {
+            'max_garments_per_group': 2,
+            'profiles': [profile, dict(profile, body_shape='pear')]
+        }, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+
+        recommendations = response.data['recommendations']
+        assert len(recommendations) == 2
+        assert all('basics' in r for r in recommendations)
+
+        first, second = [Recommendation.objects.get(pk=r['recommendation_id']) for r in recommendations]
+        assert first.profile.data['body_shape'] == 'apple'
+        assert second.profile.data['body_shape'] == 'pear'
+
+    def test_batch_recommendations_errors(self, api_client):
+        """It returns the errors of each invalid profile in a batch."""
+        response = api_client.post(self.BATCH_ENDPOINT, {
+            'profiles': [{'age': 0}, 'profile']
+        }, format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert set(response.data['errors']['profiles'].keys()) == set(['0', '1'])
+        assert not Recommendation.objects.count()
+
+    def test_batch_recommendations_empty(self, api_client):
+        """It requires a non-empty list of profiles."""
+        response = api_client.post(self.BATCH_ENDPOINT, {'profiles': []}, format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'profiles' in response.data['errors']
+
+    def test_recommendation_detail(self, api_client, formality_factory, standard_size_factory, style_factory):
+        """It returns the stored recommendations for a previous request."""
+        formality_factory(slug='casual')
+        standard_size_factory(slug='m')
+        style_factory(slug='bold-powerful')
+
+        created = api_client.post(self.ENDPOINT, {
+            'avoid_care': ['dry_clean'],
+            'birth_year': 1950,
+            'body_shape': 'apple',
+            'expectations': [
+                {'formality': 'casual', 'frequency': 'always'}
+            ],
+            'sizes': ['m'],
+            'styles': ['bold-powerful']
+        }, format='json')
+        recommendation_id = created.data['recommendation_id']
+
+        response = api_client.get(self.DETAIL_ENDPOINT % recommendation_id)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['recommendation_id'] == recommendation_id
+        assert response.data['basics'] == created.data['basics']
+
+    def test_recommendation_detail_buffered(self, api_client, formality_factory, standard_size_factory, style_factory):
+        """It returns the recommendations for a previous request still buffered by another process."""
+        formality_factory(slug='casual')
+        standard_size_factory(slug='m')
+        style_factory(slug='bold-powerful')
+
+        with mock.patch('chiton.api.views.recommendation_buffer', RecommendationBuffer(background=False)):
+            created = api_client.post(self.ENDPOINT, {
+                'avoid_care': ['dry_clean'],
+                'birth_year': 1950,
+                'body_shape': 'apple',
+                'expectations': [
+                    {'formality': 'casual', 'frequency': 'always'}
+                ],
+                'sizes': ['m'],
+                'styles': ['bold-powerful']
+            }, format='json')
+        recommendation_id = created.data['recommendation_id']
+
+        assert not Recommendation.objects.filter(pk=recommendation_id).exists()
+
+        with mock.patch('chiton.api.views.recommendation_buffer', RecommendationBuffer(background=False)):
+            response = api_client.get(self.DETAIL_ENDPOINT % recommendation_id)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['recommendation_id'] == recommendation_id
+
+    def test_recommendation_detail_compact(self, api_client, recommendation_factory):
+        """It returns recommendations in the compact binary format when requested."""
+        recommendation = recommendation_factory()
+
+        json_response = api_client.get(self.DETAIL_ENDPOINT % recommendation.pk)
+        compact_response = api_client.get(self.DETAIL_ENDPOINT % recommendation.pk, HTTP_ACCEPT='application/x-msgpack')
+
+        assert compact_response.status_code == status.HTTP_200_OK
+        assert compact_response['Content-Type'] == 'application/x-msgpack'
+        assert unpack_compact(compact_response.content) == json_response.json()
+
+    def test_recommendation_detail_etag(self, api_client, recommendation_factory):
+        """It returns a 304 without recomputing recommendations when the client's copy is current."""
+        recommendation = recommendation_factory()
+        response = api_client.get(self.DETAIL_ENDPOINT % recommendation.pk)
+
+        assert response['ETag']
+
+        with mock.patch('chiton.api.views.get_current_snapshot') as get_current_snapshot:
+            cached = api_client.get(self.DETAIL_ENDPOINT % recommendation.pk, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        assert cached.status_code == status.HTTP_304_NOT_MODIFIED
+        assert cached['ETag'] == response['ETag']
+        assert not cached.content
+        assert not get_current_snapshot.called
+
+    def test_recommendation_detail_etag_variants(self, api_client, recommendation_factory):
+        """It returns a distinct ETag for each garment limit."""
+        recommendation = recommendation_factory()
+        response = api_client.get(self.DETAIL_ENDPOINT % recommendation.pk)
+
+        limited = api_client.get(self.DETAIL_ENDPOINT % recommendation.pk, {'max_garments_per_group': 1}, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        assert limited.status_code == status.HTTP_200_OK
+        assert limited['ETag'] != response['ETag']
+
+    def test_recommendation_detail_etag_catalog(self, api_client, garment_factory, recommendation_factory):
+        """It returns the recommendations when the catalog has changed."""
+        recommendation = recommendation_factory()
+        response = api_client.get(self.DETAIL_ENDPOINT % recommendation.pk)
+
+        garment_factory()
+        updated = api_client.get(self.DETAIL_ENDPOINT % recommendation.pk, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        assert updated.status_code == status.HTTP_200_OK
+        assert updated['ETag'] != response['ETag']
+
+    def test_recommendation_detail_missing(self, api_client):
+        """It returns a 404 for an unknown recommendation."""
+        response = api_client.get(self.DETAIL_ENDPOINT % 1000)
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert 'recommendation' in response.data['errors']
+
+    def test_recommendation_detail_limit(self, api_client, recommendation_factory):
+        """It rejects a non-integer garment limit."""
+        recommendation = recommendation_factory()
+        response = api_client.get(self.DETAIL_ENDPOINT % recommendation.pk, {'max_garments_per_group': 'many'})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'max_garments_per_group' in response.data['errors']
+
+    def test_recommendation_garments_missing_group(self, api_client, recommendation_factory):
+        """It returns a 404 for a facet group absent from the recommendations."""
+        recommendation = recommendation_factory()
+        response = api_client.get(self.GARMENTS_ENDPOINT % (recommendation.pk, 'shirt'), {'facet': 'price', 'group': 'low'})
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert 'group' in response.data['errors']
+
+    def test_recommendation_garments_required(self, api_client, recommendation_factory):
+        """It requires a facet and group."""
+        recommendation = recommendation_factory()
+        response = api_client.get(self.GARMENTS_ENDPOINT % (recommendation.pk, 'shirt'))
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'group' in response.data['errors']
+
+    def test_recommendation_garments_cursor(self, api_client, recommendation_factory):
+        """It rejects an invalid cursor."""
+        recommendation = recommendation_factory()
+        response = api_client.get(self.GARMENTS_ENDPOINT % (recommendation.pk, 'shirt'), {'cursor': 'invalid', 'facet': 'price', 'group': 'low'})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'cursor' in response.data['errors']
+
+    def test_recommendation_garments_etag(self, api_client, recommendation_factory):
+        """It checks the ETag before looking up the requested facet group."""
+        recommendation = recommendation_factory()
+        params = {'facet': 'price', 'group': 'low'}
+
+        with mock.patch('chiton.api.views.get_snapshot_etag') as get_snapshot_etag:
+            get_snapshot_etag.return_value = 'current'
+            response = api_client.get(self.GARMENTS_ENDPOINT % (recommendation.pk, 'shirt'), params, HTTP_IF_NONE_MATCH='"current"')
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response['ETag'] == '"current"'
@@ -0,0 +1,201 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO
+import json
+import os
+from socketserver import ThreadingMixIn
+import threading
+
+from chitonmark.benchmark import BaseBenchmark
+
+
+# The number of affiliate items to refresh
+ITEM_COUNT = 200
+
+# The number of size and color records in each stub product
+SIZE_COUNT = 12
+COLOR_COUNT = 8
+
+# The number of distinct images served by the stub server
+IMAGE_COUNT = 10
+
+
+class Benchmark(BaseBenchmark):
+    """Refresh affiliate item details against a local stub of the Shopstyle API.
+
+    The number of fetch workers, parser processes and queue depths can be set
+    through the CHITONMARK_WORKERS, CHITONMARK_PROCESSES, CHITONMARK_PARSE_QUEUE
+    and CHITONMARK_WRITE_QUEUE environment variables, with a process count of
+    zero running the unstaged batch job.
+    """
+
+    fixtures = [
+        'affiliate_item_factory',
+        'affiliate_network_factory',
+        'basic_factory',
+        'color_factory',
+        'garment_factory'
+    ]
+
+    def resolve_imports(self):
+        from chiton.rack.affiliates.bulk import bulk_update_affiliate_item_details, DEFAULT_PARSE_QUEUE_SIZE, DEFAULT_WRITE_QUEUE_SIZE
+        from chiton.rack.affiliates.shopstyle import Affiliate
+        from chiton.rack.models import AffiliateItem
+
+        return {
+            'AffiliateItem': AffiliateItem,
+            'bulk_update_affiliate_item_details': bulk_update_affiliate_item_details,
+            'DEFAULT_PARSE_QUEUE_SIZE': DEFAULT_PARSE_QUEUE_SIZE,
+            'DEFAULT_WRITE_QUEUE_SIZE': DEFAULT_WRITE_QUEUE_SIZE,
+            'ShopstyleAffiliate': Affiliate
+        }
+
+    def pre_run(self, fixtures):
+        self._workers = int(os.environ.get('CHITONMARK_WORKERS', 8))
+        self._processes = int(os.environ.get('CHITONMARK_PROCESSES', 2))
+        self._parse_queue_size = int(os.environ.get('CHITONMARK_PARSE_QUEUE', self.imports['DEFAULT_PARSE_QUEUE_SIZE']))
+        self._write_queue_size = int(os.environ.get('CHITONMARK_WRITE_QUEUE', self.imports['DEFAULT_WRITE_QUEUE_SIZE']))
+
+        self.log('Starting stub affiliate server')
+        self._server = StubServer(('127.0.0.1', 0), StubRequestHandler)
+        self._server_thread = threading.Thread(target=self._server.serve_forever)
+        self._server_thread.daemon = True
+        self._server_thread.start()
+
+        host, port = self._server.server_address
+        self._server.base_url = 'http://%s:%d' % (host, port)
+        self._server.image = create_image()
+
+        Affiliate = self.imports['ShopstyleAffiliate']
+        self._api_url = Affiliate._API_URL
+        Affiliate._API_URL = '%s/api/v2' % self._server.base_url
+
+        self.log('Creating items')
+        color = fixtures['color_factory'](name='Color 0')
+        basic = fixtures['basic_factory'](primary_color=color)
+        network = fixtures['affiliate_network_factory'](name='Shopstyle', slug='shopstyle')
+
+        for i in range(0, ITEM_COUNT):
+            self.log('Creating item %d' % (i + 1), update=True)
+            fixtures['affiliate_item_factory'](
+                garment=fixtures['garment_factory'](basic=basic),
+                guid=str(i),
+                network=network
+            )
+
+        self.log('\nRefreshing with %d workers and %d processes' % (self._workers, self._processes))
+
+    def post_run(self):
+        self.imports['ShopstyleAffiliate']._API_URL = self._api_url
+        self._server.shutdown()
+        self._server.server_close()
+
+    def run(self, fixtures):
+        items = self.imports['AffiliateItem'].objects.all()
+
+        job = self.imports['bulk_update_affiliate_item_details'](
+            items,
+            force=True,
+            parse_queue_size=self._parse_queue_size,
+            processes=self._processes,
+            workers=self._workers,
+            write_queue_size=self._write_queue_size
+        )
+
+        for result in job.run():
+            if result.is_error:
+                raise RuntimeError(result.details)
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """A threaded HTTP server that stubs an affiliate API."""
+
+    daemon_threads = True
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """A handler that serves stub product data and images."""
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+
+        if path.startswith('/api/v2/products/'):
+            product_id = path.split('/')[-1]
+            body = json.dumps(create_product(product_id, self.server.base_url)).encode('utf-8')
+            content_type = 'application/json'
+        elif path.startswith('/images/'):
+            body = self.server.image
+            content_type = 'image/jpeg'
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def create_product(product_id, base_url):
+    """Create the stub API data for a product.
+
+    Args:
+        product_id (str): The product's ID
+        base_url (str): The base URL of the stub server
+
+    Returns:
+        dict: The product data
+    """
+    def image_sizes(index):
+        url = '%s/images/%d.jpg' % (base_url, index % IMAGE_COUNT)
+        return {'sizes': {'Medium': {'url': url}, 'XLarge': {'url': url}}}
+
+    colors = [
+        {
+            'canonicalColors': [{'name': 'Color %d' % i}],
+            'image': image_sizes(int(product_id) + i),
+            'name': 'Color %d' % i
+        }
+        for i in range(0, COLOR_COUNT)
+    ]
+
+    sizes = [
+        {'canonicalSize': {'name': str(i * 2)}, 'name': 'Size %d' % i}
+        for i in range(0, SIZE_COUNT)
+    ]
+
+    stock = [
+        {'color': {'name': color['name']}, 'size': {'name': size['name']}}
+        for color in colors
+        for size in sizes
+    ]
+
+    return {
+        'alternateImages': [image_sizes(int(product_id) + 1)],
+        'brandedName': 'Product %s' % product_id,
+        'clickUrl': '%s/products/%s' % (base_url, product_id),
+        'colors': colors,
+        'id': int(product_id),
+        'image': image_sizes(int(product_id)),
+        'inStock': True,
+        'price': 100 + int(product_id),
+        'retailer': {'name': 'Retailer'},
+        'sizes': sizes,
+        'stock': stock
+    }
+
+
+def create_image():
+    """Create the content of the image served by the stub server.
+
+    Returns:
+        bytes: The content of a JPEG image
+    """
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new('RGB', (100, 100), 'white').save(buffer, 'JPEG')
+    return buffer.getvalue()
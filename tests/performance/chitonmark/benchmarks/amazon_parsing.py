@@ -0,0 +1,60 @@
+import glob
+import gzip
+import os.path
+
+import yaml
+
+from chitonmark.benchmark import BaseBenchmark
+from chitonmark.paths import ROOT_DIR
+
+
+# The directory containing the recorded Amazon API responses
+CASSETTES_DIR = os.path.join(ROOT_DIR, 'tests', 'fixtures', 'vcr', 'rack', 'test_affiliates_amazon')
+
+
+class Benchmark(BaseBenchmark):
+    """Extract item data from recorded ItemLookup responses."""
+
+    def resolve_imports(self):
+        from chiton.rack.affiliates.amazon.parsing import parse_item_lookup
+
+        return {
+            'parse': parse_item_lookup
+        }
+
+    def pre_run(self, fixtures):
+        self.log('Loading recorded responses')
+        self._responses = load_variation_responses()
+        self.log('Loaded %d responses' % len(self._responses))
+
+    def run(self, fixtures):
+        parse = self.imports['parse']
+        for response in self._responses:
+            parse(response)
+
+
+def load_variation_responses():
+    """Load the raw XML of every recorded ItemLookup request for variations.
+
+    Returns:
+        list[bytes]: The XML of each response
+    """
+    responses = []
+
+    for cassette_path in sorted(glob.glob(os.path.join(CASSETTES_DIR, '*', '*.yml'))):
+        with open(cassette_path) as cassette_file:
+            cassette = yaml.safe_load(cassette_file)
+
+        for interaction in cassette['interactions']:
+            if 'Variations' not in interaction['request']['uri']:
+                continue
+
+            body = interaction['response']['body']['string']
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+            if 'gzip' in interaction['response']['headers'].get('Content-Encoding', []):
+                body = gzip.decompress(body)
+
+            responses.append(body)
+
+    return responses
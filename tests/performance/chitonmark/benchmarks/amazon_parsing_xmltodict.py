@@ -0,0 +1,12 @@
+from chitonmark.benchmarks.amazon_parsing import Benchmark as StreamingBenchmark
+
+
+class Benchmark(StreamingBenchmark):
+    """Build full trees of recorded ItemLookup responses, for comparison."""
+
+    def resolve_imports(self):
+        import xmltodict
+
+        return {
+            'parse': xmltodict.parse
+        }
@@ -64,6 +64,7 @@ class Benchmark(BaseBenchmark):
                     is_regular=variants[2],
                     is_tall=variants[3]
                 ))
+        all_sizes_mask = sum([1 << size.ordinal for size in standard_sizes])
 
         # Create a pool of formalities
         self.log('Creating formalities')
@@ -133,7 +134,9 @@ class Benchmark(BaseBenchmark):
                 price = basic.budget_end if i % 2 else basic.luxury_start
                 price = price * 0.5 + i * 2 if i % 3 else price * 1.5 + i * 0.5
 
+                is_available = bool(i % 2)
                 affiliate_item = fixtures['affiliate_item_factory'](
+                    availability_mask=all_sizes_mask if is_available else 0,
                     network=network,
                     garment=garment,
                     price=price
@@ -143,7 +146,7 @@ class Benchmark(BaseBenchmark):
                     fixtures['stock_record_factory'](
                         item=affiliate_item,
                         size=standard_size,
-                        is_available=bool(i % 2)
+                        is_available=is_available
                     )
 
         # Create formality expectations for the profile
@@ -17,5 +17,11 @@ CACHES['default'] = {
     'LOCATION': 'chiton_tests'
 }
 
+# Write recommendations immediately, without a background flusher
+CHITON_BUFFER_RECOMMENDATIONS = False
+
+# Spool and journal recommendations within the temporary media directory
+CHITON_RECOMMENDATION_SPOOL = os.path.join(MEDIA_ROOT, 'recommendation-spool')
+
 # Disable logging
 logging.disable(logging.CRITICAL)
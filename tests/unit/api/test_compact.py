@@ -0,0 +1,111 @@
+from decimal import Decimal
+import json
+
+import pytest
+from rest_framework.renderers import JSONRenderer
+
+from chiton.api.compact import KEY_TABLE, pack_compact, unpack_compact
+
+
+def build_garment(garment_id, weight=1):
+    return {
+        'explanations': {
+            'normalization': [{'importance': 1, 'name': 'Test', 'weight': 0.5}],
+            'weights': [{'name': 'Test', 'reasons': [{'reason': 'Test', 'weight': 1}]}]
+        },
+        'garment': {
+            'brand': 'Brand',
+            'branded_name': 'Brand Shirt',
+            'care': None,
+            'id': garment_id,
+            'name': 'Shirt'
+        },
+        'purchase_options': [{
+            'has_multiple_colors': False,
+            'id': garment_id,
+            'images': [{
+                'height': 100,
+                'url': 'http://example.com/image.jpg',
+                'variants': [{'format': 'jpeg', 'height': 50, 'url': 'http://example.com/small.jpg', 'width': 50}],
+                'width': 100
+            }],
+            'network_name': 'Network',
+            'price': 1000,
+            'retailer': 'Retailer',
+            'url': 'http://example.com'
+        }],
+        'weight': weight
+    }
+
+
+def build_recommendations(recommendation_id=1):
+    return {
+        'basics': [{
+            'basic': {'category': 'Tops', 'id': 1, 'name': 'Shirt', 'plural_name': 'Shirts', 'slug': 'shirt'},
+            'facets': [{
+                'groups': [{'garment_ids': [1, 2], 'next_cursor': 'abc', 'slug': 'low'}, {'garment_ids': [], 'slug': 'high'}],
+                'name': 'Price',
+                'slug': 'price'
+            }],
+            'garments': [build_garment(1), build_garment(2, weight=0.25)]
+        }],
+        'categories': ['Tops', 'Bottoms'],
+        'recommendation_id': recommendation_id
+    }
+
+
+def decode_json(data):
+    return json.loads(JSONRenderer().render(data).decode('utf-8'))
+
+
+class TestPackCompact:
+
+    @pytest.mark.parametrize('data', [
+        build_recommendations(),
+        {'recommendations': [build_recommendations(1), build_recommendations(2)]},
+        {'garments': [build_garment(1)], 'next_cursor': None, 'total': 1},
+        {'errors': {'profiles': {'0': {'age': 'Invalid'}, '1': 'A profile must be an object'}}},
+        {'basics': [], 'categories': []},
+        {'text': 'Ünïcode   "quoted"', 'values': (1, 2.5, True, None)},
+        []
+    ])
+    def test_round_trip(self, data):
+        """It decodes to the same data as the JSON encoding."""
+        assert unpack_compact(pack_compact(data)) == decode_json(data)
+
+    def test_round_trip_keys(self):
+        """It normalizes non-string keys as the JSON encoding does."""
+        data = {1: 'one', None: 'none', False: 'false'}
+        assert unpack_compact(pack_compact(data)) == decode_json(data)
+
+    def test_round_trip_decimals(self):
+        """It normalizes values that are not natively supported as the JSON encoding does."""
+        data = {'price': Decimal('10.50')}
+        assert unpack_compact(pack_compact(data)) == decode_json(data)
+
+    def test_unknown_keys(self):
+        """It adds keys missing from the base key table."""
+        data = {'unknown': {'nested_unknown': 1}}
+        assert unpack_compact(pack_compact(data)) == data
+
+    def test_size(self):
+        """It encodes recommendations more compactly than JSON."""
+        data = {'recommendations': [build_recommendations(i) for i in range(0, 10)]}
+        assert len(pack_compact(data)) < len(JSONRenderer().render(data))
+
+
+class TestKeyTable:
+
+    def test_shapes(self):
+        """It includes the keys of the nested recommendation data shapes."""
+        for key in ('basics', 'explanations', 'next_cursor', 'purchase_options', 'variants', 'total'):
+            assert key in KEY_TABLE
+
+    def test_response_keys(self):
+        """It includes keys added to recommendations by the API."""
+        assert 'recommendation_id' in KEY_TABLE
+        assert 'recommendations' in KEY_TABLE
+
+    def test_unique(self):
+        """It contains each key once."""
+        assert len(KEY_TABLE) == len(set(KEY_TABLE))
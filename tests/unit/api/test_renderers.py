@@ -0,0 +1,66 @@
+import json
+
+from chiton.api.compact import unpack_compact
+from chiton.api.renderers import CatalogResponse, FragmentJSONRenderer, MessagePackRenderer
+
+
+def build_garment(garment_id, weight=1, name='Shirt'):
+    return {
+        'garment': {'id': garment_id, 'name': name},
+        'purchase_options': [{'id': garment_id, 'images': [], 'price': 1000}],
+        'weight': weight
+    }
+
+
+def render(data, generation=None, accepted_media_type='application/json'):
+    context = {'response': CatalogResponse(data, catalog_generation=generation)}
+    return FragmentJSONRenderer().render(data, accepted_media_type, context)
+
+
+class TestFragmentJSONRenderer:
+
+    def test_plain(self):
+        """It renders data without a catalog generation as standard JSON."""
+        data = {'garments': [build_garment(1)]}
+        assert json.loads(render(data).decode('utf-8')) == data
+
+    def test_fragments(self):
+        """It renders garments with a catalog generation identically to standard JSON."""
+        data = {'basics': [{'garments': [build_garment(1, weight=0.5), build_garment(2)]}], 'recommendation_id': 1}
+        assert render(data, generation='first') == render(data)
+
+    def test_fragments_reused(self):
+        """It reuses the encoded catalog data of garments within a generation while encoding each weight."""
+        render({'garments': [build_garment(1, name='Shirt')]}, generation='first')
+        rendered = render({'garments': [build_garment(1, weight=0.25, name='Dress')]}, generation='first')
+
+        garment = json.loads(rendered.decode('utf-8'))['garments'][0]
+        assert garment['garment']['name'] == 'Shirt'
+        assert garment['weight'] == 0.25
+
+    def test_fragments_generation(self):
+        """It discards the encoded catalog data of garments from other generations."""
+        render({'garments': [build_garment(1, name='Shirt')]}, generation='first')
+        rendered = render({'garments': [build_garment(1, name='Dress')]}, generation='second')
+
+        assert json.loads(rendered.decode('utf-8'))['garments'][0]['garment']['name'] == 'Dress'
+
+    def test_indent(self):
+        """It renders indented JSON without fragments."""
+        data = {'garments': [build_garment(1)]}
+        rendered = render(data, generation='first', accepted_media_type='application/json; indent=4')
+
+        assert b'\n' in rendered
+        assert json.loads(rendered.decode('utf-8')) == data
+
+
+class TestMessagePackRenderer:
+
+    def test_render(self):
+        """It renders data in the compact MessagePack layout."""
+        data = {'garments': [build_garment(1)]}
+        assert unpack_compact(MessagePackRenderer().render(data)) == data
+
+    def test_render_empty(self):
+        """It renders no data as an empty body."""
+        assert MessagePackRenderer().render(None) == b''
@@ -1,5 +1,8 @@
+import pytest
+
 from chiton.closet.data import EMPHASES, EMPHASIS_CHOICES
-from chiton.closet.model_fields import EmphasisField
+from chiton.closet.model_fields import AvailabilityMaskField, EmphasisField
+from chiton.rack.models import AffiliateItem
 
 
 class TestEmphasisField:
@@ -18,3 +21,22 @@ class TestEmphasisField:
         """It allows a custom default to be used."""
         field = EmphasisField(default=EMPHASES['WEAK'])
         assert field.default == EMPHASES['WEAK']
+
+
+class TestAvailabilityMaskField:
+
+    def test_default(self):
+        """It defaults to an empty mask."""
+        field = AvailabilityMaskField()
+        assert field.default == 0
+
+    @pytest.mark.django_db
+    def test_has_any(self, affiliate_item_factory):
+        """It supports queries for masks that share any bits with a given mask."""
+        small = affiliate_item_factory(availability_mask=0b001)
+        medium_large = affiliate_item_factory(availability_mask=0b110)
+        affiliate_item_factory(availability_mask=0)
+
+        assert set(AffiliateItem.objects.filter(availability_mask__has_any=0b011)) == set([small, medium_large])
+        assert set(AffiliateItem.objects.filter(availability_mask__has_any=0b100)) == set([medium_large])
+        assert not AffiliateItem.objects.filter(availability_mask__has_any=0).exists()
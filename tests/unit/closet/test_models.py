@@ -1,7 +1,10 @@
 from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 import mock
 import pytest
 
+from chiton.closet.model_fields import AvailabilityMaskField
 from chiton.closet.models import Brand, CanonicalSize, Color, Garment, make_branded_garment_name, StandardSize
 
 
@@ -224,3 +227,61 @@ class TestStandardSize:
 
         standard_size_factory(slug='beta')
         assert StandardSize.objects.get_slugs() == ['alpha', 'beta']
+
+    def test_ordinal(self, standard_size_factory):
+        """It assigns each new size the lowest unused ordinal."""
+        first = standard_size_factory()
+        second = standard_size_factory()
+        third = standard_size_factory()
+        second.delete()
+        fourth = standard_size_factory()
+
+        assert [first.ordinal, second.ordinal, third.ordinal] == [0, 1, 2]
+        assert fourth.ordinal == 1
+
+    def test_ordinal_explicit(self, canonical_size_factory, standard_size_factory):
+        """It skips ordinals held by sizes given explicit ordinals."""
+        StandardSize.objects.create(canonical=canonical_size_factory(), ordinal=0)
+        assert standard_size_factory().ordinal == 1
+
+    def test_ordinal_lock(self, standard_size_factory):
+        """It locks the size table while assigning an ordinal."""
+        with CaptureQueriesContext(connection) as queries:
+            standard_size_factory()
+
+        assert any([q['sql'].startswith('LOCK TABLE') for q in queries])
+
+    def test_ordinal_exhausted(self, standard_size_factory):
+        """It refuses to create a size when no ordinal fits in an availability mask."""
+        with mock.patch.object(AvailabilityMaskField, 'MAX_BITS', 2):
+            standard_size_factory()
+            standard_size_factory()
+
+            with pytest.raises(ValidationError):
+                standard_size_factory()
+
+        assert StandardSize.objects.count() == 2
+
+    def test_ordinal_explicit_invalid(self, canonical_size_factory):
+        """It refuses to save a size whose explicit ordinal does not fit in an availability mask."""
+        with pytest.raises(ValidationError):
+            StandardSize.objects.create(canonical=canonical_size_factory(), ordinal=63)
+
+        assert not StandardSize.objects.count()
+
+    def test_validation_ordinal(self, canonical_size_factory):
+        """It ensures that the size's ordinal fits in an availability mask."""
+        size = StandardSize(canonical=canonical_size_factory(), ordinal=63)
+
+        with pytest.raises(ValidationError):
+            size.full_clean()
+
+    def test_get_mask(self, standard_size_factory):
+        """It produces an availability mask matching any of the given sizes."""
+        small = standard_size_factory(slug='small')
+        standard_size_factory(slug='medium')
+        large = standard_size_factory(slug='large')
+
+        mask = StandardSize.objects.get_mask(['small', 'large', 'unknown'])
+
+        assert mask == (1 << small.ordinal) | (1 << large.ordinal)
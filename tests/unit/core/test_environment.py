@@ -293,6 +293,17 @@ class TestUseConfig:
         config = use_config()
         assert not config['public_api']
 
+    def test_recommendation_spool(self):
+        """It expects an optional absolute path for the recommendation spool."""
+        config = use_config()
+        assert config['recommendation_spool'] is None
+
+        config = use_config({'recommendation_spool': '/tmp'})
+        assert config['recommendation_spool'] == '/tmp'
+
+        with pytest.raises(ConfigurationError):
+            use_config({'recommendation_spool': 'tmp'})
+
     def test_redis(self):
         """It expects a Redis hash."""
         config = use_config({
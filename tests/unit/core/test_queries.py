@@ -1,7 +1,7 @@
 import pytest
 
 from chiton.closet.models import Brand, Color, Garment
-from chiton.core.queries import bind_signal_handlers, cache_query, prime_cached_queries, unbind_signal_handlers
+from chiton.core.queries import bind_signal_handlers, cache_query, defer_cached_query_refreshes, pin_cached_queries, prime_cached_queries, refresh_cached_queries, unbind_signal_handlers
 
 
 NAMESPACE = 'test_queries'
@@ -185,6 +185,103 @@ class TestPrimeCachedQueries(TestQueryCaching):
         assert call_count == 1
 
 
+class TestRefreshCachedQueries(TestQueryCaching):
+
+    def test_refresh_models(self):
+        """It refreshes only the queries that involve the given models."""
+        @cache_query(Color, namespace=NAMESPACE)
+        def count_colors():
+            return Color.objects.count()
+
+        @cache_query(Brand, namespace=NAMESPACE)
+        def count_brands():
+            return Brand.objects.count()
+
+        assert count_colors() == 0
+        assert count_brands() == 0
+
+        Color.objects.bulk_create([Color(name='Red'), Color(name='Blue')])
+        Brand.objects.bulk_create([Brand(name='Brand', age_lower=20, age_upper=40)])
+
+        refresh_cached_queries(Color)
+
+        assert count_colors() == 2
+        assert count_brands() == 0
+
+
+class TestDeferCachedQueryRefreshes(TestQueryCaching):
+
+    def test_defer(self, color_factory):
+        """It refreshes each affected query once at the end of the block."""
+        call_count = 0
+
+        @cache_query(Color, namespace=NAMESPACE)
+        def count_colors():
+            nonlocal call_count
+            call_count += 1
+            return Color.objects.count()
+
+        bind_signal_handlers(NAMESPACE)
+        assert count_colors() == 0
+
+        with defer_cached_query_refreshes():
+            color_factory()
+            color_factory()
+            refresh_cached_queries(Color)
+            assert count_colors() == 0
+
+        assert count_colors() == 2
+        assert call_count == 2
+
+    def test_nested(self, color_factory):
+        """It waits for the outermost block to end before refreshing."""
+        @cache_query(Color, namespace=NAMESPACE)
+        def count_colors():
+            return Color.objects.count()
+
+        bind_signal_handlers(NAMESPACE)
+        assert count_colors() == 0
+
+        with defer_cached_query_refreshes():
+            with defer_cached_query_refreshes():
+                color_factory()
+            assert count_colors() == 0
+
+        assert count_colors() == 1
+
+
+class TestPinCachedQueries(TestQueryCaching):
+
+    def test_pin(self, color_factory):
+        """It reuses the first value returned by a query within the block."""
+        @cache_query(Color, namespace=NAMESPACE)
+        def count_colors():
+            return Color.objects.count()
+
+        bind_signal_handlers(NAMESPACE)
+
+        with pin_cached_queries():
+            assert count_colors() == 0
+            color_factory()
+            assert count_colors() == 0
+
+        assert count_colors() == 1
+
+    def test_nested(self, color_factory):
+        """It keeps values pinned until the outermost block exits."""
+        @cache_query(Color, namespace=NAMESPACE)
+        def count_colors():
+            return Color.objects.count()
+
+        bind_signal_handlers(NAMESPACE)
+
+        with pin_cached_queries():
+            with pin_cached_queries():
+                assert count_colors() == 0
+            color_factory()
+            assert count_colors() == 0
+
+
 class TestBindSignalHandlers(TestQueryCaching):
 
     def test_binds_handlers(self, color_factory):
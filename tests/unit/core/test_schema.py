@@ -135,6 +135,13 @@ class TestDefineDataShape:
 
         assert 'list.1' in error.value.fields
 
+    def test_schema(self):
+        """It exposes the schema used by the generated function."""
+        schema = {V.Required('name'): str}
+        create_person = define_data_shape(schema)
+
+        assert create_person.schema is schema
+
 
 class TestEmail:
 
@@ -0,0 +1,115 @@
+from chiton.rack.affiliates.amazon.parsing import parse_item_lookup
+
+
+ITEM_XML = b"""<?xml version="1.0" ?>
+<ItemLookupResponse xmlns="http://webservices.amazon.com/AWSECommerceService/2013-08-01">
+    <Items>
+        <Request><IsValid>True</IsValid></Request>
+        <Item>
+            <ASIN>PARENT</ASIN>
+            <ParentASIN>PARENT</ParentASIN>
+            <DetailPageURL>http://example.com/parent</DetailPageURL>
+            <ItemAttributes><Title>Parent Item</Title></ItemAttributes>
+            <Variations>
+                <Item>
+                    <ASIN>CHILD1</ASIN>
+                    <MediumImage><URL>http://example.com/child1-medium.jpg</URL></MediumImage>
+                    <LargeImage><URL>http://example.com/child1-large.jpg</URL></LargeImage>
+                    <ImageSets>
+                        <ImageSet><LargeImage><URL>http://example.com/set-large.jpg</URL></LargeImage></ImageSet>
+                    </ImageSets>
+                    <ItemAttributes><Color>Black</Color></ItemAttributes>
+                    <Offers><Offer><OfferListing><Price><Amount>1000</Amount></Price></OfferListing></Offer></Offers>
+                </Item>
+                <Item>
+                    <ASIN>CHILD2</ASIN>
+                    <ItemAttributes><Color>Red</Color></ItemAttributes>
+                </Item>
+            </Variations>
+        </Item>
+    </Items>
+</ItemLookupResponse>
+"""
+
+CHILD_XML = b"""<?xml version="1.0" ?>
+<ItemLookupResponse xmlns="http://webservices.amazon.com/AWSECommerceService/2013-08-01">
+    <Items>
+        <Request><IsValid>True</IsValid></Request>
+        <Item>
+            <ASIN>CHILD1</ASIN>
+            <ParentASIN>PARENT</ParentASIN>
+            <ItemAttributes><Title>Child Item</Title></ItemAttributes>
+        </Item>
+    </Items>
+</ItemLookupResponse>
+"""
+
+ERROR_XML = b"""<?xml version="1.0" ?>
+<ItemLookupResponse xmlns="http://webservices.amazon.com/AWSECommerceService/2013-08-01">
+    <Items>
+        <Request>
+            <IsValid>True</IsValid>
+            <Errors>
+                <Error>
+                    <Code>AWS.InvalidParameterValue</Code>
+                    <Message>0000000000 is not a valid value for ItemId.</Message>
+                </Error>
+            </Errors>
+        </Request>
+    </Items>
+</ItemLookupResponse>
+"""
+
+
+class TestParseItemLookup:
+
+    def test_item(self):
+        """It extracts the identifiers, title and URL of the item."""
+        item = parse_item_lookup(ITEM_XML)['item']
+
+        assert item['asin'] == 'PARENT'
+        assert item['parent_asin'] == 'PARENT'
+        assert item['title'] == 'Parent Item'
+        assert item['url'] == 'http://example.com/parent'
+        assert item['has_variations']
+
+    def test_variations(self):
+        """It extracts the ASIN, color and price of each variation."""
+        variations = parse_item_lookup(ITEM_XML)['item']['variations']
+
+        assert [v['asin'] for v in variations] == ['CHILD1', 'CHILD2']
+        assert [v['color'] for v in variations] == ['Black', 'Red']
+        assert [v['price'] for v in variations] == [1000, None]
+
+    def test_variation_images(self):
+        """It extracts the images of each variation, ignoring image sets."""
+        variations = parse_item_lookup(ITEM_XML)['item']['variations']
+
+        assert variations[0]['images'] == {
+            'LargeImage': 'http://example.com/child1-large.jpg',
+            'MediumImage': 'http://example.com/child1-medium.jpg'
+        }
+        assert variations[1]['images'] == {}
+
+    def test_child(self):
+        """It reports child items as lacking variations."""
+        item = parse_item_lookup(CHILD_XML)['item']
+
+        assert item['asin'] == 'CHILD1'
+        assert item['parent_asin'] == 'PARENT'
+        assert not item['has_variations']
+        assert item['variations'] == []
+
+    def test_errors(self):
+        """It extracts any errors reported for the request."""
+        lookup = parse_item_lookup(ERROR_XML)
+
+        assert lookup['item'] is None
+        assert lookup['errors'] == [{
+            'code': 'AWS.InvalidParameterValue',
+            'message': '0000000000 is not a valid value for ItemId.'
+        }]
+
+    def test_no_errors(self):
+        """It returns no errors for a valid request."""
+        assert parse_item_lookup(ITEM_XML)['errors'] == []
@@ -1,13 +1,17 @@
+from decimal import Decimal
 from time import sleep
 
+from django.db import DatabaseError
 import mock
 import pytest
 
-from chiton.rack.models import AffiliateItem
+from chiton.rack.models import AffiliateItem, ItemImage, ItemImageDerivative, RefreshJob, StockRecord
 from chiton.rack.affiliates.base import Affiliate
-from chiton.rack.affiliates.bulk import BatchJob, bulk_update_affiliate_item_details, bulk_update_affiliate_item_metadata, prune_affiliate_items
-from chiton.rack.affiliates.data import update_affiliate_item_details, update_affiliate_item_metadata
+from chiton.rack.affiliates.bulk import BatchJob, bulk_update_affiliate_item_details, bulk_update_affiliate_item_metadata, InFlightItems, prune_affiliate_items, StagedDetailsJob
+from chiton.rack.affiliates.circuits import CircuitBreaker, CircuitBreakers
+from chiton.rack.affiliates.data import apply_stock_record_changes, update_affiliate_item_details, update_affiliate_item_metadata
 from chiton.rack.affiliates.exceptions import BatchError, LookupError, ThrottlingError
+from chiton.rack.affiliates.metrics import measure_request, record_download
 
 
 class ValidatingAffiliate(Affiliate):
@@ -20,6 +24,41 @@ class ValidatingAffiliate(Affiliate):
         return tld in self.valid_tlds
 
 
+class PayloadAffiliate(Affiliate):
+    """An affiliate that provides details as separately fetched and parsed payloads."""
+
+    def provide_details_payload(self, guid):
+        if guid == 'invalid':
+            raise LookupError()
+        elif guid.startswith('error'):
+            raise ValueError('Fetching')
+        elif guid == 'throttled':
+            raise ThrottlingError()
+
+        return {'guid': guid}
+
+    def provide_details_from_payload(self, payload, colors):
+        if payload['guid'] == 'unparseable':
+            raise LookupError()
+
+        return {
+            'availability': True,
+            'colors': [],
+            'images': [],
+            'name': 'Item %s' % payload['guid'],
+            'price': Decimal('12.99'),
+            'retailer': 'Retailer',
+            'url': 'http://example.com/%s' % payload['guid']
+        }
+
+
+@pytest.fixture
+def payload_affiliate():
+    with mock.patch('chiton.rack.affiliates.data.create_affiliate') as create_affiliate:
+        create_affiliate.return_value = PayloadAffiliate()
+        yield
+
+
 @pytest.fixture
 def affiliate_items(affiliate_item_factory):
     for i in range(0, 4):
@@ -27,6 +66,14 @@ def affiliate_items(affiliate_item_factory):
     return AffiliateItem.objects.all()
 
 
+@pytest.fixture
+def network_items(affiliate_item_factory, affiliate_network_factory):
+    network = affiliate_network_factory()
+    for i in range(0, 4):
+        affiliate_item_factory(name=str(i), network=network)
+    return AffiliateItem.objects.all()
+
+
 @pytest.fixture
 def affiliate_items_url_factory(affiliate_item_factory):
     def factory(tlds=[]):
@@ -68,6 +115,49 @@ class TestBatchJob:
 
         assert success_count == 4
 
+    def test_results_skipped(self, affiliate_items):
+        """It marks results as skipped when the updater reports an unchanged item."""
+        def skip_first(item):
+            return item.name != "0"
+
+        batch_job = BatchJob(affiliate_items, mock.Mock(side_effect=skip_first))
+        results = list(batch_job.run())
+
+        assert len([r for r in results if r.is_skipped]) == 1
+        assert not any([r.is_error for r in results])
+
+    def test_stock_batches(self, affiliate_items):
+        """It writes the stock-record changes reported by the updater in batches."""
+        def add_changes(item, stock_changes):
+            stock_changes.append({'item': item.pk})
+            return True
+
+        batch_job = BatchJob(affiliate_items, add_changes, stock_batch_size=3)
+
+        with mock.patch('chiton.rack.affiliates.bulk.apply_stock_record_changes') as apply_stock_record_changes:
+            results = list(batch_job.run())
+
+        assert not any([r.is_error for r in results])
+        assert [len(c[0][0]) for c in apply_stock_record_changes.call_args_list] == [3, 1]
+        assert all([r.stock_changes is None for r in results])
+
+    def test_stock_batches_error(self, affiliate_items):
+        """It fails the items of a batch whose stock-record changes cannot be written."""
+        affiliate_items.update(details_fingerprint='fingerprint')
+
+        def add_changes(item, stock_changes):
+            stock_changes.append({'item': item.pk})
+            return True
+
+        batch_job = BatchJob(affiliate_items, add_changes, stock_batch_size=2)
+
+        with mock.patch('chiton.rack.affiliates.bulk.apply_stock_record_changes', side_effect=DatabaseError('Failed')):
+            results = list(batch_job.run())
+
+        assert len(results) == 4
+        assert all(['Failed' in r.details for r in results])
+        assert set(AffiliateItem.objects.values_list('details_fingerprint', flat=True)) == set([''])
+
     def test_results_errors(self, affiliate_items):
         """It flags whether a result was an error or not."""
         updater = mock.Mock(side_effect=ValueError())
@@ -172,17 +262,123 @@ class TestBatchJob:
             tick += 1
 
         update_function = mock.Mock(side_effect=throttle)
-        batch_job = BatchJob(affiliate_items, update_function)
+        batch_job = BatchJob(affiliate_items, update_function, deadline=0.5)
 
         completed_jobs = 0
 
-        with mock.patch('chiton.rack.affiliates.bulk.QUEUE_TIMEOUT', 1):
-            with pytest.raises(BatchError):
-                for result in batch_job.run():
-                    completed_jobs += 1
+        with mock.patch('chiton.rack.affiliates.bulk.QUEUE_TIMEOUT_MARGIN', 0.5):
+            with mock.patch.object(InFlightItems, 'cancel_expired', return_value=[]):
+                with pytest.raises(BatchError):
+                    for result in batch_job.run():
+                        completed_jobs += 1
 
         assert completed_jobs == 1
 
+    def test_queue_timeout_deadline(self, affiliate_items):
+        """It waits for at least the item deadline before ending a job."""
+        def stall_first(item):
+            if item.name == "0":
+                sleep(1)
+
+        batch_job = BatchJob(affiliate_items, mock.Mock(side_effect=stall_first), deadline=2)
+
+        with mock.patch('chiton.rack.affiliates.bulk.QUEUE_TIMEOUT_MARGIN', 0.5):
+            results = list(batch_job.run())
+
+        assert len(results) == 4
+        assert not any([r.is_error for r in results])
+
+    def test_deadline(self, affiliate_items):
+        """It cancels items that exceed their deadline without ending the job."""
+        def stall_first(item):
+            if item.name == "0":
+                sleep(2)
+
+        batch_job = BatchJob(affiliate_items, mock.Mock(side_effect=stall_first), deadline=0.5)
+        results = list(batch_job.run())
+
+        errors = [r for r in results if r.is_error]
+        assert len(results) == 4
+        assert len(errors) == 1
+        assert 'deadline' in errors[0].details
+        assert errors[0].item_id == affiliate_items.get(name="0").pk
+
+    def test_deadline_throttling(self, affiliate_items):
+        """It does not retry throttled requests past an item's deadline."""
+        update_function = mock.Mock(side_effect=ThrottlingError())
+
+        with mock.patch('chiton.rack.affiliates.bulk.random.uniform', return_value=0.1):
+            batch_job = BatchJob(affiliate_items, update_function, deadline=0.5, max_retries=100)
+            results = list(batch_job.run())
+
+        assert len(results) == 4
+        assert all(['deadline' in r.details for r in results])
+        assert update_function.call_count < 100
+
+    def test_circuit_breaker(self, network_items):
+        """It fails the items of a network without updating them once its circuit opens."""
+        updater = mock.Mock(side_effect=ValueError('Outage'))
+
+        breakers = CircuitBreakers(failure_threshold=2)
+        batch_job = BatchJob(network_items, updater, workers=1, circuit_breakers=breakers)
+        results = list(batch_job.run())
+
+        assert len(results) == 4
+        assert all([r.is_error for r in results])
+        assert updater.call_count == 2
+        assert len([r for r in results if 'Outage' in r.details]) == 2
+        assert len([r for r in results if 'failing' in r.details]) == 2
+
+    def test_circuit_breaker_networks(self, affiliate_items):
+        """It uses a separate circuit for each network."""
+        updater = mock.Mock(side_effect=ValueError('Outage'))
+
+        breakers = CircuitBreakers(failure_threshold=1)
+        batch_job = BatchJob(affiliate_items, updater, workers=1, circuit_breakers=breakers)
+        list(batch_job.run())
+
+        assert updater.call_count == 4
+
+    def test_circuit_breaker_recovery(self, network_items):
+        """It closes a network's circuit when a probe request succeeds."""
+        updater = mock.Mock()
+
+        breakers = CircuitBreakers(failure_threshold=1, reset_timeout=0)
+        breakers[network_items.first().network_id].record_failure()
+
+        batch_job = BatchJob(network_items, updater, workers=1, circuit_breakers=breakers)
+        results = list(batch_job.run())
+
+        assert not any([r.is_error for r in results])
+        assert updater.call_count == 4
+
+    def test_metrics(self, network_items):
+        """It collects metrics on the requests and throttling of each network."""
+        throttled = set()
+
+        def throttle_first(item):
+            if item.pk not in throttled:
+                throttled.add(item.pk)
+                raise ThrottlingError()
+            with measure_request():
+                record_download(10)
+            return item.name != "0"
+
+        batch_job = BatchJob(network_items, mock.Mock(side_effect=throttle_first))
+        with mock.patch('chiton.rack.affiliates.bulk.sleep'):
+            list(batch_job.run())
+
+        report = batch_job.metrics.report()
+        network = report['networks'][str(network_items.first().network_id)]
+
+        assert report['items'] == 4
+        assert network['changed'] == 3
+        assert network['skipped'] == 1
+        assert network['throttles'] == 4
+        assert network['retries'] == 4
+        assert network['requests']['count'] == 4
+        assert network['bytes_downloaded'] == 40
+
     @pytest.mark.django_db(transaction=True)
     def test_results_lookup_error(self, affiliate_items):
         """It removes items that cause lookup errors."""
@@ -205,6 +401,174 @@ class TestBatchJob:
         assert items.count() == 3
 
 
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.usefixtures('payload_affiliate')
+class TestStagedDetailsJob:
+
+    def test_results(self, affiliate_item_factory):
+        """It fetches, parses and applies the details of each item."""
+        for guid in ['one', 'two', 'three']:
+            affiliate_item_factory(guid=guid)
+
+        job = StagedDetailsJob(AffiliateItem.objects.all(), processes=2)
+        results = list(job.run())
+
+        assert len(results) == 3
+        assert not any([r.is_error for r in results])
+        assert not any([r.is_skipped for r in results])
+
+        items = AffiliateItem.objects.all().order_by('name')
+        assert [i.name for i in items] == ['Item one', 'Item three', 'Item two']
+        assert [i.affiliate_url for i in items] == ['http://example.com/one', 'http://example.com/three', 'http://example.com/two']
+
+    def test_results_skipped(self, affiliate_item_factory):
+        """It marks results as skipped when an item's details are unchanged."""
+        affiliate_item_factory(guid='one')
+        affiliate_item_factory(guid='two')
+
+        list(StagedDetailsJob(AffiliateItem.objects.all(), processes=1).run())
+        results = list(StagedDetailsJob(AffiliateItem.objects.all(), processes=1).run())
+
+        assert all([r.is_skipped for r in results])
+
+    def test_results_force(self, affiliate_item_factory):
+        """It can force updates of items whose details are unchanged."""
+        affiliate_item_factory(guid='one')
+
+        list(StagedDetailsJob(AffiliateItem.objects.all(), processes=1).run())
+        results = list(StagedDetailsJob(AffiliateItem.objects.all(), processes=1, force=True).run())
+
+        assert not any([r.is_skipped for r in results])
+
+    def test_results_queue_sizes(self, affiliate_item_factory):
+        """It processes every item when its queues are smaller than the batch."""
+        for i in range(0, 6):
+            affiliate_item_factory(guid=str(i))
+
+        job = StagedDetailsJob(AffiliateItem.objects.all(), workers=3, processes=2, parse_queue_size=1, write_queue_size=1)
+        results = list(job.run())
+
+        assert len(results) == 6
+        assert not any([r.is_error for r in results])
+
+    def test_results_lookup_error(self, affiliate_item_factory):
+        """It removes items whose payloads cannot be fetched or parsed."""
+        affiliate_item_factory(guid='valid')
+        affiliate_item_factory(guid='invalid')
+        affiliate_item_factory(guid='unparseable')
+
+        results = list(StagedDetailsJob(AffiliateItem.objects.all(), processes=2).run())
+
+        assert len([r for r in results if r.is_error]) == 2
+        assert list(AffiliateItem.objects.values_list('guid', flat=True)) == ['valid']
+
+    def test_results_errors(self, affiliate_item_factory):
+        """It includes a stacktrace in the details of an errored result."""
+        affiliate_item_factory(guid='error')
+
+        results = list(StagedDetailsJob(AffiliateItem.objects.all(), processes=1).run())
+
+        assert results[0].is_error
+        assert 'Fetching' in results[0].details
+        assert AffiliateItem.objects.count() == 1
+
+    def test_results_throttling(self, affiliate_item_factory):
+        """It retries throttled fetches until the retries exceed a maximum value."""
+        affiliate_item_factory(guid='throttled')
+
+        with mock.patch('chiton.rack.affiliates.bulk.sleep') as delay_function:
+            results = list(StagedDetailsJob(AffiliateItem.objects.all(), processes=1, max_retries=2).run())
+
+            assert delay_function.call_count == 2
+
+        assert results[0].is_error
+        assert 'throttling' in results[0].details
+
+    def test_circuit_breaker(self, affiliate_item_factory, affiliate_network_factory):
+        """It fails the items of a network without fetching them once its circuit opens."""
+        network = affiliate_network_factory()
+        for i in range(0, 3):
+            affiliate_item_factory(guid='error-%d' % i, network=network)
+
+        breakers = CircuitBreakers(failure_threshold=1)
+        results = list(StagedDetailsJob(AffiliateItem.objects.all(), workers=1, processes=1, circuit_breakers=breakers).run())
+
+        assert len([r for r in results if 'Fetching' in r.details]) == 1
+        assert len([r for r in results if 'failing' in r.details]) == 2
+
+    def test_stock_batches(self, affiliate_item_factory, standard_size_factory):
+        """It writes the stock records of the items in batches."""
+        standard_size_factory()
+        standard_size_factory()
+        for guid in ['one', 'two', 'three']:
+            affiliate_item_factory(guid=guid)
+
+        job = StagedDetailsJob(AffiliateItem.objects.all(), processes=1, stock_batch_size=2)
+
+        with mock.patch('chiton.rack.affiliates.bulk.apply_stock_record_changes', wraps=apply_stock_record_changes) as apply_changes:
+            results = list(job.run())
+
+        assert not any([r.is_error for r in results])
+        assert apply_changes.call_count == 2
+        assert StockRecord.objects.count() == 6
+
+    def test_metrics(self, affiliate_item_factory):
+        """It collects metrics on the fetch and write stages of each item."""
+        item = affiliate_item_factory(guid='one')
+        affiliate_item_factory(guid='two', network=item.network)
+
+        job = StagedDetailsJob(AffiliateItem.objects.all(), processes=1)
+        list(job.run())
+
+        network = job.metrics.report()['networks'][str(item.network_id)]
+        assert network['items'] == 2
+        assert network['changed'] == 2
+        assert network['requests']['count'] == 2
+        assert network['write_seconds'] > 0
+
+
+class TestInFlightItems:
+
+    def test_finish(self):
+        """It reports whether an item finished before being cancelled."""
+        clock = mock.Mock(return_value=0)
+        in_flight = InFlightItems(10, clock=clock)
+
+        in_flight.start(1)
+        in_flight.start(2)
+        clock.return_value = 10
+
+        assert sorted(in_flight.cancel_expired()) == [1, 2]
+        assert not in_flight.finish(1)
+        assert not in_flight.finish(2)
+        assert len(in_flight) == 0
+
+    def test_remaining(self):
+        """It tracks the time remaining before each item's deadline."""
+        clock = mock.Mock(return_value=0)
+        in_flight = InFlightItems(10, clock=clock)
+
+        in_flight.start(1)
+        clock.return_value = 4
+
+        assert in_flight.remaining(1) == 6
+        assert in_flight.remaining(2) == 0
+        assert in_flight.cancel_expired() == []
+        assert in_flight.finish(1)
+
+    def test_breakers(self):
+        """It records a failure with the circuit breaker of each cancelled item."""
+        clock = mock.Mock(return_value=0)
+        breaker = CircuitBreaker(failure_threshold=1)
+        in_flight = InFlightItems(1, clock=clock)
+
+        in_flight.start(1, breaker=breaker)
+        clock.return_value = 1
+        in_flight.cancel_expired()
+
+        assert breaker.state == 'open'
+
+
 @pytest.mark.django_db
 class TestBulkUpdateAffiliateItemMetadata:
 
@@ -248,6 +612,27 @@ class TestBulkUpdateAffiliateItemDetails:
             assert call_kwargs['workers'] == 10
             assert call_kwargs['max_retries'] == 20
 
+    def test_force(self, affiliate_items):
+        """It can force updates of items whose details are unchanged."""
+        with mock.patch('chiton.rack.affiliates.bulk.BatchJob') as batch_job:
+            bulk_update_affiliate_item_details(affiliate_items, force=True)
+
+            item_updater = batch_job.call_args[0][1]
+            assert item_updater.func == update_affiliate_item_details
+            assert item_updater.keywords == {'force': True}
+
+    def test_staged(self, affiliate_items):
+        """It creates a staged job when given a number of processes."""
+        job = bulk_update_affiliate_item_details(affiliate_items, workers=3, processes=4, parse_queue_size=5, write_queue_size=6, force=True)
+
+        assert isinstance(job, StagedDetailsJob)
+        assert job.items.count() == 4
+        assert job.workers == 3
+        assert job.processes == 4
+        assert job.parse_queue_size == 5
+        assert job.write_queue_size == 6
+        assert job.force
+
 
 @pytest.mark.django_db
 class TestPruneAffiliateItems:
@@ -315,3 +700,84 @@ class TestPruneAffiliateItems:
 
             remaining = set(AffiliateItem.objects.all())
             assert set([valid_one, valid_two]) == remaining
+
+    def test_affiliate_reuse(self, affiliate_item_factory, affiliate_network_factory):
+        """It creates a single affiliate for each network."""
+        network = affiliate_network_factory()
+        for tld in ['biz', 'com', 'net']:
+            affiliate_item_factory(affiliate_url='http://example.%s' % tld, network=network)
+
+        with mock.patch('chiton.rack.affiliates.bulk.create_affiliate') as create_affiliate:
+            create_affiliate.return_value = ValidatingAffiliate()
+            list(prune_affiliate_items(AffiliateItem.objects.all()))
+
+            assert create_affiliate.call_count == 1
+
+    def test_workers(self, affiliate_items_url_factory):
+        """It can check items using multiple workers."""
+        with mock.patch('chiton.rack.affiliates.bulk.create_affiliate') as create_affiliate:
+            affiliate = ValidatingAffiliate()
+            affiliate.valid_tlds = ['com']
+            create_affiliate.return_value = affiliate
+
+            items = affiliate_items_url_factory(['biz', 'com', 'net', 'org', 'com']).order_by('pk')
+            results = list(prune_affiliate_items(items, workers=3, chunk_size=2))
+
+            assert [was_pruned for name, network, was_pruned in results] == [True, False, True, True, False]
+            assert [i.affiliate_url for i in AffiliateItem.objects.all()] == ['http://example.com', 'http://example.com']
+
+    def test_chunks(self, affiliate_items_url_factory):
+        """It deletes invalid items in chunks."""
+        with mock.patch('chiton.rack.affiliates.bulk.create_affiliate') as create_affiliate:
+            create_affiliate.return_value = ValidatingAffiliate()
+
+            items = affiliate_items_url_factory(['biz', 'com', 'net'])
+            pruned = prune_affiliate_items(items.order_by('pk'), chunk_size=2)
+
+            next(pruned)
+            assert AffiliateItem.objects.count() == 3
+
+            next(pruned)
+            assert AffiliateItem.objects.count() == 1
+
+            list(pruned)
+            assert AffiliateItem.objects.count() == 0
+
+    def test_related(self, affiliate_item_factory, item_image_factory, stock_record_factory):
+        """It deletes the stock records and images of invalid items."""
+        item = affiliate_item_factory(affiliate_url='http://example.biz')
+        item_image_factory(item=item)
+        stock_record_factory(item=item)
+
+        with mock.patch('chiton.rack.affiliates.bulk.create_affiliate') as create_affiliate:
+            create_affiliate.return_value = ValidatingAffiliate()
+            list(prune_affiliate_items(AffiliateItem.objects.all()))
+
+        assert not AffiliateItem.objects.count()
+        assert not ItemImage.objects.count()
+        assert not StockRecord.objects.count()
+
+    def test_related_cascade(self, affiliate_item_factory, item_image_factory):
+        """It deletes every record that cascades from an invalid item."""
+        item = affiliate_item_factory(affiliate_url='http://example.biz')
+        image = item_image_factory(item=item)
+        ItemImageDerivative.objects.create(image=image, file='derivative.jpg', format='jpeg', width=10, height=10)
+        RefreshJob.objects.create(item=item)
+
+        with mock.patch('chiton.rack.affiliates.bulk.create_affiliate') as create_affiliate:
+            create_affiliate.return_value = ValidatingAffiliate()
+            list(prune_affiliate_items(AffiliateItem.objects.all()))
+
+        assert not AffiliateItem.objects.count()
+        assert not ItemImageDerivative.objects.count()
+        assert not RefreshJob.objects.count()
+
+    def test_cache_refresh(self, affiliate_items_url_factory):
+        """It refreshes cached queries once after deleting items."""
+        with mock.patch('chiton.rack.affiliates.bulk.create_affiliate') as create_affiliate:
+            create_affiliate.return_value = ValidatingAffiliate()
+            items = affiliate_items_url_factory(['biz', 'com', 'net'])
+
+            with mock.patch('chiton.rack.affiliates.bulk.refresh_cached_queries') as refresh:
+                list(prune_affiliate_items(items, chunk_size=1))
+                assert refresh.call_count == 1
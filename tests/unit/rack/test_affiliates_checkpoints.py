@@ -0,0 +1,132 @@
+from datetime import timedelta
+
+from django.utils import timezone
+import pytest
+
+from chiton.rack.affiliates.bulk import BatchJobResult
+from chiton.rack.affiliates.checkpoints import exclude_completed_items, exclude_recently_refreshed_items, find_resumable_refresh_run, finish_refresh_run, record_refresh_result, start_refresh_run
+from chiton.rack.models import AffiliateItem, RefreshCheckpoint
+
+
+@pytest.mark.django_db
+class TestFindResumableRefreshRun:
+
+    def test_unfinished(self):
+        """It returns the most recent unfinished run of the given kind."""
+        start_refresh_run('details')
+        latest = start_refresh_run('details')
+        start_refresh_run('metadata')
+
+        assert find_resumable_refresh_run('details') == latest
+
+    def test_finished(self):
+        """It ignores finished runs."""
+        run = start_refresh_run('details')
+        finish_refresh_run(run)
+
+        assert run.finished_at is not None
+        assert find_resumable_refresh_run('details') is None
+
+
+@pytest.mark.django_db
+class TestRecordRefreshResult:
+
+    def test_statuses(self):
+        """It records the status of each result."""
+        run = start_refresh_run('details')
+
+        changed = record_refresh_result(run, BatchJobResult(item_id=1))
+        unchanged = record_refresh_result(run, BatchJobResult(item_id=2, is_skipped=True))
+        error = record_refresh_result(run, BatchJobResult(item_id=3, is_error=True, details='Failed'))
+
+        assert changed.status == 'changed'
+        assert unchanged.status == 'unchanged'
+        assert error.status == 'error'
+        assert error.details == 'Failed'
+
+    def test_update(self):
+        """It replaces the checkpoint of an item that was already recorded in the run."""
+        run = start_refresh_run('details')
+
+        record_refresh_result(run, BatchJobResult(item_id=1, is_error=True, details='Failed'))
+        record_refresh_result(run, BatchJobResult(item_id=1))
+
+        checkpoint = RefreshCheckpoint.objects.get(run=run, item_id=1)
+        assert RefreshCheckpoint.objects.count() == 1
+        assert checkpoint.status == 'changed'
+        assert checkpoint.details == ''
+
+
+@pytest.mark.django_db
+class TestExcludeCompletedItems:
+
+    def test_completed(self, affiliate_item_factory):
+        """It excludes items that the run changed or skipped, but not items that errored out."""
+        changed = affiliate_item_factory()
+        unchanged = affiliate_item_factory()
+        failed = affiliate_item_factory()
+        pending = affiliate_item_factory()
+
+        run = start_refresh_run('details')
+        record_refresh_result(run, BatchJobResult(item_id=changed.pk))
+        record_refresh_result(run, BatchJobResult(item_id=unchanged.pk, is_skipped=True))
+        record_refresh_result(run, BatchJobResult(item_id=failed.pk, is_error=True))
+
+        items = exclude_completed_items(AffiliateItem.objects.all(), run)
+
+        assert sorted(items.values_list('pk', flat=True)) == sorted([failed.pk, pending.pk])
+
+    def test_other_runs(self, affiliate_item_factory):
+        """It ignores the checkpoints of other runs."""
+        item = affiliate_item_factory()
+
+        other_run = start_refresh_run('details')
+        record_refresh_result(other_run, BatchJobResult(item_id=item.pk))
+
+        run = start_refresh_run('details')
+        items = exclude_completed_items(AffiliateItem.objects.all(), run)
+
+        assert list(items) == [item]
+
+
+@pytest.mark.django_db
+class TestExcludeRecentlyRefreshedItems:
+
+    def test_recent(self, affiliate_item_factory):
+        """It excludes items successfully refreshed since the cutoff, but not items that errored out."""
+        changed = affiliate_item_factory()
+        unchanged = affiliate_item_factory()
+        failed = affiliate_item_factory()
+        pending = affiliate_item_factory()
+
+        run = start_refresh_run('details')
+        record_refresh_result(run, BatchJobResult(item_id=changed.pk))
+        record_refresh_result(run, BatchJobResult(item_id=unchanged.pk, is_skipped=True))
+        record_refresh_result(run, BatchJobResult(item_id=failed.pk, is_error=True))
+
+        items = exclude_recently_refreshed_items(AffiliateItem.objects.all(), 'details', timezone.now() - timedelta(hours=1))
+
+        assert sorted(items.values_list('pk', flat=True)) == sorted([failed.pk, pending.pk])
+
+    def test_stale(self, affiliate_item_factory):
+        """It ignores checkpoints recorded before the cutoff."""
+        item = affiliate_item_factory()
+
+        run = start_refresh_run('details')
+        record_refresh_result(run, BatchJobResult(item_id=item.pk))
+        RefreshCheckpoint.objects.update(recorded_at=timezone.now() - timedelta(days=2))
+
+        items = exclude_recently_refreshed_items(AffiliateItem.objects.all(), 'details', timezone.now() - timedelta(days=1))
+
+        assert list(items) == [item]
+
+    def test_other_kinds(self, affiliate_item_factory):
+        """It ignores the checkpoints of refreshes of other kinds."""
+        item = affiliate_item_factory()
+
+        run = start_refresh_run('metadata')
+        record_refresh_result(run, BatchJobResult(item_id=item.pk))
+
+        items = exclude_recently_refreshed_items(AffiliateItem.objects.all(), 'details', timezone.now() - timedelta(hours=1))
+
+        assert list(items) == [item]
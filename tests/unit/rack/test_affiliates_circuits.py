@@ -0,0 +1,104 @@
+from chiton.rack.affiliates.circuits import CircuitBreaker, CircuitBreakers
+
+
+class FakeClock:
+    """A clock whose time is advanced manually."""
+
+    def __init__(self):
+        self.time = 0
+
+    def __call__(self):
+        return self.time
+
+
+class TestCircuitBreaker:
+
+    def test_closed(self):
+        """It allows requests while the circuit is closed."""
+        breaker = CircuitBreaker()
+
+        assert breaker.state == 'closed'
+        assert breaker.allow_request()
+        assert breaker.allow_request()
+
+    def test_open(self):
+        """It opens the circuit after a number of consecutive failures."""
+        breaker = CircuitBreaker(failure_threshold=2)
+
+        breaker.record_failure()
+        assert breaker.state == 'closed'
+
+        breaker.record_failure()
+        assert breaker.state == 'open'
+        assert not breaker.allow_request()
+
+    def test_open_consecutive(self):
+        """It only opens the circuit after failures that are not interrupted by a success."""
+        breaker = CircuitBreaker(failure_threshold=2)
+
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        assert breaker.state == 'closed'
+
+    def test_half_open(self):
+        """It allows a single probe request once the reset timeout elapses."""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+
+        clock.time = 9
+        assert breaker.state == 'open'
+        assert not breaker.allow_request()
+
+        clock.time = 10
+        assert breaker.state == 'half-open'
+        assert breaker.allow_request()
+        assert not breaker.allow_request()
+
+    def test_half_open_success(self):
+        """It closes the circuit when a probe request succeeds."""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+
+        clock.time = 10
+        breaker.allow_request()
+        breaker.record_success()
+
+        assert breaker.state == 'closed'
+        assert breaker.allow_request()
+
+    def test_half_open_failure(self):
+        """It reopens the circuit when a probe request fails."""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=5, reset_timeout=10, clock=clock)
+        for i in range(0, 5):
+            breaker.record_failure()
+
+        clock.time = 10
+        breaker.allow_request()
+        breaker.record_failure()
+
+        assert breaker.state == 'open'
+
+        clock.time = 19
+        assert not breaker.allow_request()
+
+        clock.time = 20
+        assert breaker.allow_request()
+
+
+class TestCircuitBreakers:
+
+    def test_networks(self):
+        """It provides a separate circuit breaker for each network."""
+        breakers = CircuitBreakers(failure_threshold=1)
+
+        breakers['amazon'].record_failure()
+
+        assert breakers['amazon'].state == 'open'
+        assert breakers['shopstyle'].state == 'closed'
+        assert breakers['amazon'] is breakers['amazon']
+        assert breakers['amazon'].failure_threshold == 1
@@ -1,14 +1,17 @@
 from decimal import Decimal
+import hashlib
 import os
 
 from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 import mock
 import pytest
 
 from chiton.closet.models import Color
-from chiton.rack.affiliates.data import update_affiliate_item_details, update_affiliate_item_metadata
+from chiton.rack.affiliates.data import apply_stock_record_changes, update_affiliate_item_details, update_affiliate_item_metadata
 from chiton.rack.affiliates.base import Affiliate
-from chiton.rack.models import ItemImage
+from chiton.rack.models import AffiliateItem, ItemImage
 
 
 CREATE_AFFILIATE = 'chiton.rack.affiliates.data.create_affiliate'
@@ -93,6 +96,18 @@ class TestUpdateAffiliateItemMetadata:
 
             create_affiliate.assert_called_with(slug='shopping')
 
+    def test_unchanged(self, affiliate_item):
+        """It does not save an item whose GUID and name are unchanged."""
+        affiliate_item.guid = '1234'
+        affiliate_item.name = 'Overview'
+        affiliate_item.save()
+
+        with mock.patch(CREATE_AFFILIATE) as create_affiliate:
+            create_affiliate.return_value = FullAffiliate()
+            with mock.patch.object(affiliate_item, 'save') as save:
+                assert not update_affiliate_item_metadata(affiliate_item)
+                assert not save.called
+
     def test_update_data(self, affiliate_item):
         """It re-fetches the item's GUID and name."""
         affiliate_item.guid = '4321'
@@ -236,8 +251,13 @@ class TestUpdateAffiliateItemDetails:
         assert len(images) == 1
         image = images[0]
 
+        with open(image.file.path, 'rb') as image_file:
+            content_hash = hashlib.sha256(image_file.read()).hexdigest()
+
         assert settings.MEDIA_ROOT in image.file.path
-        assert os.path.basename(image.file.path) == 'image-32x32.jpg'
+        assert os.path.basename(image.file.path) == '%s.jpg' % content_hash
+        assert image.content_hash == content_hash
+        assert image.source_etag == '"90f8f375b37759c6bd925bddf33ab445"'
 
         assert image.height == 32
         assert image.width == 32
@@ -260,7 +280,7 @@ class TestUpdateAffiliateItemDetails:
         image = images[0]
 
         assert settings.MEDIA_ROOT in image.file.path
-        assert os.path.basename(image.file.path) == 'image-64x64.jpg'
+        assert image.source_url == large_image
 
         assert image.height == 64
         assert image.width == 64
@@ -338,7 +358,7 @@ class TestUpdateAffiliateItemDetails:
                 os.remove(before_image.file.path)
                 assert not os.path.isfile(before_image.file.path)
 
-                update_affiliate_item_details(affiliate_item)
+                update_affiliate_item_details(affiliate_item, force=True)
                 after_images = affiliate_item.images.all()
                 assert after_images.count() == 1
 
@@ -348,6 +368,30 @@ class TestUpdateAffiliateItemDetails:
 
                 assert before_image.pk != after_image.pk
 
+    def test_network_data_images_shared(self, affiliate_item_factory, record_request):
+        """It stores a single file for an image shared by multiple items."""
+        image_url = 'https://s3.amazonaws.com/chiton-test-assets/image-32x32.jpg'
+        first_item = affiliate_item_factory()
+        second_item = affiliate_item_factory()
+
+        with mock.patch(CREATE_AFFILIATE) as create_affiliate:
+            affiliate = FullAffiliate()
+            affiliate.images = [image_url]
+
+            create_affiliate.return_value = affiliate
+            with record_request():
+                update_affiliate_item_details(first_item)
+                update_affiliate_item_details(second_item)
+
+        first_image = first_item.images.get()
+        second_image = second_item.images.get()
+
+        assert first_image.pk != second_image.pk
+        assert first_image.file.name == second_image.file.name
+        assert second_image.content_hash == first_image.content_hash
+        assert second_image.height == 32
+        assert second_image.width == 32
+
     def test_network_data_stock_records(self, affiliate_item, standard_size_factory):
         """It creates stock records for all sizes that match a standard size's number."""
         size_8 = standard_size_factory(8)
@@ -373,6 +417,38 @@ class TestUpdateAffiliateItemDetails:
         assert len(stock_records) == 2
         assert affiliate_item.has_detailed_stock
 
+    def test_network_data_availability_mask(self, affiliate_item, standard_size_factory):
+        """It stores the ordinals of the available sizes as the item's availability mask."""
+        size_8 = standard_size_factory(8)
+        standard_size_factory(10)
+        size_12 = standard_size_factory(12)
+
+        with mock.patch(CREATE_AFFILIATE) as create_affiliate:
+            affiliate = FullAffiliate()
+            affiliate.availability = [
+                {'size': 8, 'is_regular': True},
+                {'size': 12, 'is_regular': True}
+            ]
+
+            create_affiliate.return_value = affiliate
+            update_affiliate_item_details(affiliate_item)
+
+        expected_mask = (1 << size_8.ordinal) | (1 << size_12.ordinal)
+        assert affiliate_item.availability_mask == expected_mask
+        assert AffiliateItem.objects.get(pk=affiliate_item.pk).availability_mask == expected_mask
+
+    def test_network_data_availability_mask_out_of_stock(self, affiliate_item, standard_size_factory):
+        """It clears the availability mask of an item that is globally unavailable."""
+        standard_size_factory(8)
+        affiliate_item.availability_mask = 1
+        affiliate_item.save()
+
+        with mock.patch(CREATE_AFFILIATE) as create_affiliate:
+            create_affiliate.return_value = OutOfStockAffiliate()
+            update_affiliate_item_details(affiliate_item)
+
+        assert AffiliateItem.objects.get(pk=affiliate_item.pk).availability_mask == 0
+
     def test_network_data_stock_records_range(self, affiliate_item, standard_size_factory):
         """It maps numeric sizes to the range of standard sizes."""
         size_small = standard_size_factory(4, 6)
@@ -567,7 +643,7 @@ class TestUpdateAffiliateItemDetails:
             stock_record_8.is_available = False
             stock_record_8.save()
 
-            update_affiliate_item_details(affiliate_item)
+            update_affiliate_item_details(affiliate_item, force=True)
             records = affiliate_item.stock_records.all()
 
             assert len(records) == 1
@@ -579,6 +655,53 @@ class TestUpdateAffiliateItemDetails:
 
         assert stock_record_8.is_available
 
+    def test_network_data_stock_records_unchanged(self, affiliate_item, standard_size_factory):
+        """It only writes stock records whose availability has changed."""
+        standard_size_factory(8)
+        standard_size_factory(10)
+
+        with mock.patch(CREATE_AFFILIATE) as create_affiliate:
+            affiliate = FullAffiliate()
+            affiliate.availability = [{'size': 8, 'is_regular': True}]
+            create_affiliate.return_value = affiliate
+
+            update_affiliate_item_details(affiliate_item)
+            with CaptureQueriesContext(connection) as unchanged_queries:
+                update_affiliate_item_details(affiliate_item)
+
+            affiliate.availability = [{'size': 10, 'is_regular': True}]
+            with CaptureQueriesContext(connection) as changed_queries:
+                update_affiliate_item_details(affiliate_item)
+
+        def count_stock_writes(queries):
+            return len([
+                q for q in queries
+                if 'chiton_rack_stockrecord' in q['sql'] and not q['sql'].startswith('SELECT')
+            ])
+
+        assert count_stock_writes(unchanged_queries) == 0
+        assert count_stock_writes(changed_queries) == 2
+
+        available = [r.size.canonical.range_lower for r in affiliate_item.stock_records.all() if r.is_available]
+        assert available == [10]
+
+    def test_network_data_stock_records_new_sizes(self, affiliate_item, standard_size_factory):
+        """It creates stock records for sizes added after an item's initial update."""
+        standard_size_factory(8)
+
+        with mock.patch(CREATE_AFFILIATE) as create_affiliate:
+            create_affiliate.return_value = InStockAffiliate()
+
+            update_affiliate_item_details(affiliate_item)
+            assert affiliate_item.stock_records.count() == 1
+
+            standard_size_factory(10)
+            update_affiliate_item_details(affiliate_item)
+
+        records = affiliate_item.stock_records.all()
+        assert len(records) == 2
+        assert all([r.is_available for r in records])
+
     def test_network_data_stock_records_details(self, affiliate_item, standard_size_factory):
         """It updates the detailed-stock flag on an affiliate item based on whether stock records are provided."""
         standard_size_factory(8)
@@ -599,6 +722,72 @@ class TestUpdateAffiliateItemDetails:
 
         assert affiliate_item.has_detailed_stock
 
+    def test_fingerprint_unchanged(self, affiliate_item):
+        """It skips all writes when the item's details have not changed."""
+        with mock.patch(CREATE_AFFILIATE) as create_affiliate:
+            create_affiliate.return_value = FullAffiliate()
+
+            assert update_affiliate_item_details(affiliate_item)
+            fingerprint = affiliate_item.details_fingerprint
+
+            with CaptureQueriesContext(connection) as queries:
+                assert not update_affiliate_item_details(affiliate_item)
+
+        assert fingerprint
+        assert affiliate_item.details_fingerprint == fingerprint
+        assert not [q for q in queries if not q['sql'].startswith('SELECT')]
+
+    def test_fingerprint_changed(self, affiliate_item):
+        """It updates an item whose details differ from the stored fingerprint."""
+        with mock.patch(CREATE_AFFILIATE) as create_affiliate:
+            affiliate = FullAffiliate()
+            create_affiliate.return_value = affiliate
+
+            update_affiliate_item_details(affiliate_item)
+            fingerprint = affiliate_item.details_fingerprint
+
+            affiliate.colors = ['Black', 'White']
+            assert update_affiliate_item_details(affiliate_item)
+
+        assert affiliate_item.has_multiple_colors
+        assert affiliate_item.details_fingerprint != fingerprint
+
+    def test_fingerprint_force(self, affiliate_item):
+        """It allows an item with unchanged details to be forcibly updated."""
+        with mock.patch(CREATE_AFFILIATE) as create_affiliate:
+            create_affiliate.return_value = FullAffiliate()
+
+            update_affiliate_item_details(affiliate_item)
+            AffiliateItem.objects.filter(pk=affiliate_item.pk).update(name='Changed')
+            affiliate_item.refresh_from_db()
+
+            assert update_affiliate_item_details(affiliate_item, force=True)
+
+        assert AffiliateItem.objects.get(pk=affiliate_item.pk).name == 'Details-%s' % affiliate_item.guid
+
+    def test_fingerprint_stock_changes(self, affiliate_item, standard_size_factory):
+        """It only saves the fingerprint and availability of an item when its deferred stock changes are written."""
+        standard_size_factory(8)
+
+        with mock.patch(CREATE_AFFILIATE) as create_affiliate:
+            create_affiliate.return_value = InStockAffiliate()
+            stock_changes = []
+            assert update_affiliate_item_details(affiliate_item, stock_changes=stock_changes)
+
+        saved = AffiliateItem.objects.get(pk=affiliate_item.pk)
+        assert saved.price == Decimal('9.99')
+        assert saved.details_fingerprint == ''
+        assert saved.availability_mask == 0
+        assert not affiliate_item.stock_records.exists()
+
+        apply_stock_record_changes(stock_changes)
+
+        saved.refresh_from_db()
+        assert saved.details_fingerprint == affiliate_item.details_fingerprint
+        assert saved.availability_mask == affiliate_item.availability_mask
+        assert saved.availability_mask > 0
+        assert affiliate_item.stock_records.count() == 1
+
     def test_network_data_stock_records_details_empty(self, affiliate_item):
         """It does not count an affiliate item as having detailed stock information when the list of records is empty."""
         with mock.patch(CREATE_AFFILIATE) as create_affiliate:
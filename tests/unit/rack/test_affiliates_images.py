@@ -0,0 +1,181 @@
+from io import BytesIO
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+import mock
+from PIL import Image
+import pytest
+from requests.exceptions import HTTPError
+
+from chiton.rack.affiliates.images import find_known_images, ingest_images
+from chiton.rack.models import ItemImage
+
+
+REQUEST_GET = 'chiton.rack.affiliates.images.requests.get'
+
+
+class ImageResponse:
+    """A streamed response for an image request."""
+
+    def __init__(self, content=b'', status_code=200, headers={}, stream_error=None):
+        self.content = content
+        self.headers = headers
+        self.status_code = status_code
+        self.stream_error = stream_error
+
+    def close(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for index in range(0, len(self.content), chunk_size):
+            yield self.content[index:index + chunk_size]
+
+        if self.stream_error:
+            raise self.stream_error
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError(str(self.status_code))
+
+
+def create_image_content(width=10, height=10, color='white'):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class TestIngestImages:
+
+    def test_content_addressed(self):
+        """It stores images by content hash, sharing a file among identical images."""
+        content = create_image_content(width=16, height=8)
+
+        with mock.patch(REQUEST_GET) as request_get:
+            request_get.return_value = ImageResponse(content=content)
+            ingested = ingest_images(['http://example.com/one.jpg', 'http://example.org/two.jpg'])
+
+        one = ingested['http://example.com/one.jpg']
+        two = ingested['http://example.org/two.jpg']
+
+        assert one['file'] == two['file']
+        assert one['content_hash'] == two['content_hash']
+        assert os.path.basename(one['file']) == '%s.jpg' % one['content_hash']
+        assert one['width'] == 16
+        assert one['height'] == 8
+
+        with default_storage.open(one['file']) as image_file:
+            assert image_file.read() == content
+
+    def test_streamed(self):
+        """It requests images as streams."""
+        with mock.patch(REQUEST_GET) as request_get:
+            request_get.return_value = ImageResponse(content=create_image_content())
+            ingest_images(['http://example.com/image.jpg'])
+
+            assert request_get.call_args[1]['stream']
+
+    def test_extension_content_type(self):
+        """It uses the content type to find an extension for URLs without one."""
+        with mock.patch(REQUEST_GET) as request_get:
+            request_get.return_value = ImageResponse(
+                content=create_image_content(color='black'),
+                headers={'Content-Type': 'image/png'}
+            )
+            ingested = ingest_images(['http://example.com/image'])
+
+        assert ingested['http://example.com/image']['file'].endswith('.png')
+
+    def test_validators(self):
+        """It records the validators returned with an image."""
+        with mock.patch(REQUEST_GET) as request_get:
+            request_get.return_value = ImageResponse(
+                content=create_image_content(color='red'),
+                headers={'ETag': '"abc"', 'Last-Modified': 'Tue, 12 Jul 2016 01:26:44 GMT'}
+            )
+            ingested = ingest_images(['http://example.com/image.jpg'])
+
+        image = ingested['http://example.com/image.jpg']
+        assert image['etag'] == '"abc"'
+        assert image['last_modified'] == 'Tue, 12 Jul 2016 01:26:44 GMT'
+
+    def test_conditional(self):
+        """It reuses a known image when a conditional request reports it as unchanged."""
+        with mock.patch(REQUEST_GET) as request_get:
+            request_get.return_value = ImageResponse(
+                content=create_image_content(color='blue'),
+                headers={'ETag': '"abc"'}
+            )
+            known = ingest_images(['http://example.com/image.jpg'])
+
+            request_get.return_value = ImageResponse(status_code=304)
+            ingested = ingest_images(['http://example.com/image.jpg'], known_images=known)
+
+            assert request_get.call_args[1]['headers'] == {'If-None-Match': '"abc"'}
+
+        assert ingested == known
+
+    def test_conditional_missing_file(self):
+        """It makes an unconditional request when a known image's file is missing."""
+        known = {
+            'http://example.com/image.jpg': {
+                'content_hash': 'abc',
+                'etag': '"abc"',
+                'file': 'products/missing.jpg',
+                'height': 10,
+                'last_modified': '',
+                'width': 10
+            }
+        }
+
+        with mock.patch(REQUEST_GET) as request_get:
+            request_get.return_value = ImageResponse(content=create_image_content(color='green'))
+            ingested = ingest_images(['http://example.com/image.jpg'], known_images=known)
+
+            assert request_get.call_args[1]['headers'] == {}
+
+        assert ingested['http://example.com/image.jpg']['file'] != 'products/missing.jpg'
+
+    def test_errors(self):
+        """It raises an error when an image cannot be downloaded."""
+        with mock.patch(REQUEST_GET) as request_get:
+            request_get.return_value = ImageResponse(status_code=404)
+
+            with pytest.raises(HTTPError):
+                ingest_images(['http://example.com/image.jpg'])
+
+    def test_errors_temp_file(self, tmpdir):
+        """It removes the temporary file of an image whose download or decoding fails."""
+        temp_dir = str(tmpdir.mkdir('downloads'))
+
+        with mock.patch(REQUEST_GET) as request_get, mock.patch.object(tempfile, 'tempdir', temp_dir):
+            request_get.return_value = ImageResponse(content=create_image_content(), stream_error=IOError('Interrupted'))
+            with pytest.raises(IOError):
+                ingest_images(['http://example.com/interrupted.jpg'])
+
+            request_get.return_value = ImageResponse(content=b'not an image')
+            with pytest.raises(IOError):
+                ingest_images(['http://example.com/invalid.jpg'])
+
+        assert os.listdir(temp_dir) == []
+
+
+@pytest.mark.django_db
+class TestFindKnownImages:
+
+    def test_known(self, item_image_factory):
+        """It returns the most recent ingested image for each URL."""
+        older = item_image_factory()
+        newer = item_image_factory()
+        item_image_factory()
+
+        ItemImage.objects.filter(pk=older.pk).update(source_url='http://example.com', content_hash='older')
+        ItemImage.objects.filter(pk=newer.pk).update(source_url='http://example.com', content_hash='newer', source_etag='"abc"')
+
+        known = find_known_images(['http://example.com', 'http://example.org'])
+
+        assert list(known.keys()) == ['http://example.com']
+        assert known['http://example.com']['content_hash'] == 'newer'
+        assert known['http://example.com']['etag'] == '"abc"'
+        assert settings.MEDIA_ROOT not in known['http://example.com']['file']
@@ -0,0 +1,225 @@
+from datetime import timedelta
+
+from django.db import connection, IntegrityError, transaction
+from django.db.models.query import QuerySet
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import mock
+import pytest
+
+from chiton.rack.affiliates.exceptions import LookupError
+from chiton.rack.affiliates.jobs import claim_refresh_job, enqueue_item_refresh, get_latest_refresh_jobs, prefetch_latest_refresh_jobs, process_refresh_jobs, requeue_stale_refresh_jobs, run_refresh_job
+from chiton.rack.models import AffiliateItem, RefreshJob
+
+
+@pytest.mark.django_db
+class TestEnqueueItemRefresh:
+
+    def test_pending(self, affiliate_item_factory):
+        """It creates a pending job for the item."""
+        item = affiliate_item_factory()
+        job = enqueue_item_refresh(item)
+
+        assert job.item == item
+        assert job.status == 'pending'
+        assert job.image_urls == []
+
+    def test_images(self, affiliate_item_factory):
+        """It stores any custom image URLs with the job."""
+        item = affiliate_item_factory()
+        job = enqueue_item_refresh(item, images=['http://example.com/a.jpg', 'http://example.com/b.jpg'])
+
+        assert RefreshJob.objects.get(pk=job.pk).image_urls == ['http://example.com/a.jpg', 'http://example.com/b.jpg']
+
+    def test_duplicates(self, affiliate_item_factory):
+        """It reuses a pending job that would perform the same refresh."""
+        item = affiliate_item_factory()
+
+        first = enqueue_item_refresh(item)
+        second = enqueue_item_refresh(item)
+        custom = enqueue_item_refresh(item, images=['http://example.com/a.jpg'])
+
+        assert first == second
+        assert custom != first
+        assert RefreshJob.objects.count() == 2
+
+    def test_duplicates_concurrent(self, affiliate_item_factory):
+        """It returns a pending job queued by a concurrent request instead of creating a duplicate."""
+        item = affiliate_item_factory()
+        existing = enqueue_item_refresh(item)
+
+        with pytest.raises(IntegrityError):
+            with transaction.atomic():
+                RefreshJob.objects.create(item=item)
+
+        first = QuerySet.first
+        lookups = []
+
+        def miss_first_lookup(queryset):
+            lookups.append(queryset)
+            return None if len(lookups) == 1 else first(queryset)
+
+        with mock.patch.object(QuerySet, 'first', miss_first_lookup):
+            job = enqueue_item_refresh(item)
+
+        assert job == existing
+        assert len(lookups) == 2
+        assert RefreshJob.objects.count() == 1
+
+    def test_duplicates_finished(self, affiliate_item_factory):
+        """It creates a new job when the item's previous job has already been claimed."""
+        item = affiliate_item_factory()
+
+        first = enqueue_item_refresh(item)
+        claim_refresh_job()
+        second = enqueue_item_refresh(item)
+
+        assert first != second
+
+
+@pytest.mark.django_db
+class TestClaimRefreshJob:
+
+    def test_oldest(self, affiliate_item_factory):
+        """It claims the oldest pending job."""
+        first = enqueue_item_refresh(affiliate_item_factory())
+        enqueue_item_refresh(affiliate_item_factory())
+
+        job = claim_refresh_job()
+
+        assert job == first
+        assert job.status == 'running'
+        assert job.started_at is not None
+        assert RefreshJob.objects.get(pk=job.pk).status == 'running'
+
+    def test_empty(self, affiliate_item_factory):
+        """It returns None when no jobs are pending."""
+        enqueue_item_refresh(affiliate_item_factory())
+        claim_refresh_job()
+
+        assert claim_refresh_job() is None
+
+
+@pytest.mark.django_db
+class TestRunRefreshJob:
+
+    def test_done(self, affiliate_item_factory):
+        """It refreshes the item's details using the job's images."""
+        item = affiliate_item_factory()
+        enqueue_item_refresh(item, images=['http://example.com/a.jpg'])
+
+        with mock.patch('chiton.rack.affiliates.jobs.update_affiliate_item_details') as update_details:
+            job = run_refresh_job(claim_refresh_job())
+
+            update_details.assert_called_once_with(item, images=['http://example.com/a.jpg'])
+
+        job.refresh_from_db()
+        assert job.status == 'done'
+        assert job.finished_at is not None
+
+    def test_error(self, affiliate_item_factory):
+        """It records the reason that the item could not be refreshed."""
+        enqueue_item_refresh(affiliate_item_factory())
+
+        with mock.patch('chiton.rack.affiliates.jobs.update_affiliate_item_details') as update_details:
+            update_details.side_effect = LookupError('Not found')
+            job = run_refresh_job(claim_refresh_job())
+
+        job.refresh_from_db()
+        assert job.status == 'error'
+        assert job.details == 'Not found'
+
+
+@pytest.mark.django_db
+class TestProcessRefreshJobs:
+
+    def test_all(self, affiliate_item_factory):
+        """It processes every pending job."""
+        for i in range(0, 3):
+            enqueue_item_refresh(affiliate_item_factory())
+
+        with mock.patch('chiton.rack.affiliates.jobs.update_affiliate_item_details'):
+            jobs = list(process_refresh_jobs())
+
+        assert len(jobs) == 3
+        assert RefreshJob.objects.filter(status='done').count() == 3
+
+    def test_limit(self, affiliate_item_factory):
+        """It stops processing jobs after reaching a limit."""
+        for i in range(0, 3):
+            enqueue_item_refresh(affiliate_item_factory())
+
+        with mock.patch('chiton.rack.affiliates.jobs.update_affiliate_item_details'):
+            jobs = list(process_refresh_jobs(limit=2))
+
+        assert len(jobs) == 2
+        assert RefreshJob.objects.filter(status='pending').count() == 1
+
+
+@pytest.mark.django_db
+class TestRequeueStaleRefreshJobs:
+
+    def test_stale(self, affiliate_item_factory):
+        """It returns long-running jobs to the queue."""
+        stale = enqueue_item_refresh(affiliate_item_factory())
+        fresh = enqueue_item_refresh(affiliate_item_factory())
+
+        RefreshJob.objects.filter(pk=stale.pk).update(status='running', started_at=timezone.now() - timedelta(hours=1))
+        RefreshJob.objects.filter(pk=fresh.pk).update(status='running', started_at=timezone.now())
+
+        assert requeue_stale_refresh_jobs(60) == 1
+        assert RefreshJob.objects.get(pk=stale.pk).status == 'pending'
+        assert RefreshJob.objects.get(pk=fresh.pk).status == 'running'
+
+    def test_stale_requeued(self, affiliate_item_factory):
+        """It fails a long-running job whose refresh has since been queued again."""
+        item = affiliate_item_factory()
+        stale = enqueue_item_refresh(item)
+
+        RefreshJob.objects.filter(pk=stale.pk).update(status='running', started_at=timezone.now() - timedelta(hours=1))
+        pending = enqueue_item_refresh(item)
+
+        assert requeue_stale_refresh_jobs(60) == 0
+
+        stale = RefreshJob.objects.get(pk=stale.pk)
+        assert stale.status == 'error'
+        assert stale.finished_at
+        assert RefreshJob.objects.get(pk=pending.pk).status == 'pending'
+
+
+@pytest.mark.django_db
+class TestGetLatestRefreshJobs:
+
+    def test_latest(self, affiliate_item_factory):
+        """It returns the most recent job of each item."""
+        item = affiliate_item_factory()
+        other = affiliate_item_factory()
+
+        enqueue_item_refresh(item)
+        claim_refresh_job()
+        latest = enqueue_item_refresh(item)
+
+        jobs = get_latest_refresh_jobs([item.pk, other.pk])
+
+        assert jobs == {item.pk: latest}
+
+
+@pytest.mark.django_db
+class TestPrefetchLatestRefreshJobs:
+
+    def test_latest(self, affiliate_item_factory):
+        """It fetches the most recent job of every item with a single query."""
+        item = affiliate_item_factory()
+        other = affiliate_item_factory()
+        affiliate_item_factory()
+
+        enqueue_item_refresh(item)
+        claim_refresh_job()
+        latest = enqueue_item_refresh(item)
+        other_job = enqueue_item_refresh(other)
+
+        with CaptureQueriesContext(connection) as queries:
+            items = list(prefetch_latest_refresh_jobs(AffiliateItem.objects.order_by('pk')))
+
+        assert len(queries) == 2
+        assert [i.latest_refresh_jobs for i in items] == [[latest], [other_job], []]
@@ -0,0 +1,125 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import mock
+
+from chiton.rack.affiliates.bulk import BatchJobResult
+from chiton.rack.affiliates.metrics import bind_item_activity, ItemActivity, JobMetrics, measure_request, measure_write, record_download, track_item_activity
+
+
+class TestTrackItemActivity:
+
+    def test_activity(self):
+        """It records the requests, writes and downloads made while tracking an item."""
+        with track_item_activity() as activity:
+            with measure_request():
+                record_download(100)
+            with measure_write():
+                pass
+            record_download(50)
+
+        assert len(activity.request_times) == 1
+        assert activity.byte_count == 150
+        assert activity.write_time >= 0
+
+    def test_untracked(self):
+        """It ignores activity outside of a tracked item."""
+        with track_item_activity() as activity:
+            pass
+
+        with measure_request():
+            record_download(100)
+
+        assert activity.byte_count == 0
+        assert activity.request_times == []
+
+    def test_nested(self):
+        """It restores the previously tracked item after tracking another."""
+        with track_item_activity() as outer:
+            with track_item_activity() as inner:
+                record_download(10)
+            record_download(20)
+
+        assert inner.byte_count == 10
+        assert outer.byte_count == 20
+
+    def test_bind(self):
+        """It attributes the activity of work handed to other threads to the current item."""
+        with track_item_activity() as activity:
+            download = bind_item_activity(record_download)
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(download, [10, 20, 30]))
+
+        assert activity.byte_count == 60
+
+
+class TestJobMetrics:
+
+    def test_report_networks(self):
+        """It groups metrics by network."""
+        metrics = JobMetrics()
+
+        metrics.record_result(1, BatchJobResult(item_id=1))
+        metrics.record_result(1, BatchJobResult(item_id=2, is_skipped=True))
+        metrics.record_result(2, BatchJobResult(item_id=3, is_error=True))
+
+        report = metrics.report({1: 'amazon', 2: 'shopstyle'})
+
+        assert report['items'] == 3
+        assert report['networks']['amazon']['items'] == 2
+        assert report['networks']['amazon']['changed'] == 1
+        assert report['networks']['amazon']['skipped'] == 1
+        assert report['networks']['shopstyle']['errors'] == 1
+
+    def test_report_network_ids(self):
+        """It identifies networks without names by their IDs."""
+        metrics = JobMetrics()
+        metrics.record_result(3, BatchJobResult(item_id=1))
+
+        assert list(metrics.report()['networks'].keys()) == ['3']
+
+    def test_report_activity(self):
+        """It aggregates the activity of each item."""
+        metrics = JobMetrics()
+
+        for request_time, byte_count in [(0.05, 100), (0.3, 200), (60, 300)]:
+            activity = ItemActivity()
+            activity.add_request_time(request_time)
+            activity.add_bytes(byte_count)
+            activity.add_write_time(0.5)
+            metrics.record_activity(1, activity)
+
+        network = metrics.report()['networks']['1']
+        requests = network['requests']
+
+        assert network['bytes_downloaded'] == 600
+        assert network['write_seconds'] == 1.5
+        assert requests['count'] == 3
+        assert requests['max_seconds'] == 60
+        assert requests['buckets'][0] == {'le': 0.1, 'count': 1}
+        assert requests['buckets'][2] == {'le': 0.5, 'count': 1}
+        assert requests['buckets'][-1] == {'le': None, 'count': 1}
+
+    def test_report_throttles(self):
+        """It counts throttled and retried requests."""
+        metrics = JobMetrics()
+
+        metrics.record_throttle(1, is_retried=True)
+        metrics.record_throttle(1, is_retried=True)
+        metrics.record_throttle(1, is_retried=False)
+
+        network = metrics.report()['networks']['1']
+        assert network['throttles'] == 3
+        assert network['retries'] == 2
+
+    def test_report_throughput(self):
+        """It reports the number of items processed per second."""
+        clock = mock.Mock(return_value=0)
+        metrics = JobMetrics(clock=clock)
+
+        for i in range(0, 10):
+            metrics.record_result(1, BatchJobResult(item_id=i))
+        clock.return_value = 4
+
+        report = metrics.report()
+        assert report['elapsed_seconds'] == 4
+        assert report['items_per_second'] == 2.5
@@ -0,0 +1,178 @@
+from datetime import timedelta
+
+from django.utils import timezone
+import pytest
+
+from chiton.rack.affiliates.bulk import BatchJobResult
+from chiton.rack.affiliates.checkpoints import record_refresh_result, start_refresh_run
+from chiton.rack.affiliates.scheduling import decay_item_exposure, prioritize_affiliate_items, record_recommendation_exposure, record_recommendations_exposure, schedule_affiliate_items
+from chiton.rack.models import AffiliateItem
+
+
+def set_last_modified(item, age):
+    AffiliateItem.objects.filter(pk=item.pk).update(last_modified=timezone.now() - age)
+
+
+def record_refreshes(item, *statuses):
+    for status in statuses:
+        run = start_refresh_run('details')
+        record_refresh_result(run, BatchJobResult(
+            item_id=item.pk,
+            is_error=status == 'error',
+            is_skipped=status == 'unchanged'
+        ))
+
+
+@pytest.mark.django_db
+class TestPrioritizeAffiliateItems:
+
+    def test_staleness(self, affiliate_item_factory):
+        """It gives a higher priority to items that were modified longer ago."""
+        fresh = affiliate_item_factory()
+        stale = affiliate_item_factory()
+        set_last_modified(fresh, timedelta(hours=1))
+        set_last_modified(stale, timedelta(hours=10))
+
+        priorities = prioritize_affiliate_items(AffiliateItem.objects.all())
+
+        assert priorities[stale.pk] > priorities[fresh.pk]
+
+    def test_exposure(self, affiliate_item_factory):
+        """It gives a higher priority to items that are shown more often in recommendations."""
+        hidden = affiliate_item_factory()
+        shown = affiliate_item_factory(exposure_count=10)
+        set_last_modified(hidden, timedelta(hours=5))
+        set_last_modified(shown, timedelta(hours=5))
+
+        priorities = prioritize_affiliate_items(AffiliateItem.objects.all())
+
+        assert priorities[shown.pk] > priorities[hidden.pk]
+
+    def test_volatility(self, affiliate_item_factory):
+        """It gives a higher priority to items whose details often change."""
+        stable = affiliate_item_factory()
+        volatile = affiliate_item_factory()
+
+        record_refreshes(stable, 'unchanged', 'unchanged', 'unchanged')
+        record_refreshes(volatile, 'changed', 'changed', 'unchanged')
+
+        now = timezone.now() + timedelta(hours=5)
+        priorities = prioritize_affiliate_items(AffiliateItem.objects.all(), now=now)
+
+        assert priorities[volatile.pk] > priorities[stable.pk]
+
+    def test_volatility_errors(self, affiliate_item_factory):
+        """It ignores failed refreshes when estimating volatility."""
+        failed = affiliate_item_factory()
+        unknown = affiliate_item_factory()
+        set_last_modified(failed, timedelta(hours=5))
+        set_last_modified(unknown, timedelta(hours=5))
+
+        record_refreshes(failed, 'error', 'error')
+
+        priorities = prioritize_affiliate_items(AffiliateItem.objects.all())
+
+        assert priorities[failed.pk] == pytest.approx(priorities[unknown.pk], rel=0.01)
+
+    def test_last_checked(self, affiliate_item_factory):
+        """It measures staleness from the most recent refresh, even if the item was unchanged."""
+        checked = affiliate_item_factory()
+        unchecked = affiliate_item_factory()
+        set_last_modified(checked, timedelta(hours=10))
+        set_last_modified(unchecked, timedelta(hours=10))
+
+        record_refreshes(checked, 'unchanged')
+        record_refreshes(unchecked, 'error')
+
+        priorities = prioritize_affiliate_items(AffiliateItem.objects.all())
+
+        assert priorities[checked.pk] < priorities[unchecked.pk]
+
+
+@pytest.mark.django_db
+class TestScheduleAffiliateItems:
+
+    def test_budget(self, affiliate_item_factory):
+        """It returns the IDs of the highest-priority items within the budget."""
+        items = [affiliate_item_factory() for i in range(0, 4)]
+        for index, item in enumerate(items):
+            set_last_modified(item, timedelta(hours=index + 1))
+
+        scheduled = schedule_affiliate_items(AffiliateItem.objects.all(), 2)
+
+        assert scheduled == [items[3].pk, items[2].pk]
+
+    def test_queryset(self, affiliate_item_factory):
+        """It only considers items in the given queryset."""
+        included = affiliate_item_factory()
+        excluded = affiliate_item_factory()
+        set_last_modified(excluded, timedelta(days=10))
+
+        scheduled = schedule_affiliate_items(AffiliateItem.objects.filter(pk=included.pk), 10)
+
+        assert scheduled == [included.pk]
+
+
+@pytest.mark.django_db
+class TestRecordRecommendationExposure:
+
+    def test_purchase_options(self, affiliate_item_factory):
+        """It increments the exposure count of each item offered as a purchase option."""
+        one = affiliate_item_factory()
+        two = affiliate_item_factory()
+        hidden = affiliate_item_factory()
+
+        updated = record_recommendation_exposure({
+            'basics': [
+                {'garments': [
+                    {'purchase_options': [{'id': one.pk}, {'id': two.pk}]},
+                    {'purchase_options': [{'id': one.pk}]}
+                ]},
+                {'garments': []}
+            ]
+        })
+
+        assert updated == 2
+        assert AffiliateItem.objects.get(pk=one.pk).exposure_count == 1
+        assert AffiliateItem.objects.get(pk=two.pk).exposure_count == 1
+        assert AffiliateItem.objects.get(pk=hidden.pk).exposure_count == 0
+
+    def test_last_modified(self, affiliate_item_factory):
+        """It does not change the last-modified date of an item."""
+        item = affiliate_item_factory()
+        set_last_modified(item, timedelta(days=1))
+        last_modified = AffiliateItem.objects.get(pk=item.pk).last_modified
+
+        record_recommendation_exposure({'basics': [{'garments': [{'purchase_options': [{'id': item.pk}]}]}]})
+
+        assert AffiliateItem.objects.get(pk=item.pk).last_modified == last_modified
+
+
+@pytest.mark.django_db
+class TestRecordRecommendationsExposure:
+
+    def test_batch(self, affiliate_item_factory):
+        """It increments the exposure count of each item once per set of recommendations that offers it."""
+        one = affiliate_item_factory()
+        two = affiliate_item_factory()
+
+        def offer(*items):
+            return {'basics': [{'garments': [{'purchase_options': [{'id': item.pk} for item in items]}]}]}
+
+        updated = record_recommendations_exposure([offer(one, two), offer(one, one), offer()])
+
+        assert updated == 2
+        assert AffiliateItem.objects.get(pk=one.pk).exposure_count == 2
+        assert AffiliateItem.objects.get(pk=two.pk).exposure_count == 1
+
+
+@pytest.mark.django_db
+class TestDecayItemExposure:
+
+    def test_decay(self, affiliate_item_factory):
+        """It halves the exposure count of each item."""
+        item = affiliate_item_factory(exposure_count=9)
+
+        decay_item_exposure()
+
+        assert AffiliateItem.objects.get(pk=item.pk).exposure_count == 4
@@ -0,0 +1,229 @@
+import json
+
+import mock
+import pytest
+
+from chiton.closet.models import Garment
+from chiton.core.exceptions import FormatError
+from chiton.rack.affiliates.base import Affiliate
+from chiton.rack.affiliates.exceptions import LookupError
+from chiton.rack.catalog import import_catalog, read_catalog_manifest
+from chiton.rack.models import AffiliateItem
+from chiton.wintour.weights.style import _build_garment_styles_lookup
+
+
+CREATE_AFFILIATE = 'chiton.rack.catalog.create_affiliate'
+
+
+class OverviewAffiliate(Affiliate):
+    """An affiliate that uses the final part of a URL as an item's GUID."""
+
+    def provide_overview(self, url):
+        guid = url.split('/')[-1]
+        if guid == 'missing':
+            raise LookupError('No item found')
+
+        return {'guid': guid, 'name': 'Item %s' % guid}
+
+
+@pytest.fixture
+def write_manifest(tmpdir):
+    def write(name, content):
+        path = tmpdir.join(name)
+        path.write(content)
+        return str(path)
+
+    return write
+
+
+class TestReadCatalogManifest:
+
+    def test_jsonl(self, write_manifest):
+        """It reads one entry from each line of a JSONL manifest."""
+        path = write_manifest('catalog.jsonl', '\n'.join([
+            json.dumps({'brand': 'acme', 'garment': 'Shirt', 'basic': 'shirt', 'formalities': ['casual']}),
+            '',
+            json.dumps({'brand': 'acme', 'garment': 'Shirt', 'network': 'shopstyle', 'url': 'http://example.com/1'})
+        ]))
+
+        entries = read_catalog_manifest(path)
+
+        assert len(entries) == 2
+        assert entries[0]['formalities'] == ['casual']
+        assert entries[1]['url'] == 'http://example.com/1'
+
+    def test_csv(self, write_manifest):
+        """It converts the values of a CSV manifest to their native types."""
+        path = write_manifest('catalog.csv', '\n'.join([
+            'brand,garment,basic,is_tall_sized,hip_emphasis,styles,network,url',
+            'acme,Shirt,shirt,true,1,bold|classic,,',
+        ]))
+
+        entries = read_catalog_manifest(path)
+
+        assert entries == [{
+            'basic': 'shirt',
+            'brand': 'acme',
+            'garment': 'Shirt',
+            'hip_emphasis': 1,
+            'is_tall_sized': True,
+            'styles': ['bold', 'classic']
+        }]
+
+    def test_format(self, write_manifest):
+        """It accepts an explicit format."""
+        path = write_manifest('catalog.txt', json.dumps({'brand': 'acme', 'garment': 'Shirt'}))
+
+        with pytest.raises(FormatError):
+            read_catalog_manifest(path)
+
+        assert len(read_catalog_manifest(path, format='jsonl')) == 1
+
+    def test_invalid_entry(self, write_manifest):
+        """It rejects entries that do not match the manifest's schema."""
+        path = write_manifest('catalog.jsonl', json.dumps({'garment': 'Shirt', 'care': 'boil'}))
+
+        with pytest.raises(FormatError):
+            read_catalog_manifest(path)
+
+    def test_incomplete_item(self, write_manifest):
+        """It rejects entries with an item URL but no network."""
+        path = write_manifest('catalog.jsonl', json.dumps({'brand': 'acme', 'garment': 'Shirt', 'url': 'http://example.com'}))
+
+        with pytest.raises(FormatError):
+            read_catalog_manifest(path)
+
+
+@pytest.mark.django_db
+class TestImportCatalog:
+
+    def test_create_garments(self, basic_factory, brand_factory, formality_factory, style_factory):
+        """It creates garments with their relations."""
+        brand = brand_factory()
+        basic = basic_factory()
+        formality = formality_factory()
+        style = style_factory()
+
+        result = import_catalog([{
+            'basic': basic.slug,
+            'brand': brand.slug,
+            'formalities': [formality.slug],
+            'garment': 'Shirt',
+            'is_tall_sized': True,
+            'styles': [style.slug]
+        }])
+
+        garment = Garment.objects.get()
+        assert result.created_garments == 1
+        assert garment.name == 'Shirt'
+        assert garment.basic == basic
+        assert garment.is_tall_sized
+        assert list(garment.formalities.all()) == [formality]
+        assert list(garment.styles.all()) == [style]
+
+    def test_update_garments(self, basic_factory, brand_factory, garment_factory, style_factory):
+        """It updates existing garments matched by their brand and name."""
+        garment = garment_factory(name='Shirt', care=None)
+        style = style_factory()
+
+        result = import_catalog([{
+            'brand': garment.brand.slug,
+            'care': 'hand_wash',
+            'garment': 'Shirt',
+            'styles': [style.slug]
+        }])
+
+        garment = Garment.objects.get(pk=garment.pk)
+        assert result.created_garments == 0
+        assert result.updated_garments == 1
+        assert garment.care == 'hand_wash'
+        assert list(garment.styles.all()) == [style]
+
+    def test_update_garments_cached_queries(self, garment_factory, style_factory):
+        """It refreshes the cached queries involving the imported garments."""
+        garment = garment_factory(name='Shirt')
+        style = style_factory()
+
+        assert garment.pk not in _build_garment_styles_lookup()
+
+        import_catalog([{
+            'brand': garment.brand.slug,
+            'garment': 'Shirt',
+            'styles': [style.slug]
+        }])
+
+        assert _build_garment_styles_lookup()[garment.pk] == set([style.slug])
+
+    def test_missing_references(self, basic_factory, brand_factory):
+        """It records an error for entries that refer to unknown models."""
+        brand = brand_factory()
+        basic = basic_factory()
+
+        result = import_catalog([
+            {'brand': brand.slug, 'basic': 'unknown', 'garment': 'Shirt'},
+            {'brand': brand.slug, 'basic': basic.slug, 'garment': 'Pants'}
+        ])
+
+        assert result.errors == [(1, 'Unknown basic "unknown"')]
+        assert list(Garment.objects.values_list('name', flat=True)) == ['Pants']
+
+    def test_missing_basic(self, brand_factory):
+        """It records an error for new garments without a basic."""
+        result = import_catalog([{'brand': brand_factory().slug, 'garment': 'Shirt'}])
+
+        assert len(result.errors) == 1
+        assert not Garment.objects.count()
+
+    def test_create_items(self, affiliate_network_factory, basic_factory, brand_factory):
+        """It creates affiliate items using their overviews."""
+        brand = brand_factory()
+        basic = basic_factory()
+        network = affiliate_network_factory()
+
+        with mock.patch(CREATE_AFFILIATE) as create_affiliate:
+            create_affiliate.return_value = OverviewAffiliate()
+            result = import_catalog([
+                {'brand': brand.slug, 'basic': basic.slug, 'garment': 'Shirt', 'network': network.slug, 'url': 'http://example.com/1'},
+                {'brand': brand.slug, 'garment': 'Shirt', 'network': network.slug, 'url': 'http://example.com/2'}
+            ], workers=2)
+
+        items = AffiliateItem.objects.all().order_by('guid')
+        assert result.created_items == 2
+        assert sorted(result.item_ids) == sorted([item.pk for item in items])
+        assert [item.guid for item in items] == ['1', '2']
+        assert [item.name for item in items] == ['Item 1', 'Item 2']
+        assert set([item.garment.name for item in items]) == set(['Shirt'])
+
+    def test_update_items(self, affiliate_item_factory, basic_factory, brand_factory):
+        """It moves existing affiliate items to their entry's garment."""
+        item = affiliate_item_factory(guid='1')
+        brand = brand_factory()
+        basic = basic_factory()
+
+        with mock.patch(CREATE_AFFILIATE) as create_affiliate:
+            create_affiliate.return_value = OverviewAffiliate()
+            result = import_catalog([
+                {'brand': brand.slug, 'basic': basic.slug, 'garment': 'Shirt', 'network': item.network.slug, 'url': 'http://example.com/1'}
+            ])
+
+        item = AffiliateItem.objects.get(pk=item.pk)
+        assert result.created_items == 0
+        assert result.updated_items == 1
+        assert result.item_ids == [item.pk]
+        assert item.garment.name == 'Shirt'
+
+    def test_item_errors(self, affiliate_network_factory, basic_factory, brand_factory):
+        """It records an error for items whose overviews cannot be found."""
+        brand = brand_factory()
+        basic = basic_factory()
+        network = affiliate_network_factory()
+
+        with mock.patch(CREATE_AFFILIATE) as create_affiliate:
+            create_affiliate.return_value = OverviewAffiliate()
+            result = import_catalog([
+                {'brand': brand.slug, 'basic': basic.slug, 'garment': 'Shirt', 'network': network.slug, 'url': 'http://example.com/missing'},
+                {'brand': brand.slug, 'garment': 'Shirt', 'network': network.slug, 'url': 'http://example.com/1'}
+            ])
+
+        assert result.errors == [(1, 'Could not look up http://example.com/missing: No item found')]
+        assert AffiliateItem.objects.get().guid == '1'
@@ -0,0 +1,129 @@
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+import mock
+import pytest
+
+from chiton.rack.derivatives import generate_image_derivatives, render_image_derivatives
+from chiton.rack.models import ItemImage, ItemImageDerivative
+
+
+def store_image(name, width, height, color='white', image_format='JPEG'):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, image_format)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+class TestRenderImageDerivatives:
+
+    def test_widths(self):
+        """It renders each derivative width that is smaller than the source image."""
+        file_name = store_image('derivatives-source.jpg', 400, 200, color='red')
+
+        renders = render_image_derivatives(file_name, widths=(100, 200, 400, 800), formats=('jpeg',))
+
+        assert [(r['width'], r['height']) for r in renders] == [(100, 50), (200, 100)]
+
+    def test_dimensions(self):
+        """It stores derivatives with the reported dimensions."""
+        file_name = store_image('derivatives-dimensions.jpg', 300, 150, color='blue')
+
+        renders = render_image_derivatives(file_name, widths=(100,), formats=('jpeg',))
+
+        with default_storage.open(renders[0]['file']) as derivative_file:
+            assert Image.open(derivative_file).size == (100, 50)
+
+    def test_formats(self):
+        """It renders each width in each format."""
+        file_name = store_image('derivatives-formats.jpg', 400, 400, color='green')
+
+        renders = render_image_derivatives(file_name, widths=(100,), formats=('webp', 'jpeg'))
+
+        assert [r['format'] for r in renders] == ['webp', 'jpeg']
+        assert renders[0]['file'].endswith('.webp')
+        assert renders[1]['file'].endswith('.jpg')
+
+        with default_storage.open(renders[0]['file']) as derivative_file:
+            assert Image.open(derivative_file).format == 'WEBP'
+
+    def test_small_source(self):
+        """It renders a narrow source image at its own width."""
+        file_name = store_image('derivatives-small.png', 50, 25, color='yellow', image_format='PNG')
+
+        renders = render_image_derivatives(file_name, widths=(100, 200), formats=('jpeg',))
+
+        assert [(r['width'], r['height']) for r in renders] == [(50, 25)]
+
+    def test_shared_content(self):
+        """It shares derivatives among source images with identical content."""
+        one = store_image('derivatives-one.jpg', 200, 200, color='purple')
+        two = store_image('derivatives-two.jpg', 200, 200, color='purple')
+
+        renders_one = render_image_derivatives(one, widths=(100,), formats=('jpeg',))
+        renders_two = render_image_derivatives(two, widths=(100,), formats=('jpeg',))
+
+        assert renders_one == renders_two
+
+
+@pytest.mark.django_db(transaction=True)
+class TestGenerateImageDerivatives:
+
+    def test_create(self, item_image_factory):
+        """It creates a record for each derivative of each image."""
+        image = item_image_factory(width=800, height=400)
+
+        results = list(generate_image_derivatives(ItemImage.objects.all(), processes=1))
+
+        assert len(results) == 1
+        assert results[0][0] == image
+        assert results[0][2] is None
+
+        derivatives = ItemImageDerivative.objects.filter(image=image)
+        assert derivatives.count() == 6
+        assert set(derivatives.values_list('format', flat=True)) == set(['jpeg', 'webp'])
+        assert set(derivatives.values_list('width', 'height')) == set([(160, 80), (320, 160), (640, 320)])
+
+    def test_replace(self, item_image_factory):
+        """It replaces an image's existing derivatives."""
+        image = item_image_factory(width=200, height=200)
+
+        list(generate_image_derivatives(ItemImage.objects.all(), processes=1))
+        first_pks = set(ItemImageDerivative.objects.values_list('pk', flat=True))
+
+        list(generate_image_derivatives(ItemImage.objects.all(), processes=1))
+        second_pks = set(ItemImageDerivative.objects.values_list('pk', flat=True))
+
+        assert len(first_pks) == len(second_pks) == 2
+        assert not first_pks & second_pks
+        assert image.derivatives.count() == 2
+
+    def test_errors(self, item_image_factory):
+        """It reports images whose derivatives could not be generated."""
+        valid = item_image_factory()
+        invalid = item_image_factory()
+
+        ItemImage.objects.filter(pk=invalid.pk).update(file='products/missing.jpg')
+
+        results = dict([(image.pk, error) for image, derivatives, error in generate_image_derivatives(ItemImage.objects.all(), processes=2)])
+
+        assert results[valid.pk] is None
+        assert results[invalid.pk] is not None
+        assert not ItemImageDerivative.objects.filter(image=invalid).exists()
+
+    def test_connection(self, item_image_factory):
+        """It closes the database connection before starting its worker processes."""
+        item_image_factory()
+        events = []
+
+        def create_pool(**kwargs):
+            events.append('pool')
+            return ProcessPoolExecutor(**kwargs)
+
+        with mock.patch('chiton.rack.derivatives.connection.close', side_effect=lambda: events.append('close')):
+            with mock.patch('chiton.rack.derivatives.ProcessPoolExecutor', side_effect=create_pool):
+                list(generate_image_derivatives(ItemImage.objects.all(), processes=1))
+
+        assert events == ['close', 'pool']
@@ -11,6 +11,17 @@ class TestAffiliateItem:
         item = affiliate_item_factory(name='Blazer')
         assert str(item) == 'Blazer'
 
+    def test_deleted_size_mask(self, affiliate_item_factory, standard_size_factory):
+        """It clears the bit of a deleted standard size from its availability mask."""
+        small = standard_size_factory()
+        large = standard_size_factory()
+        item = affiliate_item_factory(availability_mask=(1 << small.ordinal) | (1 << large.ordinal))
+
+        large.delete()
+        item.refresh_from_db()
+
+        assert item.availability_mask == 1 << small.ordinal
+
 
 @pytest.mark.django_db
 class TestAffiliateNetwork:
@@ -1,8 +1,10 @@
 from decimal import Decimal
 
+import mock
 import pytest
 
-from chiton.rack.pricing import update_basic_price_points
+from chiton.rack.pricing import calculate_basic_price_points, update_all_basic_price_points, update_basic_price_points
+from chiton.runway.models import Basic
 
 
 @pytest.mark.django_db
@@ -61,3 +63,96 @@ class TestUpdateBasicPricePoints:
 
         assert basic.budget_end == Decimal(10)
         assert basic.luxury_start == Decimal(100)
+
+
+@pytest.mark.django_db
+class TestCalculateBasicPricePoints:
+
+    def test_all_basics(self, basic_factory, garment_factory, affiliate_item_factory):
+        """It calculates the price points of every basic with priced offerings."""
+        shirt = basic_factory()
+        pants = basic_factory()
+        basic_factory()
+
+        for basic, prices in [(shirt, [10, 20, 30]), (pants, [50, 60, 70, 80])]:
+            garment = garment_factory(basic=basic)
+            for price in prices:
+                affiliate_item_factory(garment=garment, price=Decimal(price))
+
+        price_points = calculate_basic_price_points()
+
+        assert price_points == {
+            shirt.pk: (Decimal(10), Decimal(30)),
+            pants.pk: (Decimal(50), Decimal(80))
+        }
+
+    def test_cutoff(self, basic_factory, garment_factory, affiliate_item_factory):
+        """It accepts a custom cutoff for the price extremes."""
+        basic = basic_factory()
+        garment = garment_factory(basic=basic)
+        for inc in range(10, 120, 10):
+            affiliate_item_factory(garment=garment, price=Decimal(inc))
+
+        assert calculate_basic_price_points(cutoff=0.2) == {basic.pk: (Decimal(20), Decimal(100))}
+
+    def test_basic_ids(self, basic_factory, garment_factory, affiliate_item_factory):
+        """It can limit the calculation to specific basics."""
+        included = basic_factory()
+        excluded = basic_factory()
+        affiliate_item_factory(garment=garment_factory(basic=included), price=Decimal(10))
+        affiliate_item_factory(garment=garment_factory(basic=excluded), price=Decimal(20))
+
+        assert list(calculate_basic_price_points(basic_ids=[included.pk]).keys()) == [included.pk]
+
+    def test_unpriced(self, basic_factory, garment_factory, affiliate_item_factory):
+        """It ignores affiliate items without a price."""
+        basic = basic_factory()
+        garment = garment_factory(basic=basic)
+        affiliate_item_factory(garment=garment, price=None)
+        affiliate_item_factory(garment=garment, price=Decimal(10))
+
+        assert calculate_basic_price_points() == {basic.pk: (Decimal(10), Decimal(10))}
+
+
+@pytest.mark.django_db
+class TestUpdateAllBasicPricePoints:
+
+    def test_update(self, basic_factory, garment_factory, affiliate_item_factory):
+        """It updates the price points of every basic with priced offerings."""
+        priced = basic_factory()
+        unpriced = basic_factory(budget_end=Decimal(5), luxury_start=Decimal(50))
+        garment = garment_factory(basic=priced)
+        affiliate_item_factory(garment=garment, price=Decimal(10))
+        affiliate_item_factory(garment=garment, price=Decimal(100))
+
+        price_points = update_all_basic_price_points()
+
+        assert price_points == {priced.pk: (Decimal(10), Decimal(100))}
+
+        priced = Basic.objects.get(pk=priced.pk)
+        assert priced.budget_end == Decimal(10)
+        assert priced.luxury_start == Decimal(100)
+
+        unpriced = Basic.objects.get(pk=unpriced.pk)
+        assert unpriced.budget_end == Decimal(5)
+        assert unpriced.luxury_start == Decimal(50)
+
+    def test_cache_refresh(self, basic_factory, garment_factory, affiliate_item_factory):
+        """It refreshes cached basic queries once when any price points change."""
+        for i in range(0, 3):
+            affiliate_item_factory(garment=garment_factory(basic=basic_factory()), price=Decimal(10))
+
+        with mock.patch('chiton.rack.pricing.refresh_cached_queries') as refresh:
+            update_all_basic_price_points()
+            refresh.assert_called_once_with(Basic)
+
+    def test_unchanged(self, basic_factory, garment_factory, affiliate_item_factory):
+        """It does not write or refresh anything when no price points change."""
+        basic = basic_factory(budget_end=Decimal(10), luxury_start=Decimal(20))
+        garment = garment_factory(basic=basic)
+        affiliate_item_factory(garment=garment, price=Decimal(10))
+        affiliate_item_factory(garment=garment, price=Decimal(20))
+
+        with mock.patch('chiton.rack.pricing.refresh_cached_queries') as refresh:
+            update_all_basic_price_points()
+            assert not refresh.called
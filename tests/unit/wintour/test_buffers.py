@@ -0,0 +1,186 @@
+from datetime import datetime
+import json
+import os
+
+from django.db import DatabaseError
+from django.utils import timezone
+import mock
+import pytest
+
+from chiton.wintour.buffers import load_spooled_recommendations, RecommendationBuffer
+from chiton.wintour.models import Recommendation
+
+
+@pytest.mark.django_db
+class TestRecommendationBuffer:
+
+    @pytest.fixture
+    def spool_dir(self, tmpdir):
+        return str(tmpdir.mkdir('spool'))
+
+    def test_add(self):
+        """It assigns an ID to a recommendation without saving it."""
+        buffer = RecommendationBuffer(background=False)
+        recommendation_id = buffer.add({'birth_year': 1980}, ip_address='127.0.0.1')
+
+        assert recommendation_id
+        assert not Recommendation.objects.filter(pk=recommendation_id).exists()
+
+    def test_add_unique(self):
+        """It assigns a unique ID to each recommendation, reserving more IDs as needed."""
+        buffer = RecommendationBuffer(background=False, reserve_size=2)
+        ids = [buffer.add({}) for i in range(0, 5)]
+
+        assert len(set(ids)) == 5
+
+    def test_flush(self):
+        """It saves all buffered recommendations with their assigned IDs."""
+        buffer = RecommendationBuffer(background=False)
+        first_id = buffer.add({'birth_year': 1980}, ip_address='127.0.0.1')
+        second_id = buffer.add({'birth_year': 1990})
+
+        assert buffer.flush() == 2
+
+        first = Recommendation.objects.get(pk=first_id)
+        assert first.profile.data == {'birth_year': 1980}
+        assert first.ip_address == '127.0.0.1'
+        assert Recommendation.objects.get(pk=second_id).profile.data == {'birth_year': 1990}
+
+        assert buffer.flush() == 0
+
+    def test_flush_size(self):
+        """It saves the buffered recommendations once the flush size is reached."""
+        buffer = RecommendationBuffer(background=False, flush_size=2)
+
+        buffer.add({})
+        assert Recommendation.objects.count() == 0
+
+        buffer.add({})
+        assert Recommendation.objects.count() == 2
+
+    def test_flush_if_stale(self):
+        """It saves the buffered recommendations once the oldest exceeds the flush interval."""
+        clock = mock.Mock(return_value=0)
+        buffer = RecommendationBuffer(background=False, flush_interval=5, clock=clock)
+        buffer.add({})
+
+        clock.return_value = 4
+        assert not buffer.flush_if_stale()
+
+        clock.return_value = 5
+        assert buffer.flush_if_stale()
+        assert Recommendation.objects.count() == 1
+
+    def test_flush_if_pending(self):
+        """It saves the buffered recommendations when they include a requested recommendation."""
+        buffer = RecommendationBuffer(background=False)
+        recommendation_id = buffer.add({})
+
+        assert not buffer.flush_if_pending(recommendation_id + 1000)
+        assert buffer.flush_if_pending(recommendation_id)
+        assert Recommendation.objects.filter(pk=recommendation_id).exists()
+
+    def test_flush_if_pending_shared(self):
+        """It saves a recommendation buffered by another process."""
+        other_buffer = RecommendationBuffer(background=False)
+        recommendation_id = other_buffer.add({'birth_year': 1980}, ip_address='127.0.0.1')
+
+        buffer = RecommendationBuffer(background=False)
+        assert buffer.flush_if_pending(recommendation_id)
+
+        recommendation = Recommendation.objects.get(pk=recommendation_id)
+        assert recommendation.profile.data == {'birth_year': 1980}
+        assert recommendation.ip_address == '127.0.0.1'
+
+        assert other_buffer.flush() == 1
+        assert Recommendation.objects.count() == 1
+        assert not buffer.flush_if_pending(recommendation_id)
+
+    def test_spool(self, spool_dir):
+        """It spools recommendations to disk when they cannot be saved."""
+        buffer = RecommendationBuffer(background=False, spool_dir=spool_dir)
+        recommendation_id = buffer.add({'birth_year': 1980}, ip_address='127.0.0.1')
+
+        with mock.patch('chiton.wintour.buffers._save_recommendation_records', side_effect=DatabaseError):
+            assert buffer.flush() == 1
+
+        spool_files = os.listdir(spool_dir)
+        assert len(spool_files) == 1
+
+        with open(os.path.join(spool_dir, spool_files[0])) as spool_file:
+            record = json.loads(spool_file.readline())
+
+        assert record['id'] == recommendation_id
+        assert record['ip_address'] == '127.0.0.1'
+        assert record['profile'] == {'birth_year': 1980}
+
+    def test_load_spool(self, spool_dir):
+        """It saves spooled recommendations with their request times and removes their spool files."""
+        requested_at = timezone.make_aware(datetime(2016, 5, 1, 12, 30))
+        buffer = RecommendationBuffer(background=False, spool_dir=spool_dir)
+
+        with mock.patch('chiton.wintour.buffers.timezone.now', return_value=requested_at):
+            recommendation_id = buffer.add({'birth_year': 1980})
+
+        with mock.patch('chiton.wintour.buffers._save_recommendation_records', side_effect=DatabaseError):
+            buffer.flush()
+
+        assert load_spooled_recommendations(spool_dir) == 1
+
+        recommendation = Recommendation.objects.get(pk=recommendation_id)
+        assert recommendation.profile.data == {'birth_year': 1980}
+        assert recommendation.created_at == requested_at
+        assert os.listdir(spool_dir) == []
+
+    def test_load_spool_existing(self, spool_dir):
+        """It skips spooled recommendations that were already saved."""
+        buffer = RecommendationBuffer(background=False, spool_dir=spool_dir)
+        buffer.add({})
+
+        with mock.patch('chiton.wintour.buffers._save_recommendation_records', side_effect=DatabaseError):
+            buffer.flush()
+
+        spool_file = os.listdir(spool_dir)[0]
+        with open(os.path.join(spool_dir, spool_file)) as original:
+            contents = original.read()
+
+        load_spooled_recommendations(spool_dir)
+        with open(os.path.join(spool_dir, spool_file), 'w') as duplicate:
+            duplicate.write(contents)
+
+        assert load_spooled_recommendations(spool_dir) == 0
+        assert Recommendation.objects.count() == 1
+
+    def test_journal(self, spool_dir):
+        """It journals buffered recommendations to disk until they are written."""
+        buffer = RecommendationBuffer(background=False, spool_dir=spool_dir)
+        first_id = buffer.add({'birth_year': 1980})
+        second_id = buffer.add({'birth_year': 1990})
+
+        journals = os.listdir(spool_dir)
+        assert len(journals) == 1
+
+        with open(os.path.join(spool_dir, journals[0])) as journal:
+            assert [json.loads(line)['id'] for line in journal] == [first_id, second_id]
+
+        buffer.flush()
+        assert os.listdir(spool_dir) == []
+
+    def test_load_journal_orphaned(self, spool_dir):
+        """It saves the recommendations journaled by a process that exited without flushing its buffer."""
+        buffer = RecommendationBuffer(background=False, spool_dir=spool_dir)
+        recommendation_id = buffer.add({'birth_year': 1980})
+        buffer._journal.close()
+
+        assert load_spooled_recommendations(spool_dir) == 1
+        assert Recommendation.objects.get(pk=recommendation_id).profile.data == {'birth_year': 1980}
+        assert os.listdir(spool_dir) == []
+
+    def test_load_journal_live(self, spool_dir):
+        """It skips the journal of a buffer that is still running."""
+        buffer = RecommendationBuffer(background=False, spool_dir=spool_dir)
+        buffer.add({})
+
+        assert load_spooled_recommendations(spool_dir) == 0
+        assert len(os.listdir(spool_dir)) == 1
+        assert Recommendation.objects.count() == 0
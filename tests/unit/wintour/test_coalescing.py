@@ -0,0 +1,152 @@
+from concurrent.futures import Future
+
+from django.core.cache import cache
+import mock
+import pytest
+
+from chiton.wintour.coalescing import LOCK_KEY_PREFIX, RecommendationCoalescer, RESULT_KEY_PREFIX
+from chiton.wintour.pipelines import BasePipeline
+from chiton.wintour.projections import FieldProjection
+
+
+class TestRecommendationCoalescer:
+
+    @pytest.fixture
+    def make_recommendations(self):
+        with mock.patch('chiton.wintour.coalescing.make_recommendations') as make_recommendations:
+            make_recommendations.return_value = {'basics': []}
+            yield make_recommendations
+
+    @pytest.fixture
+    def coalescing_key(self):
+        with mock.patch('chiton.wintour.coalescing._get_coalescing_key') as get_coalescing_key:
+            get_coalescing_key.return_value = 'key'
+            yield 'key'
+
+    def test_make_recommendations(self, make_recommendations):
+        """It makes recommendations for a profile with a projection."""
+        pipeline = BasePipeline()
+        projection = FieldProjection(['garment'])
+
+        recommendations = RecommendationCoalescer().make_recommendations({'birth_year': 1980}, pipeline, projection=projection)
+
+        assert recommendations == {'basics': []}
+        make_recommendations.assert_called_once_with({'birth_year': 1980}, pipeline, projection=projection)
+
+    def test_make_recommendations_shared(self, make_recommendations):
+        """It reuses the result for an identical profile."""
+        coalescer = RecommendationCoalescer()
+
+        first = coalescer.make_recommendations({'sizes': ['m', 's']}, BasePipeline())
+        first['recommendation_id'] = 1
+        second = coalescer.make_recommendations({'sizes': ['s', 'm']}, BasePipeline())
+
+        assert make_recommendations.call_count == 1
+        assert second == {'basics': []}
+
+    def test_make_recommendations_distinct(self, make_recommendations):
+        """It makes separate recommendations for distinct profiles and projections."""
+        coalescer = RecommendationCoalescer()
+
+        coalescer.make_recommendations({'birth_year': 1980}, BasePipeline())
+        coalescer.make_recommendations({'birth_year': 1990}, BasePipeline())
+        coalescer.make_recommendations({'birth_year': 1990}, BasePipeline(), projection=FieldProjection(['garment']))
+
+        assert make_recommendations.call_count == 3
+
+    def test_make_recommendations_in_flight(self, make_recommendations, coalescing_key):
+        """It waits for the result of an identical computation in flight in the process."""
+        coalescer = RecommendationCoalescer()
+        future = Future()
+        future.set_result({'basics': [{'name': 'Shirt'}]})
+        coalescer._in_flight[coalescing_key] = future
+
+        recommendations = coalescer.make_recommendations({}, BasePipeline())
+
+        assert recommendations == {'basics': [{'name': 'Shirt'}]}
+        assert not make_recommendations.called
+
+    def test_make_recommendations_in_flight_error(self, make_recommendations, coalescing_key):
+        """It raises the error of an identical computation in flight in the process."""
+        coalescer = RecommendationCoalescer()
+        future = Future()
+        future.set_exception(ValueError('Failed'))
+        coalescer._in_flight[coalescing_key] = future
+
+        with pytest.raises(ValueError):
+            coalescer.make_recommendations({}, BasePipeline())
+
+    def test_make_recommendations_error(self, make_recommendations, coalescing_key):
+        """It releases its claim on a computation that raises an error."""
+        coalescer = RecommendationCoalescer()
+        make_recommendations.side_effect = ValueError('Failed')
+
+        with pytest.raises(ValueError):
+            coalescer.make_recommendations({}, BasePipeline())
+
+        assert coalescer._in_flight == {}
+        assert cache.get('%s:%s' % (LOCK_KEY_PREFIX, coalescing_key)) is None
+
+    def test_make_recommendations_locked(self, make_recommendations, coalescing_key):
+        """It waits for the result of another process holding the lock."""
+        coalescer = RecommendationCoalescer()
+        cache.add('%s:%s' % (LOCK_KEY_PREFIX, coalescing_key), True)
+
+        def finish_other_process(interval):
+            cache.delete('%s:%s' % (LOCK_KEY_PREFIX, coalescing_key))
+            with mock.patch('chiton.wintour.coalescing.make_recommendations', return_value={'basics': [{'name': 'Shirt'}]}):
+                RecommendationCoalescer().make_recommendations({}, BasePipeline())
+
+        with mock.patch('chiton.wintour.coalescing.sleep', side_effect=finish_other_process):
+            recommendations = coalescer.make_recommendations({}, BasePipeline())
+
+        assert recommendations == {'basics': [{'name': 'Shirt'}]}
+        assert not make_recommendations.called
+
+    def test_make_recommendations_locked_released(self, make_recommendations, coalescing_key):
+        """It makes recommendations when another process releases its lock without a result."""
+        coalescer = RecommendationCoalescer()
+        cache.add('%s:%s' % (LOCK_KEY_PREFIX, coalescing_key), True)
+
+        with mock.patch('chiton.wintour.coalescing.sleep', side_effect=lambda i: cache.delete('%s:%s' % (LOCK_KEY_PREFIX, coalescing_key))):
+            recommendations = coalescer.make_recommendations({}, BasePipeline())
+
+        assert recommendations == {'basics': []}
+        assert make_recommendations.call_count == 1
+
+    def test_make_recommendations_locked_timeout(self, make_recommendations, coalescing_key):
+        """It makes recommendations after waiting too long for another process."""
+        times = iter([0, 0, 1, 2])
+        coalescer = RecommendationCoalescer(wait_timeout=2, clock=lambda: next(times))
+        cache.add('%s:%s' % (LOCK_KEY_PREFIX, coalescing_key), True)
+
+        with mock.patch('chiton.wintour.coalescing.sleep') as sleep:
+            recommendations = coalescer.make_recommendations({}, BasePipeline())
+
+        assert recommendations == {'basics': []}
+        assert sleep.call_count == 2
+        assert make_recommendations.call_count == 1
+
+    def test_make_recommendations_locked_timeout_held(self, make_recommendations, coalescing_key):
+        """It leaves the lock of another process in place after waiting too long for it."""
+        lock_key = '%s:%s' % (LOCK_KEY_PREFIX, coalescing_key)
+        times = iter([0, 0, 1, 2])
+        coalescer = RecommendationCoalescer(wait_timeout=2, clock=lambda: next(times))
+        cache.add(lock_key, 'leader')
+
+        with mock.patch('chiton.wintour.coalescing.sleep'):
+            coalescer.make_recommendations({}, BasePipeline())
+
+        assert make_recommendations.call_count == 1
+        assert cache.get(lock_key) == 'leader'
+
+    def test_make_recommendations_stored(self, make_recommendations, coalescing_key):
+        """It stores its result for other processes."""
+        RecommendationCoalescer().make_recommendations({}, BasePipeline())
+        make_recommendations.return_value = {'basics': [{'name': 'Shirt'}]}
+
+        recommendations = RecommendationCoalescer().make_recommendations({}, BasePipeline())
+
+        assert recommendations == {'basics': []}
+        assert make_recommendations.call_count == 1
+        assert cache.get('%s:%s' % (RESULT_KEY_PREFIX, coalescing_key))
@@ -1,6 +1,5 @@
 import pytest
 
-from chiton.rack.models import StockRecord
 from chiton.wintour.garment_filters.availability import AvailabilityGarmentFilter
 
 
@@ -12,18 +11,12 @@ class TestAvailabilityGarmentFilter:
         jeans = garment_factory()
         blazer = garment_factory()
 
-        jeans_item = affiliate_item_factory(garment=jeans)
-        blazer_item = affiliate_item_factory(garment=blazer)
-
         standard_size_factory(slug='small')
         medium = standard_size_factory(slug='medium')
         large = standard_size_factory(slug='large')
 
-        StockRecord.objects.create(item=jeans_item, size=medium, is_available=True)
-        StockRecord.objects.create(item=jeans_item, size=large, is_available=False)
-
-        StockRecord.objects.create(item=blazer_item, size=medium, is_available=False)
-        StockRecord.objects.create(item=blazer_item, size=large, is_available=True)
+        affiliate_item_factory(garment=jeans, availability_mask=1 << medium.ordinal)
+        affiliate_item_factory(garment=blazer, availability_mask=1 << large.ordinal)
 
         profile = pipeline_profile_factory(sizes=['small', 'medium'])
         availability_filter = AvailabilityGarmentFilter()
@@ -34,3 +27,18 @@ class TestAvailabilityGarmentFilter:
 
         assert not exclude_jeans
         assert exclude_blazer
+
+    def test_any_item(self, affiliate_item_factory, garment_factory, pipeline_profile_factory, standard_size_factory):
+        """It includes garments with at least one affiliate item in the user's size."""
+        jeans = garment_factory()
+        medium = standard_size_factory(slug='medium')
+        large = standard_size_factory(slug='large')
+
+        affiliate_item_factory(garment=jeans, availability_mask=1 << large.ordinal)
+        affiliate_item_factory(garment=jeans, availability_mask=(1 << medium.ordinal) | (1 << large.ordinal))
+
+        profile = pipeline_profile_factory(sizes=['medium'])
+        availability_filter = AvailabilityGarmentFilter()
+
+        with availability_filter.apply_to_profile(profile) as filter_fn:
+            assert not filter_fn(jeans)
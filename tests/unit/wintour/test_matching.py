@@ -2,7 +2,8 @@ import mock
 import pytest
 
 from chiton.core.exceptions import FormatError
-from chiton.wintour.matching import convert_recommendation_to_wardrobe_profile, make_recommendations, PersonRecommendation
+from chiton.wintour.matching import convert_recommendation_to_wardrobe_profile, make_recommendations, make_recommendations_many, PersonRecommendation
+from chiton.wintour.projections import FieldProjection
 
 
 @pytest.mark.django_db
@@ -152,7 +153,7 @@ class TestMakeRecommendations:
         profile = pipeline_profile_factory()
         recommendations = make_recommendations(profile, pipeline)
 
-        pipeline.make_recommendations.assert_called_with(profile, debug=False, max_garments_per_group=None)
+        pipeline.make_recommendations.assert_called_with(profile, debug=False, max_garments_per_group=None, projection=None)
 
         assert recommendations == {}
 
@@ -165,7 +166,7 @@ class TestMakeRecommendations:
         profile = pipeline_profile_factory()
         recommendations = make_recommendations(profile, pipeline, debug=True, max_garments_per_group=None)
 
-        pipeline.make_recommendations.assert_called_with(profile, debug=True, max_garments_per_group=None)
+        pipeline.make_recommendations.assert_called_with(profile, debug=True, max_garments_per_group=None, projection=None)
 
         assert 'debug' in recommendations
         assert isinstance(recommendations['debug']['queries'], list)
@@ -180,10 +181,37 @@ class TestMakeRecommendations:
         profile = pipeline_profile_factory()
         recommendations = make_recommendations(profile, pipeline, max_garments_per_group=5)
 
-        pipeline.make_recommendations.assert_called_with(profile, debug=False, max_garments_per_group=5)
+        pipeline.make_recommendations.assert_called_with(profile, debug=False, max_garments_per_group=5, projection=None)
 
         assert recommendations == {}
 
+    def test_projection(self, pipeline_profile_factory):
+        """It passes an optional field projection to the pipeline."""
+        pipeline = mock.Mock()
+        pipeline.make_recommendations = mock.MagicMock()
+        pipeline.make_recommendations.return_value = {}
+
+        profile = pipeline_profile_factory()
+        projection = FieldProjection(['garment.name'])
+        make_recommendations(profile, pipeline, projection=projection)
+
+        pipeline.make_recommendations.assert_called_with(profile, debug=False, max_garments_per_group=None, projection=projection)
+
+
+@pytest.mark.django_db
+class TestMakeRecommendationsMany:
+
+    def test_batch(self, pipeline_profile_factory):
+        """It makes recommendations for all profiles with a single pipeline call."""
+        pipeline = mock.Mock()
+        pipeline.make_recommendations_many.return_value = [{'id': 1}, {'id': 2}]
+
+        profiles = [pipeline_profile_factory(), pipeline_profile_factory()]
+        recommendations = make_recommendations_many(profiles, pipeline, max_garments_per_group=5)
+
+        pipeline.make_recommendations_many.assert_called_once_with(profiles, max_garments_per_group=5, projection=None)
+        assert recommendations == [{'id': 1}, {'id': 2}]
+
 
 @pytest.mark.django_db
 class TestPersonRecommendation:
@@ -1,6 +1,7 @@
 import pytest
 
-from chiton.wintour.models import Person
+from chiton.wintour.models import Person, RecommendationProfile
+from chiton.wintour.profiles import hash_pipeline_profile
 
 
 @pytest.mark.django_db
@@ -117,3 +118,32 @@ class TestPerson:
         next_id = Person.objects.ensure_exists_with_email('john@example.com').pk
 
         assert original_id != next_id
+
+
+@pytest.mark.django_db
+class TestRecommendationProfile:
+
+    def test_ensure_exist(self):
+        """It stores each distinct profile once, keyed by its digest."""
+        digests = RecommendationProfile.objects.ensure_exist([
+            {'birth_year': 1980, 'styles': ['classy', 'sassy']},
+            {'birth_year': 1980, 'styles': ['sassy', 'classy']},
+            {'birth_year': 1990, 'styles': []}
+        ])
+
+        assert digests[0] == digests[1]
+        assert digests[0] != digests[2]
+        assert RecommendationProfile.objects.count() == 2
+        assert RecommendationProfile.objects.get(pk=digests[0]).data == {'birth_year': 1980, 'styles': ['classy', 'sassy']}
+
+    def test_ensure_exist_existing(self):
+        """It reuses profiles that are already stored."""
+        first = RecommendationProfile.objects.ensure_exist([{'birth_year': 1980}])
+        second = RecommendationProfile.objects.ensure_exist([{'birth_year': 1980}])
+
+        assert first == second == [hash_pipeline_profile({'birth_year': 1980})]
+        assert RecommendationProfile.objects.count() == 1
+
+    def test_ensure_exist_empty(self):
+        """It handles an empty list of profiles."""
+        assert RecommendationProfile.objects.ensure_exist([]) == []
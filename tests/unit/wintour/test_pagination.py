@@ -0,0 +1,118 @@
+import pytest
+
+from chiton.wintour.exceptions import CursorError, GroupNotFoundError
+from chiton.wintour.pagination import page_group_garments, preview_recommendations
+
+
+def build_snapshot(garment_ids, generation='first'):
+    return {
+        'generation': generation,
+        'recommendations': {
+            'basics': [{
+                'basic': {'slug': 'shirt'},
+                'facets': [{
+                    'groups': [
+                        {'garment_ids': garment_ids, 'slug': 'all'},
+                        {'garment_ids': garment_ids[0:1], 'slug': 'one'}
+                    ],
+                    'name': 'Price',
+                    'slug': 'price'
+                }],
+                'garments': [{'garment': {'id': garment_id}} for garment_id in garment_ids]
+            }],
+            'categories': [],
+            'recommendation_id': 1
+        }
+    }
+
+
+class TestPreviewRecommendations:
+
+    def test_unlimited(self):
+        """It returns the full recommendations without a garment limit."""
+        snapshot = build_snapshot([1, 2, 3])
+        assert preview_recommendations(snapshot) == snapshot['recommendations']
+
+    def test_limit(self):
+        """It limits the garments in each facet group."""
+        preview = preview_recommendations(build_snapshot([1, 2, 3]), max_garments_per_group=2)
+
+        basic = preview['basics'][0]
+        all_group, one_group = basic['facets'][0]['groups']
+
+        assert all_group['garment_ids'] == [1, 2]
+        assert one_group['garment_ids'] == [1]
+        assert [g['garment']['id'] for g in basic['garments']] == [1, 2]
+        assert preview['recommendation_id'] == 1
+
+    def test_limit_cursor(self):
+        """It provides a cursor for each facet group with remaining garments."""
+        preview = preview_recommendations(build_snapshot([1, 2, 3]), max_garments_per_group=2)
+        all_group, one_group = preview['basics'][0]['facets'][0]['groups']
+
+        assert all_group['next_cursor']
+        assert 'next_cursor' not in one_group
+
+    def test_limit_snapshot(self):
+        """It does not modify the snapshot."""
+        snapshot = build_snapshot([1, 2, 3])
+        preview_recommendations(snapshot, max_garments_per_group=1)
+
+        basic = snapshot['recommendations']['basics'][0]
+        assert basic['facets'][0]['groups'][0]['garment_ids'] == [1, 2, 3]
+        assert 'next_cursor' not in basic['facets'][0]['groups'][0]
+        assert len(basic['garments']) == 3
+
+
+class TestPageGroupGarments:
+
+    def test_first_page(self):
+        """It returns the first page of a group's garments when no cursor is given."""
+        page = page_group_garments(build_snapshot([1, 2, 3]), 'shirt', 'price', 'all', limit=2)
+
+        assert [g['garment']['id'] for g in page['garments']] == [1, 2]
+        assert page['next_cursor']
+        assert page['total'] == 3
+
+    def test_next_page(self):
+        """It returns the page following a cursor, with no cursor for the last page."""
+        snapshot = build_snapshot([1, 2, 3])
+        first = page_group_garments(snapshot, 'shirt', 'price', 'all', limit=2)
+        second = page_group_garments(snapshot, 'shirt', 'price', 'all', cursor=first['next_cursor'], limit=2)
+
+        assert [g['garment']['id'] for g in second['garments']] == [3]
+        assert second['next_cursor'] is None
+
+    def test_preview_cursor(self):
+        """It continues from the cursor of a limited facet group."""
+        snapshot = build_snapshot([1, 2, 3])
+        preview = preview_recommendations(snapshot, max_garments_per_group=2)
+        cursor = preview['basics'][0]['facets'][0]['groups'][0]['next_cursor']
+
+        page = page_group_garments(snapshot, 'shirt', 'price', 'all', cursor=cursor)
+        assert [g['garment']['id'] for g in page['garments']] == [3]
+
+    def test_cursor_outdated(self):
+        """It rejects a cursor from recommendations computed against another catalog."""
+        first = page_group_garments(build_snapshot([1, 2, 3]), 'shirt', 'price', 'all', limit=1)
+
+        with pytest.raises(CursorError):
+            page_group_garments(build_snapshot([1, 2, 3], generation='second'), 'shirt', 'price', 'all', cursor=first['next_cursor'])
+
+    def test_cursor_invalid(self):
+        """It rejects a malformed cursor."""
+        with pytest.raises(CursorError):
+            page_group_garments(build_snapshot([1, 2, 3]), 'shirt', 'price', 'all', cursor='invalid')
+
+    def test_missing_group(self):
+        """It raises an error when the basic, facet or group does not exist."""
+        snapshot = build_snapshot([1, 2, 3])
+
+        with pytest.raises(GroupNotFoundError):
+            page_group_garments(snapshot, 'pants', 'price', 'all')
+
+        with pytest.raises(GroupNotFoundError):
+            page_group_garments(snapshot, 'shirt', 'color', 'all')
+
+        with pytest.raises(GroupNotFoundError):
+            page_group_garments(snapshot, 'shirt', 'price', 'none')
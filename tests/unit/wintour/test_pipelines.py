@@ -3,10 +3,12 @@ from decimal import Decimal
 import pytest
 
 from chiton.closet.data import CARE_TYPES
+from chiton.rack.models import ItemImageDerivative
 from chiton.wintour.facets import BaseFacet
 from chiton.wintour.garment_filters import BaseGarmentFilter
 from chiton.wintour.pipeline import FacetGroup
 from chiton.wintour.pipelines import BasePipeline
+from chiton.wintour.projections import FieldProjection
 from chiton.wintour.query_filters import BaseQueryFilter
 from chiton.wintour.weights import BaseWeight
 
@@ -293,6 +295,58 @@ class TestBasePipeline:
         assert without_data['url'] == 'http://example.com/without'
         assert not len(without_data['images'])
 
+    def test_make_recommendations_image_variants(self, basic_factory, affiliate_item_factory, garment_factory, pipeline_factory, pipeline_profile_factory, item_image_factory):
+        """It exposes the resized derivatives of each image as variants."""
+        garment = garment_factory(basic=basic_factory())
+        item = affiliate_item_factory(garment=garment)
+        image = item_image_factory(item=item, height=1000, width=1000)
+
+        ItemImageDerivative.objects.create(image=image, file='derivatives/large.jpg', format='jpeg', height=640, width=640)
+        ItemImageDerivative.objects.create(image=image, file='derivatives/small.jpg', format='jpeg', height=160, width=160)
+        ItemImageDerivative.objects.create(image=image, file='derivatives/small.webp', format='webp', height=160, width=160)
+
+        pipeline = pipeline_factory()
+        recommendations = pipeline.make_recommendations(pipeline_profile_factory())
+        image_data = recommendations['basics'][0]['garments'][0]['purchase_options'][0]['images'][0]
+
+        variants = image_data['variants']
+        assert [(v['format'], v['width'], v['height']) for v in variants] == [('jpeg', 160, 160), ('jpeg', 640, 640), ('webp', 160, 160)]
+        assert variants[0]['url'].endswith('/derivatives/small.jpg')
+        assert variants[2]['url'].endswith('/derivatives/small.webp')
+
+    def test_make_recommendations_projection(self, basic_factory, affiliate_item_factory, garment_factory, pipeline_factory, pipeline_profile_factory, item_image_factory):
+        """It only builds the garment fields selected by a projection, along with required fields."""
+        garment = garment_factory(basic=basic_factory(), name='Shirt')
+        item = affiliate_item_factory(garment=garment, price=Decimal(10))
+        item_image_factory(item=item)
+        item_image_factory(item=item)
+
+        pipeline = pipeline_factory()
+        projection = FieldProjection(['garment.name', 'purchase_options.images'], max_images=1)
+        recommendations = pipeline.make_recommendations(pipeline_profile_factory(), projection=projection)
+
+        garment_data = recommendations['basics'][0]['garments'][0]
+        assert set(garment_data.keys()) == set(['garment', 'purchase_options', 'weight'])
+        assert set(garment_data['garment'].keys()) == set(['branded_name', 'id', 'name'])
+        assert garment_data['garment']['name'] == 'Shirt'
+
+        purchase_option = garment_data['purchase_options'][0]
+        assert set(purchase_option.keys()) == set(['id', 'images', 'price'])
+        assert purchase_option['id'] == item.pk
+        assert purchase_option['price'] == 1000
+        assert len(purchase_option['images']) == 1
+
+    def test_make_recommendations_projection_images(self, basic_factory, affiliate_item_factory, garment_factory, pipeline_factory, pipeline_profile_factory, item_image_factory):
+        """It does not look up images when a projection excludes them."""
+        item = affiliate_item_factory(garment=garment_factory(basic=basic_factory()))
+        item_image_factory(item=item)
+
+        pipeline = pipeline_factory()
+        recommendations = pipeline.make_recommendations(pipeline_profile_factory(), projection=FieldProjection(['garment']))
+        purchase_option = recommendations['basics'][0]['garments'][0]['purchase_options'][0]
+
+        assert 'images' not in purchase_option
+
     def test_make_recommendations_queryset_filters(self, basic_factory, affiliate_item_factory, garment_factory, pipeline_factory, pipeline_profile_factory):
         """It combines all queryset filters."""
         class TallFilter(DummyQueryFilter):
@@ -563,3 +617,56 @@ class TestBasePipeline:
             'basics': [],
             'categories': []
         }
+
+    def test_make_recommendations_many(self, basic_factory, affiliate_item_factory, garment_factory, pipeline_factory, pipeline_profile_factory):
+        """It returns the same recommendations as making them for each profile, in input order."""
+        basic = basic_factory()
+        affiliate_item_factory(garment=garment_factory(basic=basic, name='Dress'))
+        affiliate_item_factory(garment=garment_factory(basic=basic, name='Pants'))
+
+        apple = pipeline_profile_factory(body_shape='apple')
+        pear = pipeline_profile_factory(body_shape='pear')
+        pipeline = pipeline_factory()
+
+        recommendations = pipeline.make_recommendations_many([apple, pear])
+
+        assert recommendations == [pipeline.make_recommendations(apple), pipeline.make_recommendations(pear)]
+
+    def test_make_recommendations_many_queryset_filters(self, basic_factory, affiliate_item_factory, garment_factory, pipeline_factory, pipeline_profile_factory):
+        """It applies queryset filters to the shared garments for each profile."""
+        class TallFilter(DummyQueryFilter):
+            def provide_profile_data(self, profile):
+                return {'body_shape': profile['body_shape']}
+
+            def apply(self, garments, body_shape=None):
+                if body_shape == 'apple':
+                    return garments.filter(is_tall_sized=False)
+                else:
+                    return garments
+
+        basic = basic_factory()
+        affiliate_item_factory(garment=garment_factory(basic=basic, is_regular_sized=True))
+        affiliate_item_factory(garment=garment_factory(basic=basic, is_tall_sized=True))
+
+        apple = pipeline_profile_factory(body_shape='apple')
+        pear = pipeline_profile_factory(body_shape='pear')
+        pipeline = pipeline_factory(query_filters=[TallFilter()])
+
+        apple_recs, pear_recs = pipeline.make_recommendations_many([apple, pear])
+
+        assert len(apple_recs['basics'][0]['garments']) == 1
+        assert len(pear_recs['basics'][0]['garments']) == 2
+
+    def test_make_recommendations_many_projection(self, basic_factory, affiliate_item_factory, garment_factory, pipeline_factory, pipeline_profile_factory):
+        """It applies a projection to each profile's recommendations."""
+        affiliate_item_factory(garment=garment_factory(basic=basic_factory()))
+
+        pipeline = pipeline_factory()
+        recommendations = pipeline.make_recommendations_many([pipeline_profile_factory()], projection=FieldProjection(['garment.name']))
+        purchase_option = recommendations[0]['basics'][0]['garments'][0]['purchase_options'][0]
+
+        assert set(purchase_option.keys()) == set(['id', 'price'])
+
+    def test_make_recommendations_many_empty(self, pipeline_profile_factory):
+        """It returns no recommendations for an empty batch."""
+        assert BasePipeline().make_recommendations_many([]) == []
@@ -3,7 +3,57 @@ import pytest
 from chiton.closet.data import CARE_TYPES
 from chiton.core.exceptions import FormatError
 from chiton.wintour.data import BODY_SHAPES, EXPECTATION_FREQUENCIES
-from chiton.wintour.profiles import package_wardrobe_profile, PipelineProfile
+from chiton.wintour.profiles import hash_pipeline_profile, normalize_pipeline_profile, package_wardrobe_profile, PipelineProfile
+
+
+class TestNormalizePipelineProfile:
+
+    def test_unordered_fields(self):
+        """It sorts the values of fields whose order has no meaning."""
+        normalized = normalize_pipeline_profile({
+            'birth_year': 1980,
+            'expectations': [
+                {'formality': 'executive', 'frequency': 'never'},
+                {'formality': 'casual', 'frequency': 'always'}
+            ],
+            'sizes': ['m', 'l'],
+            'styles': ['sassy', 'classy']
+        })
+
+        assert normalized == {
+            'birth_year': 1980,
+            'expectations': [
+                {'formality': 'casual', 'frequency': 'always'},
+                {'formality': 'executive', 'frequency': 'never'}
+            ],
+            'sizes': ['l', 'm'],
+            'styles': ['classy', 'sassy']
+        }
+
+    def test_original(self):
+        """It does not modify the original profile."""
+        profile = {'sizes': ['m', 'l']}
+        normalize_pipeline_profile(profile)
+
+        assert profile == {'sizes': ['m', 'l']}
+
+
+class TestHashPipelineProfile:
+
+    def test_equivalent(self):
+        """It produces the same hash for profiles that differ only in ordering."""
+        one = hash_pipeline_profile({'birth_year': 1980, 'styles': ['classy', 'sassy']})
+        two = hash_pipeline_profile({'styles': ['sassy', 'classy'], 'birth_year': 1980})
+
+        assert one == two
+        assert len(one) == 64
+
+    def test_different(self):
+        """It produces different hashes for different profiles."""
+        one = hash_pipeline_profile({'birth_year': 1980})
+        two = hash_pipeline_profile({'birth_year': 1981})
+
+        assert one != two
 
 
 @pytest.mark.django_db
@@ -0,0 +1,60 @@
+import pytest
+
+from chiton.wintour.exceptions import ProjectionError
+from chiton.wintour.projections import FieldProjection
+
+
+class TestFieldProjection:
+
+    def test_all(self):
+        """It includes all fields by default."""
+        projection = FieldProjection()
+
+        assert projection.includes('explanations')
+        assert projection.includes('purchase_options.images')
+
+    def test_sub_fields(self):
+        """It includes only the selected sub-fields of a field."""
+        projection = FieldProjection(['garment.name'])
+
+        assert projection.includes('garment.name')
+        assert not projection.includes('garment.brand')
+        assert not projection.includes('purchase_options.images')
+
+    def test_fields(self):
+        """It includes all sub-fields of a selected field."""
+        projection = FieldProjection(['purchase_options'])
+
+        assert projection.includes('purchase_options.images')
+        assert projection.includes('purchase_options.retailer')
+        assert not projection.includes('garment.care')
+
+    def test_required(self):
+        """It always includes the fields required to sort and facet garments."""
+        projection = FieldProjection([])
+
+        assert projection.includes('garment.id')
+        assert projection.includes('purchase_options.price')
+        assert projection.includes('weight')
+        assert not projection.includes('explanations')
+
+    def test_invalid(self):
+        """It rejects unknown fields and sub-fields."""
+        with pytest.raises(ProjectionError):
+            FieldProjection(['sizes'])
+
+        with pytest.raises(ProjectionError):
+            FieldProjection(['garment.sizes'])
+
+        with pytest.raises(ProjectionError):
+            FieldProjection(['weight.value'])
+
+    def test_max_images(self):
+        """It exposes the maximum number of images per purchase option."""
+        assert FieldProjection(max_images=1).max_images == 1
+
+    def test_get_key(self):
+        """It identifies projections by their selected fields and image limit."""
+        assert FieldProjection(['garment.name', 'weight']).get_key() == FieldProjection(['weight', 'garment.name']).get_key()
+        assert FieldProjection(['garment.name']).get_key() != FieldProjection(['garment']).get_key()
+        assert FieldProjection(max_images=1).get_key() == [None, 1]
@@ -0,0 +1,139 @@
+from django.core.cache import cache
+import mock
+import pytest
+
+from chiton.wintour.snapshots import get_catalog_generation, get_current_snapshot, get_snapshot_etag, load_recommendation_snapshot, save_recommendation_snapshot
+
+
+@pytest.mark.django_db
+class TestGetCatalogGeneration:
+
+    def test_stable(self):
+        """It returns the same generation while the catalog is unchanged."""
+        assert get_catalog_generation() == get_catalog_generation()
+
+    def test_catalog_change(self, garment_factory):
+        """It returns a new generation when the catalog changes."""
+        generation = get_catalog_generation()
+        garment_factory()
+
+        assert get_catalog_generation() != generation
+
+
+class TestSaveRecommendationSnapshot:
+
+    def test_round_trip(self):
+        """It stores recommendations that can be loaded by their ID."""
+        saved = save_recommendation_snapshot(1, {'basics': [{'name': 'Shirt'}], 'recommendation_id': 1}, 'first')
+        snapshot = load_recommendation_snapshot(1)
+
+        assert snapshot == saved
+        assert snapshot['recommendations'] == {'basics': [{'name': 'Shirt'}], 'recommendation_id': 1}
+        assert snapshot['generation'] == 'first'
+
+    def test_compressed(self):
+        """It stores the recommendations in compressed form."""
+        recommendations = {'basics': [{'name': 'Shirt'}] * 100}
+
+        with mock.patch.object(cache, 'set') as cache_set:
+            save_recommendation_snapshot(1, recommendations, 'first')
+
+        stored = cache_set.call_args[0][1]['recommendations']
+        assert isinstance(stored, bytes)
+        assert len(stored) < len(str(recommendations))
+
+    def test_ttl(self):
+        """It stores the snapshot with an expiration time."""
+        with mock.patch.object(cache, 'set') as cache_set:
+            save_recommendation_snapshot(1, {}, 'first', ttl=60)
+
+        assert cache_set.call_args[0][2] == 60
+
+
+class TestLoadRecommendationSnapshot:
+
+    def test_missing(self):
+        """It returns None for a recommendation without a snapshot."""
+        assert load_recommendation_snapshot(1) is None
+
+
+@pytest.mark.django_db
+class TestGetCurrentSnapshot:
+
+    def test_current(self, recommendation_factory):
+        """It returns a snapshot computed against the current catalog without recomputing it."""
+        recommendation = recommendation_factory()
+        save_recommendation_snapshot(recommendation.pk, {'basics': [], 'recommendation_id': recommendation.pk}, get_catalog_generation())
+
+        with mock.patch('chiton.wintour.snapshots.make_recommendations') as make_recommendations:
+            snapshot = get_current_snapshot(recommendation)
+
+        assert snapshot['recommendations'] == {'basics': [], 'recommendation_id': recommendation.pk}
+        assert not make_recommendations.called
+
+    def test_outdated(self, recommendation_factory, garment_factory):
+        """It recomputes and stores a snapshot computed against an older catalog."""
+        recommendation = recommendation_factory()
+        save_recommendation_snapshot(recommendation.pk, {'basics': []}, get_catalog_generation())
+        garment_factory()
+
+        with mock.patch('chiton.wintour.snapshots.make_recommendations') as make_recommendations:
+            make_recommendations.return_value = {'basics': [{'name': 'Shirt'}]}
+            snapshot = get_current_snapshot(recommendation)
+
+        assert snapshot['recommendations'] == {'basics': [{'name': 'Shirt'}], 'recommendation_id': recommendation.pk}
+        assert snapshot['generation'] == get_catalog_generation()
+        assert load_recommendation_snapshot(recommendation.pk) == snapshot
+
+    def test_catalog_change(self, recommendation_factory, garment_factory):
+        """It stores recommendations under the generation read before computing them."""
+        recommendation = recommendation_factory()
+        generation = get_catalog_generation()
+
+        def change_catalog(*args, **kwargs):
+            garment_factory()
+            return {'basics': []}
+
+        with mock.patch('chiton.wintour.snapshots.make_recommendations', side_effect=change_catalog):
+            snapshot = get_current_snapshot(recommendation)
+
+        assert snapshot['generation'] == generation
+        assert snapshot['generation'] != get_catalog_generation()
+
+    def test_missing(self, recommendation_factory):
+        """It computes full recommendations from the stored profile when no snapshot exists."""
+        recommendation = recommendation_factory()
+
+        with mock.patch('chiton.wintour.snapshots.make_recommendations') as make_recommendations:
+            make_recommendations.return_value = {'basics': []}
+            get_current_snapshot(recommendation)
+
+        profile = make_recommendations.call_args[0][0]
+        assert dict(profile) == recommendation.profile.data
+        assert 'max_garments_per_group' not in make_recommendations.call_args[1]
+        assert load_recommendation_snapshot(recommendation.pk)
+
+
+@pytest.mark.django_db
+class TestGetSnapshotEtag:
+
+    def test_stable(self, recommendation_factory):
+        """It returns the same tag for the same recommendation, generation and variants."""
+        recommendation = recommendation_factory()
+        assert get_snapshot_etag(recommendation, 'first', 'json', 10) == get_snapshot_etag(recommendation, 'first', 'json', 10)
+
+    def test_generation(self, recommendation_factory):
+        """It returns a new tag for a new catalog generation."""
+        recommendation = recommendation_factory()
+        assert get_snapshot_etag(recommendation, 'first') != get_snapshot_etag(recommendation, 'second')
+
+    def test_variants(self, recommendation_factory):
+        """It returns a distinct tag for each variant of the served data."""
+        recommendation = recommendation_factory()
+
+        assert get_snapshot_etag(recommendation, 'first', 'json', 10) != get_snapshot_etag(recommendation, 'first', 'json', None)
+        assert get_snapshot_etag(recommendation, 'first', 'json', 10) != get_snapshot_etag(recommendation, 'first', 'msgpack', 10)
+
+    def test_recommendation(self, recommendation_factory):
+        """It returns a distinct tag for each recommendation."""
+        assert get_snapshot_etag(recommendation_factory(), 'first') != get_snapshot_etag(recommendation_factory(), 'first')